@@ -1,5 +1,5 @@
 from app import app, db
-from app.models import Employee, Client, Intervention, Invoice, InvoicePayment, PayStub, PayStubItem
+from app.models import Employee, Client, PayStub, DailyRollup
 from sqlalchemy import func, case, and_
 from flask import render_template, redirect, url_for, flash, request, session, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
@@ -104,30 +104,37 @@ def get_session_stats(employee_email=None):
     last_year_start = date(today.year - 1, 1, 1)
     last_year_end = date(today.year - 1, 12, 31)
     
-    # Base query
-    query = db.session.query(
-        func.count(Intervention.id).label('session_count'),
-        func.sum(Intervention._duration).label('total_hours')  # Use the actual column name
-    ).select_from(Intervention)
+    ranges = {
+        'current_week': (current_week_start, current_week_end),
+        'current_month': (current_month_start, current_month_end),
+        'year_to_date': (year_start, today),
+        'last_week': (last_week_start, last_week_end),
+        'last_month': (last_month_start, last_month_end),
+        'last_year': (last_year_start, last_year_end)
+    }
+    
+    # One pass over the pre-aggregated daily rollups with a conditional sum per range
+    columns = []
+    for name, (start_date, end_date) in ranges.items():
+        in_range = DailyRollup.date.between(start_date, end_date)
+        columns.append(func.sum(case((in_range, DailyRollup.session_count), else_=0)).label(f'{name}_sessions'))
+        columns.append(func.sum(case((in_range, DailyRollup.hours), else_=0)).label(f'{name}_hours'))
+    query = db.session.query(*columns).filter(
+        DailyRollup.date.between(min(r[0] for r in ranges.values()), max(r[1] for r in ranges.values()))
+    )
     
     if employee_email:
-        query = query.join(Employee).filter(Employee.email == employee_email)
-    
-    # Function to get stats for a date range
-    def get_stats_for_range(start_date, end_date):
-        result = query.filter(Intervention.date.between(start_date, end_date)).first()
-        return {
-            'sessions': result.session_count or 0,
-            'hours': float(result.total_hours or 0)
-        }
+        query = query.filter(DailyRollup.employee_id.in_(
+            db.session.query(Employee.id).filter(Employee.email == employee_email)
+        ))
     
+    result = query.one()
     return {
-        'current_week': get_stats_for_range(current_week_start, current_week_end),
-        'current_month': get_stats_for_range(current_month_start, current_month_end),
-        'year_to_date': get_stats_for_range(year_start, today),
-        'last_week': get_stats_for_range(last_week_start, last_week_end),
-        'last_month': get_stats_for_range(last_month_start, last_month_end),
-        'last_year': get_stats_for_range(last_year_start, last_year_end)
+        name: {
+            'sessions': int(getattr(result, f'{name}_sessions') or 0),
+            'hours': float(getattr(result, f'{name}_hours') or 0)
+        }
+        for name in ranges
     }
 
 
@@ -135,50 +142,22 @@ def get_monthly_totals():
     today = date.today()
     start_date = date(today.year - 1, today.month, 1)  # 12 months ago
     
-    # Subquery to get the total duration per invoice
-    total_duration_per_invoice = db.session.query(
-        Intervention.invoice_number,
-        func.sum(Intervention._duration).label('total_duration')
-    ).filter(Intervention.invoiced == True)\
-     .group_by(Intervention.invoice_number)\
-     .subquery()
-
-    # Get paid amounts per invoice so partial payments are included in received totals.
-    paid_amount_per_invoice = db.session.query(
-        InvoicePayment.invoice_id.label('invoice_id'),
-        func.coalesce(func.sum(InvoicePayment.amount), 0).label('paid_amount')
-    ).group_by(InvoicePayment.invoice_id).subquery()
-
-    # Get monthly data for the past 12 months based on intervention dates with prorated invoice amounts
-    monthly_data = db.session.query(
-        func.date_trunc('month', Intervention.date).label('month'),
-        func.sum(
-            case(
-                (Intervention.invoiced == True,
-                 (Intervention._duration / total_duration_per_invoice.c.total_duration) * Invoice.total_cost)
-            , else_=0)
-        ).label('total_invoiced'),
-        func.sum(
-            case(
-                (Intervention.invoiced == True,
-                 (Intervention._duration / total_duration_per_invoice.c.total_duration) * func.coalesce(paid_amount_per_invoice.c.paid_amount, 0))
-            , else_=0)
-        ).label('total_received')
-    ).join(Invoice, Intervention.invoice_number == Invoice.invoice_number)\
-     .outerjoin(paid_amount_per_invoice, Invoice.id == paid_amount_per_invoice.c.invoice_id)\
-     .join(total_duration_per_invoice, Intervention.invoice_number == total_duration_per_invoice.c.invoice_number)\
-     .filter(Intervention.date >= start_date)\
-     .group_by('month')\
-     .order_by('month').all()
-    
-    # Get monthly paystub totals based on intervention dates
-    monthly_paystubs = db.session.query(
-        func.date_trunc('month', Intervention.date).label('month'),
-        func.sum(PayStubItem.amount).label('total_amount')
-    ).join(PayStubItem, Intervention.id == PayStubItem.intervention_id)\
-     .filter(Intervention.date >= start_date)\
-     .group_by('month')\
-     .order_by('month').all()
+    # Daily rollups already hold the invoice amounts prorated to session dates,
+    # received payments and paystub amounts; sum them per day and bucket by month
+    daily = db.session.query(
+        DailyRollup.date,
+        func.sum(DailyRollup.invoiced_amount).label('total_invoiced'),
+        func.sum(DailyRollup.received_amount).label('total_received'),
+        func.sum(DailyRollup.paystub_amount).label('total_paystubs')
+    ).filter(DailyRollup.date >= start_date)\
+     .group_by(DailyRollup.date).all()
+    
+    monthly = {}
+    for row in daily:
+        totals = monthly.setdefault((row.date.year, row.date.month), [0.0, 0.0, 0.0])
+        totals[0] += float(row.total_invoiced or 0)
+        totals[1] += float(row.total_received or 0)
+        totals[2] += float(row.total_paystubs or 0)
     
     # Initialize result lists
     labels = []
@@ -193,15 +172,9 @@ def get_monthly_totals():
         month_str = current.strftime('%b %Y')
         labels.append(month_str)
         
-        # Find invoice data for this month
-        month_data = next((d for d in monthly_data if d.month.year == current.year and d.month.month == current.month), None)
-        total_invoices.append(float(month_data.total_invoiced if month_data else 0))
-        paid_amount = float(month_data.total_received if month_data else 0)
+        total_invoiced, paid_amount, paystub_amount = monthly.get((current.year, current.month), (0.0, 0.0, 0.0))
+        total_invoices.append(total_invoiced)
         paid_invoices.append(paid_amount)
-        
-        # Find paystub data for this month
-        paystub_data = next((d for d in monthly_paystubs if d.month.year == current.year and d.month.month == current.month), None)
-        paystub_amount = float(paystub_data.total_amount if paystub_data else 0)
         paystub_amounts.append(paystub_amount)
         
         # Calculate earnings (paid invoices - paystub amounts)
@@ -227,12 +200,18 @@ def home():
     if current_user.is_authenticated:
         total_employees = Employee.query.count()
         total_clients = Client.query.count()
-        total_interventions = Intervention.query.count()
-        user_interventions = Intervention.query.join(Employee).filter(Employee.email == current_user.email).count()
         
         # Get employee record for role-based stats
         employee = Employee.query.filter_by(email=current_user.email).first()
         
+        # Session counts come from the daily rollups rather than counting interventions
+        counts = db.session.query(
+            func.sum(DailyRollup.session_count).label('total'),
+            func.sum(case((DailyRollup.employee_id == (employee.id if employee else None), DailyRollup.session_count), else_=0)).label('user')
+        ).one()
+        total_interventions = int(counts.total or 0)
+        user_interventions = int(counts.user or 0)
+        
         # Initialize stats
         org_stats = None
         user_stats = None
@@ -559,6 +538,7 @@ def forgot_password():
                     body_text=body_text,
                     body_html=body_html
                 )
+                db.session.commit()
             except Exception as e:
                 flash(f'Error sending email: {str(e)}', 'danger')
                 return render_template('auth.html', login_form=login_form, register_form=register_form, forgot_form=form, org_name=settings['org_name'])
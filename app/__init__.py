@@ -22,8 +22,8 @@ app.config['SECRET_KEY'] = 'my_app_super_secret_key'
 
 def _get_org_name():
     try:
-        from app.models import AppSettings
-        s = AppSettings.get()
+        from app.utils.settings_utils import get_app_settings
+        s = get_app_settings()
         if s and s.org_name:
             return s.org_name
     except Exception:
@@ -66,18 +66,14 @@ app.jinja_env.globals['current_org_logo'] = _get_org_logo
 @app.context_processor
 def _inject_org_globals():
     # Prefer values stored in the database AppSettings if present, otherwise fall back to environment values
-    try:
-        from app.models import AppSettings
-        s = AppSettings.get()
-    except Exception:
-        s = None
-
-    # also include resolved logo fields for templates
+    # also include resolved logo fields for templates; both come from the
+    # cached settings so rendering a page doesn't query AppSettings
     try:
         from app.utils.settings_utils import get_org_settings
         resolved = get_org_settings()
     except Exception:
         resolved = {}
+    s = resolved.get('appsettings')
 
     return {
         'org_name': (s.org_name if s and s.org_name else os.environ.get('ORG_NAME', 'My Organization')),
@@ -172,6 +168,17 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'data/uploads')
 app.config['DELETE_FOLDER'] = os.path.join(basedir, 'data/deleted')
 app.config['PROFILE_PIC_FOLDER'] = os.path.join(basedir, 'data/profile_pic')
+app.config['PDF_CACHE_FOLDER'] = os.path.join(basedir, 'data/pdf_cache')
+app.config['PDF_CACHE_MAX_BYTES'] = int(os.environ.get('PDF_CACHE_MAX_MB', '200')) * 1024 * 1024
+app.config['SETTINGS_CACHE_TTL'] = int(os.environ.get('SETTINGS_CACHE_TTL', '300'))
+app.config['EMAIL_SEND_WORKERS'] = int(os.environ.get('EMAIL_SEND_WORKERS', '4'))
+app.config['EMAIL_BATCH_SIZE'] = int(os.environ.get('EMAIL_BATCH_SIZE', '10'))
+app.config['EMAIL_OUTBOX_WORKER'] = os.environ.get('EMAIL_OUTBOX_WORKER', '1') != '0'  # 0: only `flask send-email-outbox` sends
+app.config['SESSION_IMPORT_BACKGROUND_BYTES'] = int(os.environ.get('SESSION_IMPORT_BACKGROUND_BYTES', '65536'))  # larger CSV uploads import in a thread
+app.config['PDF_RENDER_WORKERS'] = int(os.environ.get('PDF_RENDER_WORKERS', '0')) or None  # render processes; default: CPU count
+app.config['PDF_RENDER_MAX_CONCURRENT'] = int(os.environ.get('PDF_RENDER_MAX_CONCURRENT', '0')) or None  # default: one per worker
+app.config['PDF_RENDER_QUEUE_TIMEOUT'] = float(os.environ.get('PDF_RENDER_QUEUE_TIMEOUT', '30'))
+app.config['PDF_RENDER_TIMEOUT'] = float(os.environ.get('PDF_RENDER_TIMEOUT', '120'))
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB limit
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -226,6 +233,17 @@ def create_app():
     app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'data/uploads')
     app.config['DELETE_FOLDER'] = os.path.join(basedir, 'data/deleted')
     app.config['PROFILE_PIC_FOLDER'] = os.path.join(basedir, 'data/profile_pic')
+    app.config['PDF_CACHE_FOLDER'] = os.path.join(basedir, 'data/pdf_cache')
+    app.config['PDF_CACHE_MAX_BYTES'] = int(os.environ.get('PDF_CACHE_MAX_MB', '200')) * 1024 * 1024
+    app.config['SETTINGS_CACHE_TTL'] = int(os.environ.get('SETTINGS_CACHE_TTL', '300'))
+    app.config['EMAIL_SEND_WORKERS'] = int(os.environ.get('EMAIL_SEND_WORKERS', '4'))
+    app.config['EMAIL_BATCH_SIZE'] = int(os.environ.get('EMAIL_BATCH_SIZE', '10'))
+    app.config['EMAIL_OUTBOX_WORKER'] = os.environ.get('EMAIL_OUTBOX_WORKER', '1') != '0'
+    app.config['SESSION_IMPORT_BACKGROUND_BYTES'] = int(os.environ.get('SESSION_IMPORT_BACKGROUND_BYTES', '65536'))
+    app.config['PDF_RENDER_WORKERS'] = int(os.environ.get('PDF_RENDER_WORKERS', '0')) or None
+    app.config['PDF_RENDER_MAX_CONCURRENT'] = int(os.environ.get('PDF_RENDER_MAX_CONCURRENT', '0')) or None
+    app.config['PDF_RENDER_QUEUE_TIMEOUT'] = float(os.environ.get('PDF_RENDER_QUEUE_TIMEOUT', '30'))
+    app.config['PDF_RENDER_TIMEOUT'] = float(os.environ.get('PDF_RENDER_TIMEOUT', '120'))
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
     # ensure upload dirs exist inside container
@@ -247,18 +265,13 @@ def create_app():
     # Also provide org globals for apps created via the factory
     @app.context_processor
     def _inject_org_globals_factory():
-        try:
-            from app.models import AppSettings
-            s = AppSettings.get()
-        except Exception:
-            s = None
-
         # resolve logo fields using get_org_settings for factory-created apps
         try:
             from app.utils.settings_utils import get_org_settings
             resolved = get_org_settings()
         except Exception:
             resolved = {}
+        s = resolved.get('appsettings')
 
         return {
             'org_name': (s.org_name if s and s.org_name else os.environ.get('ORG_NAME', 'My Organization')),
@@ -278,8 +291,8 @@ def create_app():
     # Register the same helpers for factory-created app so templates can call them
     def _factory_get_org_name():
         try:
-            from app.models import AppSettings
-            ss = AppSettings.get()
+            from app.utils.settings_utils import get_app_settings
+            ss = get_app_settings()
             if ss and ss.org_name:
                 return ss.org_name
         except Exception:
@@ -320,6 +333,12 @@ def create_app():
         except Exception:
             abort(404)
 
+    from app.cli_commands import generate_invoices, rebuild_rollups, run_payroll, send_email_outbox
+    app.cli.add_command(generate_invoices)
+    app.cli.add_command(run_payroll)
+    app.cli.add_command(rebuild_rollups)
+    app.cli.add_command(send_email_outbox)
+
     return app
 
 
@@ -384,4 +403,11 @@ def send_invoice_reminders():
         logger.info('Invoice reminders processing completed successfully')
     except Exception as e:
         logger.exception(f'Error processing invoice reminders: {e}')
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+from app.cli_commands import generate_invoices, rebuild_rollups, run_payroll, send_email_outbox  # noqa: E402
+app.cli.add_command(generate_invoices)
+app.cli.add_command(run_payroll)
+app.cli.add_command(rebuild_rollups)
+app.cli.add_command(send_email_outbox)
@@ -1,9 +1,13 @@
 from flask import request, jsonify
 from . import api_bp, token_required
+from .paging import as_bool, hhmm, iso, list_page, same
 from app import db
 from app.models import Intervention
+from app.utils.session_overlaps import find_overlaps
 from datetime import date, time, datetime
 
+MAX_BATCH_SIZE = 500
+
 
 def _serialize_int(i: Intervention):
     return {
@@ -20,6 +24,23 @@ def _serialize_int(i: Intervention):
     }
 
 
+# fields selectable with ?fields= (same formatting as _serialize_int)
+_FIELDS = {
+    'id': (Intervention.id, same),
+    'client_id': (Intervention.client_id, same),
+    'employee_id': (Intervention.employee_id, same),
+    'intervention_type': (Intervention.intervention_type, same),
+    'date': (Intervention.date, iso),
+    'start_time': (Intervention.start_time, hhmm),
+    'end_time': (Intervention.end_time, hhmm),
+    'duration': (Intervention._duration, lambda v: round(float(v), 2) if v is not None else None),
+    'invoiced': (Intervention.invoiced, as_bool),
+    'invoice_number': (Intervention.invoice_number, same),
+    'is_paid': (Intervention.is_paid, as_bool),
+    'updated_at': (Intervention.updated_at, iso),
+}
+
+
 def _compute_duration(start_time, end_time):
     if end_time <= start_time:
         return None
@@ -30,8 +51,7 @@ def _compute_duration(start_time, end_time):
 @api_bp.route('/interventions', methods=['GET'])
 @token_required
 def list_interventions():
-    items = Intervention.query.order_by(Intervention.date.desc()).limit(200).all()
-    return jsonify([_serialize_int(i) for i in items])
+    return list_page(Intervention, Intervention.date, _FIELDS, _serialize_int)
 
 
 @api_bp.route('/interventions/<int:int_id>', methods=['GET'])
@@ -41,37 +61,33 @@ def get_intervention(int_id):
     return jsonify(_serialize_int(i))
 
 
-@api_bp.route('/interventions', methods=['POST'])
-@token_required
-def create_intervention():
-    data = request.get_json() or {}
+def _parse_new_intervention(data):
+    """Validate a create payload; returns ``(Intervention, None)`` or ``(None, error)``."""
     required = ['client_id', 'employee_id', 'intervention_type', 'date', 'start_time', 'end_time']
     for f in required:
         if f not in data:
-            return jsonify({'error': f'missing field: {f}'}), 400
+            return None, f'missing field: {f}'
+
+    try:
+        employee_id = int(data.get('employee_id'))
+    except (TypeError, ValueError):
+        return None, 'employee_id must be an integer'
 
     try:
         d = date.fromisoformat(data.get('date'))
         st = time.fromisoformat(data.get('start_time'))
         et = time.fromisoformat(data.get('end_time'))
     except Exception:
-        return jsonify({'error': 'date/time fields must be ISO format'}), 400
+        return None, 'date/time fields must be ISO format'
 
     duration = _compute_duration(st, et)
     if duration is None:
-        return jsonify({'error': 'end_time must be later than start_time'}), 400
-
-    employee_id = data.get('employee_id')
-    client_id = data.get('client_id')
-    intervention_type = data.get('intervention_type')
+        return None, 'end_time must be later than start_time'
 
-    if Intervention.has_overlap(employee_id, d, st, et):
-        return jsonify({'error': 'session overlap detected for this employee'}), 400
-
-    i = Intervention(
-        client_id=client_id,
+    return Intervention(
+        client_id=data.get('client_id'),
         employee_id=employee_id,
-        intervention_type=intervention_type,
+        intervention_type=data.get('intervention_type'),
         date=d,
         start_time=st,
         end_time=et,
@@ -79,12 +95,61 @@ def create_intervention():
         file_names='[]',
         invoiced=False,
         invoice_number=None
-    )
+    ), None
+
+
+@api_bp.route('/interventions', methods=['POST'])
+@token_required
+def create_intervention():
+    data = request.get_json() or {}
+    i, error = _parse_new_intervention(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    if find_overlaps([(i.employee_id, i.date, i.start_time, i.end_time)]):
+        return jsonify({'error': 'session overlap detected for this employee'}), 400
+
     db.session.add(i)
     db.session.commit()
     return jsonify(_serialize_int(i)), 201
 
 
+@api_bp.route('/interventions/batch', methods=['POST'])
+@token_required
+def create_interventions_batch():
+    """Create many sessions at once; nothing is saved unless every row is valid.
+
+    Accepts a JSON list or ``{"interventions": [...]}``. Rows are checked for
+    overlaps against stored sessions and against each other; errors are
+    returned as ``{"errors": [{"index": n, "error": "..."}]}``.
+    """
+    data = request.get_json() or {}
+    rows = data.get('interventions') if isinstance(data, dict) else data
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'expected a non-empty list of interventions'}), 400
+    if len(rows) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'at most {MAX_BATCH_SIZE} interventions per batch'}), 400
+
+    items = []
+    errors = []
+    for index, row in enumerate(rows):
+        i, error = _parse_new_intervention(row if isinstance(row, dict) else {})
+        if error:
+            errors.append({'index': index, 'error': error})
+        items.append(i)
+
+    parsed = [(index, i) for index, i in enumerate(items) if i is not None]
+    for n in find_overlaps([(i.employee_id, i.date, i.start_time, i.end_time) for _, i in parsed]):
+        errors.append({'index': parsed[n][0], 'error': 'session overlap detected for this employee'})
+
+    if errors:
+        return jsonify({'errors': sorted(errors, key=lambda e: e['index'])}), 400
+
+    db.session.add_all(items)
+    db.session.commit()
+    return jsonify([_serialize_int(i) for i in items]), 201
+
+
 @api_bp.route('/interventions/<int:int_id>', methods=['PUT'])
 @token_required
 def update_intervention(int_id):
@@ -117,7 +182,7 @@ def update_intervention(int_id):
         return jsonify({'error': 'end_time must be later than start_time'}), 400
     i.duration = duration
 
-    if Intervention.has_overlap(i.employee_id, i.date, i.start_time, i.end_time, exclude_id=i.id):
+    if find_overlaps([(i.employee_id, i.date, i.start_time, i.end_time)], exclude_ids=[i.id]):
         return jsonify({'error': 'session overlap detected for this employee'}), 400
 
     db.session.commit()
@@ -2,8 +2,13 @@ import json
 from datetime import date
 from flask import request, jsonify, g
 from . import api_bp, token_required
+from .paging import iso, list_page, same
 from app import db
-from app.models import Invoice, Intervention, Mileage, Client, Activity
+from app.models import Invoice, Intervention, Mileage, Client, Activity, InvoiceSendJob
+from app.utils.invoice_batch import generate_invoices_for_period
+from app.utils.invoice_send import serialize_job, start_send_job
+from app.utils.pdf_cache import invalidate_invoice
+from app.utils.rollups import mark_dirty as mark_rollups_dirty
 
 
 def _serialize_invoice(inv: Invoice):
@@ -19,10 +24,34 @@ def _serialize_invoice(inv: Invoice):
         'total_cost': float(inv.total_cost or 0),
         'status': inv.status,
         'paid_date': inv.paid_date.isoformat() if inv.paid_date else None,
-        'payment_comments': inv.payment_comments
+        'payment_comments': inv.payment_comments,
+        'amount_paid': float(inv.amount_paid or 0),
+        'amount_pending': float(inv.amount_pending or 0),
+        'payment_state': inv.payment_state
     }
 
 
+# fields selectable with ?fields= (same formatting as _serialize_invoice)
+_FIELDS = {
+    'id': (Invoice.id, same),
+    'invoice_number': (Invoice.invoice_number, same),
+    'client_id': (Invoice.client_id, same),
+    'invoiced_date': (Invoice.invoiced_date, iso),
+    'payby_date': (Invoice.payby_date, iso),
+    'date_from': (Invoice.date_from, iso),
+    'date_to': (Invoice.date_to, iso),
+    'invoice_items': (Invoice.invoice_items, lambda v: json.loads(v) if v else []),
+    'total_cost': (Invoice.total_cost, lambda v: float(v or 0)),
+    'status': (Invoice.status, same),
+    'paid_date': (Invoice.paid_date, iso),
+    'payment_comments': (Invoice.payment_comments, same),
+    'amount_paid': (Invoice.amount_paid, lambda v: float(v or 0)),
+    'amount_pending': (Invoice.amount_pending, lambda v: float(v or 0)),
+    'payment_state': (Invoice.payment_state, same),
+    'updated_at': (Invoice.updated_at, iso),
+}
+
+
 def _require_admin():
     if g.current_user.user_type not in ['admin', 'super']:
         return jsonify({'error': 'admin access required'}), 403
@@ -45,8 +74,16 @@ def list_invoices():
     admin_check = _require_admin()
     if admin_check:
         return admin_check
-    invs = Invoice.query.order_by(Invoice.invoiced_date.desc()).limit(200).all()
-    return jsonify([_serialize_invoice(i) for i in invs])
+
+    filters = []
+    if request.args.get('payment_state'):
+        filters.append(Invoice.payment_state == request.args['payment_state'])
+    if request.args.get('min_pending'):
+        try:
+            filters.append(Invoice.amount_pending >= float(request.args['min_pending']))
+        except ValueError:
+            return jsonify({'error': 'min_pending must be numeric'}), 400
+    return list_page(Invoice, Invoice.invoiced_date, _FIELDS, _serialize_invoice, filters=filters)
 
 
 @api_bp.route('/invoices/<string:invoice_number>', methods=['GET'])
@@ -163,6 +200,72 @@ def create_invoice():
     return jsonify(_serialize_invoice(invoice)), 201
 
 
+@api_bp.route('/invoices/generate', methods=['POST'])
+@token_required
+def generate_invoices():
+    admin_check = _require_admin()
+    if admin_check:
+        return admin_check
+
+    data = request.get_json() or {}
+    try:
+        date_from = date.fromisoformat(data.get('date_from'))
+        date_to = date.fromisoformat(data.get('date_to'))
+    except Exception:
+        return jsonify({'error': 'date_from and date_to must be YYYY-MM-DD'}), 400
+    if date_to < date_from:
+        return jsonify({'error': 'date_to must not be before date_from'}), 400
+
+    client_ids = data.get('client_ids') or None
+    if client_ids is not None and not isinstance(client_ids, list):
+        return jsonify({'error': 'client_ids must be a list'}), 400
+
+    results = generate_invoices_for_period(
+        date_from, date_to,
+        client_ids=client_ids,
+        render_pdfs=bool(data.get('render_pdfs', True)),
+        dry_run=bool(data.get('dry_run', False))
+    )
+    return jsonify({
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'created': sum(1 for r in results if r['invoice_number']),
+        'failed': sum(1 for r in results if r['error']),
+        'results': results
+    }), 200
+
+
+@api_bp.route('/invoices/send_drafts', methods=['POST'])
+@token_required
+def send_draft_invoices():
+    admin_check = _require_admin()
+    if admin_check:
+        return admin_check
+
+    data = request.get_json() or {}
+    try:
+        date_from = date.fromisoformat(data.get('date_from'))
+        date_to = date.fromisoformat(data.get('date_to'))
+    except Exception:
+        return jsonify({'error': 'date_from and date_to must be YYYY-MM-DD'}), 400
+    if date_to < date_from:
+        return jsonify({'error': 'date_to must not be before date_from'}), 400
+
+    job, created = start_send_job(date_from, date_to, requested_by=getattr(g.current_user, 'id', None))
+    if not created:
+        return jsonify({'error': 'a send job is already running', 'job': serialize_job(job)}), 409
+    return jsonify(serialize_job(job)), 202
+
+
+@api_bp.route('/invoices/send_jobs/<int:job_id>', methods=['GET'])
+@token_required
+def get_send_job(job_id):
+    admin_check = _require_admin()
+    if admin_check:
+        return admin_check
+    return jsonify(serialize_job(db.get_or_404(InvoiceSendJob, job_id))), 200
+
+
 @api_bp.route('/invoices/<string:invoice_number>', methods=['PUT'])
 @token_required
 def update_invoice(invoice_number):
@@ -226,6 +329,7 @@ def delete_invoice(invoice_number):
     intervention_ids.update(i.id for i in linked_interventions)
 
     if intervention_ids:
+        mark_rollups_dirty(intervention_ids=intervention_ids)
         Intervention.query.filter(Intervention.id.in_(intervention_ids)).update(
             {
                 Intervention.invoiced: False,
@@ -244,4 +348,5 @@ def delete_invoice(invoice_number):
 
     db.session.delete(invoice)
     db.session.commit()
+    invalidate_invoice(invoice_number)
     return jsonify({'status': 'deleted'})
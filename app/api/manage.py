@@ -2,6 +2,9 @@ from flask import request, jsonify, g
 from . import api_bp, token_required
 from app import db
 from app.models import Designation, Activity, AppSettings, Employee, Intervention
+from app.utils.pdf_cache import clear_pdf_cache
+from app.utils.pdf_render import get_render_service
+from app.utils.settings_utils import bump_settings_version
 
 
 def _serialize_designation(d: Designation):
@@ -179,4 +182,15 @@ def update_settings():
 
     db.session.add(settings)
     db.session.commit()
+    bump_settings_version()
+    clear_pdf_cache()
     return jsonify(_serialize_settings(settings))
+
+
+@api_bp.route('/manage/pdf_render', methods=['GET'])
+@token_required
+def pdf_render_stats():
+    admin_check = _require_admin()
+    if admin_check:
+        return admin_check
+    return jsonify(get_render_service().stats())
@@ -1,5 +1,6 @@
 from flask import request, jsonify, g
 from . import api_bp, token_required
+from .paging import as_bool, as_float, iso, list_page, same
 from app import db
 from app.models import Mileage, MileageRate
 from datetime import date
@@ -21,6 +22,23 @@ def _serialize_mileage(m: Mileage):
     }
 
 
+# fields selectable with ?fields= (same formatting as _serialize_mileage)
+_FIELDS = {
+    'id': (Mileage.id, same),
+    'employee_id': (Mileage.employee_id, same),
+    'client_id': (Mileage.client_id, same),
+    'date': (Mileage.date, iso),
+    'distance': (Mileage.distance, as_float),
+    'description': (Mileage.description, same),
+    'mileage_rate_id': (Mileage.mileage_rate_id, same),
+    'cost': (Mileage.cost, as_float),
+    'invoice_number': (Mileage.invoice_number, same),
+    'invoiced': (Mileage.invoiced, as_bool),
+    'is_paid': (Mileage.is_paid, as_bool),
+    'updated_at': (Mileage.updated_at, iso),
+}
+
+
 def _serialize_rate(r: MileageRate):
     return {
         'id': r.id,
@@ -39,8 +57,7 @@ def _require_admin():
 @api_bp.route('/mileages', methods=['GET'])
 @token_required
 def list_mileages():
-    ms = Mileage.query.order_by(Mileage.date.desc()).limit(200).all()
-    return jsonify([_serialize_mileage(m) for m in ms])
+    return list_page(Mileage, Mileage.date, _FIELDS, _serialize_mileage)
 
 
 @api_bp.route('/mileages/<int:mileage_id>', methods=['GET'])
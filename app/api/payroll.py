@@ -1,8 +1,15 @@
 from flask import request, jsonify, g
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 from . import api_bp, token_required
+from .paging import as_bool, as_float, iso, list_page, same
 from app import db
-from app.models import PayRate, PayStub, PayStubItem, Employee
+from app.models import PayRate, PayStub, PayStubItem, Employee, Intervention
 from datetime import date
+from app.utils.payrates import PayRateResolver
+from app.utils.payroll_run import run_payroll_for_period
+from app.utils.pdf_cache import invalidate_paystub
+from app.utils.rollups import mark_dirty as mark_rollups_dirty
 
 
 def _serialize_payrate(p: PayRate):
@@ -41,6 +48,42 @@ def _serialize_paystub(s: PayStub):
     }
 
 
+# fields selectable with ?fields= (same formatting as the serializers above)
+_PAYRATE_FIELDS = {
+    'id': (PayRate.id, same),
+    'employee_id': (PayRate.employee_id, same),
+    'client_id': (PayRate.client_id, same),
+    'rate': (PayRate.rate, as_float),
+    'effective_date': (PayRate.effective_date, iso),
+    'updated_at': (PayRate.updated_at, iso),
+}
+
+_PAYSTUB_FIELDS = {
+    'id': (PayStub.id, same),
+    'employee_id': (PayStub.employee_id, same),
+    'period_start': (PayStub.period_start, iso),
+    'period_end': (PayStub.period_end, iso),
+    'generated_date': (PayStub.generated_date, iso),
+    'total_hours': (PayStub.total_hours, as_float),
+    'total_amount': (PayStub.total_amount, as_float),
+    'notes': (PayStub.notes, same),
+    'email_sent': (PayStub.email_sent, as_bool),
+    'updated_at': (PayStub.updated_at, iso),
+}
+
+# rates without an effective date sort as the oldest
+_PAYRATE_KEY_DATE = func.coalesce(PayRate.effective_date, date(1900, 1, 1))
+
+
+def _set_sessions_paid(intervention_ids, paid):
+    """Keep Intervention.is_paid in step with paystub items."""
+    intervention_ids = [i for i in intervention_ids if i is not None]
+    if intervention_ids:
+        Intervention.query.filter(Intervention.id.in_(intervention_ids)).update(
+            {Intervention.is_paid: paid}, synchronize_session=False
+        )
+
+
 def _require_admin():
     if g.current_user.user_type not in ['admin', 'super']:
         return jsonify({'error': 'admin access required'}), 403
@@ -53,8 +96,7 @@ def list_payrates():
     admin_check = _require_admin()
     if admin_check:
         return admin_check
-    rates = PayRate.query.order_by(PayRate.effective_date.desc()).limit(200).all()
-    return jsonify([_serialize_payrate(r) for r in rates])
+    return list_page(PayRate, _PAYRATE_KEY_DATE, _PAYRATE_FIELDS, _serialize_payrate)
 
 
 @api_bp.route('/payrates/<int:rate_id>', methods=['GET'])
@@ -140,11 +182,11 @@ def delete_payrate(rate_id):
 @api_bp.route('/paystubs', methods=['GET'])
 @token_required
 def list_paystubs():
-    if g.current_user.user_type in ['admin', 'super']:
-        stubs = PayStub.query.order_by(PayStub.generated_date.desc()).limit(200).all()
-    else:
-        stubs = PayStub.query.filter_by(employee_id=g.current_user.id).order_by(PayStub.generated_date.desc()).limit(200).all()
-    return jsonify([_serialize_paystub(s) for s in stubs])
+    filters = []
+    if g.current_user.user_type not in ['admin', 'super']:
+        filters.append(PayStub.employee_id == g.current_user.id)
+    return list_page(PayStub, PayStub.generated_date, _PAYSTUB_FIELDS, _serialize_paystub,
+                     filters=filters, options=[selectinload(PayStub.items)])
 
 
 @api_bp.route('/paystubs/<int:stub_id>', methods=['GET'])
@@ -178,6 +220,19 @@ def create_paystub():
     except Exception:
         return jsonify({'error': 'invalid paystub date or numeric fields'}), 400
 
+    items = data.get('items') or []
+
+    # items may omit rate/amount; they are then resolved from the employee's
+    # pay rates with the same rules the payroll screen uses
+    unrated_ids = [item.get('intervention_id') for item in items if item.get('rate') is None]
+    resolved_rates = {}
+    if unrated_ids:
+        sessions = Intervention.query.filter(Intervention.id.in_(unrated_ids)).all()
+        resolved_rates = PayRateResolver.for_employees({s.employee_id for s in sessions}).resolve_sessions(sessions)
+        missing = [i for i in unrated_ids if resolved_rates.get(i) is None]
+        if missing:
+            return jsonify({'error': 'missing pay rate for interventions', 'intervention_ids': missing}), 400
+
     paystub = PayStub(
         employee_id=data.get('employee_id'),
         period_start=period_start,
@@ -191,22 +246,61 @@ def create_paystub():
     db.session.add(paystub)
     db.session.flush()
 
-    items = data.get('items') or []
     for item in items:
+        rate = item.get('rate')
+        rate = float(rate) if rate is not None else resolved_rates[item.get('intervention_id')]
+        hours = float(item.get('hours', 0))
+        amount = item.get('amount')
         paystub_item = PayStubItem(
             paystub_id=paystub.id,
             intervention_id=item.get('intervention_id'),
             client_id=item.get('client_id'),
-            rate=float(item.get('rate', 0)),
-            hours=float(item.get('hours', 0)),
-            amount=float(item.get('amount', 0))
+            rate=rate,
+            hours=hours,
+            amount=float(amount) if amount is not None else round(rate * hours, 2)
         )
         db.session.add(paystub_item)
+    _set_sessions_paid([item.get('intervention_id') for item in items], True)
 
     db.session.commit()
     return jsonify(_serialize_paystub(paystub)), 201
 
 
+@api_bp.route('/payroll/run', methods=['POST'])
+@token_required
+def run_payroll():
+    admin_check = _require_admin()
+    if admin_check:
+        return admin_check
+
+    data = request.get_json() or {}
+    try:
+        period_start = date.fromisoformat(data.get('period_start'))
+        period_end = date.fromisoformat(data.get('period_end'))
+    except Exception:
+        return jsonify({'error': 'period_start and period_end must be YYYY-MM-DD'}), 400
+    if period_end < period_start:
+        return jsonify({'error': 'period_end must not be before period_start'}), 400
+
+    employee_ids = data.get('employee_ids') or None
+    if employee_ids is not None and not isinstance(employee_ids, list):
+        return jsonify({'error': 'employee_ids must be a list'}), 400
+
+    result = run_payroll_for_period(
+        period_start, period_end,
+        employee_ids=employee_ids,
+        dry_run=bool(data.get('dry_run', False)),
+        render_pdfs=bool(data.get('render_pdfs', True))
+    )
+    return jsonify({
+        'period_start': period_start.isoformat(),
+        'period_end': period_end.isoformat(),
+        'paystubs': result['paystubs'],
+        'missing_rates': result['missing_rates'],
+        'pdfs': result['pdfs']
+    }), 200
+
+
 @api_bp.route('/paystubs/<int:stub_id>', methods=['PUT'])
 @token_required
 def update_paystub(stub_id):
@@ -249,7 +343,11 @@ def update_paystub(stub_id):
         paystub.email_sent = bool(data.get('email_sent'))
 
     if 'items' in data:
+        previous_ids = [i.intervention_id for i in PayStubItem.query.filter_by(paystub_id=paystub.id).all()]
         PayStubItem.query.filter_by(paystub_id=paystub.id).delete()
+        mark_rollups_dirty(intervention_ids=previous_ids)
+        _set_sessions_paid(previous_ids, False)
+        _set_sessions_paid([item.get('intervention_id') for item in data.get('items', [])], True)
         for item in data.get('items', []):
             paystub_item = PayStubItem(
                 paystub_id=paystub.id,
@@ -262,6 +360,9 @@ def update_paystub(stub_id):
             db.session.add(paystub_item)
 
     db.session.commit()
+    if 'items' in data:
+        # the PDF fingerprint would miss the old renders anyway; free their space now
+        invalidate_paystub(paystub.id)
     return jsonify(_serialize_paystub(paystub))
 
 
@@ -272,6 +373,8 @@ def delete_paystub(stub_id):
     if admin_check:
         return admin_check
     paystub = PayStub.query.get_or_404(stub_id)
+    _set_sessions_paid([item.intervention_id for item in paystub.items], False)
     db.session.delete(paystub)
     db.session.commit()
+    invalidate_paystub(stub_id)
     return jsonify({'status': 'deleted'})
@@ -1,4 +1,4 @@
-from flask import current_app, request, jsonify
+from flask import request, jsonify
 from flask_login import current_user, login_required
 from . import api_bp, token_required
 
@@ -223,30 +223,14 @@ def delete_service_account():
 @api_bp.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
 @token_required
 def proxy(path):
-    """Proxy requests to the same web route and return the rendered HTML inside JSON.
+    """Serve the web route at the same URL and return its response inside JSON.
 
-    This mirrors web URLs under `/api/...` by internally dispatching the request
-    to the application and returning a JSON payload containing the original
-    response body (usually HTML). This is a pragmatic first step to mirror all
-    web URLs without re-implementing every view as JSON endpoints.
+    This mirrors web URLs under `/api/...` by calling the matching view in
+    this request, as the token's user, and returning a JSON payload with the
+    status code and the response body (usually HTML). Clients sending
+    `Accept: application/json` get the view's template context instead of
+    the rendered HTML.
     """
-    # Reconstruct target path
-    target = '/' + path
-    # Use test_client to perform an internal request to the app
-    client = current_app.test_client()
-
-    # prepare kwargs for client.open
-    kwargs = {}
-    if request.query_string:
-        kwargs['query_string'] = request.query_string
-    if request.data:
-        kwargs['data'] = request.get_data()
-    headers = {}
-    # forward form/content-type headers
-    if request.content_type:
-        headers['Content-Type'] = request.content_type
-    # call internal client
-    resp = client.open(target, method=request.method, headers=headers, **kwargs)
-
-    content = resp.get_data(as_text=True)
-    return jsonify({'status_code': resp.status_code, 'content': content}), resp.status_code
+    from app.utils.direct_dispatch import dispatch, wants_context
+    payload, status = dispatch(path, as_context=wants_context())
+    return jsonify(payload), status
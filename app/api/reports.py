@@ -1,6 +1,8 @@
 from flask import request, jsonify, g
 from . import api_bp, token_required
+from .paging import as_bool, as_float, hhmm, iso
 from app.models import Employee, Client, Intervention, Invoice, PayStub
+from app.utils.report_export import FORMATS, invoice_rows, paystub_rows, session_rows, stream_csv, stream_ndjson
 from datetime import date
 
 
@@ -67,7 +69,10 @@ def _serialize_invoice(inv: Invoice):
         'date_to': inv.date_to.isoformat() if inv.date_to else None,
         'total_cost': float(inv.total_cost or 0),
         'status': inv.status,
-        'paid_date': inv.paid_date.isoformat() if inv.paid_date else None
+        'paid_date': inv.paid_date.isoformat() if inv.paid_date else None,
+        'amount_paid': float(inv.amount_paid or 0),
+        'amount_pending': float(inv.amount_pending or 0),
+        'payment_state': inv.payment_state
     }
 
 
@@ -84,6 +89,64 @@ def _serialize_paystub(s: PayStub):
     }
 
 
+# fields of the streamed exports, matching the JSON serializers above
+_SESSION_FIELDS = [
+    ('id', lambda r: r.id),
+    ('client_id', lambda r: r.client_id),
+    ('employee_id', lambda r: r.employee_id),
+    ('intervention_type', lambda r: r.intervention_type),
+    ('date', lambda r: iso(r.date)),
+    ('start_time', lambda r: hhmm(r.start_time)),
+    ('end_time', lambda r: hhmm(r.end_time)),
+    ('duration', lambda r: round(r.duration, 2) if r.duration is not None else None),
+    ('invoiced', lambda r: as_bool(r.invoiced)),
+    ('invoice_number', lambda r: r.invoice_number),
+]
+
+_INVOICE_FIELDS = [
+    ('id', lambda r: r.id),
+    ('invoice_number', lambda r: r.invoice_number),
+    ('client_id', lambda r: r.client_id),
+    ('invoiced_date', lambda r: iso(r.invoiced_date)),
+    ('payby_date', lambda r: iso(r.payby_date)),
+    ('date_from', lambda r: iso(r.date_from)),
+    ('date_to', lambda r: iso(r.date_to)),
+    ('total_cost', lambda r: float(r.total_cost or 0)),
+    ('status', lambda r: r.status),
+    ('paid_date', lambda r: iso(r.paid_date)),
+    ('amount_paid', lambda r: float(r.amount_paid or 0)),
+    ('amount_pending', lambda r: float(r.amount_pending or 0)),
+    ('payment_state', lambda r: r.payment_state),
+]
+
+_PAYSTUB_FIELDS = [
+    ('id', lambda r: r.id),
+    ('employee_id', lambda r: r.employee_id),
+    ('period_start', lambda r: iso(r.period_start)),
+    ('period_end', lambda r: iso(r.period_end)),
+    ('generated_date', lambda r: iso(r.generated_date)),
+    ('total_hours', lambda r: as_float(r.total_hours)),
+    ('total_amount', lambda r: as_float(r.total_amount)),
+    ('email_sent', lambda r: as_bool(r.email_sent)),
+]
+
+
+def _export_format():
+    """Return (format, error): None for the default JSON body, else ndjson/csv."""
+    fmt = request.args.get('format')
+    if not fmt or fmt == 'json':
+        return None, None
+    if fmt not in FORMATS:
+        return None, (jsonify({'error': f"format must be one of json, {', '.join(FORMATS)}"}), 400)
+    return fmt, None
+
+
+def _stream(fmt, rows, fields, name, start, end):
+    if fmt == 'csv':
+        return stream_csv(rows, fields, f'{name}_{start.isoformat()}_{end.isoformat()}.csv')
+    return stream_ndjson(rows, fields)
+
+
 def _require_report_access():
     if not getattr(g.current_user, 'position', None) == 'Administrator':
         return jsonify({'error': 'administrator access required'}), 403
@@ -162,9 +225,17 @@ def sessions_report():
     except Exception:
         return jsonify({'error': 'invalid date format; expected YYYY-MM-DD'}), 400
 
-    query = Intervention.query.filter(Intervention.date >= start, Intervention.date <= end)
+    fmt, error = _export_format()
+    if error:
+        return error
     client_id = request.args.get('client_id')
     employee_id = request.args.get('employee_id')
+    if fmt:
+        rows = session_rows(start, end, client_id=int(client_id) if client_id else None,
+                            employee_id=int(employee_id) if employee_id else None)
+        return _stream(fmt, rows, _SESSION_FIELDS, 'sessions', start, end)
+
+    query = Intervention.query.filter(Intervention.date >= start, Intervention.date <= end)
     if client_id:
         query = query.filter_by(client_id=int(client_id))
     if employee_id:
@@ -189,10 +260,21 @@ def invoices_report():
     except Exception:
         return jsonify({'error': 'invalid date format; expected YYYY-MM-DD'}), 400
 
-    query = Invoice.query.filter(Invoice.invoiced_date >= start, Invoice.invoiced_date <= end)
+    fmt, error = _export_format()
+    if error:
+        return error
     client_id = request.args.get('client_id')
+    payment_state = request.args.get('payment_state') or None
+    if fmt:
+        rows = invoice_rows(start, end, client_id=int(client_id) if client_id else None,
+                            payment_state=payment_state)
+        return _stream(fmt, rows, _INVOICE_FIELDS, 'invoices', start, end)
+
+    query = Invoice.query.filter(Invoice.invoiced_date >= start, Invoice.invoiced_date <= end)
     if client_id:
         query = query.filter_by(client_id=int(client_id))
+    if payment_state:
+        query = query.filter_by(payment_state=payment_state)
 
     results = query.order_by(Invoice.invoiced_date.desc()).all()
     return jsonify({'start_date': start.isoformat(), 'end_date': end.isoformat(), 'invoices': [_serialize_invoice(inv) for inv in results]})
@@ -213,8 +295,15 @@ def paystubs_report():
     except Exception:
         return jsonify({'error': 'invalid date format; expected YYYY-MM-DD'}), 400
 
-    query = PayStub.query.filter(PayStub.generated_date >= start, PayStub.generated_date <= end)
+    fmt, error = _export_format()
+    if error:
+        return error
     employee_id = request.args.get('employee_id')
+    if fmt:
+        rows = paystub_rows(start, end, employee_id=int(employee_id) if employee_id else None)
+        return _stream(fmt, rows, _PAYSTUB_FIELDS, 'paystubs', start, end)
+
+    query = PayStub.query.filter(PayStub.generated_date >= start, PayStub.generated_date <= end)
     if employee_id:
         query = query.filter_by(employee_id=int(employee_id))
 
@@ -1,4 +1,6 @@
-"""Flask CLI commands for invoice reminders."""
+"""Flask CLI commands for invoice reminders, bulk invoicing, payroll runs, dashboard rollups and the email outbox."""
+
+from datetime import date
 
 import click
 from flask.cli import with_appcontext
@@ -12,3 +14,146 @@ def send_invoice_reminders():
     click.echo('Processing invoice reminders...')
     process_invoice_reminders()
     click.echo('Done!')
+
+
+@click.command('generate-invoices')
+@click.option('--from', 'date_from', required=True, help='First day of the billing period (YYYY-MM-DD).')
+@click.option('--to', 'date_to', required=True, help='Last day of the billing period (YYYY-MM-DD).')
+@click.option('--client', 'client_ids', multiple=True, type=int, help='Limit to these client ids (repeatable).')
+@click.option('--no-pdf', is_flag=True, help='Create the invoices without pre-rendering their PDFs.')
+@click.option('--workers', type=int, default=None, help='PDF render processes (defaults to PDF_RENDER_WORKERS or CPU count).')
+@click.option('--dry-run', is_flag=True, help='Only report what would be invoiced.')
+@with_appcontext
+def generate_invoices(date_from, date_to, client_ids, no_pdf, workers, dry_run):
+    """Create Draft invoices for all active clients with uninvoiced work in a period."""
+    from flask import current_app
+    from app.utils.invoice_batch import generate_invoices_for_period
+
+    try:
+        start = date.fromisoformat(date_from)
+        end = date.fromisoformat(date_to)
+    except ValueError:
+        raise click.BadParameter('dates must be YYYY-MM-DD')
+    if end < start:
+        raise click.BadParameter('--to must not be before --from')
+
+    # the PDF template lives in the invoices blueprint, which factory-created
+    # apps don't register
+    if not no_pdf and 'invoices' not in current_app.blueprints:
+        from app.invoices.views import invoices_bp
+        current_app.register_blueprint(invoices_bp, url_prefix='/invoices')
+    if workers:
+        # this command's own render pool
+        current_app.config['PDF_RENDER_WORKERS'] = workers
+
+    results = generate_invoices_for_period(
+        start, end,
+        client_ids=list(client_ids) or None,
+        render_pdfs=not no_pdf,
+        dry_run=dry_run,
+        max_workers=workers
+    )
+    for r in results:
+        if r['error']:
+            click.echo(f"  {r['client_name']}: FAILED - {r['error']}")
+        else:
+            pdf = ' (pdf cached)' if r['pdf_rendered'] else ''
+            click.echo(f"  {r['client_name']}: {r['invoice_number'] or '(dry run)'} "
+                       f"{r['sessions']} session(s), {r['mileages']} mileage, ${r['total_cost']:.2f}{pdf}")
+    created = sum(1 for r in results if r['invoice_number'])
+    failed = sum(1 for r in results if r['error'])
+    click.echo(f'{created} invoice(s) created, {failed} failed, {len(results)} client(s) with activity.')
+
+
+@click.command('run-payroll')
+@click.option('--from', 'date_from', required=True, help='First day of the pay period (YYYY-MM-DD).')
+@click.option('--to', 'date_to', required=True, help='Last day of the pay period (YYYY-MM-DD).')
+@click.option('--employee', 'employee_ids', multiple=True, type=int, help='Limit to these employee ids (repeatable).')
+@click.option('--no-pdf', is_flag=True, help='Save paystubs without rendering their PDFs.')
+@click.option('--workers', type=int, default=None, help='PDF render processes (defaults to PDF_RENDER_WORKERS or CPU count).')
+@click.option('--dry-run', is_flag=True, help='Only report what would be paid.')
+@with_appcontext
+def run_payroll(date_from, date_to, employee_ids, no_pdf, workers, dry_run):
+    """Create paystubs for all active employees for a pay period."""
+    from flask import current_app
+    from app.utils.payroll_run import run_payroll_for_period
+
+    try:
+        start = date.fromisoformat(date_from)
+        end = date.fromisoformat(date_to)
+    except ValueError:
+        raise click.BadParameter('dates must be YYYY-MM-DD')
+    if end < start:
+        raise click.BadParameter('--to must not be before --from')
+
+    # the PDF template lives in the payroll blueprint, which factory-created
+    # apps don't register
+    if not no_pdf and 'payroll' not in current_app.blueprints:
+        from app.payroll.views import payroll_bp
+        current_app.register_blueprint(payroll_bp, url_prefix='/payroll')
+    if workers:
+        # this command's own render pool
+        current_app.config['PDF_RENDER_WORKERS'] = workers
+
+    result = run_payroll_for_period(
+        start, end,
+        employee_ids=list(employee_ids) or None,
+        dry_run=dry_run,
+        render_pdfs=not no_pdf,
+        max_workers=workers
+    )
+    for p in result['paystubs']:
+        pdf = p['paystub_id'] in result['pdfs']
+        click.echo(f"  {p['employee_name']}: paystub {p['paystub_id'] or '(dry run)'} "
+                   f"{p['total_hours']:.2f}h, ${p['total_amount']:.2f}{', PDF cached' if pdf else ''}")
+    for m in result['missing_rates']:
+        click.echo(f"  {m['employee_name']}: SKIPPED - missing pay rates for client(s) "
+                   f"{', '.join(str(c) for c in m['client_ids']) or '(none)'} "
+                   f"({len(m['intervention_ids'])} session(s))")
+    click.echo(f"{len(result['paystubs'])} paystub(s), {len(result['missing_rates'])} employee(s) skipped for missing rates.")
+
+
+@click.command('rebuild-rollups')
+@click.option('--from', 'date_from', default=None, help='First session date to rebuild (YYYY-MM-DD); defaults to the earliest.')
+@click.option('--to', 'date_to', default=None, help='Last session date to rebuild (YYYY-MM-DD); defaults to the latest.')
+@click.option('--if-empty', is_flag=True, help='Do nothing if daily_rollups already has rows (for container start-up).')
+@with_appcontext
+def rebuild_rollups(date_from, date_to, if_empty):
+    """Recompute the daily_rollups dashboard table from sessions, invoices and paystubs."""
+    from app import db
+    from app.models import DailyRollup
+    from app.utils.rollups import rebuild_rollups as rebuild
+
+    try:
+        start = date.fromisoformat(date_from) if date_from else None
+        end = date.fromisoformat(date_to) if date_to else None
+    except ValueError:
+        raise click.BadParameter('dates must be YYYY-MM-DD')
+    if start and end and end < start:
+        raise click.BadParameter('--to must not be before --from')
+
+    if if_empty and db.session.query(DailyRollup.id).first() is not None:
+        click.echo('daily_rollups already populated; skipping.')
+        return
+
+    written = rebuild(start, end)
+    click.echo(f'{written} daily rollup row(s) written.')
+
+
+@click.command('send-email-outbox')
+@click.option('--workers', type=int, default=None, help='Concurrent sends (defaults to EMAIL_SEND_WORKERS).')
+@click.option('--loop', is_flag=True, help='Keep running, polling for due and retried messages (a separate worker process).')
+@with_appcontext
+def send_email_outbox(workers, loop):
+    """Send the queued emails that are due."""
+    import time
+    from flask import current_app
+    from app.utils.email_outbox import drain
+
+    while True:
+        totals = drain(max_workers=workers)
+        if totals['claimed'] or not loop:
+            click.echo(f"{totals['sent']} sent, {totals['retried']} to retry, {totals['failed']} failed.")
+        if not loop:
+            return
+        time.sleep(int(current_app.config.get('EMAIL_OUTBOX_POLL_SECONDS') or 30))
@@ -220,8 +220,8 @@ def list_clients():
 
                 def compute_stats(invoice_list):
                     invoiced = round(sum([inv.total_cost or 0.0 for inv in invoice_list]), 2)
-                    paid = round(sum([inv.total_cost or 0.0 for inv in invoice_list if inv.status and inv.status.lower() == 'paid']), 2)
-                    pending = round(max(invoiced - paid, 0.0), 2)
+                    paid = round(sum([inv.amount_paid or 0.0 for inv in invoice_list]), 2)
+                    pending = round(sum([inv.amount_pending or 0.0 for inv in invoice_list]), 2)
                     return invoiced, paid, pending
 
                 today = date.today()
@@ -336,8 +336,8 @@ def client_info(client_id):
 
         def compute_stats(invoice_list):
             invoiced = round(sum([inv.total_cost or 0.0 for inv in invoice_list]), 2)
-            paid = round(sum([inv.total_cost or 0.0 for inv in invoice_list if inv.status and inv.status.lower() == 'paid']), 2)
-            pending = round(max(invoiced - paid, 0.0), 2)
+            paid = round(sum([inv.amount_paid or 0.0 for inv in invoice_list]), 2)
+            pending = round(sum([inv.amount_pending or 0.0 for inv in invoice_list]), 2)
             return invoiced, paid, pending
 
         today = date.today()
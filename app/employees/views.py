@@ -218,6 +218,7 @@ def reactivate_employee(employee_id):
             body_text = render_template('email/activation_email.txt', firstname=employee.firstname, activation_key=activation_key, org_name=settings['org_name'])
             body_html = render_template('email/activation_email.html', firstname=employee.firstname, activation_key=activation_key, org_name=settings['org_name'])
             queue_email(subject=subject, recipients=employee.email, body_text=body_text, body_html=body_html)
+            db.session.commit()
             flash('Employee has been prepared for reactivation. Activation key emailed to user.', 'info')
         except Exception:
             flash(f'Employee has been prepared for reactivation. Please provide them with the activation code: {activation_key}', 'info')
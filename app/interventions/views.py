@@ -1,13 +1,17 @@
-from flask import Blueprint, render_template, redirect, url_for, request, abort, flash, send_from_directory
+from flask import Blueprint, render_template, redirect, url_for, request, abort, flash, send_from_directory, jsonify
 from app import db, app, allowed_file
-from app.models import Intervention, Client, Employee, Activity, PayStubItem
+from app.models import Intervention, Client, Employee, Activity, PayStubItem, SessionImportJob
 from app.interventions.forms import AddInterventionForm, UpdateInterventionForm
 from flask_login import login_required, current_user
 import os
 from app.utils.settings_utils import get_org_settings
+from app.utils.session_overlaps import SessionOverlapChecker
+from app.utils.calendar_feed import load_events, load_events_uncached, parse_calendar_date
+from app.utils import session_import
 import json
 from werkzeug.utils import secure_filename
 import shutil
+import tempfile
 from datetime import datetime
 import csv
 import io
@@ -103,6 +107,19 @@ def add_intervention():
                 session_count = 0
                 error_count = 0
                 
+                # Load the employee's existing sessions on every submitted date in one
+                # query; rows accepted below are added so later rows are checked
+                # against them too
+                overlap_checker = SessionOverlapChecker()
+                submitted_dates = set()
+                for key, value in request.form.items():
+                    if key.startswith('session_date_'):
+                        try:
+                            submitted_dates.add(datetime.strptime(value.strip(), '%Y-%m-%d').date())
+                        except ValueError:
+                            pass
+                overlap_checker.preload((int(employee_id), d) for d in submitted_dates)
+                
                 # Find all session rows submitted
                 row_index = 0
                 while True:
@@ -142,12 +159,7 @@ def add_intervention():
                             continue
                         
                         # Check for overlapping sessions
-                        if Intervention.has_overlap(
-                            employee_id=int(employee_id),
-                            date=session_date,
-                            start_time=start_time,
-                            end_time=end_time
-                        ):
+                        if overlap_checker.overlaps(int(employee_id), session_date, start_time, end_time):
                             employee = Employee.query.get(int(employee_id))
                             flash(f'Row {row_index + 1}: Schedule conflict - {employee.firstname} {employee.lastname} already has a session scheduled during {session_date.strftime("%Y-%m-%d")} {start_time.strftime("%H:%M")} - {end_time.strftime("%H:%M")}.', 'warning')
                             error_count += 1
@@ -217,6 +229,7 @@ def add_intervention():
                         )
                         
                         db.session.add(new_intervention)
+                        overlap_checker.add(int(employee_id), session_date, start_time, end_time)
                         session_count += 1
                         
                     except Exception as e:
@@ -687,104 +700,52 @@ def calendar_events():
             mimetype='application/json'
         )
     
-    # Build query based on view_type
-    query = Intervention.query.join(Client).join(Employee)
-    
-    if view_type == 'client':
-        query = query.filter(Intervention.client_id == entity_id)
-    elif view_type == 'employee':
-        query = query.filter(Intervention.employee_id == entity_id)
-    
-    # Apply role-based filters
+    # Role-based visibility; the scope is part of the cache key
+    scope = ('all',)
+    scope_filters = []
     if current_user.user_type == 'therapist':
         emp = Employee.query.filter_by(email=current_user.email).first()
         if emp:
-            query = query.filter(Intervention.employee_id == emp.id)
+            scope = ('therapist', emp.id)
+            scope_filters.append(Intervention.employee_id == emp.id)
     elif current_user.user_type == 'supervisor':
         emp = Employee.query.filter_by(email=current_user.email).first()
         if emp:
+            scope = ('supervisor', emp.id)
             if view_type == 'client':
-                query = query.filter(Client.supervisor_id == emp.id)
+                scope_filters.append(Client.supervisor_id == emp.id)
             else:
                 # For employee view, allow viewing own and supervised employees
-                supervised_client_ids = [c.id for c in Client.query.filter_by(supervisor_id=emp.id).all()]
-                query = query.filter(
+                supervised_client_ids = [c.id for (c,) in db.session.query(Client.id).filter_by(supervisor_id=emp.id)]
+                scope_filters.append(
                     db.or_(
                         Intervention.employee_id == emp.id,
                         Intervention.client_id.in_(supervised_client_ids)
                     )
                 )
     
-    # Filter by date range if provided
-    if start:
-        query = query.filter(Intervention.date >= start)
-    if end:
-        query = query.filter(Intervention.date < end)
-    
-    interventions = query.all()
-    
-    # Convert to calendar events
-    events = []
-    for intv in interventions:
-        # Combine date and time for start/end
-        start_datetime = f"{intv.date}T{intv.start_time}"
-        end_datetime = f"{intv.date}T{intv.end_time}"
-        
-        # Format times for display
-        start_time_formatted = intv.start_time.strftime('%I:%M %p').lstrip('0')
-        end_time_formatted = intv.end_time.strftime('%I:%M %p').lstrip('0')
-        time_range = f"{start_time_formatted} - {end_time_formatted}"
-        
-        # Create title with time on first line, details on second line
-        if view_type == 'client':
-            details = f"{intv.employee.firstname} {intv.employee.lastname} - {intv.intervention_type}"
-        else:  # employee view
-            details = f"{intv.client.firstname} {intv.client.lastname} - {intv.intervention_type}"
-        
-        title = f"{time_range}<br>{details}"
-        
-        # Determine color based on invoice status
-        if intv.invoice:
-            inv_status = intv.invoice.status
-            if inv_status == 'Draft':
-                bg_color = '#0dcaf0'  # Bootstrap info color
-                class_name = 'invoice-draft'
-            elif inv_status == 'Sent':
-                bg_color = '#d48717'  # Bootstrap warning color
-                class_name = 'invoice-sent'
-            elif inv_status == 'Paid':
-                bg_color = '#606e30'  # Bootstrap success color
-                class_name = 'invoice-paid'
-            else:
-                bg_color = '#6c757d'  # Bootstrap secondary color
-                class_name = 'invoice-other'
-        else:
-            bg_color = '#6c757d'  # Bootstrap secondary color for not invoiced
-            class_name = 'not-invoiced'
-        
-        events.append({
-            'id': intv.id,
-            'title': title,
-            'start': start_datetime,
-            'end': end_datetime,
-            'backgroundColor': bg_color,
-            'borderColor': bg_color,
-            'textColor': '#ffffff',
-            'className': class_name,
-            'extendedProps': {
-                'client': f"{intv.client.firstname} {intv.client.lastname}",
-                'employee': f"{intv.employee.firstname} {intv.employee.lastname}",
-                'type': intv.intervention_type,
-                'duration': intv.duration,
-                'invoiced': intv.invoiced
-            }
-        })
+    date_from = parse_calendar_date(start)
+    date_to = parse_calendar_date(end)
+    if view_type not in ('client', 'employee') or not date_from or not date_to or date_to <= date_from:
+        # open-ended or unusual requests are answered directly, without caching
+        return app.response_class(
+            response=load_events_uncached(view_type, entity_id, scope_filters, date_from, date_to),
+            status=200,
+            mimetype='application/json'
+        )
     
-    return app.response_class(
-        response=json.dumps(events),
+    events_json, etag, last_modified = load_events(view_type, entity_id, scope, scope_filters, date_from, date_to)
+    response = app.response_class(
+        response=events_json,
         status=200,
         mimetype='application/json'
     )
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # let the browser keep the feed but revalidate it on every navigation
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @interventions_bp.route('/get_activities/<int:employee_id>')
@@ -857,143 +818,78 @@ def bulk_upload():
             flash('Only CSV files are allowed.', 'danger')
             return redirect(url_for('interventions.list_interventions'))
         
-        # Read CSV
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 since row 1 is header
-            try:
-                # Parse row
-                client_name = row.get('Client Name', '').strip()
-                employee_name = row.get('Employee Name', '').strip()
-                intervention_type = row.get('Intervention Type', '').strip()
-                date_str = row.get('Date', '').strip()
-                start_time_str = row.get('Start Time', '').strip()
-                end_time_str = row.get('End Time', '').strip()
-                
-                # Validate required fields
-                if not all([client_name, employee_name, intervention_type, date_str, start_time_str, end_time_str]):
-                    raise ValueError("Missing required fields")
-                
-                # Parse date and times
-                try:
-                    date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    start_time = datetime.strptime(start_time_str, '%H:%M').time()
-                    end_time = datetime.strptime(end_time_str, '%H:%M').time()
-                except ValueError:
-                    raise ValueError("Invalid date or time format")
-                
-                # Calculate duration
-                start_dt = datetime.combine(date, start_time)
-                end_dt = datetime.combine(date, end_time)
-                if end_dt <= start_dt:
-                    raise ValueError("End time must be after start time")
-                duration = (end_dt - start_dt).total_seconds() / 3600
-                
-                # Find client
-                name_parts = client_name.split()
-                if len(name_parts) < 2:
-                    raise ValueError("Client name must have at least first and last name")
-                
-                client = None
-                # Try different ways to split the name for matching
-                for i in range(1, len(name_parts)):
-                    potential_firstname = ' '.join(name_parts[:i])
-                    potential_lastname = ' '.join(name_parts[i:])
-                    client = Client.query.filter(
-                        db.func.lower(Client.firstname) == potential_firstname.lower(),
-                        db.func.lower(Client.lastname) == potential_lastname.lower(),
-                        Client.is_active == True
-                    ).first()
-                    if client:
-                        break
-                
-                if not client:
-                    raise ValueError(f"Client '{client_name}' not found or inactive")
-                
-                # Find employee
-                emp_parts = employee_name.split()
-                if len(emp_parts) < 2:
-                    raise ValueError("Employee name must have at least first and last name")
-                
-                employee = None
-                # Try different ways to split the name for matching
-                for i in range(1, len(emp_parts)):
-                    potential_firstname = ' '.join(emp_parts[:i])
-                    potential_lastname = ' '.join(emp_parts[i:])
-                    employee = Employee.query.filter(
-                        db.func.lower(Employee.firstname) == potential_firstname.lower(),
-                        db.func.lower(Employee.lastname) == potential_lastname.lower(),
-                        Employee.is_active == True
-                    ).first()
-                    if employee:
-                        break
-                
-                if not employee:
-                    raise ValueError(f"Employee '{employee_name}' not found or inactive")
-                
-                # Check intervention type exists and matches employee position
-                intervention_type_clean = ' '.join(intervention_type.strip().split())  # Normalize whitespace and strip
-                activity = Activity.query.filter(
-                    Activity.activity_name.ilike(intervention_type_clean)
-                ).first()
-                if not activity:
-                    # Get all available activities for better error message
-                    all_activities = [a.activity_name for a in Activity.query.all()]
-                    raise ValueError(f"Intervention type '{intervention_type}' not found. Available types: {', '.join(all_activities)}")
-                
-                # Check if activity category matches employee position
-                if employee.position.lower() == 'behaviour analyst' and activity.activity_category.lower() not in ['supervision', 'therapy']:
-                    raise ValueError(f"Behaviour Analyst can only perform Supervision or Therapy activities")
-                elif employee.position.lower() in ['therapist', 'senior therapist'] and activity.activity_category.lower() != 'therapy':
-                    raise ValueError(f"{employee.position} can only perform Therapy activities")
-                
-                # Check permissions based on user type
-                if current_user.user_type == 'supervisor':
-                    emp = Employee.query.filter_by(email=current_user.email).first()
-                    if not emp or client.supervisor_id != emp.id:
-                        raise ValueError("Supervisor can only upload sessions for their clients")
-                
-                # Check for overlapping sessions
-                if Intervention.has_overlap(employee.id, date, start_time, end_time):
-                    raise ValueError(f"Schedule conflict for {employee_name} on {date_str}")
-                
-                # Create intervention
-                new_intervention = Intervention(
-                    client_id=client.id,
-                    employee_id=employee.id,
-                    intervention_type=activity.activity_name,
-                    date=date,
-                    start_time=start_time,
-                    end_time=end_time,
-                    duration=round(duration, 2),
-                    invoiced=False,
-                    invoice_number=None,
-                    file_names=json.dumps([])
-                )
-                
-                db.session.add(new_intervention)
-                success_count += 1
-                
-            except Exception as e:
-                error_msg = f"Row {row_num}: {str(e)}"
-                errors.append(error_msg)
-                error_count += 1
-                if not skip_errors:
-                    db.session.rollback()
-                    flash(f'Error processing row {row_num}: {str(e)}', 'danger')
-                    return redirect(url_for('interventions.list_interventions'))
-        
-        if success_count > 0:
-            db.session.commit()
-            flash(f'Successfully uploaded {success_count} sessions.', 'success')
-        if error_count > 0:
-            flash(f'Failed to process {error_count} rows: ' + '; '.join(errors[:5]), 'warning')  # Show first 5 errors
-        
+        supervisor_id = None
+        if current_user.user_type == 'supervisor':
+            emp = Employee.query.filter_by(email=current_user.email).first()
+            if not emp:
+                flash('Supervisor can only upload sessions for their clients.', 'danger')
+                return redirect(url_for('interventions.list_interventions'))
+            supervisor_id = emp.id
+
+        # spooled to disk so large files are streamed, in this request or in the job's thread
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        file.save(path)
+        size = os.path.getsize(path)
+        job = session_import.create_import_job(secure_filename(file.filename), size, skip_errors=skip_errors,
+                                               requested_by=current_user.id)
+
+        if session_import.runs_in_background(size):
+            session_import.start_import_job(job, path, supervisor_id)
+            flash('The file is being imported in the background.', 'info')
+            return redirect(url_for('interventions.import_job', job_id=job.id))
+
+        job = session_import.run_import_job(job.id, path, supervisor_id)
+        if job.status == 'failed':
+            flash(f'The import failed: {job.error}', 'danger')
+            return redirect(url_for('interventions.list_interventions'))
+        if job.imported > 0:
+            flash(f'Successfully uploaded {job.imported} sessions.', 'success')
+        if job.failed > 0:
+            errors = [f"Row {e['row']}: {e['error']}" for e in job.error_list]
+            if skip_errors:
+                flash(f'Failed to process {job.failed} rows: ' + '; '.join(errors[:5]), 'warning')  # Show first 5 errors
+            else:
+                flash(f'Nothing was uploaded; {job.failed} rows have errors: ' + '; '.join(errors[:5]), 'danger')
+            return redirect(url_for('interventions.import_job', job_id=job.id))
+
         return redirect(url_for('interventions.list_interventions'))
     else:
         abort(403)
+
+
+def _get_import_job(job_id):
+    if current_user.user_type not in ['admin', 'super', 'supervisor']:
+        abort(403)
+    job = SessionImportJob.query.get_or_404(job_id)
+    if current_user.user_type == 'supervisor' and job.requested_by != current_user.id:
+        abort(403)
+    return job
+
+
+@interventions_bp.route('/import_jobs/<int:job_id>')
+@login_required
+def import_job(job_id):
+    return render_template('import_job.html', job=_get_import_job(job_id))
+
+
+@interventions_bp.route('/import_jobs/<int:job_id>/status')
+@login_required
+def import_job_status(job_id):
+    return jsonify(session_import.serialize_job(_get_import_job(job_id)))
+
+
+@interventions_bp.route('/import_jobs/<int:job_id>/errors.csv')
+@login_required
+def import_job_errors(job_id):
+    job = _get_import_job(job_id)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Row', 'Error'])
+    for error in job.error_list:
+        writer.writerow([error['row'], error['error']])
+    return app.response_class(
+        output.getvalue(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=import_{job.id}_errors.csv'}
+    )
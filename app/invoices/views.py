@@ -1,18 +1,24 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, make_response, abort, current_app
+from flask import Blueprint, render_template, redirect, url_for, request, flash, make_response, abort, current_app, jsonify
 from app import db
 import json
 import base64
 import os
-from app.models import Invoice, Intervention, Client, Activity, Employee, PayStubItem, AppSettings, Mileage
+from app.models import Invoice, Intervention, Client, Activity, Employee, PayStubItem, AppSettings, Mileage, InvoiceSendJob
 from app.invoices.forms import InvoiceClientSelectionForm
 from datetime import date, timedelta, datetime
 from sqlalchemy import and_
 from sqlalchemy.orm import joinedload
 from flask_login import login_required, current_user
-from weasyprint import HTML
 from app.utils.email_utils import queue_email_with_pdf, queue_email
 import os
 from app.utils.settings_utils import get_org_settings
+from app.utils.pdf_cache import invoice_pdf_fingerprint, get_or_render_pdf, invalidate_invoice
+from app.utils.pdf_render import render_pdf
+from app.utils.invoice_context import InvoiceRenderContext
+from app.utils import invoice_numbers
+from app.utils.rollups import mark_dirty as mark_rollups_dirty
+from app.utils.invoice_balances import STATES as PAYMENT_STATES
+from app.utils.invoice_send import active_job, serialize_job, start_send_job
 
 invoices_bp = Blueprint('invoices', __name__, template_folder='templates')
 
@@ -26,34 +32,6 @@ def parse_date(val):
     return val
 
 
-def _extract_mileages(invoice):
-    """Return a list of lightweight objects representing mileage entries
-
-    The invoice_items JSON snapshot may include items of type "mileage".  The
-    PDF template expects each entry to have attributes like :date, :description,
-    :distance, :rate and :cost.  We create a minimal ``MileageSnapshot`` class in
-    memory so that the same template logic can operate transparently whether the
-    mileage rows originated from real ``Mileage`` models or the invoice snapshot.
-    """
-    mileages = []
-    if invoice.invoice_items:
-        try:
-            items = json.loads(invoice.invoice_items)
-            mileage_items = [item for item in items if item.get('type') == 'mileage']
-            for m_item in mileage_items:
-                class MileageSnapshot:
-                    def __init__(self, data):
-                        self.date = data.get('date')
-                        self.description = data.get('description')
-                        self.distance = data.get('distance')
-                        self.rate = data.get('rate')
-                        self.cost = data.get('cost')
-                mileages.append(MileageSnapshot(m_item))
-        except Exception:
-            pass
-    return mileages
-
-
 def _last_payment_date(invoice):
     payments = sorted(invoice.payments, key=lambda p: p.payment_date or date.min)
     if payments:
@@ -63,6 +41,54 @@ def _last_payment_date(invoice):
     return ''
 
 
+def _invoice_pdf_html(ctx, status):
+    """Render the invoice_pdf.html template for an ``InvoiceRenderContext``."""
+    invoice, client, supervisor, settings = ctx.invoice, ctx.client, ctx.supervisor, ctx.settings
+    return render_template(
+        'invoice_pdf.html',
+        parent_name=getattr(client, 'parentname', ''),
+        billing_address=f"{client.address1}{', ' + client.address2 if client.address2 else ''}<br>{client.city}, {client.state} {client.zipcode}",
+        client=client,
+        invoice=invoice,
+        invoice_number=invoice.invoice_number,
+        invoice_date=invoice.invoiced_date.strftime('%Y-%m-%d'),
+        payby_date=invoice.payby_date.strftime('%Y-%m-%d'),
+        date_from=invoice.date_from.strftime('%Y-%m-%d'),
+        date_to=invoice.date_to.strftime('%Y-%m-%d'),
+        supervisor_name=f"{supervisor.firstname} {supervisor.lastname}" if supervisor else "N/A",
+        supervisor_rba_number=supervisor.rba_number if supervisor else "N/A",
+        status=status,
+        last_payment_date=_last_payment_date(invoice),
+        interventions=ctx.interventions,
+        mileages=ctx.mileages,
+        org_name=settings['org_name'],
+        org_address=settings['org_address'],
+        org_email=settings['org_email'],
+        payment_email=settings['payment_email'],
+        org_phone=settings['org_phone'],
+        logo_b64=settings.get('logo_b64'),
+        logo_url=settings.get('logo_url'),
+        # For PDF rendering, prefer a file:// URI if available
+        logo_path=settings.get('logo_file_uri') or settings.get('logo_web_path'),
+        download_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    )
+
+
+def _render_invoice_pdf(ctx, status):
+    """Return the invoice PDF bytes, reusing the on-disk cache when nothing changed.
+
+    The fingerprint covers everything the template shows, so a cache hit skips
+    both the template render and the WeasyPrint rasterisation.
+    """
+    fingerprint = invoice_pdf_fingerprint(ctx.invoice, ctx.client, ctx.interventions, ctx.mileages, ctx.supervisor, ctx.settings)
+
+    def _render():
+        html = _invoice_pdf_html(ctx, status)
+        return render_pdf(html, label=ctx.invoice.invoice_number)
+
+    return get_or_render_pdf(ctx.invoice.invoice_number, fingerprint, _render)
+
+
 @invoices_bp.route('/list', methods=['GET'])
 @login_required
 def list_invoices():
@@ -70,15 +96,28 @@ def list_invoices():
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
-        
+        payment_state = request.args.get('payment_state', '')
+        sort = request.args.get('sort', '')
+
+        # Filter and sort on the stored payment columns
+        query = Invoice.query.options(joinedload(Invoice.client))
+        if payment_state == 'outstanding':
+            query = query.filter(Invoice.amount_pending > 0)
+        elif payment_state in PAYMENT_STATES:
+            query = query.filter(Invoice.payment_state == payment_state)
+        if sort == 'balance':
+            query = query.order_by(Invoice.amount_pending.desc(), Invoice.invoiced_date.desc(), Invoice.id.desc())
+        else:
+            query = query.order_by(Invoice.invoiced_date.desc(), Invoice.id.desc())
+
         # Paginate invoices
-        pagination = Invoice.query.order_by(Invoice.invoiced_date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
         invoices = pagination.items
         
         settings = get_org_settings()
-        return render_template('list_invoices.html', invoices=invoices, pagination=pagination, per_page=per_page, org_name=settings['org_name'])
+        return render_template('list_invoices.html', invoices=invoices, pagination=pagination, per_page=per_page,
+                               payment_state=payment_state, payment_states=PAYMENT_STATES, sort=sort,
+                               send_job=active_job(), org_name=settings['org_name'])
     else:
         abort(403)
 
@@ -139,8 +178,8 @@ def invoice_preview():
         supervisor_name = f"{supervisor.firstname} {supervisor.lastname}" if supervisor else "N/A"
         supervisor_rba_number = supervisor.rba_number if supervisor else "N/A"
 
-        # Generate invoice number and dates
-        invoice_number = Invoice.generate_invoice_number()
+        # Show the next invoice number; it is only reserved when the invoice is saved
+        invoice_number = invoice_numbers.peek()
         invoice_date = date.today()
         payby_date = invoice_date + timedelta(days=7)
 
@@ -235,6 +274,7 @@ def invoice_preview():
             total_cost = sum(item['cost'] for item in invoice_items)
 
             # 1. Create Invoice record
+            invoice_number = Invoice.generate_invoice_number()
             invoice = Invoice(
                 client_id=client.id,
                 invoice_number=invoice_number,
@@ -312,100 +352,17 @@ def invoice_preview():
 @login_required
 def download_invoice_pdf_by_number(invoice_number):
     if current_user.is_authenticated and current_user.user_type in ["admin", "super"]:
-        invoice = Invoice.query.filter_by(invoice_number=invoice_number).first_or_404()
-        client = invoice.client
-        interventions = Intervention.query.filter_by(invoice_number=invoice_number).order_by(Intervention.date, Intervention.start_time).all()
-
-        # Use invoice_items snapshot if available; otherwise fall back to calculating from current rates
-        import json
-        if invoice.invoice_items:
-            try:
-                items = json.loads(invoice.invoice_items)
-            except Exception:
-                items = []
-            # attach snapshot data to interventions by matching ids
-            items_map = {item.get('intervention_id'): item for item in items}
-            for i in interventions:
-                item = items_map.get(i.id)
-                if item:
-                    i.rate = item.get('rate', 0)
-                    i.cost = item.get('cost', 0)
-                    i._snapshot = item
-                else:
-                    # fallback: compute from current client rates
-                    from app.models import Activity
-                    activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
-                    category = activity_map.get(i.intervention_type, '').lower()
-                    if category == 'therapy':
-                        rate = client.cost_therapy
-                    elif category == 'supervision':
-                        rate = client.cost_supervision
-                    else:
-                        rate = 0
-                    i.rate = rate
-                    try:
-                        i.cost = float(i.duration) * float(rate)
-                    except Exception:
-                        i.cost = 0
-
-        parent_name = getattr(client, 'parent_name', '')
-        address = f"{client.address1}{', ' + client.address2 if client.address2 else ''}<br>{client.city}, {client.state} {client.zipcode}"
-
-        # Get the superivisor's name
-        supervisor = Employee.query.get(client.supervisor_id) if client and client.supervisor_id else None
-        supervisor_name = f"{supervisor.firstname} {supervisor.lastname}" if supervisor else "N/A"
-        supervisor_rba_number = supervisor.rba_number if supervisor else "N/A"
-
+        ctx = InvoiceRenderContext.load(invoice_number)
+        invoice = ctx.invoice
         status = "Pending" if invoice.status != "Paid" else invoice.status
-
-        # include any mileage line items from the invoice snapshot
-        mileages = _extract_mileages(invoice)
-
-        # Resolve org settings and logo context
-        settings = get_org_settings()
-        logo_b64 = settings.get('logo_b64')
-        logo_url = settings.get('logo_url')
-        logo_file_uri = settings.get('logo_file_uri')
-        logo_web_path = settings.get('logo_web_path')
-        
-
-        html = render_template(
-            'invoice_pdf.html',  # <-- use the new template!
-            parent_name=parent_name,
-            billing_address=address,
-            client=client,
-            invoice=invoice,
-            invoice_number=invoice.invoice_number,
-            invoice_date=invoice.invoiced_date.strftime('%Y-%m-%d'),
-            payby_date=invoice.payby_date.strftime('%Y-%m-%d'),
-            date_from=invoice.date_from.strftime('%Y-%m-%d'),
-            date_to=invoice.date_to.strftime('%Y-%m-%d'),
-            supervisor_name=supervisor_name,
-            supervisor_rba_number=supervisor_rba_number,
-            status=status,
-            last_payment_date=_last_payment_date(invoice),
-            interventions=interventions,
-            mileages=mileages,
-            org_name=settings['org_name'],
-            org_address=settings['org_address'],
-            org_email=settings['org_email'],
-            payment_email=settings['payment_email'],
-            org_phone=settings['org_phone'],
-            logo_b64=logo_b64,
-            logo_url=logo_url,
-            # For PDF rendering, prefer a file:// URI if available
-            logo_path=logo_file_uri or logo_web_path,
-            download_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        )
-
-        pdf = HTML(string=html, base_url=request.url_root).write_pdf()
+        pdf = _render_invoice_pdf(ctx, status)
         
         # Create filename with download time, date range, and client name parts
         download_time_str = datetime.now().strftime('%Y%m%d%H%M%S')
         date_range_str = f"{invoice.date_from.strftime('%Y%m%d')}-{invoice.date_to.strftime('%Y%m%d')}"
         
         # Get first 3 letters of first and last name in uppercase
-        client = invoice.client
+        client = ctx.client
         first_three = client.firstname[:3].upper() if client.firstname else ''
         last_three = client.lastname[:3].upper() if client.lastname else ''
         client_name_code = f"{first_three}{last_three}"
@@ -424,68 +381,20 @@ def download_invoice_pdf_by_number(invoice_number):
 @login_required
 def preview_invoice_by_number(invoice_number):
     if current_user.is_authenticated and current_user.user_type in ["admin", "super"]:
-        invoice = Invoice.query.filter_by(invoice_number=invoice_number).first_or_404()
-        client = invoice.client
-        interventions = Intervention.query.filter_by(invoice_number=invoice_number).order_by(Intervention.date, Intervention.start_time).all()
-        # Use invoice_items snapshot if available; otherwise compute
-        import json
-        if invoice.invoice_items:
-            try:
-                items = json.loads(invoice.invoice_items)
-            except Exception:
-                items = []
-            items_map = {item.get('intervention_id'): item for item in items}
-            for i in interventions:
-                item = items_map.get(i.id)
-                if item:
-                    i.rate = item.get('rate', 0)
-                    i.cost = item.get('cost', 0)
-                    i._snapshot = item
-                else:
-                    from app.models import Activity
-                    activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
-                    category = activity_map.get(i.intervention_type, '').lower()
-                    if category == 'therapy':
-                        rate = client.cost_therapy
-                    elif category == 'supervision':
-                        rate = client.cost_supervision
-                    else:
-                        rate = 0
-                    i.rate = rate
-                    try:
-                        i.cost = float(i.duration) * float(rate)
-                    except Exception:
-                        i.cost = 0
+        ctx = InvoiceRenderContext.load(invoice_number)
+        invoice, client, interventions = ctx.invoice, ctx.client, ctx.interventions
         parent_name = getattr(client, 'parent_name', '')
         address = f"{client.address1}{', ' + client.address2 if client.address2 else ''}<br>{client.city}, {client.state} {client.zipcode}"
 
         # Get the superivisor's name
-        supervisor = Employee.query.get(client.supervisor_id) if client and client.supervisor_id else None
+        supervisor = ctx.supervisor
         supervisor_name = f"{supervisor.firstname} {supervisor.lastname}" if supervisor else "N/A"
         supervisor_rba_number = supervisor.rba_number if supervisor else "N/A"
 
         status = "Pending" if invoice.status != "Paid" else invoice.status
 
-        # Extract mileage items from invoice_items JSON
-        mileages = []
-        if invoice.invoice_items:
-            try:
-                items = json.loads(invoice.invoice_items)
-                mileage_items = [item for item in items if item.get('type') == 'mileage']
-                # Convert mileage items to objects for template rendering
-                for m_item in mileage_items:
-                    class MileageSnapshot:
-                        def __init__(self, data):
-                            self.date = data.get('date')
-                            self.description = data.get('description')
-                            self.distance = data.get('distance')
-                            self.rate = data.get('rate')
-                            self.cost = data.get('cost')
-                    mileages.append(MileageSnapshot(m_item))
-            except Exception:
-                pass
-
-        settings = get_org_settings()
+        mileages = ctx.mileages
+        settings = ctx.settings
         
         return render_template(
             'invoice_preview.html',
@@ -543,6 +452,7 @@ def delete_invoice(invoice_number):
                 flash('Warning: No interventions found for this invoice', 'warning')
             
             # Update the interventions
+            mark_rollups_dirty(intervention_ids=intervention_ids)
             updated_count = Intervention.query.filter(Intervention.id.in_(intervention_ids)).update(
                 {
                     Intervention.invoiced: False,
@@ -563,6 +473,7 @@ def delete_invoice(invoice_number):
             # Delete the invoice
             db.session.delete(invoice)
             db.session.commit()
+            invalidate_invoice(invoice_number)
 
             # Verify the updates
             still_linked = Intervention.query.filter(
@@ -591,88 +502,12 @@ def delete_invoice(invoice_number):
 @login_required
 def mark_sent(invoice_number):
     if current_user.is_authenticated and current_user.user_type in ["admin", "super"]:
-        invoice = Invoice.query.filter_by(invoice_number=invoice_number).first_or_404()
-        client = invoice.client
-
-        # Build interventions list (use snapshot if available)
-        interventions = Intervention.query.filter_by(invoice_number=invoice_number).order_by(Intervention.date, Intervention.start_time).all()
-        import json as _json
-        if invoice.invoice_items:
-            try:
-                items = _json.loads(invoice.invoice_items)
-            except Exception:
-                items = []
-            items_map = {item.get('intervention_id'): item for item in items}
-            for i in interventions:
-                item = items_map.get(i.id)
-                if item:
-                    i.rate = item.get('rate', 0)
-                    i.cost = item.get('cost', 0)
-                    i._snapshot = item
-                else:
-                    from app.models import Activity
-                    activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
-                    category = activity_map.get(i.intervention_type, '').lower()
-                    if category == 'therapy':
-                        rate = client.cost_therapy
-                    elif category == 'supervision':
-                        rate = client.cost_supervision
-                    else:
-                        rate = 0
-                    i.rate = rate
-                    try:
-                        i.cost = float(i.duration) * float(rate)
-                    except Exception:
-                        i.cost = 0
-
-        # prepare address and supervisor data
-        parent_name = getattr(client, 'parentname', '')
-        address = f"{client.address1}{', ' + client.address2 if client.address2 else ''}<br>{client.city}, {client.state} {client.zipcode}"
-        supervisor = Employee.query.get(client.supervisor_id) if client and client.supervisor_id else None
-        supervisor_name = f"{supervisor.firstname} {supervisor.lastname}" if supervisor else "N/A"
-        supervisor_rba_number = supervisor.rba_number if supervisor else "N/A"
-
-        # include any mileage line items from the invoice snapshot
-        mileages = _extract_mileages(invoice)
+        ctx = InvoiceRenderContext.load(invoice_number)
+        invoice, client, settings = ctx.invoice, ctx.client, ctx.settings
 
         # Generate PDF and send email
         try:
-            # Resolve org settings and logo context
-            settings = get_org_settings()
-            logo_b64 = settings.get('logo_b64')
-            logo_url = settings.get('logo_url')
-            logo_file_uri = settings.get('logo_file_uri')
-            logo_web_path = settings.get('logo_web_path')
-            
-
-            html = render_template(
-                'invoice_pdf.html',
-                parent_name=parent_name,
-                billing_address=address,
-                client=client,
-                invoice=invoice,
-                invoice_number=invoice.invoice_number,
-                invoice_date=invoice.invoiced_date.strftime('%Y-%m-%d'),
-                payby_date=invoice.payby_date.strftime('%Y-%m-%d'),
-                date_from=invoice.date_from.strftime('%Y-%m-%d'),
-                date_to=invoice.date_to.strftime('%Y-%m-%d'),
-                supervisor_name=supervisor_name,
-                supervisor_rba_number=supervisor_rba_number,
-                status=invoice.status or 'Pending',
-                last_payment_date=_last_payment_date(invoice),
-                interventions=interventions,
-                mileages=mileages,
-                org_name=settings['org_name'],
-                org_address=settings['org_address'],
-                org_email=settings['org_email'],
-                payment_email=settings['payment_email'],
-                org_phone=settings['org_phone'],
-                logo_b64=logo_b64,
-                logo_url=logo_url,
-                logo_path=logo_file_uri or logo_web_path,
-                download_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            )
-            pdf_bytes = HTML(string=html, base_url=request.url_root).write_pdf()
+            pdf_bytes = _render_invoice_pdf(ctx, invoice.status or 'Pending')
             
             subject = f"Invoice {invoice.invoice_number} from {settings['org_name']}"
             # Render nice HTML and plain text email templates for invoice
@@ -719,89 +554,12 @@ def mark_sent(invoice_number):
 @login_required
 def email_invoice(invoice_number):
     if current_user.is_authenticated and current_user.user_type in ["admin", "super"]:
-        invoice = Invoice.query.filter_by(invoice_number=invoice_number).first_or_404()
-        client = invoice.client
-
-        # Build interventions list (use snapshot if available)
-        interventions = Intervention.query.filter_by(invoice_number=invoice_number).order_by(Intervention.date, Intervention.start_time).all()
-        import json as _json
-        if invoice.invoice_items:
-            try:
-                items = _json.loads(invoice.invoice_items)
-            except Exception:
-                items = []
-            items_map = {item.get('intervention_id'): item for item in items}
-            for i in interventions:
-                item = items_map.get(i.id)
-                if item:
-                    i.rate = item.get('rate', 0)
-                    i.cost = item.get('cost', 0)
-                    i._snapshot = item
-                else:
-                    from app.models import Activity
-                    activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
-                    category = activity_map.get(i.intervention_type, '').lower()
-                    if category == 'therapy':
-                        rate = client.cost_therapy
-                    elif category == 'supervision':
-                        rate = client.cost_supervision
-                    else:
-                        rate = 0
-                    i.rate = rate
-                    try:
-                        i.cost = float(i.duration) * float(rate)
-                    except Exception:
-                        i.cost = 0
-
-        # prepare address and supervisor data
-        parent_name = getattr(client, 'parentname', '')
-        address = f"{client.address1}{', ' + client.address2 if client.address2 else ''}<br>{client.city}, {client.state} {client.zipcode}"
-        supervisor = Employee.query.get(client.supervisor_id) if client and client.supervisor_id else None
-        supervisor_name = f"{supervisor.firstname} {supervisor.lastname}" if supervisor else "N/A"
-        supervisor_rba_number = supervisor.rba_number if supervisor else "N/A"
-
-        # include any mileage line items from the invoice snapshot
-        mileages = _extract_mileages(invoice)
+        ctx = InvoiceRenderContext.load(invoice_number)
+        invoice, client, settings = ctx.invoice, ctx.client, ctx.settings
 
         # Generate PDF and send email
         try:
-            # Resolve org settings and logo context
-            settings = get_org_settings()
-            logo_b64 = settings.get('logo_b64')
-            logo_url = settings.get('logo_url')
-            logo_file_uri = settings.get('logo_file_uri')
-            logo_web_path = settings.get('logo_web_path')
-            
-
-            html = render_template(
-                'invoice_pdf.html',
-                parent_name=parent_name,
-                billing_address=address,
-                client=client,
-                invoice=invoice,
-                invoice_number=invoice.invoice_number,
-                invoice_date=invoice.invoiced_date.strftime('%Y-%m-%d'),
-                payby_date=invoice.payby_date.strftime('%Y-%m-%d'),
-                date_from=invoice.date_from.strftime('%Y-%m-%d'),
-                date_to=invoice.date_to.strftime('%Y-%m-%d'),
-                supervisor_name=supervisor_name,
-                supervisor_rba_number=supervisor_rba_number,
-                status=invoice.status or 'Pending',
-                last_payment_date=_last_payment_date(invoice),
-                interventions=interventions,
-                # include mileage records extracted from invoice_items snapshot (if any)
-                mileages=mileages,
-                org_name=settings['org_name'],
-                org_address=settings['org_address'],
-                org_email=settings['org_email'],
-                payment_email=settings['payment_email'],
-                org_phone=settings['org_phone'],
-                logo_b64=logo_b64,
-                logo_url=logo_url,
-                logo_path=logo_file_uri or logo_web_path,
-                download_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            )
-            pdf_bytes = HTML(string=html, base_url=request.url_root).write_pdf()
+            pdf_bytes = _render_invoice_pdf(ctx, invoice.status or 'Pending')
             
             subject = f"Invoice {invoice.invoice_number} from {settings['org_name']}"
             # Render appropriate email templates based on invoice status
@@ -835,6 +593,7 @@ def email_invoice(invoice_number):
 
             sent = queue_email_with_pdf(recipients=recipients, subject=subject, body_text=body_text, pdf_bytes=pdf_bytes, filename=f"{invoice.invoice_number}.pdf", body_html=body_html)
             if sent:
+                db.session.commit()
                 flash('Invoice emailed to client.', 'success')
             else:
                 flash('Failed to enqueue invoice email to client.', 'warning')
@@ -846,6 +605,49 @@ def email_invoice(invoice_number):
         abort(403)
 
 
+@invoices_bp.route('/send_drafts', methods=['POST'])
+@login_required
+def send_drafts():
+    """Start a background job that emails every Draft invoice of a billing period and marks it Sent."""
+    if current_user.is_authenticated and current_user.user_type in ["admin", "super"]:
+        try:
+            date_from = parse_date(request.form.get('date_from'))
+            date_to = parse_date(request.form.get('date_to'))
+        except ValueError:
+            date_from = date_to = None
+        if not date_from or not date_to or date_to < date_from:
+            flash('Choose the first and last day of the billing period to send.', 'warning')
+            return redirect(url_for('invoices.list_invoices'))
+
+        job, created = start_send_job(date_from, date_to, requested_by=current_user.id)
+        if created:
+            flash(f'Sending {job.total} draft invoice(s) for {date_from} to {date_to}.', 'info')
+        else:
+            flash('A send job is already running; showing its progress.', 'warning')
+        return redirect(url_for('invoices.send_job', job_id=job.id))
+    else:
+        abort(403)
+
+
+@invoices_bp.route('/send_jobs/<int:job_id>', methods=['GET'])
+@login_required
+def send_job(job_id):
+    if current_user.is_authenticated and current_user.user_type in ["admin", "super"]:
+        job = db.get_or_404(InvoiceSendJob, job_id)
+        return render_template('send_job.html', job=job)
+    else:
+        abort(403)
+
+
+@invoices_bp.route('/send_jobs/<int:job_id>/status', methods=['GET'])
+@login_required
+def send_job_status(job_id):
+    if current_user.is_authenticated and current_user.user_type in ["admin", "super"]:
+        return jsonify(serialize_job(db.get_or_404(InvoiceSendJob, job_id)))
+    else:
+        abort(403)
+
+
 @invoices_bp.route('/mark_draft/<invoice_number>', methods=['POST'])
 @login_required
 def mark_draft(invoice_number):
@@ -894,85 +696,11 @@ def mark_paid(invoice_number):
         
         # Send notification email to client parent about each new payment with invoice PDF attached
         try:
-            client = Client.query.get(invoice.client_id)
-            settings = get_org_settings()
+            ctx = InvoiceRenderContext.load(invoice_number)
+            client, settings = ctx.client, ctx.settings
             if client and client.parentemail:
                 # Generate invoice PDF
-                interventions = Intervention.query.filter_by(invoice_number=invoice_number).order_by(Intervention.date, Intervention.start_time).all()
-                
-                # Use invoice_items snapshot if available; otherwise fall back to calculating from current rates
-                if invoice.invoice_items:
-                    try:
-                        items = json.loads(invoice.invoice_items)
-                    except Exception:
-                        items = []
-                    items_map = {item.get('intervention_id'): item for item in items}
-                    for i in interventions:
-                        item = items_map.get(i.id)
-                        if item:
-                            i.rate = item.get('rate', 0)
-                            i.cost = item.get('cost', 0)
-                            i._snapshot = item
-                        else:
-                            from app.models import Activity
-                            activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
-                            category = activity_map.get(i.intervention_type, '').lower()
-                            if category == 'therapy':
-                                rate = client.cost_therapy
-                            elif category == 'supervision':
-                                rate = client.cost_supervision
-                            else:
-                                rate = 0
-                            i.rate = rate
-                            try:
-                                i.cost = float(i.duration) * float(rate)
-                            except Exception:
-                                i.cost = 0
-                
-                # include any mileage line items from the invoice snapshot
-                mileages = _extract_mileages(invoice)
-                
-                parent_name = getattr(client, 'parent_name', '')
-                address = f"{client.address1}{', ' + client.address2 if client.address2 else ''}<br>{client.city}, {client.state} {client.zipcode}"
-                supervisor = Employee.query.get(client.supervisor_id) if client and client.supervisor_id else None
-                supervisor_name = f"{supervisor.firstname} {supervisor.lastname}" if supervisor else "N/A"
-                supervisor_rba_number = supervisor.rba_number if supervisor else "N/A"
-                
-                logo_b64 = settings.get('logo_b64')
-                logo_url = settings.get('logo_url')
-                logo_file_uri = settings.get('logo_file_uri')
-                logo_web_path = settings.get('logo_web_path')
-                
-                html = render_template(
-                    'invoice_pdf.html',
-                    parent_name=parent_name,
-                    billing_address=address,
-                    client=client,
-                    invoice=invoice,
-                    invoice_number=invoice.invoice_number,
-                    invoice_date=invoice.invoiced_date.strftime('%Y-%m-%d'),
-                    payby_date=invoice.payby_date.strftime('%Y-%m-%d'),
-                    date_from=invoice.date_from.strftime('%Y-%m-%d'),
-                    date_to=invoice.date_to.strftime('%Y-%m-%d'),
-                    supervisor_name=supervisor_name,
-                    supervisor_rba_number=supervisor_rba_number,
-                    status=invoice.payment_status,
-                    last_payment_date=_last_payment_date(invoice),
-                    interventions=interventions,
-                    # mileages list may be empty if no mileage entries exist
-                    mileages=mileages,
-                    org_name=settings['org_name'],
-                    org_address=settings['org_address'],
-                    org_email=settings['org_email'],
-                    payment_email=settings['payment_email'],
-                    org_phone=settings['org_phone'],
-                    logo_b64=logo_b64,
-                    logo_url=logo_url,
-                    logo_path=logo_file_uri or logo_web_path,
-                    download_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                )
-                
-                pdf_bytes = HTML(string=html, base_url=request.url_root).write_pdf()
+                pdf_bytes = _render_invoice_pdf(ctx, invoice.payment_status)
                 
                 # Create filename for PDF attachment
                 download_time_str = datetime.now().strftime('%Y%m%d%H%M%S')
@@ -1012,8 +740,10 @@ def mark_paid(invoice_number):
                     body_text=body_text,
                     body_html=body_html,
                     pdf_bytes=pdf_bytes,
-                    filename=pdf_filename
+                    filename=pdf_filename,
+                    dedupe_key=f'invoice-payment:{payment.id}'
                 )
+                db.session.commit()
         except Exception as e:
             # Log but don't fail the payment marking if email fails
             current_app.logger.exception(f'Failed to send paid invoice email for {invoice_number}: {e}')
@@ -11,7 +11,11 @@ from werkzeug.utils import secure_filename
 from app.manage.forms import SettingsForm
 from app import db
 from app.models import AppSettings
-from app.utils.settings_utils import get_org_settings
+from app.utils.settings_utils import get_org_settings, bump_settings_version
+from app.utils.pdf_cache import clear_pdf_cache
+from app.models import EmailOutbox
+from sqlalchemy.orm import defer
+from app.utils import email_outbox
 
 manage_bp = Blueprint('manage', __name__, template_folder='templates')
 
@@ -173,6 +177,9 @@ def settings():
 
             db.session.add(settings)
             db.session.commit()
+            bump_settings_version()
+            # org details and logo are baked into cached invoice PDFs
+            clear_pdf_cache()
             
             # Update cron schedule if reminder settings changed
             try:
@@ -212,3 +219,33 @@ def api_docs():
     return render_template('api_docs.html', org_name=settings['org_name'])
 
 
+@manage_bp.route('/email_outbox', methods=['GET'])
+@login_required
+def email_outbox_status():
+    if not (current_user.is_authenticated and current_user.user_type in ['admin', 'super']):
+        abort(403)
+    status = request.args.get('status', '')
+    page = request.args.get('page', 1, type=int)
+    # the bodies can be large and are not shown
+    query = EmailOutbox.query.options(defer(EmailOutbox.body_text), defer(EmailOutbox.body_html))
+    if status in email_outbox.STATUSES:
+        query = query.filter(EmailOutbox.status == status)
+    pagination = query.order_by(EmailOutbox.id.desc()).paginate(page=page, per_page=50, error_out=False)
+    settings = get_org_settings()
+    return render_template('email_outbox.html', messages=pagination.items, pagination=pagination,
+                           counts=email_outbox.status_counts(), statuses=email_outbox.STATUSES, status=status,
+                           org_name=settings['org_name'])
+
+
+@manage_bp.route('/email_outbox/<int:outbox_id>/retry', methods=['POST'])
+@login_required
+def retry_email(outbox_id):
+    if not (current_user.is_authenticated and current_user.user_type in ['admin', 'super']):
+        abort(403)
+    if email_outbox.retry(outbox_id):
+        flash('Email queued for another attempt.', 'success')
+    else:
+        flash('Only failed emails can be retried.', 'warning')
+    return redirect(url_for('manage.email_outbox_status', status=request.args.get('status') or None))
+
+
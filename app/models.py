@@ -5,6 +5,7 @@ from flask_login import UserMixin
 from datetime import date, datetime, timedelta
 import json, string, secrets
 from app.utils.two_factor import generate_totp_secret
+from app.utils.pdf_cache import invalidate_invoice
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -67,7 +68,7 @@ class Employee(db.Model, UserMixin):
     locked_until = db.Column(db.DateTime, default=None)
     failed_attempt = db.Column(db.Integer, default=-2, nullable=False)
     activation_key = db.Column(db.String(16), nullable=True, default=None)
-    password_reset_key = db.Column(db.String(64), nullable=True, default=None)  # For password reset requests
+    password_reset_key = db.Column(db.String(64), nullable=True, default=None, index=True)  # For password reset requests
     password_reset_requested_at = db.Column(db.DateTime, nullable=True, default=None)  # Timestamp when reset was requested
     two_factor_enabled = db.Column(db.Boolean, nullable=False, default=False)
     two_factor_secret = db.Column(db.String(64), nullable=True, default=None)
@@ -377,6 +378,15 @@ class Client(db.Model):
 
 class Intervention(db.Model):
     __tablename__ = 'interventions'
+    __table_args__ = (
+        # payroll: unpaid sessions for an employee in a date range
+        db.Index('ix_interventions_employee_date_paid', 'employee_id', 'date', 'is_paid'),
+        # invoicing: uninvoiced sessions for a client in a date range; also serves the client calendar
+        db.Index('ix_interventions_client_invoiced_date', 'client_id', 'invoiced', 'date'),
+        # reports: all sessions in a date range
+        db.Index('ix_interventions_date', 'date'),
+        db.Index('ix_interventions_invoice_number', 'invoice_number'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     # allow NULL for client_id to support base rates (apply to all clients)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=True)
@@ -390,6 +400,7 @@ class Intervention(db.Model):
     invoiced = db.Column(db.Boolean, default=False)  # Indicates if the intervention has been invoiced
     invoice_number = db.Column(db.String(25), db.ForeignKey('invoices.invoice_number'), nullable=True)  # Invoice number if invoiced
     is_paid = db.Column(db.Boolean, default=False)  # Indicates if the intervention has been paid
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # for ?updated_after= exports
 
     client = db.relationship('Client', backref='interventions')
     employee = db.relationship('Employee', backref='interventions')
@@ -412,6 +423,19 @@ class Intervention(db.Model):
     def set_file_names(self, filenames):
         self.file_names = json.dumps(filenames)
 
+    @classmethod
+    def unpaid_clause(cls):
+        """SQL filter for sessions not yet included in any paystub.
+
+        Uses the is_paid flag (indexed together with employee_id and date) and
+        a NOT EXISTS anti-join on paystub_items as the source of truth, so rows
+        written without updating the flag are still excluded.
+        """
+        return db.and_(
+            cls.is_paid == False,
+            ~db.exists().where(PayStubItem.intervention_id == cls.id)
+        )
+
     @classmethod
     def has_overlap(cls, employee_id, date, start_time, end_time, exclude_id=None):
         """
@@ -472,7 +496,7 @@ class Intervention(db.Model):
 class InvoicePayment(db.Model):
     __tablename__ = 'invoice_payments'
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False, default=0.0)
     payment_date = db.Column(db.Date, nullable=False)
     transaction_number = db.Column(db.String(100), nullable=True)
@@ -491,6 +515,14 @@ class InvoicePayment(db.Model):
 
 class Invoice(db.Model):
     __tablename__ = 'invoices'
+    __table_args__ = (
+        # client invoice history and the reports' client filter
+        db.Index('ix_invoices_client_invoiced_date', 'client_id', 'invoiced_date'),
+        # reminders: Sent invoices ordered by due date
+        db.Index('ix_invoices_status_payby_date', 'status', 'payby_date'),
+        # invoice list and reports, newest first
+        db.Index('ix_invoices_invoiced_date', 'invoiced_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(25), unique=True, nullable=False)  # Format: INVYYYYMM00000001
     invoiced_date = db.Column(db.Date, nullable=False)
@@ -505,6 +537,11 @@ class Invoice(db.Model):
     payment_comments = db.Column(db.Text)
     last_reminder_sent_date = db.Column(db.DateTime, nullable=True)  # Tracks when last reminder was sent
     reminder_count = db.Column(db.Integer, default=0)  # Tracks how many reminders have been sent
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # for ?updated_after= exports
+    # sum of invoice_payments, kept in step by app/utils/invoice_balances.py
+    amount_paid = db.Column(db.Float, nullable=False, default=0.0)
+    amount_pending = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    payment_state = db.Column(db.String(20), nullable=False, default='Pending', index=True)  # Pending, Partially Paid, Paid
 
     client = db.relationship('Client', backref='invoices')
 
@@ -522,28 +559,45 @@ class Invoice(db.Model):
         self.invoice_items = invoice_items
         self.last_reminder_sent_date = None
         self.reminder_count = 0
+        self.amount_paid, self.amount_pending, self.payment_state = invoice_balances.payment_totals(total_cost, 0.0, status)
 
     @property
     def paid_amount(self):
-        return round(sum(payment.amount for payment in self.payments), 2) if self.payments else 0.0
+        return self.amount_paid or 0.0
 
     @property
     def pending_amount(self):
-        return round(max(self.total_cost - self.paid_amount, 0.0), 2)
+        return self.amount_pending or 0.0
 
     @property
     def payment_status(self):
-        if self.pending_amount <= 0:
-            return 'Paid'
-        if self.paid_amount > 0:
-            return 'Partially Paid'
-        return 'Pending'
+        return self.payment_state
+
+    def refresh_payment_totals(self):
+        """Recompute the stored payment columns from this invoice's payments."""
+        db.session.flush()
+        paid = db.session.query(db.func.sum(InvoicePayment.amount)).filter(
+            InvoicePayment.invoice_id == self.id
+        ).scalar()
+        self.amount_paid, self.amount_pending, self.payment_state = invoice_balances.payment_totals(self.total_cost, paid, self.status)
+        return self
+
+    def invalidate_cached_pdf(self):
+        """Drop any rendered PDFs for this invoice from the on-disk cache."""
+        try:
+            invalidate_invoice(self.invoice_number)
+        except RuntimeError:
+            # no application context (standalone scripts); nothing to drop
+            pass
 
     def reset_to_draft(self):
         self.status = 'Draft'
         self.paid_date = None
         self.payment_comments = ''
         InvoicePayment.query.filter_by(invoice_id=self.id).delete(synchronize_session=False)
+        rollups.mark_dirty(invoice_ids=[self.id])
+        self.amount_paid, self.amount_pending, self.payment_state = invoice_balances.payment_totals(self.total_cost, 0.0)
+        self.invalidate_cached_pdf()
         return self
 
     def add_payment(self, amount, payment_date=None, transaction_number=None, payment_comments=None):
@@ -566,10 +620,9 @@ class Invoice(db.Model):
             payment_comments=payment_comments,
         )
         db.session.add(payment)
-        db.session.flush()
+        self.refresh_payment_totals()
 
-        new_total_paid = round(float(self.paid_amount) + amount, 2)
-        if new_total_paid >= self.total_cost - 1e-9:
+        if self.payment_state == 'Paid':
             self.status = 'Paid'
             self.paid_date = payment_date
         else:
@@ -582,38 +635,27 @@ class Invoice(db.Model):
 
         if payment_comments:
             self.payment_comments = payment_comments
+        self.invalidate_cached_pdf()
         return payment
 
     @staticmethod
     def generate_invoice_number():
-        today = date.today()
-        date_str = today.strftime('%Y%m')
-        prefix = f'INV{date_str}'
-
-        # Use the highest existing invoice number for the month so deleted invoices
-        # do not cause the next invoice to reuse a previously used number.
-        last_invoice = Invoice.query.filter(
-            Invoice.invoice_number.like(f'{prefix}%')
-        ).order_by(Invoice.invoice_number.desc()).first()
-
-        last_sequence = 0
-        if last_invoice and len(last_invoice.invoice_number) > len(prefix):
-            try:
-                last_sequence = int(last_invoice.invoice_number[len(prefix):])
-            except ValueError:
-                last_sequence = 0
-
-        next_sequence = last_sequence + 1
-        return f'{prefix}{str(next_sequence).zfill(4)}'
+        """Reserve the next invoice number for this month; see app.utils.invoice_numbers."""
+        from app.utils import invoice_numbers
+        return invoice_numbers.reserve(1)[0]
 
 
 class PayRate(db.Model):
     __tablename__ = 'payrates'
+    __table_args__ = (
+        db.Index('ix_payrates_employee_client_effective', 'employee_id', 'client_id', 'effective_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=True)  # Allow NULL for base rates
     rate = db.Column(db.Float, nullable=False)  # hourly rate
     effective_date = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # for ?updated_after= exports
 
     # employee relationship is now defined in Employee class with cascade delete
     client = db.relationship('Client', backref='payrates')
@@ -633,6 +675,7 @@ class PayStub(db.Model):
     total_amount = db.Column(db.Float, nullable=False, default=0.0)
     notes = db.Column(db.Text)
     email_sent = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # for ?updated_after= exports
 
     employee = db.relationship('Employee', backref='paystubs')
     items = db.relationship('PayStubItem', backref='paystub', cascade='all, delete-orphan')
@@ -645,7 +688,7 @@ class PayStubItem(db.Model):
     __tablename__ = 'paystub_items'
     id = db.Column(db.Integer, primary_key=True)
     paystub_id = db.Column(db.Integer, db.ForeignKey('paystubs.id'), nullable=False)
-    intervention_id = db.Column(db.Integer, db.ForeignKey('interventions.id'), nullable=False)
+    intervention_id = db.Column(db.Integer, db.ForeignKey('interventions.id'), nullable=False, index=True)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
     rate = db.Column(db.Float, nullable=False)
     hours = db.Column(db.Float, nullable=False)
@@ -673,6 +716,11 @@ class MileageRate(db.Model):
 
 class Mileage(db.Model):
     __tablename__ = 'mileages'
+    __table_args__ = (
+        db.Index('ix_mileages_client_invoiced_date', 'client_id', 'invoiced', 'date'),
+        db.Index('ix_mileages_employee_date_paid', 'employee_id', 'date', 'is_paid'),
+        db.Index('ix_mileages_invoice_number', 'invoice_number'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
@@ -684,6 +732,7 @@ class Mileage(db.Model):
     invoice_number = db.Column(db.String(25), db.ForeignKey('invoices.invoice_number'), nullable=True)  # Invoice number if invoiced
     invoiced = db.Column(db.Boolean, default=False)  # Indicates if included in an invoice
     is_paid = db.Column(db.Boolean, default=False)  # Indicates if included in a paystub payment
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # for ?updated_after= exports
 
     employee = db.relationship('Employee', backref='mileages')
     client = db.relationship('Client', backref='mileages')
@@ -778,3 +827,150 @@ class AppSettings(db.Model):
             logger.error(f'Exception in AppSettings.get(): {e}', exc_info=True)
             return None
 
+
+class DailyRollup(db.Model):
+    """Dashboard totals per (date, employee, client), kept current by app.utils.rollups.
+
+    Amounts are attributed to the session date: an invoice's total and its
+    received payments are prorated across its sessions by duration, and
+    paystub amounts follow the session they pay for.
+    """
+    __tablename__ = 'daily_rollups'
+    __table_args__ = (
+        db.Index('ix_daily_rollups_date_employee_client', 'date', 'employee_id', 'client_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    # no foreign keys: rows are derived data and are rebuilt, never joined for integrity
+    employee_id = db.Column(db.Integer, nullable=False)
+    client_id = db.Column(db.Integer, nullable=True)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    hours = db.Column(db.Float, nullable=False, default=0.0)
+    invoiced_amount = db.Column(db.Float, nullable=False, default=0.0)
+    received_amount = db.Column(db.Float, nullable=False, default=0.0)
+    paystub_amount = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# one row per key, which concurrent refreshes upsert; client_id is nullable and NULLs never conflict, so it is keyed as 0
+db.Index('ux_daily_rollups_key', DailyRollup.date, DailyRollup.employee_id,
+         db.func.coalesce(DailyRollup.client_id, db.literal_column('0')), unique=True)
+
+
+class ReminderRun(db.Model):
+    """One run of the invoice reminder job and what it did."""
+    __tablename__ = 'reminder_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    candidates = db.Column(db.Integer, nullable=False, default=0)  # invoices selected as due a reminder
+    sent = db.Column(db.Integer, nullable=False, default=0)  # queued in the email outbox
+    skipped = db.Column(db.Integer, nullable=False, default=0)  # no client email address
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    workers = db.Column(db.Integer, nullable=False, default=1)
+    duration_ms = db.Column(db.Integer, nullable=True)  # whole run
+    # per-email send timings of runs that sent directly; the outbox now delivers
+    avg_send_ms = db.Column(db.Integer, nullable=True)
+    max_send_ms = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+
+class EmailAttachment(db.Model):
+    """Attachment content for outbox messages, stored once per SHA-256."""
+    __tablename__ = 'email_attachments'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    content = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class EmailOutbox(db.Model):
+    """An outbound email waiting for, or done with, delivery by app.utils.email_outbox."""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # the worker's due-message scan
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    dedupe_key = db.Column(db.String(200), unique=True, nullable=True)  # a second message with the same key is dropped
+    subject = db.Column(db.String(500), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    from_addr = db.Column(db.String(200), nullable=True)
+    body_text = db.Column(db.Text, nullable=True)
+    body_html = db.Column(db.Text, nullable=True)
+    attachments = db.Column(db.Text, nullable=True)  # JSON list of {filename, mime_type, sha256}
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32), nullable=True)  # worker batch currently sending it
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def recipient_list(self):
+        return json.loads(self.recipients) if self.recipients else []
+
+    @property
+    def attachment_refs(self):
+        return json.loads(self.attachments) if self.attachments else []
+
+
+class InvoiceSendJob(db.Model):
+    """A background "send all drafts" run over one billing period, polled by the UI."""
+    __tablename__ = 'invoice_send_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    date_from = db.Column(db.Date, nullable=False)
+    date_to = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    requested_by = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
+    total = db.Column(db.Integer, nullable=False, default=0)  # draft invoices selected
+    sent = db.Column(db.Integer, nullable=False, default=0)  # emailed (queued in the outbox) and marked Sent
+    skipped = db.Column(db.Integer, nullable=False, default=0)  # no client email address, or sent by another request
+    failed = db.Column(db.Integer, nullable=False, default=0)  # PDF could not be rendered
+    errors = db.Column(db.Text, nullable=True)  # JSON list of {invoice_number, error}
+    error = db.Column(db.Text, nullable=True)  # why the whole job stopped
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def error_list(self):
+        return json.loads(self.errors) if self.errors else []
+
+
+class SessionImportJob(db.Model):
+    """A CSV session import, run in the background for large files and polled by the UI."""
+    __tablename__ = 'session_import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=True)
+    size = db.Column(db.Integer, nullable=False, default=0)  # bytes uploaded
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    skip_errors = db.Column(db.Boolean, nullable=False, default=False)
+    requested_by = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
+    rows = db.Column(db.Integer, nullable=False, default=0)  # CSV rows read so far
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)  # rows rejected
+    errors = db.Column(db.Text, nullable=True)  # JSON list of {row, error}
+    error = db.Column(db.Text, nullable=True)  # why the whole job stopped
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def error_list(self):
+        return json.loads(self.errors) if self.errors else []
+
+
+class InvoiceSequence(db.Model):
+    """The last invoice number handed out per month, allocated by app.utils.invoice_numbers."""
+    __tablename__ = 'invoice_sequences'
+    month = db.Column(db.String(6), primary_key=True)  # YYYYMM
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+
+# keep daily_rollups, invoice balances and the calendar feed cache in step with writes made through the ORM session
+from app.utils import rollups  # noqa: E402,F401
+from app.utils import calendar_feed  # noqa: E402,F401
+from app.utils import invoice_balances  # noqa: E402
@@ -5,15 +5,46 @@ from app.models import Employee, Intervention, PayRate, PayStub, PayStubItem, Cl
 from sqlalchemy import extract
 from flask_login import login_required, current_user
 from datetime import date, datetime
-from weasyprint import HTML
-import tempfile, os
+import io
 from app.utils.email_utils import queue_email_with_pdf
 from app.utils.settings_utils import get_org_settings
+from app.utils.payrates import PayRateResolver
+from app.utils.pdf_render import render_pdf
+from app.utils.pdf_cache import get_or_render_pdf, invalidate_paystub, paystub_cache_key, paystub_pdf_fingerprint
 
 
 payroll_bp = Blueprint('payroll', __name__, template_folder='templates')
 
 
+def _paystub_pdf_html(paystub, settings, download_time=None):
+    """Render the paystub_pdf.html template for a paystub."""
+    return render_template('paystub_pdf.html',
+           paystub=paystub,
+           logo_b64=settings.get('logo_b64'),
+           # For PDF rendering prefer a file:// URI; fall back to web path
+           logo_path=settings.get('logo_file_uri') or settings.get('logo_web_path'),
+           logo_url=settings.get('logo_url'),
+           org_name=settings.get('org_name'),
+           org_phone=settings.get('org_phone'),
+           org_email=settings.get('org_email'),
+           org_address=settings.get('org_address'),
+           download_time=download_time or datetime.now().strftime('%Y/%m/%d %H:%M:%S'))
+
+
+def _render_paystub_pdf(paystub, settings):
+    """Return the paystub PDF bytes, shared by download and email through the PDF cache.
+
+    The fingerprint covers everything the template shows except the
+    "Generated" time, which is the time of the render that was cached.
+    """
+    fingerprint = paystub_pdf_fingerprint(paystub, settings)
+
+    def _render():
+        return render_pdf(_paystub_pdf_html(paystub, settings), label=f'paystub {paystub.id}')
+
+    return get_or_render_pdf(paystub_cache_key(paystub.id), fingerprint, _render)
+
+
 @payroll_bp.route('/paystubs')
 @login_required
 def list_paystubs():
@@ -206,49 +237,16 @@ def export_paystub_pdf(id):
         
         # Resolve org settings and logo using AppSettings -> env -> defaults
         settings = get_org_settings()
-        logo_b64 = settings.get('logo_b64')
-        logo_file_uri = settings.get('logo_file_uri')
-        logo_web_path = settings.get('logo_web_path')
-        logo_url = settings.get('logo_url')
-        org_name = settings.get('org_name')
-        org_phone = settings.get('org_phone')
-        org_email = settings.get('org_email')
-        org_address = settings.get('org_address')
-        
-        
-        # Get current timestamp for download time
-        download_time = datetime.now()
-        formatted_time = download_time.strftime('%Y/%m/%d %H:%M:%S')
-        filename_time = download_time.strftime('%Y%m%d%H%M%S')
-        
-        # Generate PDF using WeasyPrint with the new template
-        # render the template from this blueprint's templates folder
-        html = render_template('paystub_pdf.html',
-               paystub=paystub,
-               logo_b64=logo_b64,
-               # For PDF rendering prefer a file:// URI; fall back to web path
-               logo_path=logo_file_uri or logo_web_path,
-               logo_url=logo_url,
-               org_name=org_name,
-               org_phone=org_phone,
-               org_email=org_email,
-               org_address=org_address,
-               download_time=formatted_time)
-        
-        # Create a temporary file for the PDF
-        temp_dir = tempfile.mkdtemp()
-        pdf_path = os.path.join(temp_dir, f'paystub_{id}.pdf')
-        
-        # Generate PDF from HTML with custom styles
-        HTML(string=html, base_url=request.url_root).write_pdf(pdf_path)
-        try:
-            size = os.path.getsize(pdf_path)
-        except Exception:
-            size = None
+
+        # Get current timestamp for the file name
+        filename_time = datetime.now().strftime('%Y%m%d%H%M%S')
+
+        pdf_bytes = _render_paystub_pdf(paystub, settings)
         
-        # Send the PDF file
+        # Send the PDF from memory
         return send_file(
-            pdf_path,
+            io.BytesIO(pdf_bytes),
+            mimetype='application/pdf',
             as_attachment=True,
             download_name=f'paystub_{paystub.period_start.strftime("%Y%m%d")}-{paystub.period_end.strftime("%Y%m%d")}_{paystub.employee.firstname}_{paystub.employee.lastname}_{filename_time}.pdf'
         )
@@ -275,30 +273,10 @@ def email_paystub(id):
     try:
         # Resolve org settings and logo
         settings = get_org_settings()
-        logo_b64 = settings.get('logo_b64')
-        logo_file_uri = settings.get('logo_file_uri')
-        logo_web_path = settings.get('logo_web_path')
-        logo_url = settings.get('logo_url')
         org_name = settings.get('org_name')
-        
-        # Generate PDF
-        html = render_template('paystub_pdf.html',
-               paystub=paystub,
-               logo_b64=logo_b64,
-               logo_path=logo_file_uri or logo_web_path,
-               logo_url=logo_url,
-               org_name=org_name,
-               download_time=datetime.now().strftime('%Y/%m/%d %H:%M:%S'))
-        
-        pdf_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        HTML(string=html, base_url=request.url_root).write_pdf(pdf_temp.name)
-        pdf_temp.close()
-        
-        with open(pdf_temp.name, 'rb') as f:
-            pdf_bytes = f.read()
-        
-        # Clean up temp file
-        os.unlink(pdf_temp.name)
+
+        # Generate PDF (or reuse the one rendered for a download)
+        pdf_bytes = _render_paystub_pdf(paystub, settings)
         
         # Prepare email
         filename = f"paystub_{paystub.period_start.strftime('%Y%m%d')}-{paystub.period_end.strftime('%Y%m%d')}_{paystub.employee.firstname}_{paystub.employee.lastname}.pdf"
@@ -351,6 +329,7 @@ def delete_paystub(id):
     # deleting paystub will cascade to PayStubItem because of relationship cascade
     db.session.delete(paystub)
     db.session.commit()
+    invalidate_paystub(id)
     flash('Paystub deleted successfully', 'success')
     return redirect(url_for('payroll.list_paystubs'))
 
@@ -377,17 +356,13 @@ def create_paystub():
             flash('Start date must be before end date', 'danger')
             return render_template('create_paystub.html', form=form)
 
-        # Query sessions within date range, regardless of invoice status
-        # Get list of interventions that are already in paystubs
-        existing_paystub_sessions = db.session.query(PayStubItem.intervention_id).all()
-        existing_session_ids = [id[0] for id in existing_paystub_sessions]
-
-        # Query sessions within date range, excluding those already in paystubs
+        # Query sessions within date range, regardless of invoice status,
+        # excluding those already in paystubs (is_paid + NOT EXISTS anti-join)
         sessions = Intervention.query.filter(
             Intervention.employee_id == emp_id,
             Intervention.date >= start,
             Intervention.date <= end,
-            ~Intervention.id.in_(existing_session_ids) if existing_session_ids else True
+            Intervention.unpaid_clause()
         ).order_by(Intervention.date).all()
         
         # Query mileage entries for the employee within date range
@@ -402,31 +377,13 @@ def create_paystub():
         total_hours = 0.0
         total_amount = 0.0
         
-        # Process interventions
+        # Process interventions; all of the employee's pay rates are loaded once
+        # (client-specific rate first, then base rate, see app.utils.payrates)
+        rates = PayRateResolver.for_employees([emp_id]).resolve_sessions(sessions)
         for s in sessions:
-            # 1. Try to find latest client-specific rate for employee-client pair
-            rate = None
-            payrates = PayRate.query.filter_by(employee_id=emp_id, client_id=s.client_id).order_by(PayRate.effective_date.desc()).all()
-            if payrates:
-                for pr in payrates:
-                    if pr.effective_date is None or pr.effective_date <= s.date:
-                        rate = pr.rate
-                        break
-                if rate is None:
-                    rate = payrates[0].rate
-
-            # 2. If no client-specific rate, use latest base rate (client_id is None)
-            if rate is None:
-                base_rates = PayRate.query.filter_by(employee_id=emp_id, client_id=None).order_by(PayRate.effective_date.desc()).all()
-                if base_rates:
-                    for br in base_rates:
-                        if br.effective_date is None or br.effective_date <= s.date:
-                            rate = br.rate
-                            break
-                    if rate is None:
-                        rate = base_rates[0].rate
-
-            # 3. If still no rate, mark as missing
+            rate = rates.get(s.id)
+
+            # If no rate, mark as missing
             if rate is None:
                 missing_rates.append((s.client_id, s.id))
                 continue
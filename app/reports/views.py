@@ -1,10 +1,53 @@
 from flask import Blueprint, render_template, request, abort
 from app import db
-from app.models import Employee, Client, Intervention, Invoice, PayStub
+from app.models import Employee, Client
 from flask_login import login_required, current_user
 from app.utils.settings_utils import get_org_settings
 from datetime import date, timedelta
 from app.reports.forms import ClientReportForm, EmployeeReportForm
+from app.utils.invoice_balances import STATES as PAYMENT_STATES
+from app.utils.report_aggregates import invoice_summary, paystub_summary, session_summary
+from app.utils.report_export import invoice_rows, paystub_rows, session_rows, stream_csv
+
+REPORT_PAGE_SIZE = 50
+# the largest page a report table shows; the CSV export has every row
+REPORT_MAX_PAGE_SIZE = 500
+
+# CSV columns of the Export CSV button, matching the report tables
+_SESSION_CSV = [
+    ('Date', lambda r: r.date),
+    ('Employee', lambda r: f"{r.employee_firstname} {r.employee_lastname}"),
+    ('Client', lambda r: f"{r.client_firstname} {r.client_lastname}" if r.client_firstname is not None else 'N/A'),
+    ('Activity', lambda r: r.intervention_type),
+    ('Start Time', lambda r: r.start_time),
+    ('End Time', lambda r: r.end_time),
+    ('Duration', lambda r: round(r.duration, 2) if r.duration is not None else None),
+    ('Invoiced', lambda r: 'Yes' if r.invoiced else 'No'),
+    ('Paid', lambda r: 'Yes' if r.is_paid else 'No'),
+]
+
+_INVOICE_CSV = [
+    ('Invoice Number', lambda r: r.invoice_number),
+    ('Client', lambda r: f"{r.client_firstname} {r.client_lastname}"),
+    ('Invoiced Date', lambda r: r.invoiced_date),
+    ('Pay By Date', lambda r: r.payby_date),
+    ('Period', lambda r: f"{r.date_from} to {r.date_to}"),
+    ('Total Cost', lambda r: f"${r.total_cost:.2f}"),
+    ('Paid', lambda r: f"${r.amount_paid:.2f}"),
+    ('Pending', lambda r: f"${r.amount_pending:.2f}"),
+    ('Status', lambda r: r.status),
+    ('Payment Status', lambda r: r.payment_state),
+    ('Paid Date', lambda r: r.paid_date if r.paid_date else 'N/A'),
+]
+
+_PAYSTUB_CSV = [
+    ('Employee', lambda r: f"{r.employee_firstname} {r.employee_lastname}"),
+    ('Period Start', lambda r: r.period_start),
+    ('Period End', lambda r: r.period_end),
+    ('Generated Date', lambda r: r.generated_date),
+    ('Total Hours', lambda r: r.total_hours),
+    ('Total Amount', lambda r: f"${r.total_amount:.2f}"),
+]
 
 reports_bp = Blueprint('reports', __name__, template_folder='templates')
 
@@ -77,26 +120,26 @@ def sessions_report():
     else:
         end_date = (date.today().replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
     
-    interventions = Intervention.query.filter(
-        Intervention.date >= start_date,
-        Intervention.date <= end_date
-    )
-    
     client_id = request.args.get('client_id')
-    if client_id:
-        interventions = interventions.filter(Intervention.client_id == int(client_id))
-    
     employee_id = request.args.get('employee_id')
-    if employee_id:
-        interventions = interventions.filter(Intervention.employee_id == int(employee_id))
-    
-    interventions = interventions.order_by(Intervention.date).all()
+    interventions = session_rows(start_date, end_date,
+                                 client_id=int(client_id) if client_id else None,
+                                 employee_id=int(employee_id) if employee_id else None)
+    if request.args.get('format') == 'csv':
+        return stream_csv(interventions, _SESSION_CSV, f'sessions_report_{start_date.isoformat()}_{end_date.isoformat()}.csv')
+    
+    # totals come from one grouped query; the table shows one page of rows
+    summary = session_summary(interventions)
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', REPORT_PAGE_SIZE, type=int)
+    pagination = interventions.paginate(page=page, per_page=per_page, max_per_page=REPORT_MAX_PAGE_SIZE, error_out=False)
+    per_page = pagination.per_page
     
     clients = Client.query.filter_by(is_active=True).order_by(Client.firstname).all()
     employees = Employee.query.filter(Employee.position != 'Administrator').order_by(Employee.firstname).all()
     
     settings = get_org_settings()
-    return render_template('sessions_report.html', interventions=interventions, start_date=start_date.isoformat(), end_date=end_date.isoformat(), clients=clients, employees=employees, org_name=settings['org_name'])
+    return render_template('sessions_report.html', interventions=pagination.items, pagination=pagination, per_page=per_page, summary=summary, start_date=start_date.isoformat(), end_date=end_date.isoformat(), clients=clients, employees=employees, org_name=settings['org_name'])
 
 @reports_bp.route('/invoices')
 @login_required
@@ -117,21 +160,23 @@ def invoices_report():
     else:
         end_date = (date.today().replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
     
-    invoices = Invoice.query.filter(
-        Invoice.invoiced_date >= start_date,
-        Invoice.invoiced_date <= end_date
-    )
-    
     client_id = request.args.get('client_id')
-    if client_id:
-        invoices = invoices.filter(Invoice.client_id == int(client_id))
-    
-    invoices = invoices.order_by(Invoice.invoiced_date.desc()).all()
+    payment_state = request.args.get('payment_state') or None
+    invoices = invoice_rows(start_date, end_date, client_id=int(client_id) if client_id else None,
+                            payment_state=payment_state)
+    if request.args.get('format') == 'csv':
+        return stream_csv(invoices, _INVOICE_CSV, f'invoices_report_{start_date.isoformat()}_{end_date.isoformat()}.csv')
+    
+    summary = invoice_summary(invoices)
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', REPORT_PAGE_SIZE, type=int)
+    pagination = invoices.paginate(page=page, per_page=per_page, max_per_page=REPORT_MAX_PAGE_SIZE, error_out=False)
+    per_page = pagination.per_page
     
     clients = Client.query.filter_by(is_active=True).order_by(Client.firstname).all()
     
     settings = get_org_settings()
-    return render_template('invoices_report.html', invoices=invoices, start_date=start_date.isoformat(), end_date=end_date.isoformat(), clients=clients, org_name=settings['org_name'])
+    return render_template('invoices_report.html', invoices=pagination.items, pagination=pagination, per_page=per_page, summary=summary, start_date=start_date.isoformat(), end_date=end_date.isoformat(), clients=clients, payment_states=PAYMENT_STATES, org_name=settings['org_name'])
 
 @reports_bp.route('/paystubs')
 @login_required
@@ -152,18 +197,18 @@ def paystubs_report():
     else:
         end_date = (date.today().replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
     
-    paystubs = PayStub.query.filter(
-        PayStub.generated_date >= start_date,
-        PayStub.generated_date <= end_date
-    )
-    
     employee_id = request.args.get('employee_id')
-    if employee_id:
-        paystubs = paystubs.filter(PayStub.employee_id == int(employee_id))
+    paystubs = paystub_rows(start_date, end_date, employee_id=int(employee_id) if employee_id else None)
+    if request.args.get('format') == 'csv':
+        return stream_csv(paystubs, _PAYSTUB_CSV, f'paystubs_report_{start_date.isoformat()}_{end_date.isoformat()}.csv')
     
-    paystubs = paystubs.order_by(PayStub.generated_date.desc()).all()
+    summary = paystub_summary(paystubs)
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', REPORT_PAGE_SIZE, type=int)
+    pagination = paystubs.paginate(page=page, per_page=per_page, max_per_page=REPORT_MAX_PAGE_SIZE, error_out=False)
+    per_page = pagination.per_page
     
     employees = Employee.query.filter(Employee.position != 'Administrator').order_by(Employee.firstname).all()
     
     settings = get_org_settings()
-    return render_template('paystubs_report.html', paystubs=paystubs, start_date=start_date.isoformat(), end_date=end_date.isoformat(), employees=employees, org_name=settings['org_name'])
\ No newline at end of file
+    return render_template('paystubs_report.html', paystubs=pagination.items, pagination=pagination, per_page=per_page, summary=summary, start_date=start_date.isoformat(), end_date=end_date.isoformat(), employees=employees, org_name=settings['org_name'])
\ No newline at end of file
@@ -142,6 +142,7 @@ def send_activation_email(id):
         )
         
         if success:
+            db.session.commit()
             flash(f"Activation email sent to {employee.email}.", "success")
         else:
             flash(f"Failed to send activation email to {employee.email}.", "danger")
@@ -0,0 +1,289 @@
+"""Calendar event feed with per-month caching and conditional GETs.
+
+``load_events`` builds FullCalendar events from a single column-only query
+joining clients, employees and invoices. Serialised events are cached per
+process for each (view_type, entity, visibility scope, month), so navigating
+back and forth between months does not hit the database.
+
+Entries are keyed by a change version per calendar entity (``('client', id)``
+or ``('employee', id)``). A session listener bumps the versions touched by a
+commit: session edits bump their client and employee, invoice edits bump the
+invoice's client and the employees on it. Changes to names or supervisors,
+which can affect any calendar, bump a global version. As with the settings
+cache, ``CALENDAR_CACHE_TTL`` bounds how long another process's writes can go
+unseen. Versions also feed the ETag/Last-Modified of the response, so an
+unchanged month answers with 304.
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+
+from app import db
+from app.models import Client, Employee, Intervention, Invoice
+
+DEFAULT_CACHE_TTL = 300
+DEFAULT_MAX_ENTRIES = 512
+
+_DIRTY_KEY = 'calendar_feed_dirty'
+_GLOBAL = ('all', None)
+
+_cache_lock = Lock()
+
+_STATUS_COLORS = {
+    'Draft': ('#0dcaf0', 'invoice-draft'),  # Bootstrap info color
+    'Sent': ('#d48717', 'invoice-sent'),  # Bootstrap warning color
+    'Paid': ('#606e30', 'invoice-paid'),  # Bootstrap success color
+}
+_OTHER_INVOICE = ('#6c757d', 'invoice-other')  # Bootstrap secondary color
+_NOT_INVOICED = ('#6c757d', 'not-invoiced')
+
+# attributes shown on, or deciding visibility of, any calendar
+_NAME_ATTRS = {
+    Client: ('firstname', 'lastname', 'supervisor_id'),
+    Employee: ('firstname', 'lastname', 'email'),
+}
+
+
+def _state():
+    return current_app.extensions.setdefault('calendar_cache', {
+        'versions': {},
+        'entries': OrderedDict(),
+    })
+
+
+def _config_number(name, default):
+    try:
+        return float(current_app.config.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _version(state, entity):
+    # first sight of an entity starts at version 0 "modified" now
+    return state['versions'].setdefault(entity, (0, time.time()))
+
+
+def bump_versions(entities):
+    """Invalidate cached months for ``entities`` (``('client'|'employee', id)`` or the global key)."""
+    try:
+        state = _state()
+    except RuntimeError:
+        # no app context (standalone scripts): nothing cached in this process
+        return
+    now = time.time()
+    with _cache_lock:
+        for entity in entities:
+            number, _ = state['versions'].get(entity, (0, now))
+            state['versions'][entity] = (number + 1, now)
+
+
+def _dirty(session):
+    return session.info.setdefault(_DIRTY_KEY, set())
+
+
+def mark_dirty(session=None, entities=()):
+    """Queue calendar entities to be bumped when ``session`` commits.
+
+    ORM changes are collected by ``before_flush``; bulk statements that
+    bypass the unit of work must call this.
+    """
+    _dirty(session or db.session).update(entities)
+
+
+def _values(state, attr):
+    history = state.attrs[attr].history
+    values = set(history.added) | set(history.deleted) | set(history.unchanged)
+    if not values:
+        values.add(getattr(state.obj(), attr, None))
+    return {v for v in values if v is not None}
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_dirty(session, flush_context, instances):
+    dirty = _dirty(session)
+    invoice_numbers = set()
+    edited_ids = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        state = inspect(obj)
+        if isinstance(obj, Intervention):
+            dirty.update(('client', c) for c in _values(state, 'client_id'))
+            dirty.update(('employee', e) for e in _values(state, 'employee_id'))
+            if state.persistent:
+                edited_ids.append(obj.id)
+        elif isinstance(obj, Invoice):
+            dirty.update(('client', c) for c in _values(state, 'client_id'))
+            invoice_numbers.update(_values(state, 'invoice_number'))
+        elif isinstance(obj, (Client, Employee)) and obj not in session.new:
+            if any(state.attrs[attr].history.has_changes() for attr in _NAME_ATTRS[type(obj)]):
+                dirty.add(_GLOBAL)
+
+    if edited_ids:
+        # previous owners, in case the attributes were expired before the edit
+        for client_id, employee_id in session.execute(
+            select(Intervention.client_id, Intervention.employee_id).where(Intervention.id.in_(edited_ids))
+        ):
+            dirty.update({('client', client_id), ('employee', employee_id)})
+    if invoice_numbers:
+        dirty.update(
+            ('employee', employee_id) for (employee_id,) in session.execute(
+                select(Intervention.employee_id).where(Intervention.invoice_number.in_(invoice_numbers)).distinct()
+            )
+        )
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_committed(session):
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        bump_versions(dirty)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_dirty(session, previous_transaction):
+    session.info.pop(_DIRTY_KEY, None)
+
+
+def _months(date_from, date_to):
+    """First days of the months overlapping [date_from, date_to)."""
+    month = date_from.replace(day=1)
+    while month < date_to:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def _event(row, view_type):
+    start_time_formatted = row.start_time.strftime('%I:%M %p').lstrip('0')
+    end_time_formatted = row.end_time.strftime('%I:%M %p').lstrip('0')
+    client_name = f"{row.client_firstname} {row.client_lastname}"
+    employee_name = f"{row.employee_firstname} {row.employee_lastname}"
+    # time on the first line, details on the second
+    details = f"{employee_name if view_type == 'client' else client_name} - {row.intervention_type}"
+    if row.invoice_id is None:
+        bg_color, class_name = _NOT_INVOICED
+    else:
+        bg_color, class_name = _STATUS_COLORS.get(row.invoice_status, _OTHER_INVOICE)
+    return {
+        'id': row.id,
+        'title': f"{start_time_formatted} - {end_time_formatted}<br>{details}",
+        'start': f"{row.date}T{row.start_time}",
+        'end': f"{row.date}T{row.end_time}",
+        'backgroundColor': bg_color,
+        'borderColor': bg_color,
+        'textColor': '#ffffff',
+        'className': class_name,
+        'extendedProps': {
+            'client': client_name,
+            'employee': employee_name,
+            'type': row.intervention_type,
+            'duration': round(row._duration, 2) if row._duration is not None else None,
+            'invoiced': row.invoiced
+        }
+    }
+
+
+def _query_events(view_type, entity_id, scope_filters, date_from=None, date_to=None):
+    """Return ``[(date, event_json)]`` for the calendar in one query."""
+    query = (
+        db.session.query(
+            Intervention.id, Intervention.date, Intervention.start_time, Intervention.end_time,
+            Intervention.intervention_type, Intervention._duration, Intervention.invoiced,
+            Client.firstname.label('client_firstname'), Client.lastname.label('client_lastname'),
+            Employee.firstname.label('employee_firstname'), Employee.lastname.label('employee_lastname'),
+            Invoice.id.label('invoice_id'), Invoice.status.label('invoice_status')
+        )
+        .join(Client, Intervention.client_id == Client.id)
+        .join(Employee, Intervention.employee_id == Employee.id)
+        .outerjoin(Invoice, Intervention.invoice_number == Invoice.invoice_number)
+    )
+    if view_type == 'client':
+        query = query.filter(Intervention.client_id == entity_id)
+    elif view_type == 'employee':
+        query = query.filter(Intervention.employee_id == entity_id)
+    for condition in scope_filters:
+        query = query.filter(condition)
+    if date_from:
+        query = query.filter(Intervention.date >= date_from)
+    if date_to:
+        query = query.filter(Intervention.date < date_to)
+    query = query.order_by(Intervention.date, Intervention.start_time)
+    return [(row.date, json.dumps(_event(row, view_type))) for row in query]
+
+
+def load_events(view_type, entity_id, scope, scope_filters, date_from, date_to):
+    """Return ``(events_json, etag, last_modified_timestamp)`` for [date_from, date_to).
+
+    ``scope`` identifies the caller's visibility (e.g. ``('therapist', 7)``)
+    and ``scope_filters`` are the matching SQL conditions; both are part of
+    the cache key. Months missing from the cache are loaded in one query.
+    """
+    state = _state()
+    entity = (view_type, entity_id)
+    ttl = _config_number('CALENDAR_CACHE_TTL', DEFAULT_CACHE_TTL)
+    max_entries = int(_config_number('CALENDAR_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+
+    with _cache_lock:
+        versions = (_version(state, entity), _version(state, _GLOBAL))
+    version_key = (versions[0][0], versions[1][0])
+    last_modified = max(versions[0][1], versions[1][1])
+
+    months = list(_months(date_from, date_to))
+    now = time.monotonic()
+    cached = {}
+    with _cache_lock:
+        for month in months:
+            entry = state['entries'].get((entity, scope, month))
+            if entry and entry['version'] == version_key and now - entry['loaded_at'] < ttl:
+                state['entries'].move_to_end((entity, scope, month))
+                cached[month] = entry
+
+    missing = [m for m in months if m not in cached]
+    if missing:
+        range_end = (missing[-1] + timedelta(days=32)).replace(day=1)
+        rows = _query_events(view_type, entity_id, scope_filters, missing[0], range_end)
+        loaded = {m: [] for m in missing}
+        for day, event_json in rows:
+            month = day.replace(day=1)
+            if month in loaded:
+                loaded[month].append((day, event_json))
+        with _cache_lock:
+            for month, events in loaded.items():
+                digest = hashlib.sha1('\n'.join(e for _, e in events).encode()).hexdigest()
+                entry = {'version': version_key, 'loaded_at': now, 'events': events, 'digest': digest}
+                state['entries'][(entity, scope, month)] = entry
+                cached[month] = entry
+            while len(state['entries']) > max_entries:
+                state['entries'].popitem(last=False)
+
+    parts = [
+        event_json
+        for month in months
+        for day, event_json in cached[month]['events']
+        if date_from <= day < date_to
+    ]
+    etag = hashlib.sha1(json.dumps([
+        view_type, entity_id, list(scope), date_from.isoformat(), date_to.isoformat(),
+        list(version_key), [cached[m]['digest'] for m in months]
+    ]).encode()).hexdigest()
+    return '[' + ','.join(parts) + ']', etag, last_modified
+
+
+def load_events_uncached(view_type, entity_id, scope_filters, date_from=None, date_to=None):
+    """Events for an open-ended range (no start/end given); not cached."""
+    return '[' + ','.join(e for _, e in _query_events(view_type, entity_id, scope_filters, date_from, date_to)) + ']'
+
+
+def parse_calendar_date(value):
+    """FullCalendar sends ISO dates or datetimes (with offset); keep the date part."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
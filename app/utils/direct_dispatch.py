@@ -0,0 +1,199 @@
+"""In-process dispatch of web routes for the ``/api/<path>`` mirror.
+
+The API proxy used to replay each request through ``app.test_client()``,
+which built a second WSGI environ and ran the whole request stack again.
+``dispatch`` instead matches the target path against the URL map and calls
+the view function inside the current request, with the API caller as the
+logged-in user. The query string and body of the API request are the
+view's query string and body.
+
+With ``Accept: application/json`` the view's ``render_template`` call is
+intercepted before rendering and its context is returned as JSON instead of
+HTML. Columns that look like credentials are never included.
+
+Bodies that are not text (file downloads, PDFs) are returned base64-encoded,
+with ``content_encoding: 'base64'``.
+"""
+
+import base64
+import re
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from flask import before_render_template, current_app, g, request, session
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.engine import Row
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+from wtforms import Form, PasswordField
+
+_CAPTURE_KEY = '_direct_dispatch_capture'
+
+# template variables every render gets from Flask, Flask-Login and the app
+_INJECTED = {'g', 'request', 'session', 'current_user'}
+
+# never serialise password hashes, reset/activation keys, 2FA or OAuth secrets
+_SENSITIVE = re.compile(r'password|secret|token|(^|_)key$|_hash$')
+
+_MAX_DEPTH = 6
+
+
+# text bodies are returned as they are, anything else base64-encoded
+_TEXT_MIMETYPES = {'application/json', 'application/javascript', 'application/xml'}
+
+
+class _TemplateCaptured(BaseException):
+    # a BaseException, like GeneratorExit, so the views' ``except Exception``
+    # blocks around render_template don't swallow it
+    def __init__(self, template_name, context):
+        super().__init__(template_name)
+        self.template_name = template_name
+        self.context = context
+
+
+@before_render_template.connect
+def _capture_context(sender, template, context, **extra):
+    # raising aborts render_template before any HTML is produced; only
+    # requests that asked for the context have the flag set
+    if g.get(_CAPTURE_KEY):
+        raise _TemplateCaptured(template.name, dict(context))
+
+
+def wants_context():
+    """True for GET requests whose client prefers JSON over HTML.
+
+    Other methods always run to completion: a view may render an email
+    template before it commits and redirects.
+    """
+    best = request.accept_mimetypes.best_match(['text/html', 'application/json'])
+    return request.method == 'GET' and best == 'application/json'
+
+
+def _injected_names():
+    names = set(_INJECTED)
+    for blueprint in (None, *request.blueprints):
+        for func in current_app.template_context_processors.get(blueprint, ()):
+            try:
+                names.update(func())
+            except Exception:
+                continue
+    return names
+
+
+def _model_to_dict(value, state, depth):
+    return {
+        attr.key: to_jsonable(getattr(value, attr.key), depth + 1)
+        for attr in state.mapper.column_attrs
+        if not _SENSITIVE.search(attr.key)
+    }
+
+
+def to_jsonable(value, depth=0):
+    """Best-effort JSON conversion of a template context value."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if depth > _MAX_DEPTH:
+        return None
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, dict):
+        return {
+            str(k): to_jsonable(v, depth + 1)
+            for k, v in value.items()
+            if not (isinstance(k, str) and _SENSITIVE.search(k))
+        }
+    if isinstance(value, Row):
+        return to_jsonable(value._asdict(), depth)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [to_jsonable(v, depth + 1) for v in value]
+    if isinstance(value, Pagination):
+        return {
+            'items': to_jsonable(value.items, depth + 1),
+            'page': value.page,
+            'per_page': value.per_page,
+            'pages': value.pages,
+            'total': value.total,
+        }
+    if isinstance(value, Form):
+        return {
+            field.name: to_jsonable(field.data, depth + 1)
+            for field in value
+            if field.name != 'csrf_token' and not isinstance(field, PasswordField)
+        }
+    state = sa_inspect(value, raiseerr=False)
+    if state is not None and hasattr(state, 'mapper'):
+        return _model_to_dict(value, state, depth)
+    if callable(value):
+        return None
+    return str(value)
+
+
+def _wrap(response):
+    payload = {'status_code': response.status_code}
+    if response.location:
+        payload['location'] = response.location
+    if response.direct_passthrough:
+        # send_file / send_from_directory: read the file into the response
+        response.make_sequence()
+    mimetype = response.mimetype or ''
+    if mimetype.startswith('text/') or mimetype in _TEXT_MIMETYPES or mimetype.endswith(('+json', '+xml')):
+        payload['content'] = response.get_data(as_text=True)
+    else:
+        payload['content'] = base64.b64encode(response.get_data()).decode('ascii')
+        payload['content_encoding'] = 'base64'
+        payload['mimetype'] = mimetype
+    return payload
+
+
+def dispatch(path, as_context=False):
+    """Run the web view for ``/path`` in the current request.
+
+    Returns ``(payload, status_code)``. The payload holds the response body
+    as ``content`` or, with ``as_context``, the ``template`` name and its
+    ``context``. Messages flashed by the view are returned as ``messages``
+    rather than stored in the API caller's session.
+    """
+    adapter = current_app.create_url_adapter(request)
+    try:
+        rule, view_args = adapter.match('/' + path, method=request.method, return_rule=True)
+    except RequestRedirect as e:
+        return {'status_code': 308, 'location': e.new_url}, 308
+    except HTTPException as e:
+        return {'status_code': e.code, 'error': e.description}, e.code
+    if rule.endpoint == request.endpoint:
+        # /api/api/... would dispatch back into the proxy
+        return {'status_code': 404, 'error': 'not found'}, 404
+
+    view = current_app.view_functions[rule.endpoint]
+    outer_rule, outer_args = request.url_rule, request.view_args
+    # flask_login's current_user reads g._login_user before touching the session
+    g._login_user = g.current_user
+    request.url_rule, request.view_args = rule, view_args
+    setattr(g, _CAPTURE_KEY, as_context)
+    payload = None
+    try:
+        response = current_app.make_response(view(**view_args))
+    except _TemplateCaptured as captured:
+        injected = _injected_names()
+        payload = {
+            'status_code': 200,
+            'template': captured.template_name,
+            'context': {k: to_jsonable(v) for k, v in captured.context.items() if k not in injected},
+        }
+    except HTTPException as e:
+        response = e.get_response()
+    finally:
+        request.url_rule, request.view_args = outer_rule, outer_args
+        g.pop(_CAPTURE_KEY, None)
+
+    if payload is None:
+        payload = _wrap(response)
+    messages = session.pop('_flashes', None)
+    if messages:
+        payload['messages'] = [{'category': c, 'message': m} for c, m in messages]
+    return payload, payload['status_code']
@@ -0,0 +1,332 @@
+"""Durable outbound email queue.
+
+``queue_email`` adds each message to the session as an ``email_outbox`` row
+(attachments go to ``email_attachments`` once per SHA-256 of their content);
+the caller commits it with the rest of its work, so a restart no longer
+loses mail and a rolled back request sends none. Delivery happens in batches:
+:func:`process_outbox` claims the due rows, builds the messages in the
+calling thread and sends them in Gmail batch requests of
+``EMAIL_BATCH_SIZE`` messages, through a ``ThreadPoolExecutor`` of
+``EMAIL_SEND_WORKERS`` threads.
+
+Each process runs one :class:`OutboxWorker` thread, started by the first
+commit that queued a message, that drains the outbox when woken and polls every
+``EMAIL_OUTBOX_POLL_SECONDS`` for retries. ``flask send-email-outbox`` drains
+it from the command line (``--loop`` to run as a separate worker process).
+
+A Gmail ``HttpError`` puts the message back in the queue with exponential
+backoff (``EMAIL_RETRY_BASE_SECONDS`` doubling per attempt, capped at an
+hour) until ``EMAIL_MAX_ATTEMPTS``; any other failure marks it failed.
+Messages with a ``dedupe_key`` are queued at most once.
+"""
+
+import hashlib
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from flask import current_app
+from googleapiclient.errors import HttpError
+from sqlalchemy import and_, event, func, or_
+
+from app import db
+from app.models import EmailAttachment, EmailOutbox
+from app.utils.email_utils import _build_message, _send_messages
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('queued', 'sending', 'sent', 'failed')
+
+BATCH_SIZE = 50
+
+# a 'sending' row older than this belongs to a worker that died mid-batch
+STALE_AFTER = timedelta(minutes=10)
+
+MAX_BACKOFF_SECONDS = 3600
+
+_EXTENSION_KEY = 'email_outbox'
+_worker_lock = Lock()
+
+# set on a session that queued mail; its next commit wakes the worker
+_KICK_KEY = 'email_outbox_kick'
+
+
+def _config(name, default):
+    return int(current_app.config.get(name) or default)
+
+
+def _store_attachments(blobs, stored):
+    for sha256, content in blobs.items():
+        if sha256 not in stored and db.session.get(EmailAttachment, sha256) is None:
+            db.session.add(EmailAttachment(sha256=sha256, content=content, size=len(content)))
+        stored.add(sha256)
+
+
+def _new_row(stored, subject, recipients, body_text=None, body_html=None, attachments=None, from_addr=None, dedupe_key=None):
+    # the message is built in full before anything is added to the session
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    refs, blobs = [], {}
+    for filename, content, mime_type in (attachments or []):
+        sha256 = hashlib.sha256(content).hexdigest()
+        refs.append({'filename': filename, 'mime_type': mime_type, 'sha256': sha256})
+        blobs[sha256] = content
+    row = EmailOutbox(
+        dedupe_key=dedupe_key,
+        subject=subject,
+        recipients=json.dumps(list(recipients)),
+        from_addr=from_addr,
+        body_text=body_text,
+        body_html=body_html,
+        attachments=json.dumps(refs) if refs else None,
+        status='queued',
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    _store_attachments(blobs, stored)
+    db.session.add(row)
+    db.session.info[_KICK_KEY] = True
+    return row
+
+
+def enqueue(subject, recipients, body_text=None, body_html=None, attachments=None, from_addr=None, dedupe_key=None):
+    """Add a message to the outbox in the current transaction; the caller commits.
+
+    ``attachments`` is a list of ``(filename, bytes, mime_type)``. Returns
+    the outbox row; when ``dedupe_key`` was already queued, the earlier row.
+    A message that cannot be built raises before anything is added to the
+    session. This process's worker is woken once the caller commits.
+    """
+    if dedupe_key:
+        existing = EmailOutbox.query.filter_by(dedupe_key=dedupe_key).first()
+        if existing is not None:
+            logger.info('Email %r already queued as outbox #%s; not queuing again', dedupe_key, existing.id)
+            return existing
+
+    row = _new_row(set(), subject, recipients, body_text, body_html, attachments, from_addr, dedupe_key)
+    logger.info('Queued email to %s subject=%s', ', '.join(row.recipient_list), subject)
+    return row
+
+
+def enqueue_many(messages):
+    """Add several messages (dicts of :func:`enqueue` arguments) to the session.
+
+    As with :func:`enqueue` the caller commits, so bulk jobs queue mail in
+    the same transaction as the rows it reports on. Messages whose
+    ``dedupe_key`` is already in the outbox are skipped. Returns the number
+    of messages added.
+    """
+    keys = [m['dedupe_key'] for m in messages if m.get('dedupe_key')]
+    queued = {k for (k,) in db.session.query(EmailOutbox.dedupe_key).filter(EmailOutbox.dedupe_key.in_(keys))} if keys else set()
+    stored = set()
+    added = 0
+    for message in messages:
+        key = message.get('dedupe_key')
+        if key and key in queued:
+            logger.info('Email %r already queued; not queuing again', key)
+            continue
+        queued.add(key)
+        _new_row(stored, **message)
+        added += 1
+    return added
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a message that has failed ``attempts`` times."""
+    return min(_config('EMAIL_RETRY_BASE_SECONDS', 30) * 2 ** max(attempts - 1, 0), MAX_BACKOFF_SECONDS)
+
+
+def _due(now):
+    return or_(
+        and_(EmailOutbox.status == 'queued', EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == 'sending', EmailOutbox.locked_at < now - STALE_AFTER),
+    )
+
+
+def _claim(limit):
+    """Mark up to ``limit`` due messages as being sent by this batch and return them."""
+    now = datetime.utcnow()
+    ids = [i for (i,) in db.session.query(EmailOutbox.id).filter(_due(now))
+           .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(limit)]
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # re-checking _due makes the claim safe against another worker taking the same rows
+    EmailOutbox.query.filter(EmailOutbox.id.in_(ids), _due(now)).update({
+        EmailOutbox.status: 'sending',
+        EmailOutbox.claimed_by: token,
+        EmailOutbox.locked_at: now,
+        EmailOutbox.attempts: EmailOutbox.attempts + 1,
+    }, synchronize_session=False)
+    db.session.commit()
+    return EmailOutbox.query.filter_by(claimed_by=token, status='sending').order_by(EmailOutbox.id).all()
+
+
+def _build(row, blobs):
+    attachments = [(ref['filename'], blobs[ref['sha256']], ref['mime_type']) for ref in row.attachment_refs]
+    return _build_message(row.subject, row.recipient_list, row.body_text, row.body_html, attachments, row.from_addr)
+
+
+def _deliver(app, msgs):
+    """Pool worker: send one batch of messages. Returns ``(ok, error, retryable)`` per message."""
+    try:
+        with app.app_context():
+            sent = _send_messages(msgs)
+    except HttpError as e:
+        return [(False, str(e), True)] * len(msgs)
+    except Exception as e:
+        logger.exception('Email delivery raised: %s', e)
+        return [(False, str(e), False)] * len(msgs)
+    return [
+        (True, None, False) if ok
+        else (False, str(error), True) if error is not None
+        else (False, 'delivery failed; see the application log', False)
+        for ok, error in sent
+    ]
+
+
+def process_outbox(limit=BATCH_SIZE, max_workers=None):
+    """Send one batch of due messages. Returns counts of claimed, sent, retried and failed."""
+    counts = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+    rows = _claim(limit)
+    if not rows:
+        return counts
+    counts['claimed'] = len(rows)
+
+    hashes = {ref['sha256'] for row in rows for ref in row.attachment_refs}
+    blobs = dict(
+        db.session.query(EmailAttachment.sha256, EmailAttachment.content).filter(EmailAttachment.sha256.in_(hashes))
+    ) if hashes else {}
+
+    # messages are built here, where settings and the session are at hand;
+    # the pool threads only talk to Gmail
+    jobs, results = [], []
+    for row in rows:
+        try:
+            jobs.append((row, _build(row, blobs)))
+        except Exception as e:
+            logger.exception('Could not build outbox email #%s: %s', row.id, e)
+            results.append((row, (False, f'could not build message: {e}', False)))
+
+    if jobs:
+        app = current_app._get_current_object()
+        size = _config('EMAIL_BATCH_SIZE', 10)
+        chunks = [jobs[start:start + size] for start in range(0, len(jobs), size)]
+        workers = max(1, min(int(max_workers or _config('EMAIL_SEND_WORKERS', 4)), len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(lambda chunk: _deliver(app, [msg for _, msg in chunk]), chunks))
+        for chunk, chunk_outcomes in zip(chunks, outcomes):
+            results.extend((row, outcome) for (row, _), outcome in zip(chunk, chunk_outcomes))
+
+    max_attempts = _config('EMAIL_MAX_ATTEMPTS', 5)
+    now = datetime.utcnow()
+    for row, (ok, error, retryable) in results:
+        row.claimed_by = None
+        row.locked_at = None
+        row.last_error = error
+        if ok:
+            row.status = 'sent'
+            row.sent_at = now
+            counts['sent'] += 1
+        elif retryable and row.attempts < max_attempts:
+            row.status = 'queued'
+            row.next_attempt_at = now + timedelta(seconds=backoff(row.attempts))
+            counts['retried'] += 1
+            logger.warning('Email #%s failed (attempt %s), retrying at %s: %s', row.id, row.attempts, row.next_attempt_at, error)
+        else:
+            row.status = 'failed'
+            counts['failed'] += 1
+            logger.error('Email #%s failed after %s attempt(s): %s', row.id, row.attempts, error)
+    db.session.commit()
+    return counts
+
+
+def drain(timeout=None, max_workers=None):
+    """Send due messages batch by batch until none are due or ``timeout`` seconds pass."""
+    deadline = time.monotonic() + timeout if timeout else None
+    totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+    while deadline is None or time.monotonic() < deadline:
+        counts = process_outbox(max_workers=max_workers)
+        for key, value in counts.items():
+            totals[key] += value
+        if not counts['claimed']:
+            break
+    return totals
+
+
+def retry(outbox_id):
+    """Queue a failed message again, now, with a fresh attempt count."""
+    updated = EmailOutbox.query.filter(EmailOutbox.id == outbox_id, EmailOutbox.status == 'failed').update({
+        EmailOutbox.status: 'queued',
+        EmailOutbox.attempts: 0,
+        EmailOutbox.next_attempt_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.session.commit()
+    if updated:
+        kick()
+    return bool(updated)
+
+
+def status_counts():
+    """``{status: count}`` over the whole outbox."""
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(db.session.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status))
+    return counts
+
+
+class OutboxWorker:
+    """Background thread draining the outbox for one app in this process."""
+
+    def __init__(self, app):
+        self.app = app
+        self._wake = Event()
+        self._thread = None
+
+    def wake(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = Thread(target=self._run, name='email-outbox', daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=int(self.app.config.get('EMAIL_OUTBOX_POLL_SECONDS') or 30))
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    drain()
+            except Exception as e:
+                logger.exception('Email outbox worker error: %s', e)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _kick_after_commit(session):
+    if session.info.pop(_KICK_KEY, False):
+        try:
+            kick()
+        except Exception as e:
+            # the mail is committed; the worker's poll will pick it up
+            logger.warning('Could not wake the email outbox worker: %s', e)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_kick(session, previous_transaction):
+    # a rolled back savepoint leaves the outer transaction, and its mail, going
+    if not previous_transaction.nested:
+        session.info.pop(_KICK_KEY, None)
+
+
+def kick():
+    """Wake (starting if needed) this process's outbox worker, unless EMAIL_OUTBOX_WORKER is off."""
+    app = current_app._get_current_object()
+    if not app.config.get('EMAIL_OUTBOX_WORKER', True):
+        return
+    with _worker_lock:
+        worker = app.extensions.get(_EXTENSION_KEY)
+        if worker is None:
+            worker = app.extensions[_EXTENSION_KEY] = OutboxWorker(app)
+        worker.wake()
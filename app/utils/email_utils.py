@@ -1,15 +1,12 @@
 import os
 import logging
 from email.message import EmailMessage
-from threading import Thread, Lock
 from typing import List, Tuple, Optional
-import base64
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 from flask import render_template, current_app
-from app import app
+from app.utils.gmail_client import get_gmail_client
+from app.utils.settings_utils import get_app_settings
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -18,10 +15,6 @@ logger.setLevel(logging.DEBUG)
 DEFAULT_FROM = os.environ.get('ORG_EMAIL', 'no-reply@example.com')
 ORG_NAME = os.environ.get('ORG_NAME', '')
 
-# Track active background email threads
-_active_email_threads = []
-_email_thread_lock = Lock()
-
 
 def _get_testing_delivery_settings() -> Tuple[bool, Optional[str]]:
     """Resolve whether outbound mail should be redirected or suppressed in testing mode."""
@@ -50,8 +43,7 @@ def _get_testing_delivery_settings() -> Tuple[bool, Optional[str]]:
 
     if not testing_mode:
         try:
-            from app.models import AppSettings
-            s = AppSettings.get()
+            s = get_app_settings()
             if getattr(s, 'testing_mode', False):
                 testing_mode = True
                 testing_email = getattr(s, 'testing_email', None) or testing_email
@@ -91,7 +83,7 @@ def _apply_testing_override(msg: EmailMessage) -> bool:
     return True
 
 
-# No Redis/RQ support in this deployment; always use threaded background send.
+# No Redis/RQ support in this deployment; queued mail goes through the email_outbox table.
 def _build_message(subject: str, recipients, body_text: Optional[str] = None, body_html: Optional[str] = None, attachments: Optional[List[Tuple[str, bytes, str]]] = None, from_addr: Optional[str] = None) -> EmailMessage:
     if isinstance(recipients, str):
         recipients = [recipients]
@@ -100,10 +92,10 @@ def _build_message(subject: str, recipients, body_text: Optional[str] = None, bo
     msg['Subject'] = subject
     # Allow AppSettings to override the default From address
     try:
-        from app.models import AppSettings
-        s = AppSettings.get()
+        s = get_app_settings()
         default_from = s.org_email if s and s.org_email else DEFAULT_FROM
     except Exception:
+        s = None
         default_from = DEFAULT_FROM
 
     msg['From'] = from_addr or default_from
@@ -111,8 +103,6 @@ def _build_message(subject: str, recipients, body_text: Optional[str] = None, bo
     
     # Add CC for all outgoing emails if configured in AppSettings
     try:
-        from app.models import AppSettings
-        s = AppSettings.get()
         if s and s.default_cc:
             msg['Cc'] = s.default_cc
     except Exception:
@@ -143,7 +133,7 @@ def _build_message(subject: str, recipients, body_text: Optional[str] = None, bo
     return msg
 
 
-def _send_via_gmail_api(msg: EmailMessage, settings) -> bool:
+def _send_via_gmail_api(msg: EmailMessage, settings, raise_http_errors: bool = False) -> bool:
     try:
         # Log recipients before sending (include original recipients if present)
         try:
@@ -163,35 +153,22 @@ def _send_via_gmail_api(msg: EmailMessage, settings) -> bool:
             logger.error('Gmail refresh token not configured, cannot send email')
             return False
 
-        creds = Credentials(
-            token=None,
-            refresh_token=settings.gmail_refresh_token,
-            token_uri='https://oauth2.googleapis.com/token',
-            client_id=settings.gmail_client_id,
-            client_secret=settings.gmail_client_secret,
-            scopes=['https://www.googleapis.com/auth/gmail.send']
-        )
-        service = build('gmail', 'v1', credentials=creds)
-
-        # Encode the message
-        raw_message = base64.urlsafe_b64encode(msg.as_bytes()).decode()
-
-        message = {'raw': raw_message}
-
-        # Send the message
         logger.debug('Executing Gmail API send request')
-        sent_message = service.users().messages().send(userId='me', body=message).execute()
-        logger.info('Email sent via Gmail API successfully, message ID: %s', sent_message['id'])
+        message_id = get_gmail_client(settings).send(msg)
+        logger.info('Email sent via Gmail API successfully, message ID: %s', message_id)
         return True
     except HttpError as e:
         logger.error('Failed to send email via Gmail API - HTTP Error: %s', e)
+        if raise_http_errors:
+            # the outbox retries these with backoff
+            raise
         return False
     except Exception as e:
         logger.error('Failed to send email via Gmail API - Exception: %s', e)
         return False
 
 
-def _send_message(msg: EmailMessage) -> bool:
+def _send_message(msg: EmailMessage, raise_http_errors: bool = False) -> bool:
     try:
         testing_mode_active = _apply_testing_override(msg)
         if testing_mode_active:
@@ -200,8 +177,7 @@ def _send_message(msg: EmailMessage) -> bool:
 
         # Allow AppSettings to override configuration and enable testing mode
         try:
-            from app.models import AppSettings
-            s = AppSettings.get()
+            s = get_app_settings()
         except Exception:
             s = None
 
@@ -210,13 +186,46 @@ def _send_message(msg: EmailMessage) -> bool:
             logger.error('Gmail OAuth not configured. Please set Gmail OAuth credentials in app settings.')
             return False
 
-        return _send_via_gmail_api(msg, s)
+        return _send_via_gmail_api(msg, s, raise_http_errors=raise_http_errors)
 
+    except HttpError:
+        raise
     except Exception as e:
         logger.exception('Failed to send email: %s', e)
         return False
 
 
+def _send_messages(msgs: List[EmailMessage]) -> List[Tuple[bool, Optional[HttpError]]]:
+    """Send several messages in as few Gmail round trips as the batch endpoint allows.
+
+    Returns ``(sent, error)`` per message, in order; ``error`` is the
+    ``HttpError`` for a message Gmail rejected. An ``HttpError`` for the
+    batch request as a whole is raised.
+    """
+    testing_mode_active = [_apply_testing_override(msg) for msg in msgs]
+    if all(testing_mode_active):
+        logger.info('Delivery of %s emails suppressed because testing mode is enabled', len(msgs))
+        return [(True, None)] * len(msgs)
+
+    try:
+        s = get_app_settings()
+    except Exception:
+        s = None
+    if not s or not s.gmail_client_id or not s.gmail_client_secret or not s.gmail_refresh_token:
+        logger.error('Gmail OAuth not configured. Please set Gmail OAuth credentials in app settings.')
+        return [(False, None)] * len(msgs)
+
+    logger.info('Sending %s emails via Gmail API batch', len(msgs))
+    results = []
+    for msg, (message_id, error) in zip(msgs, get_gmail_client(s).send_batch(msgs)):
+        if error is not None:
+            logger.error('Gmail API rejected email to %s subject=%s: %s', msg['To'], msg['Subject'], error)
+        else:
+            logger.info('Email sent via Gmail API to %s, message ID: %s', msg['To'], message_id)
+        results.append((error is None, error))
+    return results
+
+
 def send_email(subject: str, recipients, body_text: str = None, body_html: str = None, attachments: list = None, from_addr: str = None) -> bool:
     """Build and send an email immediately (blocking). Use `queue_email` to send async."""
     msg = _build_message(subject, recipients, body_text, body_html, attachments, from_addr)
@@ -228,71 +237,38 @@ def send_email_with_pdf(recipient: str, subject: str, body_text: str, pdf_bytes:
     return send_email(subject=subject, recipients=[recipient], body_text=body_text, body_html=body_html, attachments=attachments, from_addr=from_addr)
 
 
-# _background_send removed — always build message in request thread and send in background thread
-
-
-
-def queue_email(subject: str, recipients, body_text: str = None, body_html: str = None, attachments: list = None, from_addr: str = None):
-    """Queue email for background sending. Uses a background thread to send the prebuilt message.
+def queue_email(subject: str, recipients, body_text: str = None, body_html: str = None, attachments: list = None, from_addr: str = None, dedupe_key: str = None):
+    """Queue email for background sending through the email_outbox table.
 
+    The message is added to the current session; the caller commits it
+    (with the rest of its work) and the outbox worker then sends it.
+    Returns False, leaving the session usable, when it could not be queued.
     attachments: list of (filename, bytes, mime_type)
+    dedupe_key: when given, a message with the same key is only queued once.
     """
-    # Build the message in the current thread/context so AppSettings and
-    # environment-based overrides are read while the Flask app/context is active.
+    from app.utils.email_outbox import enqueue
+
     try:
-        msg = _build_message(subject, recipients, body_text, body_html, attachments, from_addr)
+        enqueue(subject, recipients, body_text=body_text, body_html=body_html, attachments=attachments, from_addr=from_addr, dedupe_key=dedupe_key)
     except Exception:
-        logger.exception('Failed to build email message')
+        logger.exception('Failed to queue email message')
         return False
-
-    # Send in a background thread so request isn't blocked.
-    def send_in_thread(msg):
-        try:
-            with app.app_context():
-                result = _send_message(msg)
-                if result:
-                    logger.info('Email queued background thread: email sent successfully')
-                else:
-                    logger.error('Email queued background thread: email failed to send')
-        except Exception as e:
-            logger.exception(f'Email queued background thread: exception occurred: {e}')
-
-    t = Thread(target=send_in_thread, args=(msg,), daemon=False)  # daemon=False to ensure thread completes
-    t.start()
-    
-    # Track the thread so we can wait for it if needed
-    with _email_thread_lock:
-        _active_email_threads.append(t)
-    
     return True
 
 
 def wait_for_pending_emails(timeout: float = 30.0):
-    """Wait for all pending background email threads to complete.
-    
-    Args:
-        timeout: Maximum time to wait in seconds. Logs a warning if timeout is reached.
+    """Send the queued emails that are due now, for up to ``timeout`` seconds.
+
+    Short-lived scripts call this before exiting; anything left (including
+    retries scheduled for later) stays queued for the next worker.
     """
-    with _email_thread_lock:
-        threads_to_wait = list(_active_email_threads)
-        _active_email_threads.clear()
-    
-    if not threads_to_wait:
-        return
-    
-    logger.info(f'Waiting for {len(threads_to_wait)} pending email threads to complete (timeout: {timeout}s)')
-    
-    for i, t in enumerate(threads_to_wait, 1):
-        t.join(timeout=timeout)
-        if t.is_alive():
-            logger.warning(f'Email thread {i}/{len(threads_to_wait)} did not complete within {timeout}s')
-        else:
-            logger.info(f'Email thread {i}/{len(threads_to_wait)} completed')
-    
-    logger.info('All pending email threads processed')
+    from app.utils.email_outbox import drain
+
+    totals = drain(timeout=timeout)
+    logger.info('Outbox drained: %s sent, %s retrying, %s failed', totals['sent'], totals['retried'], totals['failed'])
 
 
-def queue_email_with_pdf(recipients, subject: str, body_text: str, pdf_bytes: bytes, filename: str, body_html: str = None, from_addr: str = None) -> bool:
+def queue_email_with_pdf(recipients, subject: str, body_text: str, pdf_bytes: bytes, filename: str, body_html: str = None, from_addr: str = None, dedupe_key: str = None) -> bool:
     """Queue an email with a single PDF attachment.
 
     `recipients` may be a single email string or a list of emails.
@@ -300,4 +276,4 @@ def queue_email_with_pdf(recipients, subject: str, body_text: str, pdf_bytes: by
     if isinstance(recipients, str):
         recipients = [recipients]
     attachments = [(filename, pdf_bytes, 'application/pdf')]
-    return queue_email(subject=subject, recipients=recipients, body_text=body_text, body_html=body_html, attachments=attachments, from_addr=from_addr)
+    return queue_email(subject=subject, recipients=recipients, body_text=body_text, body_html=body_html, attachments=attachments, from_addr=from_addr, dedupe_key=dedupe_key)
@@ -0,0 +1,124 @@
+"""Cached Gmail API client.
+
+Building a Gmail service parses the discovery document, and a new
+``Credentials`` object has no access token, so every message used to cost a
+parse and an OAuth token refresh. :func:`get_gmail_client` keeps one
+:class:`GmailClient` per app process, keyed by the client id, client secret
+and refresh token from ``AppSettings``. Saving different credentials changes
+the key and the next send builds a new client. The access token is kept on
+the client's ``Credentials`` and refreshed only once it has expired.
+
+httplib2 connections are not thread-safe, so each thread sending through a
+client gets its own authorized connection over the shared credentials.
+``GMAIL_HTTP_FACTORY`` (a callable returning an ``httplib2.Http``-compatible
+object) replaces the transport, e.g. with a local stub in tests.
+"""
+
+import base64
+import logging
+from threading import Lock, local
+
+import httplib2
+from flask import current_app
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp, Request
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+# the bundled discovery document names the generic /batch path; Gmail documents its own
+BATCH_URI = 'https://gmail.googleapis.com/batch/gmail/v1'
+SCOPES = ['https://www.googleapis.com/auth/gmail.send']
+
+# Gmail accepts up to 100 calls per batch but throttles large ones; 50 is its recommendation
+BATCH_LIMIT = 50
+
+_EXTENSION_KEY = 'gmail_client'
+_clients_lock = Lock()
+
+
+def _raw(msg):
+    return {'raw': base64.urlsafe_b64encode(msg.as_bytes()).decode()}
+
+
+class GmailClient:
+    """A Gmail service and OAuth credentials shared by every send in this process."""
+
+    def __init__(self, client_id, client_secret, refresh_token, http_factory=None):
+        self.key = (client_id, client_secret, refresh_token)
+        self.credentials = Credentials(
+            token=None,
+            refresh_token=refresh_token,
+            token_uri=TOKEN_URI,
+            client_id=client_id,
+            client_secret=client_secret,
+            scopes=SCOPES,
+        )
+        self._http_factory = http_factory or httplib2.Http
+        self._local = local()
+        self._token_lock = Lock()
+        # the gmail discovery document ships with googleapiclient, so this makes no request
+        self.service = build('gmail', 'v1', credentials=self.credentials, cache_discovery=False, static_discovery=True)
+
+    def _http(self):
+        """This thread's authorized connection, with a current access token."""
+        with self._token_lock:
+            # one refresh per expiry, rather than one per thread that notices it
+            if not self.credentials.valid:
+                self.credentials.refresh(Request(self._http_factory()))
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.credentials, http=self._http_factory())
+        return http
+
+    def _send_request(self, msg):
+        return self.service.users().messages().send(userId='me', body=_raw(msg))
+
+    def send(self, msg):
+        """Send one ``EmailMessage`` and return its Gmail message id. Raises ``HttpError``."""
+        return self._send_request(msg).execute(http=self._http())['id']
+
+    def send_batch(self, messages):
+        """Send ``messages`` through the batch endpoint, ``BATCH_LIMIT`` per round trip.
+
+        Returns ``(message_id, error)`` for each message, in order; ``error``
+        is the ``HttpError`` Gmail answered that message with. A failure of
+        a batch request as a whole raises.
+        """
+        if len(messages) == 1:
+            try:
+                return [(self.send(messages[0]), None)]
+            except HttpError as e:
+                return [(None, e)]
+
+        results = [(None, None)] * len(messages)
+
+        def collect(request_id, response, exception):
+            index = int(request_id)
+            results[index] = (None, exception) if exception is not None else (response['id'], None)
+
+        for start in range(0, len(messages), BATCH_LIMIT):
+            batch = BatchHttpRequest(callback=collect, batch_uri=BATCH_URI)
+            for index in range(start, min(start + BATCH_LIMIT, len(messages))):
+                batch.add(self._send_request(messages[index]), request_id=str(index))
+            batch.execute(http=self._http())
+        return results
+
+
+def get_gmail_client(settings):
+    """The process's :class:`GmailClient` for the Gmail credentials in ``settings``."""
+    key = (settings.gmail_client_id, settings.gmail_client_secret, settings.gmail_refresh_token)
+    app = current_app._get_current_object()
+    with _clients_lock:
+        client = app.extensions.get(_EXTENSION_KEY)
+        if client is None or client.key != key:
+            if client is not None:
+                logger.info('Gmail credentials changed; building a new Gmail client')
+            client = app.extensions[_EXTENSION_KEY] = GmailClient(
+                *key, http_factory=app.config.get('GMAIL_HTTP_FACTORY')
+            )
+    return client
+
@@ -0,0 +1,110 @@
+"""Maintain the stored payment columns on ``invoices``.
+
+``amount_paid``, ``amount_pending`` and ``payment_state`` mirror the sum of
+an invoice's ``invoice_payments`` so lists, reports and the reminder job can
+filter and sort by outstanding balance in SQL instead of loading every
+invoice's payments. An invoice whose status is ``Paid`` is settled in full
+whatever its payments: legacy invoices and invoices marked Paid through
+``PUT /api/invoices/<number>`` have no payment rows.
+
+``Invoice.add_payment`` and ``Invoice.reset_to_draft`` set the columns as
+they write. Anything else that touches payments through the session (an
+edited or deleted payment, a payment added directly) is recorded by
+``before_flush`` and the invoices are recomputed from their payments in
+``before_commit``, in the same transaction, as are invoices whose
+``total_cost`` or ``status`` changed. Statements that bypass the unit of
+work must call :func:`mark_dirty`.
+"""
+
+from sqlalchemy import event, func, inspect, update
+
+from app import db
+from app.models import Invoice, InvoicePayment
+
+_DIRTY_KEY = 'invoice_balances_dirty'
+
+STATES = ('Pending', 'Partially Paid', 'Paid')
+
+
+def payment_totals(total_cost, paid, status=None):
+    """``(amount_paid, amount_pending, payment_state)`` for an invoice total and the sum of its payments.
+
+    A ``Paid`` status counts the whole total as paid.
+    """
+    paid = float(paid or 0.0)
+    if status == 'Paid':
+        paid = max(paid, float(total_cost or 0.0))
+    paid = round(paid, 2)
+    pending = round(max(float(total_cost or 0.0) - paid, 0.0), 2)
+    if pending <= 0:
+        state = 'Paid'
+    elif paid > 0:
+        state = 'Partially Paid'
+    else:
+        state = 'Pending'
+    return paid, pending, state
+
+
+def mark_dirty(session=None, invoice_ids=()):
+    """Queue invoices for recomputation at the next commit of ``session``."""
+    dirty = (session or db.session).info.setdefault(_DIRTY_KEY, set())
+    dirty.update(i for i in invoice_ids if i is not None)
+
+
+def refresh_balances(invoice_ids, session=None):
+    """Recompute the payment columns of ``invoice_ids`` from their payments."""
+    session = session or db.session
+    invoice_ids = list(invoice_ids)
+    rows = []
+    for start in range(0, len(invoice_ids), 500):
+        chunk = invoice_ids[start:start + 500]
+        paid = (
+            session.query(InvoicePayment.invoice_id, func.sum(InvoicePayment.amount))
+            .filter(InvoicePayment.invoice_id.in_(chunk))
+            .group_by(InvoicePayment.invoice_id)
+        )
+        paid = dict(paid.all())
+        for invoice_id, total_cost, status in (
+            session.query(Invoice.id, Invoice.total_cost, Invoice.status).filter(Invoice.id.in_(chunk))
+        ):
+            amount_paid, amount_pending, state = payment_totals(total_cost, paid.get(invoice_id), status)
+            rows.append({'id': invoice_id, 'amount_paid': amount_paid,
+                         'amount_pending': amount_pending, 'payment_state': state})
+    if rows:
+        session.execute(update(Invoice), rows)
+    return len(rows)
+
+
+def _changed(state, attrs):
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_dirty(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, InvoicePayment):
+            state = inspect(obj)
+            history = state.attrs.invoice_id.history
+            if obj in session.new or obj in session.deleted or history.has_changes() \
+                    or state.attrs.amount.history.has_changes():
+                mark_dirty(session, set(history.added) | set(history.deleted) | {obj.invoice_id})
+        elif isinstance(obj, Invoice) and obj not in session.deleted:
+            if obj in session.new:
+                obj.amount_paid, obj.amount_pending, obj.payment_state = payment_totals(
+                    obj.total_cost, 0.0, obj.status
+                )
+            elif _changed(inspect(obj), ('total_cost', 'status')):
+                mark_dirty(session, [obj.id])
+
+
+@event.listens_for(db.session, 'before_commit')
+def _refresh_dirty(session):
+    session.flush()
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        refresh_balances(dirty, session=session)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_dirty(session, previous_transaction):
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,235 @@
+"""Bulk invoice generation for a billing period.
+
+Month-end invoicing creates one Draft invoice per active client from every
+uninvoiced session and mileage entry in the date range. The invoice numbers
+for the whole run are reserved up front, in one statement (see
+``invoice_numbers``). Each client is then built and committed in its own
+transaction so one bad client doesn't roll back the rest of the run. The
+invoice PDFs are then rendered in a process pool, since WeasyPrint is
+CPU-bound and single-threaded, and stored in the invoice PDF cache so later
+downloads and sends don't render them again.
+"""
+
+import json
+import logging
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import Activity, Client, Employee, Intervention, Invoice, Mileage
+from app.utils.invoice_context import InvoiceRenderContext, extract_mileages
+from app.utils.pdf_cache import invoice_pdf_fingerprint, store_pdf
+from app.utils import invoice_numbers, pdf_render
+from app.utils.settings_utils import get_org_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _session_rate(intervention, client, activity_map):
+    category = activity_map.get(intervention.intervention_type, '').lower()
+    if category == 'therapy':
+        return float(client.cost_therapy or 0)
+    if category == 'supervision':
+        return float(client.cost_supervision or 0)
+    return 0.0
+
+
+def _build_items(client, interventions, mileages, activity_map):
+    """Build the invoice_items snapshot exactly as invoice_preview does."""
+    items = []
+    for i in interventions:
+        rate = _session_rate(i, client, activity_map)
+        try:
+            cost = float(i.duration) * rate
+        except Exception:
+            cost = 0
+        i.rate = rate
+        i.cost = cost
+        items.append({
+            'type': 'intervention',
+            'intervention_id': i.id,
+            'date': i.date.strftime('%Y-%m-%d'),
+            'activity': i.intervention_type,
+            'duration': float(i.duration) if i.duration is not None else 0,
+            'rate': rate,
+            'cost': cost
+        })
+    for m in mileages:
+        items.append({
+            'type': 'mileage',
+            'mileage_id': m.id,
+            'date': m.date.strftime('%Y-%m-%d'),
+            'description': m.description or 'Mileage',
+            'distance': float(m.distance),
+            'rate': float(m.mileage_rate.rate) if m.mileage_rate else 0,
+            'cost': float(m.cost)
+        })
+    return items
+
+
+def _create_client_invoice(client, invoice_number, interventions, mileages, activity_map, date_from, date_to, payby_days):
+    """Create and commit one Draft invoice for a client. Returns the invoice."""
+    invoice_items = _build_items(client, interventions, mileages, activity_map)
+    invoice_date = date.today()
+    invoice = Invoice(
+        client_id=client.id,
+        invoice_number=invoice_number,
+        invoiced_date=invoice_date,
+        payby_date=invoice_date + timedelta(days=payby_days),
+        date_from=date_from,
+        date_to=date_to,
+        total_cost=sum(item['cost'] for item in invoice_items),
+        status='Draft',
+        paid_date=None,
+        payment_comments='',
+        invoice_items=json.dumps(invoice_items)
+    )
+    db.session.add(invoice)
+    db.session.flush()
+
+    for intervention in interventions:
+        intervention.invoiced = True
+        intervention.invoice_number = invoice_number
+    for mileage in mileages:
+        mileage.invoiced = True
+        mileage.invoice_number = invoice_number
+
+    db.session.commit()
+    return invoice
+
+
+@contextmanager
+def _keep_loaded():
+    """Leave loaded rows loaded across the session's commits.
+
+    Each client's invoice is committed on its own, and a commit expires
+    every object in the session: the sessions and mileages loaded up front
+    for the other clients would then be reloaded one row at a time.
+    """
+    session = db.session()
+    expire_on_commit, session.expire_on_commit = session.expire_on_commit, False
+    try:
+        yield
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+def _render_pdfs(created, max_workers=None):
+    """Render PDFs for freshly created invoices in a process pool and cache them.
+
+    ``created`` is a list of (invoice, client, interventions) tuples. HTML is
+    rendered here (it needs the app and DB); only the WeasyPrint step runs in
+    the worker processes.
+    """
+    from app.invoices.views import _invoice_pdf_html
+
+    settings = get_org_settings()
+    supervisors = {}
+    jobs = []
+    for invoice, client, interventions in created:
+        if client.supervisor_id and client.supervisor_id not in supervisors:
+            supervisors[client.supervisor_id] = Employee.query.get(client.supervisor_id)
+        ctx = InvoiceRenderContext(invoice, client, interventions, extract_mileages(invoice),
+                                   supervisors.get(client.supervisor_id), settings)
+        fingerprint = invoice_pdf_fingerprint(ctx.invoice, ctx.client, ctx.interventions, ctx.mileages, ctx.supervisor, ctx.settings)
+        html = _invoice_pdf_html(ctx, 'Pending')
+        jobs.append((invoice.invoice_number, fingerprint, html))
+
+    pdfs = pdf_render.render_pdfs(((number, html) for number, _fingerprint, html in jobs), max_workers=max_workers)
+    rendered = {}
+    for number, fingerprint, _html in jobs:
+        pdf_bytes = pdfs.get(number)
+        rendered[number] = bool(pdf_bytes) and store_pdf(number, fingerprint, pdf_bytes)
+    return rendered
+
+
+def generate_invoices_for_period(date_from, date_to, client_ids=None, render_pdfs=True, dry_run=False, max_workers=None, payby_days=7):
+    """Create Draft invoices for every active client with uninvoiced work in the period.
+
+    Returns a list of per-client result dicts with keys ``client_id``,
+    ``client_name``, ``invoice_number``, ``sessions``, ``mileages``,
+    ``total_cost``, ``pdf_rendered`` and ``error``.
+    """
+    activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
+
+    clients_query = Client.query.filter(Client.is_active == True)
+    if client_ids:
+        clients_query = clients_query.filter(Client.id.in_(client_ids))
+    clients = {c.id: c for c in clients_query.order_by(Client.id).all()}
+    if not clients:
+        return []
+
+    # two queries for the whole period instead of two per client
+    interventions_by_client = {}
+    for i in Intervention.query.filter(
+        Intervention.client_id.in_(list(clients)),
+        Intervention.invoiced == False,
+        Intervention.date >= date_from,
+        Intervention.date <= date_to
+    ).order_by(Intervention.date, Intervention.start_time).all():
+        interventions_by_client.setdefault(i.client_id, []).append(i)
+
+    mileages_by_client = {}
+    for m in Mileage.query.options(joinedload(Mileage.mileage_rate)).filter(
+        Mileage.client_id.in_(list(clients)),
+        Mileage.invoiced == False,
+        Mileage.date >= date_from,
+        Mileage.date <= date_to
+    ).order_by(Mileage.date).all():
+        mileages_by_client.setdefault(m.client_id, []).append(m)
+
+    results = []
+    pending = []
+    for client_id, client in clients.items():
+        interventions = interventions_by_client.get(client_id, [])
+        mileages = mileages_by_client.get(client_id, [])
+        if not interventions and not mileages:
+            continue
+
+        result = {
+            'client_id': client_id,
+            'client_name': f"{client.firstname} {client.lastname or ''}".strip(),
+            'invoice_number': None,
+            'sessions': len(interventions),
+            'mileages': len(mileages),
+            'total_cost': round(sum(_session_rate(i, client, activity_map) * float(i.duration or 0) for i in interventions)
+                                + sum(float(m.cost or 0) for m in mileages), 2),
+            'pdf_rendered': False,
+            'error': None,
+        }
+        results.append(result)
+        pending.append((result, client, interventions, mileages))
+
+    if dry_run:
+        return results
+
+    created = []
+    with _keep_loaded():
+        # one round trip for the run's numbers, committed so the sequence is not locked while invoicing
+        numbers = invoice_numbers.reserve(len(pending))
+        db.session.commit()
+
+        for (result, client, interventions, mileages), invoice_number in zip(pending, numbers):
+            try:
+                invoice = _create_client_invoice(client, invoice_number, interventions, mileages, activity_map,
+                                                 date_from, date_to, payby_days)
+            except Exception as e:
+                # a rollback still expires everything; later clients reload what they use
+                db.session.rollback()
+                logger.exception('Failed to create invoice for client %s: %s', client.id, e)
+                result['error'] = str(e)
+                continue
+            result['invoice_number'] = invoice.invoice_number
+            result['total_cost'] = round(float(invoice.total_cost or 0), 2)
+            created.append((invoice, client, interventions))
+
+    logger.info('Bulk invoicing %s..%s: %d invoice(s) created', date_from, date_to, len(created))
+
+    if render_pdfs and created:
+        rendered = _render_pdfs(created, max_workers=max_workers)
+        for result in results:
+            result['pdf_rendered'] = bool(rendered.get(result['invoice_number']))
+
+    return results
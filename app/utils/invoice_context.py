@@ -0,0 +1,131 @@
+"""Load everything needed to render one invoice in a fixed number of queries.
+
+The download, preview, email, mark-sent and mark-paid routes all need the same
+data: the invoice with its client, supervisor and payments, the linked
+sessions with their employees, the mileage snapshot and the organization
+settings. Loading it lazily costs one query per session (plus an
+``Activity`` scan per session missing from the snapshot), so
+``InvoiceRenderContext.load`` eager-loads it up front instead:
+
+1. invoice + client + supervisor (joined)
+2. payments (selectin)
+3. interventions + employee (joined)
+4. activity map, only if a session is missing from the ``invoice_items`` snapshot
+
+plus whatever ``get_org_settings()`` costs.
+"""
+
+import json
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import Activity, Client, Intervention, Invoice
+from app.utils.settings_utils import get_org_settings
+
+
+class MileageSnapshot:
+    """Mileage line item rebuilt from the ``invoice_items`` JSON snapshot."""
+
+    def __init__(self, data):
+        self.date = data.get('date')
+        self.description = data.get('description')
+        self.distance = data.get('distance')
+        self.rate = data.get('rate')
+        self.cost = data.get('cost')
+
+
+def invoice_items(invoice):
+    """Return the parsed ``invoice_items`` snapshot, or [] if missing/invalid."""
+    if not invoice.invoice_items:
+        return []
+    try:
+        items = json.loads(invoice.invoice_items)
+    except Exception:
+        return []
+    return items if isinstance(items, list) else []
+
+
+def extract_mileages(invoice):
+    """Return ``MileageSnapshot`` objects for the mileage items of an invoice.
+
+    The PDF template expects mileage entries with :date, :description,
+    :distance, :rate and :cost attributes, whether they come from real
+    ``Mileage`` rows or the invoice snapshot.
+    """
+    return [MileageSnapshot(item) for item in invoice_items(invoice) if item.get('type') == 'mileage']
+
+
+def apply_line_items(invoice, client, interventions, activity_map=None):
+    """Set ``rate``/``cost`` on each intervention from the invoice snapshot.
+
+    Sessions missing from the snapshot fall back to the client's current
+    rates. The activity map is queried at most once, and only when needed.
+    """
+    items = invoice_items(invoice)
+    if not items:
+        return
+    items_map = {item.get('intervention_id'): item for item in items}
+    for i in interventions:
+        item = items_map.get(i.id)
+        if item:
+            i.rate = item.get('rate', 0)
+            i.cost = item.get('cost', 0)
+            i._snapshot = item
+            continue
+        if activity_map is None:
+            activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
+        category = activity_map.get(i.intervention_type, '').lower()
+        if category == 'therapy':
+            rate = client.cost_therapy
+        elif category == 'supervision':
+            rate = client.cost_supervision
+        else:
+            rate = 0
+        i.rate = rate
+        try:
+            i.cost = float(i.duration) * float(rate)
+        except Exception:
+            i.cost = 0
+
+
+class InvoiceRenderContext:
+    """Everything the invoice PDF/preview templates need for one invoice."""
+
+    def __init__(self, invoice, client, interventions, mileages, supervisor, settings):
+        self.invoice = invoice
+        self.client = client
+        self.interventions = interventions
+        self.mileages = mileages
+        self.supervisor = supervisor
+        self.settings = settings
+
+    @classmethod
+    def load(cls, invoice_number, settings=None):
+        """Load the context for ``invoice_number``, aborting with 404 if missing."""
+        invoice = (
+            Invoice.query
+            .options(
+                joinedload(Invoice.client).joinedload(Client.supervisor),
+                selectinload(Invoice.payments),
+            )
+            .filter_by(invoice_number=invoice_number)
+            .first_or_404()
+        )
+        client = invoice.client
+        interventions = (
+            Intervention.query
+            .options(joinedload(Intervention.employee))
+            .filter_by(invoice_number=invoice_number)
+            .order_by(Intervention.date, Intervention.start_time)
+            .all()
+        )
+        apply_line_items(invoice, client, interventions)
+        supervisor = client.supervisor if client and client.supervisor_id else None
+        return cls(
+            invoice=invoice,
+            client=client,
+            interventions=interventions,
+            mileages=extract_mileages(invoice),
+            supervisor=supervisor,
+            settings=settings if settings is not None else get_org_settings(),
+        )
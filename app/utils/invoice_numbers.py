@@ -0,0 +1,118 @@
+"""Allocate invoice numbers from the ``invoice_sequences`` table.
+
+Invoice numbers are ``INV<YYYYMM><nnnn>``, counted per month. The next one
+used to be worked out from the highest number already in ``invoices``, a
+prefix scan per invoice, so two requests creating invoices at the same time
+could pick the same number and one of them failed on the unique constraint.
+
+``invoice_sequences`` keeps the last number handed out for each month, and
+:func:`reserve` takes ``n`` numbers with one
+``UPDATE invoice_sequences SET last_value = last_value + n ... RETURNING``:
+
+- on PostgreSQL the UPDATE locks the month's row, the lock
+  ``SELECT ... FOR UPDATE`` would take; a concurrent reserve waits for it
+  and then adds to the value the first one committed
+- on SQLite the driver begins the transaction lazily, so the UPDATE is
+  where the database write lock is taken, as with ``BEGIN IMMEDIATE``
+
+The lock is held until the caller's transaction ends, so the numbers of a
+rolled back invoice go back to the sequence. Bulk invoicing reserves the
+numbers for every client at once and commits them straight away; a number
+reserved for a client whose invoice then fails is left unused.
+
+A month's row is created by its first reserve, starting from the highest
+number already in ``invoices`` for the month.
+"""
+
+from datetime import date
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Invoice, InvoiceSequence
+
+PREFIX = 'INV'
+
+
+def _month(on=None):
+    return (on or date.today()).strftime('%Y%m')
+
+
+def format_number(month, value):
+    return f'{PREFIX}{month}{str(value).zfill(4)}'
+
+
+def _last_invoiced(month):
+    """The highest sequence number among the month's existing invoices, or 0."""
+    prefix = f'{PREFIX}{month}'
+    # longest first, so INV2026100010000 sorts above INV2026109999
+    numbers = (
+        db.session.query(Invoice.invoice_number)
+        .filter(Invoice.invoice_number.like(f'{prefix}%'))
+        .order_by(func.length(Invoice.invoice_number).desc(), Invoice.invoice_number.desc())
+    )
+    for (number,) in numbers:
+        try:
+            return int(number[len(prefix):])
+        except ValueError:
+            continue
+    return 0
+
+
+def _create_sequence(month):
+    """Add the month's row unless a concurrent reserve already did."""
+    values = {'month': month, 'last_value': _last_invoiced(month)}
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        db.session.execute(dialect_insert(InvoiceSequence).values(**values).on_conflict_do_nothing(index_elements=['month']))
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(InvoiceSequence).values(**values))
+    except IntegrityError:
+        pass
+
+
+def _advance(month, n):
+    """Add ``n`` to the month's sequence and return the new last value, or None when it has no row."""
+    stmt = (
+        update(InvoiceSequence)
+        .where(InvoiceSequence.month == month)
+        .values(last_value=InvoiceSequence.last_value + n)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(stmt.returning(InvoiceSequence.last_value)).scalar()
+    if not db.session.execute(stmt).rowcount:
+        return None
+    return db.session.execute(select(InvoiceSequence.last_value).where(InvoiceSequence.month == month)).scalar()
+
+
+def reserve(n=1, on=None):
+    """Hand out ``n`` consecutive invoice numbers for the month of ``on`` (default: today).
+
+    Returns them in order. The month's sequence stays locked until the
+    caller commits or rolls back.
+    """
+    if n < 1:
+        return []
+    month = _month(on)
+    last = _advance(month, n)
+    if last is None:
+        _create_sequence(month)
+        last = _advance(month, n)
+    return [format_number(month, value) for value in range(last - n + 1, last + 1)]
+
+
+def peek(on=None):
+    """The number the next :func:`reserve` would hand out, without reserving it (for previews)."""
+    month = _month(on)
+    last = db.session.execute(select(InvoiceSequence.last_value).where(InvoiceSequence.month == month)).scalar()
+    if last is None:
+        last = _last_invoiced(month)
+    return format_number(month, last + 1)
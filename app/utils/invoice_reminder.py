@@ -1,12 +1,26 @@
-"""Invoice reminder utility for sending email reminders for due invoices."""
+"""Invoice reminder utility for sending email reminders for due invoices.
+
+The scheduled job (``process_invoice_reminders``) selects the invoices due a
+reminder with one query over the stored payment columns
+(:func:`reminder_candidates` mirrors the ``should_*`` checks below), renders
+each email once from templates loaded once per run, and adds them to the
+email outbox in the same transaction as the bulk ``reminder_count`` update.
+Each email carries the ``invoice-reminder:<number>:<count>`` dedupe key the
+manual reminder uses, so a reminder is queued at most once however often
+the job runs; the outbox worker delivers and retries them. Each run is
+recorded in ``reminder_runs``.
+"""
 
 import logging
-import sys
-from datetime import datetime, timedelta, timezone
+import time as _time
+from datetime import datetime, time, timedelta
 from app import db
-from app.models import Invoice, Client, AppSettings
+from app.models import Invoice, Client, AppSettings, ReminderRun
+from app.utils import email_outbox
 from app.utils.email_utils import queue_email
-from flask import render_template
+from flask import current_app
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import joinedload
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -89,85 +103,98 @@ def should_send_repeat_reminder(invoice: Invoice, settings: AppSettings) -> bool
     return days_since_last_reminder >= settings.invoice_reminder_repeat_days
 
 
-def send_invoice_reminder(invoice: Invoice, settings: AppSettings) -> bool:
-    """Send invoice reminder email to client."""
-    try:
-        # Only send reminders for invoices that are in the 'Sent' state
-        if getattr(invoice, 'status', None) != 'Sent':
-            logger.info(f'Invoice {getattr(invoice, "invoice_number", "?")}: skipping reminder because status is not Sent')
-            return False
+def reminder_candidates(settings: AppSettings, today=None):
+    """Query for the Sent invoices due a first or repeat reminder on ``today`` (UTC).
 
-        if should_skip_reminder_for_low_balance(invoice):
-            logger.info(f'Invoice {getattr(invoice, "invoice_number", "?")}: skipping reminder because remaining balance is below the reminder threshold')
-            return False
+    The SQL form of ``should_send_first_reminder`` or
+    ``should_send_repeat_reminder``, low-balance skip included.
+    """
+    today = today or datetime.utcnow().date()
+    window = timedelta(days=settings.invoice_reminder_days or 0)
+    reminder_count = func.coalesce(Invoice.reminder_count, 0)
+    threshold = case((Invoice.total_cost * 0.10 < 20.0, Invoice.total_cost * 0.10), else_=20.0)
 
-        client = invoice.client
-        # Require at least one parent email address; prefer primary but allow secondary
-        if not client or not (client.parentemail or client.parentemail2):
-            logger.warning(f'Invoice {invoice.invoice_number}: No client email found')
-            return False
-        
-        # Prepare email data - use UTC for timezone-independent calculations
-        utc_today = datetime.utcnow().date()
-        days_until_due = (invoice.payby_date - utc_today).days
-        
-        # Determine if this is a repeat reminder
-        is_repeat = invoice.reminder_count > 0
-        reminder_type = 'Follow-up Reminder' if is_repeat else 'Due Date Reminder'
-        
-        # Determine status: overdue, due soon, or upcoming
+    due = [and_(reminder_count == 0, Invoice.payby_date.between(today - window, today + window))]
+    if settings.invoice_reminder_repeat_enabled:
+        # days since the last reminder (by date) >= repeat days
+        cutoff = datetime.combine(today - timedelta(days=(settings.invoice_reminder_repeat_days or 0) - 1), time.min)
+        due.append(and_(
+            Invoice.last_reminder_sent_date.isnot(None),
+            or_(and_(Invoice.payby_date == today, reminder_count > 0), Invoice.last_reminder_sent_date < cutoff),
+        ))
+
+    return (
+        Invoice.query.options(joinedload(Invoice.client))
+        .filter(Invoice.status == 'Sent', Invoice.amount_pending > threshold, or_(*due))
+        .order_by(Invoice.payby_date, Invoice.id)
+    )
+
+
+def _reminder_templates():
+    """The reminder email templates (HTML, text), loaded once per run."""
+    env = current_app.jinja_env
+    return env.get_template('email/invoice_reminder_email.html'), env.get_template('email/invoice_reminder_email.txt')
+
+
+def _reminder_email(invoice: Invoice, settings: AppSettings, templates=None):
+    """``(subject, recipients, body_text, body_html)`` for an invoice, or None without a client email."""
+    client = invoice.client
+    # Require at least one parent email address; prefer primary but allow secondary
+    recipients = [e for e in (client.parentemail, client.parentemail2) if e] if client else []
+    if not recipients:
+        logger.warning(f'Invoice {invoice.invoice_number}: No client email found')
+        return None
+
+    # Prepare email data - use UTC for timezone-independent calculations
+    utc_today = datetime.utcnow().date()
+    days_until_due = (invoice.payby_date - utc_today).days
+
+    # Determine if this is a repeat reminder
+    is_repeat = (invoice.reminder_count or 0) > 0
+    reminder_type = 'Follow-up Reminder' if is_repeat else 'Due Date Reminder'
+
+    # Determine status: overdue, due soon, or upcoming
+    if days_until_due < 0:
+        status = 'overdue'
+        days_overdue = abs(days_until_due)
+        status_message = f"This invoice is now OVERDUE by {days_overdue} day{'s' if days_overdue != 1 else ''}!"
+    elif days_until_due == 0:
+        status = 'due_today'
+        status_message = "This invoice is DUE TODAY!"
+    else:
+        status = 'upcoming'
+        status_message = f"This invoice is due in {days_until_due} day{'s' if days_until_due != 1 else ''}."
+
+    # Render email template
+    try:
+        html_template, text_template = templates or _reminder_templates()
+        # Use the invoice's pending/outstanding amount for reminders
+        context = dict(
+            client_name=client.parentname,
+            invoice_number=invoice.invoice_number,
+            invoice_total=invoice.pending_amount,
+            due_date=invoice.payby_date.strftime('%Y-%m-%d'),
+            days_until_due=max(days_until_due, 0),
+            reminder_type=reminder_type,
+            is_repeat=is_repeat,
+            status=status,
+            status_message=status_message,
+            days_overdue=abs(days_until_due) if days_until_due < 0 else 0
+        )
+        body_html = html_template.render(context)
+        body_text = text_template.render(context)
+    except Exception as e:
+        logger.exception(f'Error rendering email template for invoice {invoice.invoice_number}: {e}')
+        # Fall back to basic text version
+        status_text = ''
         if days_until_due < 0:
-            status = 'overdue'
-            days_overdue = abs(days_until_due)
-            status_message = f"This invoice is now OVERDUE by {days_overdue} day{'s' if days_overdue != 1 else ''}!"
+            status_text = f'This invoice is OVERDUE by {abs(days_until_due)} days!'
         elif days_until_due == 0:
-            status = 'due_today'
-            status_message = "This invoice is DUE TODAY!"
+            status_text = 'This invoice is DUE TODAY!'
         else:
-            status = 'upcoming'
-            status_message = f"This invoice is due in {days_until_due} day{'s' if days_until_due != 1 else ''}."
-        
-        # Render email template
-        try:
-            # Use the invoice's pending/outstanding amount for reminders
-            body_html = render_template(
-                'email/invoice_reminder_email.html',
-                client_name=client.parentname,
-                invoice_number=invoice.invoice_number,
-                invoice_total=invoice.pending_amount,
-                due_date=invoice.payby_date.strftime('%Y-%m-%d'),
-                days_until_due=max(days_until_due, 0),
-                reminder_type=reminder_type,
-                is_repeat=is_repeat,
-                status=status,
-                status_message=status_message,
-                days_overdue=abs(days_until_due) if days_until_due < 0 else 0
-            )
-            body_text = render_template(
-                'email/invoice_reminder_email.txt',
-                client_name=client.parentname,
-                invoice_number=invoice.invoice_number,
-                invoice_total=invoice.pending_amount,
-                due_date=invoice.payby_date.strftime('%Y-%m-%d'),
-                days_until_due=max(days_until_due, 0),
-                reminder_type=reminder_type,
-                is_repeat=is_repeat,
-                status=status,
-                status_message=status_message,
-                days_overdue=abs(days_until_due) if days_until_due < 0 else 0
-            )
-        except Exception as e:
-            logger.exception(f'Error rendering email template for invoice {invoice.invoice_number}: {e}')
-            # Fall back to basic text version
-            status_text = ''
-            if days_until_due < 0:
-                status_text = f'This invoice is OVERDUE by {abs(days_until_due)} days!'
-            elif days_until_due == 0:
-                status_text = 'This invoice is DUE TODAY!'
-            else:
-                status_text = f'This invoice is due in {days_until_due} days.'
-            
-            body_text = f"""
+            status_text = f'This invoice is due in {days_until_due} days.'
+
+        body_text = f"""
 Dear {client.parentname},
 
 This is a {reminder_type.lower()} for Invoice {invoice.invoice_number}.
@@ -184,25 +211,41 @@ Please ensure payment is made by the due date.
 Thank you,
 {settings.org_name or 'Organization'}
 """
-            body_html = None
-        
-        # Send email
-        recipients = [client.parentemail]
-        if client.parentemail2:
-            recipients.append(client.parentemail2)
-        
+        body_html = None
+
+    return f'{reminder_type}: Invoice {invoice.invoice_number}', recipients, body_text, body_html
+
+
+def send_invoice_reminder(invoice: Invoice, settings: AppSettings) -> bool:
+    """Send invoice reminder email to client."""
+    try:
+        # Only send reminders for invoices that are in the 'Sent' state
+        if getattr(invoice, 'status', None) != 'Sent':
+            logger.info(f'Invoice {getattr(invoice, "invoice_number", "?")}: skipping reminder because status is not Sent')
+            return False
+
+        if should_skip_reminder_for_low_balance(invoice):
+            logger.info(f'Invoice {getattr(invoice, "invoice_number", "?")}: skipping reminder because remaining balance is below the reminder threshold')
+            return False
+
+        email = _reminder_email(invoice, settings)
+        if email is None:
+            return False
+        subject, recipients, body_text, body_html = email
+
         success = queue_email(
-            subject=f'{reminder_type}: Invoice {invoice.invoice_number}',
+            subject=subject,
             recipients=recipients,
             body_text=body_text,
-            body_html=body_html
+            body_html=body_html,
+            dedupe_key=_dedupe_key(invoice)
         )
         
         if success:
             logger.info(f'Invoice {invoice.invoice_number}: Email queued successfully to {recipients}')
             # Update invoice tracking using UTC timestamp for consistency
             invoice.last_reminder_sent_date = datetime.utcnow()
-            invoice.reminder_count += 1
+            invoice.reminder_count = (invoice.reminder_count or 0) + 1
             db.session.commit()
             logger.info(f'Invoice {invoice.invoice_number}: Reminder tracking updated (count: {invoice.reminder_count})')
             return True
@@ -215,57 +258,79 @@ Thank you,
         return False
 
 
+def _dedupe_key(invoice: Invoice) -> str:
+    """Outbox dedupe key of the invoice's next reminder."""
+    return f'invoice-reminder:{invoice.invoice_number}:{(invoice.reminder_count or 0) + 1}'
+
+
 def process_invoice_reminders():
-    """Main function to process and send invoice reminders."""
+    """Main function to process and send invoice reminders.
+
+    Returns the ``ReminderRun`` recorded for this run, or None when
+    reminders are disabled or settings are unavailable.
+    """
     try:
         settings = AppSettings.get()
         
         if not settings:
             logger.error('Failed to retrieve AppSettings from database - check database connection and migrations')
-            return
+            return None
         
         if not settings.invoice_reminder_enabled:
             logger.info('Invoice reminders are disabled in settings')
-            return
-        
-        # Only process invoices that have been Sent to clients
-        unpaid_invoices = Invoice.query.filter(
-            Invoice.status == 'Sent'
-        ).all()
-        
-        reminders_sent = 0
-        for invoice in unpaid_invoices:
-            # Debug info to help trace why invoices are or are not eligible
-            # compute values for logging clarity
-            utc_today = datetime.utcnow().date()
-            days_until_due = (invoice.payby_date - utc_today).days
-            days_since_last = None
-            if invoice.last_reminder_sent_date:
-                days_since_last = (utc_today - invoice.last_reminder_sent_date.date()).days
+            return None
+    except Exception as e:
+        logger.exception(f'Error in process_invoice_reminders: {e}')
+        return None
+
+    # delivery happens in the outbox worker; the run only queues
+    run = ReminderRun(started_at=datetime.utcnow(), workers=1, candidates=0, sent=0, skipped=0, failed=0)
+    started = _time.monotonic()
+    try:
+        candidates = reminder_candidates(settings).all()
+        run.candidates = len(candidates)
+        logger.info(f'{len(candidates)} invoices are due a reminder')
+
+        # render every email up front, in this thread and app context
+        templates = _reminder_templates()
+        messages, sent_ids = [], []
+        for invoice in candidates:
             logger.debug(
-                f"Evaluating invoice {invoice.invoice_number}: due={invoice.payby_date} "
-                f"(days_until={days_until_due}), status={invoice.status}, "
-                f"reminders={invoice.reminder_count}, last_sent={invoice.last_reminder_sent_date}, "
-                f"days_since_last={days_since_last}"
+                f"Reminder for invoice {invoice.invoice_number}: due={invoice.payby_date}, "
+                f"pending={invoice.amount_pending}, reminders={invoice.reminder_count}, "
+                f"last_sent={invoice.last_reminder_sent_date}"
             )
+            email = _reminder_email(invoice, settings, templates)
+            if email is None:
+                run.skipped += 1
+                continue
+            subject, recipients, body_text, body_html = email
+            messages.append({'subject': subject, 'recipients': recipients, 'body_text': body_text,
+                             'body_html': body_html, 'dedupe_key': _dedupe_key(invoice)})
+            sent_ids.append(invoice.id)
 
-            # Check for first reminder
-            if should_send_first_reminder(invoice, settings):
-                if send_invoice_reminder(invoice, settings):
-                    reminders_sent += 1
-
-            # Check for repeat reminder
-            elif should_send_repeat_reminder(invoice, settings):
-                if send_invoice_reminder(invoice, settings):
-                    reminders_sent += 1
-        
-        logger.info(f'Processed {len(unpaid_invoices)} unpaid invoices, sent {reminders_sent} reminders')
-        
-        # Wait for all background email threads to complete before exiting
-        logger.info('Waiting for all queued emails to be sent...')
-        from app.utils.email_utils import wait_for_pending_emails
-        wait_for_pending_emails(timeout=30.0)
-        logger.info('All emails sent successfully')
-        
+        # a reminder already in the outbox (dedupe key) is not queued again but still counts
+        email_outbox.enqueue_many(messages)
+        if sent_ids:
+            Invoice.query.filter(Invoice.id.in_(sent_ids)).update({
+                Invoice.reminder_count: func.coalesce(Invoice.reminder_count, 0) + 1,
+                Invoice.last_reminder_sent_date: datetime.utcnow(),
+            }, synchronize_session=False)
+        # the emails and the tracking update are committed together; the commit wakes the outbox worker
+        db.session.commit()
+        run.sent = len(sent_ids)
+        logger.info(f'Processed {run.candidates} reminder candidates: queued {run.sent}, skipped {run.skipped}')
     except Exception as e:
         logger.exception(f'Error in process_invoice_reminders: {e}')
+        db.session.rollback()
+        run.error = str(e)
+
+    run.finished_at = datetime.utcnow()
+    run.duration_ms = int((_time.monotonic() - started) * 1000)
+    try:
+        db.session.add(run)
+        db.session.commit()
+    except Exception as e:
+        logger.exception(f'Failed to record reminder run: {e}')
+        db.session.rollback()
+    return run
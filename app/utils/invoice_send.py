@@ -0,0 +1,266 @@
+"""Send every Draft invoice of a billing period in the background.
+
+Month-end sending used to be one ``mark_sent`` POST per invoice, each
+rendering a PDF and queuing its email inside the request. A send job
+instead runs in a thread and works through the period's drafts in chunks
+of ``CHUNK_SIZE``:
+
+1. load the chunk's invoices, sessions and activity map in a few queries
+2. take PDFs from the invoice PDF cache, rendering the misses in the
+   ``pdf_render`` process pool
+3. render the email bodies from templates loaded once per job
+4. claim the chunk with one ``UPDATE ... SET status = 'Sent' WHERE status =
+   'Draft'`` and add the emails of the invoices it changed to the outbox,
+   in the same transaction
+
+The job row (``invoice_send_jobs``) records progress, so the page that
+started it can poll ``/invoices/send_jobs/<id>/status``. Only one job is
+started at a time, and the claim makes that safe when two requests race:
+an invoice another job (or ``mark_sent``) sent first is not Draft any more,
+so it is not claimed or emailed again.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from threading import Thread
+
+from flask import current_app
+from sqlalchemy import or_, update
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import db
+from app.models import Activity, Client, Intervention, Invoice, InvoiceSendJob
+from app.utils import calendar_feed, email_outbox, pdf_render
+from app.utils.invoice_context import InvoiceRenderContext, apply_line_items, extract_mileages
+from app.utils.pdf_cache import get_cached_pdf, invoice_pdf_fingerprint, store_pdf
+from app.utils.settings_utils import get_org_settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 50
+
+# a job still 'running' after this long belongs to a process that died
+STALE_AFTER = timedelta(hours=1)
+
+
+def invoice_recipients(client):
+    """The client's parent email addresses, de-duplicated, in order."""
+    seen = set()
+    recipients = [getattr(client, 'parentemail', None), getattr(client, 'parentemail2', None)]
+    return [x for x in recipients if x and not (x in seen or seen.add(x))]
+
+
+def _drafts(date_from, date_to):
+    return Invoice.query.filter(
+        Invoice.status == 'Draft',
+        Invoice.date_from >= date_from,
+        Invoice.date_to <= date_to,
+    )
+
+
+def active_job():
+    """The queued or running send job, if one is in progress."""
+    return (
+        InvoiceSendJob.query
+        .filter(or_(
+            InvoiceSendJob.status == 'queued',
+            (InvoiceSendJob.status == 'running') & (InvoiceSendJob.started_at >= datetime.utcnow() - STALE_AFTER),
+        ))
+        .order_by(InvoiceSendJob.id)
+        .first()
+    )
+
+
+def create_send_job(date_from, date_to, requested_by=None):
+    """Record a send job for the period. Returns ``(job, created)``; an active job is returned instead of a new one."""
+    job = active_job()
+    if job is not None:
+        return job, False
+    job = InvoiceSendJob(date_from=date_from, date_to=date_to, requested_by=requested_by, status='queued',
+                         total=_drafts(date_from, date_to).count(), sent=0, skipped=0, failed=0)
+    db.session.add(job)
+    db.session.commit()
+    return job, True
+
+
+def start_send_job(date_from, date_to, requested_by=None):
+    """Create a send job and run it in a background thread. Returns ``(job, created)``."""
+    job, created = create_send_job(date_from, date_to, requested_by)
+    if created:
+        app = current_app._get_current_object()
+        Thread(target=_run_in_app, args=(app, job.id), name=f'invoice-send-{job.id}', daemon=True).start()
+    return job, created
+
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        run_send_job(job_id)
+
+
+def _load_contexts(numbers, settings, activity_map):
+    invoices = (
+        Invoice.query
+        .options(joinedload(Invoice.client).joinedload(Client.supervisor), selectinload(Invoice.payments))
+        .filter(Invoice.invoice_number.in_(numbers), Invoice.status == 'Draft')
+        .order_by(Invoice.id)
+        .all()
+    )
+    interventions = {}
+    for i in (
+        Intervention.query
+        .options(joinedload(Intervention.employee))
+        .filter(Intervention.invoice_number.in_(numbers))
+        .order_by(Intervention.date, Intervention.start_time)
+    ):
+        interventions.setdefault(i.invoice_number, []).append(i)
+
+    contexts = []
+    for invoice in invoices:
+        client = invoice.client
+        sessions = interventions.get(invoice.invoice_number, [])
+        apply_line_items(invoice, client, sessions, activity_map)
+        supervisor = client.supervisor if client and client.supervisor_id else None
+        contexts.append(InvoiceRenderContext(invoice, client, sessions, extract_mileages(invoice), supervisor, settings))
+    return contexts
+
+
+def _pdf_html(ctx):
+    from app.invoices.views import _invoice_pdf_html
+    return _invoice_pdf_html(ctx, ctx.invoice.status or 'Pending')
+
+
+def _invoice_pdfs(contexts):
+    """``{invoice_number: pdf_bytes}``, from the PDF cache or rendered in the process pool."""
+    pdfs, misses = {}, []
+    for ctx in contexts:
+        number = ctx.invoice.invoice_number
+        fingerprint = invoice_pdf_fingerprint(ctx.invoice, ctx.client, ctx.interventions, ctx.mileages, ctx.supervisor, ctx.settings)
+        cached = get_cached_pdf(number, fingerprint)
+        if cached is not None:
+            pdfs[number] = cached
+        else:
+            misses.append((number, fingerprint, _pdf_html(ctx)))
+
+    rendered = pdf_render.render_pdfs((number, html) for number, _fingerprint, html in misses)
+    for number, fingerprint, _html in misses:
+        if rendered.get(number):
+            store_pdf(number, fingerprint, rendered[number])
+            pdfs[number] = rendered[number]
+    return pdfs
+
+
+def _claim(numbers):
+    """Mark the Draft invoices among ``numbers`` Sent; returns the numbers this transaction changed."""
+    stmt = (
+        update(Invoice)
+        .where(Invoice.invoice_number.in_(numbers), Invoice.status == 'Draft')
+        .values(status='Sent')
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        return {n for (n,) in db.session.execute(stmt.returning(Invoice.invoice_number))}
+    claimed = {n for (n,) in db.session.query(Invoice.invoice_number)
+               .filter(Invoice.invoice_number.in_(numbers), Invoice.status == 'Draft').with_for_update()}
+    db.session.execute(stmt)
+    return claimed
+
+
+def _send_chunk(job, numbers, settings, activity_map, templates):
+    messages, errors = {}, []
+    contexts = []
+    for ctx in _load_contexts(numbers, settings, activity_map):
+        if invoice_recipients(ctx.client):
+            contexts.append(ctx)
+        else:
+            job.skipped += 1
+            errors.append({'invoice_number': ctx.invoice.invoice_number, 'error': 'client has no parent email address'})
+
+    pdfs = _invoice_pdfs(contexts)
+    html_template, text_template = templates
+    for ctx in contexts:
+        invoice, client = ctx.invoice, ctx.client
+        number = invoice.invoice_number
+        recipients = invoice_recipients(client)
+        if not pdfs.get(number):
+            job.failed += 1
+            errors.append({'invoice_number': number, 'error': 'PDF could not be rendered'})
+            continue
+        messages[number] = {
+            'subject': f"Invoice {number} from {settings['org_name']}",
+            'recipients': recipients,
+            'body_text': text_template.render(client=client, invoice=invoice, org_name=settings['org_name']),
+            'body_html': html_template.render(client=client, invoice=invoice, org_name=settings['org_name']),
+            'attachments': [(f'{number}.pdf', pdfs[number], 'application/pdf')],
+            'dedupe_key': f'invoice-send:{job.id}:{number}',
+        }
+
+    sent_numbers = _claim(list(messages)) if messages else set()
+    for number in messages.keys() - sent_numbers:
+        job.skipped += 1
+        errors.append({'invoice_number': number, 'error': 'invoice was sent by another request'})
+    email_outbox.enqueue_many([messages[number] for number in messages if number in sent_numbers])
+    if sent_numbers:
+        # the calendar colours sessions by invoice status
+        sent = [ctx for ctx in contexts if ctx.invoice.invoice_number in sent_numbers]
+        calendar_feed.mark_dirty(entities={('client', ctx.client.id) for ctx in sent}
+                                 | {('employee', i.employee_id) for ctx in sent for i in ctx.interventions})
+    job.sent += len(sent_numbers)
+    if errors:
+        job.errors = json.dumps(job.error_list + errors)
+    # committing wakes the outbox worker
+    db.session.commit()
+
+
+def run_send_job(job_id):
+    """Send the job's Draft invoices, committing progress after every chunk. Returns the job."""
+    job = db.session.get(InvoiceSendJob, job_id)
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    try:
+        numbers = [n for (n,) in _drafts(job.date_from, job.date_to)
+                   .with_entities(Invoice.invoice_number).order_by(Invoice.id)]
+        job.total = len(numbers)
+        db.session.commit()
+
+        settings = get_org_settings()
+        activity_map = {a.activity_name: a.activity_category for a in Activity.query.all()}
+        env = current_app.jinja_env
+        templates = env.get_template('email/invoice_email.html'), env.get_template('email/invoice_email.txt')
+        for start in range(0, len(numbers), CHUNK_SIZE):
+            _send_chunk(job, numbers[start:start + CHUNK_SIZE], settings, activity_map, templates)
+            # the chunk's invoices and PDFs are not needed any more
+            db.session.expunge_all()
+            job = db.session.get(InvoiceSendJob, job_id)
+        job.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Invoice send job %s failed: %s', job_id, e)
+        job = db.session.get(InvoiceSendJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    logger.info('Invoice send job %s %s: %s sent, %s skipped, %s failed of %s',
+                job_id, job.status, job.sent, job.skipped, job.failed, job.total)
+    return job
+
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'date_from': job.date_from.isoformat(),
+        'date_to': job.date_to.isoformat(),
+        'status': job.status,
+        'total': job.total,
+        'sent': job.sent,
+        'skipped': job.skipped,
+        'failed': job.failed,
+        'errors': job.error_list,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,90 @@
+"""Resolve employee pay rates for many sessions from one PayRate query.
+
+Rate selection for a session (employee, client, date):
+
+1. the employee's client-specific rates for that client, if any exist:
+   the latest rate effective on or before the session date, otherwise the
+   latest rate overall;
+2. else the employee's base rates (``client_id`` NULL), same rule;
+3. else no rate (the caller reports it as missing).
+
+A rate with no ``effective_date`` counts as effective on every date. Rows
+are read in ``ORDER BY effective_date DESC, id DESC`` order, as the
+per-session queries did (NULLs sort first on PostgreSQL and last on SQLite);
+on equal or missing dates the most recently entered rate wins.
+"""
+
+from bisect import bisect_right
+
+from app.models import PayRate
+
+
+class _RateIndex:
+    """Effective-date index for one (employee, client-or-base) group."""
+
+    def __init__(self, rows):
+        # rows arrive in ORDER BY effective_date DESC, id DESC order
+        self.first = rows[0].rate
+        self.leading_undated = None
+        self.trailing_undated = None
+        dated = {}
+        seen_dated = False
+        for row in rows:
+            if row.effective_date is None:
+                if not seen_dated and self.leading_undated is None:
+                    self.leading_undated = row.rate
+                elif seen_dated and self.trailing_undated is None:
+                    self.trailing_undated = row.rate
+                continue
+            seen_dated = True
+            # on equal dates the first row in query order wins
+            dated.setdefault(row.effective_date, row.rate)
+        self.dates = sorted(dated)
+        self.rates = [dated[d] for d in self.dates]
+
+    def resolve(self, on_date):
+        if self.leading_undated is not None:
+            return self.leading_undated
+        pos = bisect_right(self.dates, on_date)
+        if pos:
+            return self.rates[pos - 1]
+        if self.trailing_undated is not None:
+            return self.trailing_undated
+        return self.first
+
+
+class PayRateResolver:
+    """Pay rates for a set of employees, loaded once and resolved in memory."""
+
+    def __init__(self, payrates):
+        grouped = {}
+        for row in payrates:
+            grouped.setdefault((row.employee_id, row.client_id), []).append(row)
+        self._index = {key: _RateIndex(rows) for key, rows in grouped.items()}
+
+    @classmethod
+    def for_employees(cls, employee_ids):
+        """Load every PayRate row for ``employee_ids`` in a single query."""
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return cls([])
+        rows = (
+            PayRate.query
+            .filter(PayRate.employee_id.in_(employee_ids))
+            .order_by(PayRate.effective_date.desc(), PayRate.id.desc())
+            .all()
+        )
+        return cls(rows)
+
+    def resolve(self, employee_id, client_id, on_date):
+        """Return the hourly rate for one session, or None if none is configured."""
+        index = self._index.get((employee_id, client_id))
+        if index is None:
+            index = self._index.get((employee_id, None))
+        if index is None:
+            return None
+        return index.resolve(on_date)
+
+    def resolve_sessions(self, sessions):
+        """Return ``{session.id: rate or None}`` for a batch of interventions."""
+        return {s.id: self.resolve(s.employee_id, s.client_id, s.date) for s in sessions}
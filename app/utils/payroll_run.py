@@ -0,0 +1,252 @@
+"""Payroll run: paystubs for every active employee over one pay period.
+
+``compute_payroll_previews`` builds the same preview the ``/paystubs/create``
+screen shows, but for all employees at once: one query for the unpaid
+sessions, one for unpaid mileage and one for pay rates, grouped in memory.
+``run_payroll_for_period`` then saves the paystubs of every employee without
+missing rates in a single transaction using bulk inserts, and optionally
+renders their PDFs in worker processes into the PDF cache, so the first
+download or email of a new paystub does not render it again. Nothing is
+written outside the cache, which drops a paystub's PDFs when it changes.
+"""
+
+import logging
+from datetime import date
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import db
+from app.models import Employee, Intervention, Mileage, PayStub, PayStubItem
+from app.utils import pdf_render
+from app.utils.pdf_cache import paystub_cache_key, paystub_pdf_fingerprint, store_pdf
+from app.utils.payrates import PayRateResolver
+from app.utils.rollups import mark_dirty as mark_rollups_dirty
+from app.utils.settings_utils import get_org_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _empty_preview(employee, start, end):
+    return {
+        'employee': employee,
+        'start': start,
+        'end': end,
+        'lines': [],
+        'missing_rates': [],
+        'total_hours': 0.0,
+        'total_amount': 0.0,
+    }
+
+
+def compute_payroll_previews(start, end, employee_ids=None):
+    """Return ``{employee_id: preview}`` for active employees with unpaid work.
+
+    Each preview has ``lines`` (same shape as the create_paystub screen),
+    ``missing_rates`` as ``(client_id, intervention_id)`` pairs and the
+    rounded ``total_hours``/``total_amount``.
+    """
+    employees_query = Employee.query.filter(Employee.is_active == True)
+    if employee_ids:
+        employees_query = employees_query.filter(Employee.id.in_(employee_ids))
+    employees = {e.id: e for e in employees_query.all()}
+    if not employees:
+        return {}
+
+    sessions = (
+        Intervention.query
+        .options(joinedload(Intervention.client))
+        .filter(
+            Intervention.employee_id.in_(list(employees)),
+            Intervention.date >= start,
+            Intervention.date <= end,
+            Intervention.unpaid_clause()
+        )
+        .order_by(Intervention.employee_id, Intervention.date)
+        .all()
+    )
+    mileages = (
+        Mileage.query
+        .options(joinedload(Mileage.client), joinedload(Mileage.mileage_rate))
+        .filter(
+            Mileage.employee_id.in_(list(employees)),
+            Mileage.date >= start,
+            Mileage.date <= end,
+            Mileage.is_paid == False
+        )
+        .order_by(Mileage.employee_id, Mileage.date)
+        .all()
+    )
+    rates = PayRateResolver.for_employees({s.employee_id for s in sessions}).resolve_sessions(sessions)
+
+    previews = {}
+    for s in sessions:
+        preview = previews.setdefault(s.employee_id, _empty_preview(employees[s.employee_id], start, end))
+        rate = rates.get(s.id)
+        if rate is None:
+            preview['missing_rates'].append((s.client_id, s.id))
+            continue
+        amount = round(rate * (s.duration or 0), 2)
+        preview['lines'].append({
+            'type': 'intervention',
+            'intervention': s,
+            'client': s.client,
+            'rate': rate,
+            'hours': s.duration,
+            'amount': amount
+        })
+        preview['total_hours'] += s.duration or 0
+        preview['total_amount'] += amount
+
+    for m in mileages:
+        preview = previews.setdefault(m.employee_id, _empty_preview(employees[m.employee_id], start, end))
+        preview['lines'].append({
+            'type': 'mileage',
+            'mileage': m,
+            'client': m.client,
+            'description': m.description or 'Mileage',
+            'distance': m.distance,
+            'rate': m.mileage_rate.rate,
+            'amount': m.cost
+        })
+        preview['total_amount'] += m.cost
+
+    for preview in previews.values():
+        preview['total_hours'] = round(preview['total_hours'], 2)
+        preview['total_amount'] = round(preview['total_amount'], 2)
+    return previews
+
+
+def _save_paystubs(previews, generated_date):
+    """Insert paystubs and items for ``previews`` and mark their work paid.
+
+    Returns ``{employee_id: paystub_id}``. The caller commits.
+    """
+    paystubs = {}
+    for emp_id, preview in previews.items():
+        paystubs[emp_id] = PayStub(
+            employee_id=emp_id,
+            period_start=preview['start'],
+            period_end=preview['end'],
+            generated_date=generated_date,
+            total_hours=preview['total_hours'],
+            total_amount=preview['total_amount'],
+            email_sent=False
+        )
+    db.session.add_all(paystubs.values())
+    db.session.flush()
+
+    item_rows = []
+    session_ids = []
+    mileage_ids = []
+    for emp_id, preview in previews.items():
+        for ln in preview['lines']:
+            if ln['type'] == 'intervention':
+                item_rows.append({
+                    'paystub_id': paystubs[emp_id].id,
+                    'intervention_id': ln['intervention'].id,
+                    'client_id': ln['client'].id,
+                    'rate': ln['rate'],
+                    'hours': ln['hours'],
+                    'amount': ln['amount'],
+                })
+                session_ids.append(ln['intervention'].id)
+            elif ln['type'] == 'mileage':
+                mileage_ids.append(ln['mileage'].id)
+
+    if item_rows:
+        db.session.execute(insert(PayStubItem), item_rows)
+        mark_rollups_dirty(intervention_ids=session_ids)
+    if session_ids:
+        db.session.execute(
+            update(Intervention).where(Intervention.id.in_(session_ids)).values(is_paid=True),
+            execution_options={'synchronize_session': False}
+        )
+    if mileage_ids:
+        db.session.execute(
+            update(Mileage).where(Mileage.id.in_(mileage_ids)).values(is_paid=True),
+            execution_options={'synchronize_session': False}
+        )
+    return {emp_id: ps.id for emp_id, ps in paystubs.items()}
+
+
+def _render_paystub_pdfs(paystub_ids, max_workers=None):
+    """Render paystub PDFs in worker processes into the PDF cache; returns the ids cached."""
+    from app.payroll.views import _paystub_pdf_html
+
+    paystubs = (
+        PayStub.query
+        .options(
+            joinedload(PayStub.employee),
+            selectinload(PayStub.items).joinedload(PayStubItem.intervention),
+            selectinload(PayStub.items).joinedload(PayStubItem.client),
+        )
+        .filter(PayStub.id.in_(paystub_ids))
+        .all()
+    )
+    settings = get_org_settings()
+    pdfs = pdf_render.render_pdfs(((ps.id, _paystub_pdf_html(ps, settings)) for ps in paystubs), max_workers=max_workers)
+
+    cached = []
+    for ps in paystubs:
+        pdf_bytes = pdfs.get(ps.id)
+        if pdf_bytes and store_pdf(paystub_cache_key(ps.id), paystub_pdf_fingerprint(ps, settings), pdf_bytes):
+            cached.append(ps.id)
+    return sorted(cached)
+
+
+def run_payroll_for_period(start, end, employee_ids=None, dry_run=False, render_pdfs=True, max_workers=None):
+    """Create paystubs for all active employees for the period.
+
+    Employees with any session lacking a pay rate are skipped (as on the
+    create_paystub screen) and reported in ``missing_rates``. Returns a dict
+    with ``paystubs`` (one summary per saved or previewed employee),
+    ``missing_rates`` and ``pdfs`` (ids of the paystubs whose PDFs were cached).
+    """
+    previews = compute_payroll_previews(start, end, employee_ids=employee_ids)
+
+    missing = {emp_id: p for emp_id, p in previews.items() if p['missing_rates']}
+    ready = {emp_id: p for emp_id, p in previews.items() if not p['missing_rates'] and p['lines']}
+
+    summary = {
+        'paystubs': [],
+        'missing_rates': [
+            {
+                'employee_id': emp_id,
+                'employee_name': f"{p['employee'].firstname} {p['employee'].lastname or ''}".strip(),
+                'client_ids': sorted({client_id for client_id, _ in p['missing_rates'] if client_id is not None}),
+                'intervention_ids': [intervention_id for _, intervention_id in p['missing_rates']],
+            }
+            for emp_id, p in sorted(missing.items())
+        ],
+        'pdfs': [],
+    }
+
+    for emp_id, p in sorted(ready.items()):
+        summary['paystubs'].append({
+            'employee_id': emp_id,
+            'employee_name': f"{p['employee'].firstname} {p['employee'].lastname or ''}".strip(),
+            'paystub_id': None,
+            'sessions': sum(1 for ln in p['lines'] if ln['type'] == 'intervention'),
+            'mileages': sum(1 for ln in p['lines'] if ln['type'] == 'mileage'),
+            'total_hours': p['total_hours'],
+            'total_amount': p['total_amount'],
+        })
+
+    paystub_ids = {}
+    if ready and not dry_run:
+        try:
+            paystub_ids = _save_paystubs(ready, date.today())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for entry in summary['paystubs']:
+            entry['paystub_id'] = paystub_ids.get(entry['employee_id'])
+
+    logger.info('Payroll run %s..%s: %d paystub(s), %d employee(s) with missing rates',
+                start, end, len(paystub_ids), len(missing))
+
+    if render_pdfs and paystub_ids:
+        summary['pdfs'] = _render_paystub_pdfs(list(paystub_ids.values()), max_workers=max_workers)
+    return summary
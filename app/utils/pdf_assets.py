@@ -0,0 +1,172 @@
+"""Serve the assets a PDF links to from disk instead of over HTTP.
+
+PDF templates are rendered with the request's root URL as WeasyPrint's base
+URL, so a relative ``/static/...`` link, or the web path of the org logo,
+made the render worker fetch the file from this same server over HTTP. That
+is a round trip through the single gevent worker in the middle of a render.
+
+:func:`local_assets` captures, in the app process, where those URLs live
+on disk: the static folder, ``PROFILE_PIC_FOLDER`` and the configured logo.
+The render worker turns it into a WeasyPrint ``url_fetcher`` with
+:func:`url_fetcher`. Such URLs are then read from disk, and the file bytes
+are kept in an LRU keyed by path, mtime and size. Other URLs (``data:``,
+external hosts) go to WeasyPrint's default fetcher.
+
+:data:`image_cache` keeps decoded images between the renders of one worker.
+An image whose file changed on disk is decoded again.
+"""
+
+import logging
+import mimetypes
+import os
+from functools import lru_cache
+from urllib.parse import unquote, urlsplit
+from urllib.request import url2pathname
+
+from flask import current_app
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+# files kept in memory per render worker
+FILE_CACHE_SIZE = 128
+
+# image cache entries kept per render worker; it is emptied between renders once past this
+IMAGE_CACHE_SIZE = 64
+
+
+class LocalAssets:
+    """Where the site's asset URLs live on disk. Plain data, so it can be sent to a render worker."""
+
+    def __init__(self, base_url, roots=(), files=None):
+        parts = urlsplit(base_url or '')
+        self.origin = f'{parts.scheme}://{parts.netloc}' if parts.scheme in ('http', 'https') else None
+        # the app may be mounted below the root of the host
+        self.script_root = parts.path.rstrip('/') if self.origin else ''
+        self.roots = tuple((prefix, os.path.abspath(directory)) for prefix, directory in roots if directory)
+        self.files = dict(files or {})
+
+    def _site_path(self, url):
+        parts = urlsplit(url)
+        if parts.scheme == 'file':
+            return unquote(parts.path)
+        if self.origin and parts.scheme in ('http', 'https') and f'{parts.scheme}://{parts.netloc}' == self.origin:
+            path = unquote(parts.path)
+            if self.script_root and path.startswith(self.script_root + '/'):
+                path = path[len(self.script_root):]
+            return path
+        return None
+
+    def resolve(self, url):
+        """The file behind ``url``, or None when ``url`` is not one of ours.
+
+        Raises ``FileNotFoundError`` for a URL under one of our prefixes that
+        names no file, rather than letting it go out over HTTP.
+        """
+        path = self._site_path(url)
+        if path is None:
+            return None
+        if path in self.files:
+            return self.files[path]
+        if url.startswith('file:'):
+            filename = url2pathname(path)
+            if any(filename.startswith(directory + os.sep) for _prefix, directory in self.roots):
+                return filename
+        for prefix, directory in self.roots:
+            if path.startswith(prefix):
+                filename = safe_join(directory, path[len(prefix):])
+                if filename is None or not os.path.isfile(filename):
+                    raise FileNotFoundError(url)
+                return filename
+        if url.startswith('file:'):
+            # a file:// link to some other file; WeasyPrint reads it from disk itself
+            return None
+        if self.origin:
+            logger.warning('PDF asset %s is fetched over HTTP from this server', url)
+        return None
+
+
+def local_assets(base_url):
+    """The :class:`LocalAssets` for this app and its configured logo."""
+    from app.utils.settings_utils import get_org_settings
+
+    app = current_app._get_current_object()
+    roots = [
+        (app.static_url_path.rstrip('/') + '/', app.static_folder),
+        ('/profile_pic/', app.config.get('PROFILE_PIC_FOLDER')),
+    ]
+    files = {}
+    settings = get_org_settings()
+    logo_uri = settings.get('logo_file_uri') or ''
+    if logo_uri.startswith('file:'):
+        logo_file = url2pathname(urlsplit(logo_uri).path)
+        files[unquote(urlsplit(logo_uri).path)] = logo_file
+        if settings.get('logo_web_path'):
+            files[settings['logo_web_path']] = logo_file
+    return LocalAssets(base_url, roots, files)
+
+
+def _file_version(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@lru_cache(maxsize=FILE_CACHE_SIZE)
+def _read_file(filename, version):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+class ImageCache(dict):
+    """WeasyPrint's image cache, dropping an image whose local file changed since it was decoded."""
+
+    def __init__(self):
+        super().__init__()
+        self.versions = {}
+
+    def __contains__(self, url):
+        if not super().__contains__(url):
+            return False
+        filename, version = self.versions.get(url, (None, None))
+        if filename is not None and _file_version(filename) != version:
+            del self[url]
+            return False
+        return True
+
+    def clear(self):
+        super().clear()
+        self.versions.clear()
+
+
+# render worker: decoded images by URL, across renders
+image_cache = ImageCache()
+
+
+def url_fetcher(assets):
+    """A WeasyPrint ``url_fetcher`` reading ``assets`` from disk through the LRU."""
+
+    def fetch(url):
+        filename = assets.resolve(url) if assets is not None else None
+        if filename is None:
+            from weasyprint import default_url_fetcher
+            return default_url_fetcher(url)
+        version = _file_version(filename)
+        if version is None:
+            raise FileNotFoundError(url)
+        image_cache.versions[url] = (filename, version)
+        return {
+            'string': _read_file(filename, version),
+            'mime_type': mimetypes.guess_type(filename)[0],
+            'redirected_url': url,
+        }
+
+    return fetch
+
+
+def trim_image_cache():
+    """Empty :data:`image_cache` once it is past ``IMAGE_CACHE_SIZE`` entries. Call between renders only."""
+    if len(image_cache) > IMAGE_CACHE_SIZE:
+        image_cache.clear()
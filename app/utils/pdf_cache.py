@@ -0,0 +1,291 @@
+"""On-disk cache for rendered invoice and paystub PDFs.
+
+Rendering an invoice through WeasyPrint is expensive, while the inputs of an
+invoice rarely change once it has been created. Each rendered PDF is stored
+under ``PDF_CACHE_FOLDER`` (``app/data/pdf_cache`` by default) as
+``<invoice_number>-<fingerprint>.pdf`` where the fingerprint is a hash of
+everything the PDF template displays: the invoice snapshot, status, payments,
+line items and the organization settings/logo. A changed invoice therefore
+never matches a stale file, and the explicit invalidation helpers only exist
+to free disk space early.
+
+Paystubs share the cache under the key ``paystub-<id>``
+(:func:`paystub_cache_key`), fingerprinted by :func:`paystub_pdf_fingerprint`.
+
+The cache is bounded by ``PDF_CACHE_MAX_BYTES``; least recently used files are
+evicted first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from threading import Lock
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+_cache_lock = Lock()
+
+
+def _cache_dir():
+    folder = current_app.config.get('PDF_CACHE_FOLDER')
+    if not folder:
+        folder = os.path.join(current_app.root_path, 'data', 'pdf_cache')
+    return folder
+
+
+def _max_bytes():
+    try:
+        return int(current_app.config.get('PDF_CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_BYTES
+
+
+def _safe_name(invoice_number):
+    return ''.join(ch for ch in str(invoice_number) if ch.isalnum() or ch in '-_')
+
+
+def _path_for(invoice_number, fingerprint):
+    return os.path.join(_cache_dir(), f'{_safe_name(invoice_number)}-{fingerprint}.pdf')
+
+
+def _iso(value):
+    if value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _logo_signature(settings):
+    """Describe the configured logo so replacing the file busts the cache."""
+    signature = {
+        'logo_b64': hashlib.sha256(settings['logo_b64'].encode('utf-8')).hexdigest() if settings.get('logo_b64') else None,
+        'logo_url': settings.get('logo_url'),
+        'logo_file_uri': settings.get('logo_file_uri'),
+        'logo_web_path': settings.get('logo_web_path'),
+    }
+    appsettings = settings.get('appsettings')
+    logo_path = getattr(appsettings, 'logo_path', None) or os.environ.get('LOGO_PATH')
+    if logo_path:
+        if not os.path.isabs(logo_path):
+            logo_path = os.path.join(current_app.root_path, logo_path)
+        try:
+            stat = os.stat(logo_path)
+            signature['logo_stat'] = [stat.st_size, int(stat.st_mtime)]
+        except OSError:
+            signature['logo_stat'] = None
+    return signature
+
+
+def invoice_pdf_fingerprint(invoice, client, interventions, mileages, supervisor, settings):
+    """Return a stable hash of every value the invoice PDF template renders."""
+    snapshot = {
+        'invoice': {
+            'number': invoice.invoice_number,
+            'invoiced_date': _iso(invoice.invoiced_date),
+            'payby_date': _iso(invoice.payby_date),
+            'date_from': _iso(invoice.date_from),
+            'date_to': _iso(invoice.date_to),
+            'total_cost': float(invoice.total_cost or 0),
+            'status': invoice.status,
+            'paid_date': _iso(invoice.paid_date),
+            'items': invoice.invoice_items,
+        },
+        'payments': sorted(
+            [p.id, float(p.amount or 0), _iso(p.payment_date), p.transaction_number]
+            for p in invoice.payments
+        ),
+        'client': [
+            client.firstname, client.lastname, client.parentname, client.address1,
+            client.address2, client.city, client.state, client.zipcode,
+        ] if client else None,
+        'supervisor': [supervisor.firstname, supervisor.lastname, supervisor.rba_number] if supervisor else None,
+        'interventions': [
+            [
+                i.id, i.intervention_type, _iso(i.date), _iso(i.start_time), _iso(i.end_time),
+                float(i.duration or 0), float(getattr(i, 'rate', 0) or 0), float(getattr(i, 'cost', 0) or 0),
+                i.employee.firstname if i.employee else None,
+                i.employee.lastname if i.employee else None,
+                i.employee.position if i.employee else None,
+            ]
+            for i in interventions
+        ],
+        'mileages': [
+            [_iso(m.date), m.description, m.distance, m.rate, m.cost]
+            for m in mileages
+        ],
+        'org': [
+            settings.get('org_name'), settings.get('org_address'), settings.get('org_email'),
+            settings.get('org_phone'), settings.get('payment_email'),
+        ],
+        'logo': _logo_signature(settings),
+    }
+    payload = json.dumps(snapshot, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def paystub_cache_key(paystub_id):
+    """Cache key of a paystub's PDF; invoice numbers never start with ``paystub-``."""
+    return f'paystub-{paystub_id}'
+
+
+def paystub_pdf_fingerprint(paystub, settings):
+    """Return a stable hash of every value the paystub PDF template renders."""
+    employee = paystub.employee
+    snapshot = {
+        'paystub': [
+            paystub.id, _iso(paystub.period_start), _iso(paystub.period_end), _iso(paystub.generated_date),
+            float(paystub.total_hours or 0), float(paystub.total_amount or 0), paystub.notes,
+        ],
+        'employee': [
+            employee.firstname, employee.lastname, employee.position, employee.rba_number,
+        ] if employee else None,
+        'items': [
+            [
+                item.id, float(item.rate or 0), float(item.hours or 0), float(item.amount or 0),
+                item.client.firstname if item.client else None,
+                item.client.lastname if item.client else None,
+                item.intervention.intervention_type if item.intervention else None,
+                _iso(item.intervention.date) if item.intervention else None,
+                _iso(item.intervention.start_time) if item.intervention else None,
+                _iso(item.intervention.end_time) if item.intervention else None,
+            ]
+            for item in paystub.items
+        ],
+        'org': [
+            settings.get('org_name'), settings.get('org_address'), settings.get('org_email'),
+            settings.get('org_phone'),
+        ],
+        'logo': _logo_signature(settings),
+    }
+    payload = json.dumps(snapshot, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_pdf(invoice_number, fingerprint):
+    """Return cached PDF bytes for the fingerprint or None on a miss."""
+    path = _path_for(invoice_number, fingerprint)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        # bump mtime so eviction treats this entry as recently used
+        os.utime(path, None)
+    except OSError:
+        pass
+    logger.debug('Invoice PDF cache hit for %s', invoice_number)
+    return data
+
+
+def store_pdf(invoice_number, fingerprint, pdf_bytes):
+    """Write PDF bytes to the cache, dropping older renders of the same invoice."""
+    folder = _cache_dir()
+    try:
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        final_path = _path_for(invoice_number, fingerprint)
+        os.replace(tmp_path, final_path)
+    except OSError as e:
+        logger.warning('Could not write invoice PDF cache entry for %s: %s', invoice_number, e)
+        return False
+
+    invalidate_invoice(invoice_number, keep=os.path.basename(final_path))
+    _evict()
+    return True
+
+
+def get_or_render_pdf(invoice_number, fingerprint, render):
+    """Serve the PDF from the cache, calling ``render()`` to produce it on a miss."""
+    pdf_bytes = get_cached_pdf(invoice_number, fingerprint)
+    if pdf_bytes is not None:
+        return pdf_bytes
+    pdf_bytes = render()
+    store_pdf(invoice_number, fingerprint, pdf_bytes)
+    return pdf_bytes
+
+
+def invalidate_invoice(invoice_number, keep=None):
+    """Remove cached PDFs for one invoice (optionally keeping one file name)."""
+    folder = _cache_dir()
+    prefix = f'{_safe_name(invoice_number)}-'
+    removed = 0
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith(prefix) or not name.endswith('.pdf') or name == keep:
+            continue
+        try:
+            os.remove(os.path.join(folder, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def invalidate_paystub(paystub_id):
+    """Remove cached PDFs for one paystub."""
+    return invalidate_invoice(paystub_cache_key(paystub_id))
+
+
+def clear_pdf_cache():
+    """Remove every cached PDF, e.g. after organization settings change."""
+    folder = _cache_dir()
+    removed = 0
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return 0
+    for name in names:
+        if name.endswith('.pdf'):
+            try:
+                os.remove(os.path.join(folder, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _evict():
+    """Delete least recently used entries until the cache fits its size budget."""
+    folder = _cache_dir()
+    limit = _max_bytes()
+    with _cache_lock:
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.pdf'):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= limit:
+            return
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
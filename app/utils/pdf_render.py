@@ -0,0 +1,286 @@
+"""Render HTML documents to PDF in a pool of warm worker processes.
+
+WeasyPrint is CPU-bound and never yields, so a render inside a request held
+up every other request on ``app.py``'s gevent server. Templates are still
+rendered in the app process, where templates and the DB are available, and
+only the HTML is handed to the process's :class:`PdfRenderService`:
+
+- one ``ProcessPoolExecutor`` of ``PDF_RENDER_WORKERS`` processes (default:
+  the CPU count), kept for the life of the app process; each worker imports
+  WeasyPrint once, when it starts, and a new pool is only used once its
+  workers have started
+- at most ``PDF_RENDER_MAX_CONCURRENT`` renders in flight (default: one per
+  worker); a render waits up to ``PDF_RENDER_QUEUE_TIMEOUT`` seconds for a
+  slot and then raises ``TimeoutError``, as does a render still running
+  after ``PDF_RENDER_TIMEOUT`` seconds. A process pool cannot stop one of
+  its workers, so the pool is then stopped and a new one started: a stuck
+  render neither keeps its worker nor runs beyond the cap, and the other
+  renders that were in the stopped pool run again in the new one
+- called from a gevent greenlet (a request), the wait happens on gevent's
+  thread pool, so the event loop keeps serving other requests
+
+Assets the HTML links to on this site (static files, profile pictures, the
+org logo) are read from disk by the worker; see :mod:`app.utils.pdf_assets`.
+
+Each render's wait for a slot and render time are logged and added up in
+:meth:`PdfRenderService.stats`.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from threading import BoundedSemaphore, Lock
+from weakref import WeakSet
+
+from flask import current_app, has_request_context, request
+
+from app.utils import pdf_assets
+
+logger = logging.getLogger(__name__)
+
+_EXTENSION_KEY = 'pdf_render'
+_service_lock = Lock()
+
+# render() default: wait up to the service's queue timeout
+_QUEUE_TIMEOUT = object()
+
+# worker process: parsed stylesheets by file path
+_stylesheets = {}
+
+
+def _warm_worker():
+    """Process pool initializer: import WeasyPrint before the first render needs it."""
+    try:
+        import weasyprint  # noqa: F401
+    except Exception as e:
+        logger.warning('PDF render worker could not import WeasyPrint: %s', e)
+
+
+def write_pdf(html, base_url, stylesheets=(), assets=None):
+    """Process pool worker: rasterise one HTML document to PDF bytes.
+
+    ``stylesheets`` are CSS file paths; each worker parses a stylesheet once.
+    ``assets`` (:class:`~app.utils.pdf_assets.LocalAssets`) says which URLs
+    are read from disk.
+    """
+    from weasyprint import CSS, HTML
+    fetcher = pdf_assets.url_fetcher(assets)
+    css = []
+    for path in stylesheets:
+        if path not in _stylesheets:
+            _stylesheets[path] = CSS(filename=path, url_fetcher=fetcher)
+        css.append(_stylesheets[path])
+    pdf_assets.trim_image_cache()
+    return HTML(string=html, base_url=base_url, url_fetcher=fetcher).write_pdf(
+        stylesheets=css or None, cache=pdf_assets.image_cache
+    )
+
+
+def pdf_base_url():
+    """Base URL used to resolve relative asset links in PDF templates."""
+    if has_request_context():
+        return request.url_root
+    return current_app.config.get('PDF_BASE_URL') or Path(current_app.root_path).as_uri() + '/'
+
+
+class PdfRenderService:
+    """A warm process pool for WeasyPrint renders, with a cap on renders in flight."""
+
+    def __init__(self, workers=None, max_concurrent=None, queue_timeout=30, render_timeout=120, render=write_pdf,
+                 startup_timeout=60):
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.max_concurrent = max(1, int(max_concurrent or self.workers))
+        self.queue_timeout = queue_timeout
+        self.render_timeout = render_timeout
+        self.startup_timeout = startup_timeout
+        self._render = render
+        self._slots = BoundedSemaphore(self.max_concurrent)
+        self._lock = Lock()
+        self._start_lock = Lock()
+        self._pool = None
+        # pools stopped because one of their renders timed out
+        self._stopped = WeakSet()
+        self._stats = {'renders': 0, 'failed': 0, 'timed_out': 0, 'resubmitted': 0, 'busy': 0, 'in_flight': 0,
+                       'queue_ms': 0.0, 'render_ms': 0.0, 'max_queue_ms': 0.0, 'max_render_ms': 0.0}
+
+    def _executor(self):
+        # the render timeout counts from a started pool, not from forking
+        # the workers and importing WeasyPrint
+        with self._start_lock:
+            with self._lock:
+                pool = self._pool
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+                try:
+                    for started in [pool.submit(os.getpid) for _ in range(self.workers)]:
+                        started.result(timeout=self.startup_timeout)
+                except Exception as e:
+                    self._discard_pool(pool, terminate=True)
+                    raise BrokenProcessPool(f'PDF render workers did not start: {e!r}') from e
+                with self._lock:
+                    self._pool = pool
+            return pool
+
+    def _discard_pool(self, pool, terminate=False):
+        if pool is None:
+            return
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+            if terminate:
+                self._stopped.add(pool)
+        # shutdown() lets a running render finish; ``terminate`` stops the workers
+        processes = list((getattr(pool, '_processes', None) or {}).values()) if terminate else []
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+            if key in ('queue_ms', 'render_ms'):
+                self._stats[f'max_{key}'] = max(self._stats[f'max_{key}'], value)
+
+    def render(self, html, base_url, stylesheets=(), queue_timeout=_QUEUE_TIMEOUT, label=None, assets=None):
+        """Rasterise ``html`` in the pool and return the PDF bytes.
+
+        Blocks the calling thread; see :func:`render_pdf` for requests.
+        ``queue_timeout=None`` waits for a slot however long it takes.
+        """
+        if queue_timeout is _QUEUE_TIMEOUT:
+            queue_timeout = self.queue_timeout
+        queued = time.monotonic()
+        if not self._slots.acquire(timeout=queue_timeout):
+            self._count('busy')
+            raise TimeoutError(f'No PDF render slot came free within {queue_timeout}s')
+        started = time.monotonic()
+        self._count('queue_ms', (started - queued) * 1000)
+        self._count('in_flight')
+        pool = None
+        try:
+            while True:
+                pool = self._executor()
+                try:
+                    pdf = pool.submit(self._render, html, base_url, tuple(stylesheets), assets).result(timeout=self.render_timeout)
+                    break
+                except (BrokenProcessPool, CancelledError, RuntimeError):
+                    # stopped for another render's timeout: render again in a new pool
+                    if pool not in self._stopped:
+                        raise
+                    self._count('resubmitted')
+        except FutureTimeoutError:
+            # the worker is still rendering; the pool is stopped, the other
+            # renders in it run again and the next render starts a new pool
+            self._count('timed_out')
+            self._discard_pool(pool, terminate=True)
+            raise TimeoutError(f'PDF render took longer than {self.render_timeout}s')
+        except BrokenProcessPool:
+            # a worker died; the next render starts a new pool
+            self._count('failed')
+            self._discard_pool(pool)
+            raise
+        except Exception:
+            self._count('failed')
+            raise
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+        render_ms = (time.monotonic() - started) * 1000
+        self._count('renders')
+        self._count('render_ms', render_ms)
+        logger.info('Rendered PDF %s in %.0f ms (%.0f ms waiting for a slot)',
+                    label or '', render_ms, (started - queued) * 1000)
+        return pdf
+
+    def stats(self):
+        """Counters and timings since the service started."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_queue_ms'] = stats['queue_ms'] / (stats['renders'] + stats['failed'] + stats['timed_out'] or 1)
+        stats['avg_render_ms'] = stats['render_ms'] / (stats['renders'] or 1)
+        stats.update(workers=self.workers, max_concurrent=self.max_concurrent)
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def get_render_service():
+    """The app process's :class:`PdfRenderService`, built from config on first use."""
+    app = current_app._get_current_object()
+    with _service_lock:
+        service = app.extensions.get(_EXTENSION_KEY)
+        if service is None:
+            service = app.extensions[_EXTENSION_KEY] = PdfRenderService(
+                workers=app.config.get('PDF_RENDER_WORKERS'),
+                max_concurrent=app.config.get('PDF_RENDER_MAX_CONCURRENT'),
+                queue_timeout=app.config.get('PDF_RENDER_QUEUE_TIMEOUT', 30),
+                render_timeout=app.config.get('PDF_RENDER_TIMEOUT', 120),
+            )
+    return service
+
+
+def _off_loop(fn, *args):
+    """Call ``fn(*args)``, on gevent's thread pool when called from a greenlet.
+
+    The server does not monkey-patch, so a blocking wait in a greenlet would
+    stop the event loop; outside gevent (CLI, background threads, tests)
+    ``fn`` is simply called.
+    """
+    try:
+        from gevent import Greenlet, get_hub, getcurrent
+    except ImportError:
+        return fn(*args)
+    if isinstance(getcurrent(), Greenlet):
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def render_pdf(html, base_url=None, stylesheets=(), label=None):
+    """Render one document in the render pool and return the PDF bytes.
+
+    Raises ``TimeoutError`` when the pool is busy for longer than
+    ``PDF_RENDER_QUEUE_TIMEOUT`` or the render exceeds ``PDF_RENDER_TIMEOUT``.
+    """
+    if base_url is None:
+        base_url = pdf_base_url()
+    assets = pdf_assets.local_assets(base_url)
+    return _off_loop(get_render_service().render, html, base_url, stylesheets, _QUEUE_TIMEOUT, label, assets)
+
+
+def render_pdfs(jobs, max_workers=None, base_url=None):
+    """Render ``jobs`` (an iterable of ``(key, html)``) in the render pool.
+
+    Returns ``{key: pdf_bytes}``; keys whose render failed map to None.
+    ``max_workers`` caps this batch's renders in flight and defaults to
+    the pool size. Batch renders wait for a slot without a timeout.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return {}
+    if base_url is None:
+        base_url = pdf_base_url()
+    assets = pdf_assets.local_assets(base_url)
+    service = get_render_service()
+    workers = max(1, min(int(max_workers or service.workers), len(jobs)))
+
+    def render(job):
+        key, html = job
+        try:
+            return key, service.render(html, base_url, queue_timeout=None, label=key, assets=assets)
+        except Exception as e:
+            logger.exception('PDF render failed for %s: %s', key, e)
+            return key, None
+
+    def render_all():
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            return dict(threads.map(render, jobs))
+
+    return _off_loop(render_all)
@@ -0,0 +1,152 @@
+"""Report totals computed in SQL.
+
+Each summary groups the report's row query (see ``report_export``) by
+several dimensions at once (per client, per employee, per activity, per
+month) and returns additive totals for each, plus a grand total, in one
+statement whatever the number of rows:
+
+- on PostgreSQL with ``GROUP BY GROUPING SETS`` (one set per dimension and
+  the empty set for the grand total, i.e. a ROLLUP of each dimension),
+  using ``grouping()`` to tell which set a row belongs to;
+- elsewhere (SQLite) with a single ``GROUP BY`` over all the dimensions,
+  folded into the per-dimension totals in Python. The grouped rows are
+  bounded by clients x employees x activities x months, not by sessions.
+
+A summary is ``{'total': {...}, '<dimension>': [{'key', 'label', ...}]}``
+with one entry per dimension value, ordered by label (``'YYYY-MM'`` for
+months).
+"""
+
+from sqlalchemy import func, literal_column, tuple_
+
+from app import db
+from app.models import Client, Employee, Intervention, Invoice, PayStub
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _month(column):
+    """``'YYYY-MM'`` of a date column.
+
+    The format is inlined: PostgreSQL only matches a selected expression to
+    its GROUP BY expression if both are identical, bound parameters included.
+    """
+    if _dialect() == 'postgresql':
+        return func.to_char(column, literal_column("'YYYY-MM'"))
+    return func.strftime(literal_column("'%Y-%m'"), column)
+
+
+def _label(values):
+    parts = [str(v) for v in values if v is not None]
+    return ' '.join(parts) if parts else 'N/A'
+
+
+def _empty(measures):
+    return {name: 0 for name, _ in measures}
+
+
+def _add(totals, row, measures):
+    for name, _ in measures:
+        totals[name] += getattr(row, name) or 0
+
+
+def _round(values):
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in values.items()}
+
+
+def _summary(totals, groups):
+    summary = {'total': _round(totals)}
+    for name, entries in groups.items():
+        summary[name] = sorted(
+            ({'key': key, 'label': _label(labels or (key,)), **_round(values)}
+             for (key, labels), values in entries.items()),
+            key=lambda r: r['label'],
+        )
+    return summary
+
+
+def aggregate(query, dimensions, measures, joins=()):
+    """Totals of ``measures`` over ``query`` for each dimension and overall.
+
+    ``query`` is a row query whose FROM and filters are kept; ``dimensions``
+    maps a name to ``(key_column, [label_columns])``; ``measures`` is a list
+    of ``(name, aggregate_expression)``; ``joins`` are extra
+    ``(target, onclause)`` outer joins the measures need.
+    """
+    measure_columns = [expr.label(name) for name, expr in measures]
+    dim_columns = []
+    for name, (key, labels) in dimensions.items():
+        dim_columns.append(key.label(f'{name}_key'))
+        dim_columns.extend(label.label(f'{name}_label{i}') for i, label in enumerate(labels))
+
+    base = query.order_by(None)
+    groups = {name: {} for name in dimensions}
+    totals = _empty(measures)
+
+    if _dialect() == 'postgresql':
+        flags = [func.grouping(key).label(f'{name}_grouping') for name, (key, _) in dimensions.items()]
+        sets = [tuple_(key, *labels) for key, labels in dimensions.values()] + [tuple_()]
+        grouped = base.with_entities(*dim_columns, *flags, *measure_columns)
+        for target, onclause in joins:
+            grouped = grouped.outerjoin(target, onclause)
+        for row in grouped.group_by(func.grouping_sets(*sets)):
+            members = [name for name in dimensions if getattr(row, f'{name}_grouping') == 0]
+            if not members:
+                _add(totals, row, measures)
+                continue
+            name = members[0]
+            labels = tuple(getattr(row, f'{name}_label{i}') for i in range(len(dimensions[name][1])))
+            entry = groups[name].setdefault((getattr(row, f'{name}_key'), labels), _empty(measures))
+            _add(entry, row, measures)
+        return _summary(totals, groups)
+
+    grouped = base.with_entities(*dim_columns, *measure_columns)
+    for target, onclause in joins:
+        grouped = grouped.outerjoin(target, onclause)
+    for row in grouped.group_by(*dim_columns):
+        _add(totals, row, measures)
+        for name, (_, labels) in dimensions.items():
+            labels = tuple(getattr(row, f'{name}_label{i}') for i in range(len(labels)))
+            entry = groups[name].setdefault((getattr(row, f'{name}_key'), labels), _empty(measures))
+            _add(entry, row, measures)
+    return _summary(totals, groups)
+
+
+def session_summary(query):
+    """Sessions and hours per client, employee, activity and month."""
+    return aggregate(query, {
+        'client': (Intervention.client_id, [Client.firstname, Client.lastname]),
+        'employee': (Intervention.employee_id, [Employee.firstname, Employee.lastname]),
+        'activity': (Intervention.intervention_type, []),
+        'month': (_month(Intervention.date), []),
+    }, [
+        ('sessions', func.count(Intervention.id)),
+        ('hours', func.coalesce(func.sum(Intervention._duration), 0.0)),
+    ])
+
+
+def invoice_summary(query):
+    """Invoice count, invoiced, received and outstanding amounts per client and month."""
+    return aggregate(query, {
+        'client': (Invoice.client_id, [Client.firstname, Client.lastname]),
+        'month': (_month(Invoice.invoiced_date), []),
+    }, [
+        ('invoices', func.count(Invoice.id)),
+        ('invoiced', func.coalesce(func.sum(Invoice.total_cost), 0.0)),
+        ('received', func.coalesce(func.sum(Invoice.amount_paid), 0.0)),
+        ('outstanding', func.coalesce(func.sum(Invoice.amount_pending), 0.0)),
+    ])
+
+
+def paystub_summary(query):
+    """Paystub count, hours and amounts per employee and month."""
+    return aggregate(query, {
+        'employee': (PayStub.employee_id, [Employee.firstname, Employee.lastname]),
+        'month': (_month(PayStub.generated_date), []),
+    }, [
+        ('paystubs', func.count(PayStub.id)),
+        ('hours', func.coalesce(func.sum(PayStub.total_hours), 0.0)),
+        ('amount', func.coalesce(func.sum(PayStub.total_amount), 0.0)),
+    ])
@@ -0,0 +1,129 @@
+"""Streaming report exports.
+
+The session, invoice and paystub reports used to load the whole date range
+as ORM objects (plus a lazy load per row for names) before rendering or
+serialising it. The queries here select plain columns, joined with the
+names the reports show. ``stream_ndjson`` and ``stream_csv`` iterate them
+with ``yield_per`` so rows arrive in batches (a server-side cursor on
+PostgreSQL) and stream them out, so memory stays flat however long the
+range is. The HTML reports page through the same queries and take their
+totals from ``report_aggregates``.
+
+A field list is a sequence of ``(name, getter)`` pairs; ``name`` is the
+NDJSON key or CSV header and ``getter`` maps a row to the value.
+"""
+
+import csv
+import io
+import json
+
+from flask import current_app, stream_with_context
+
+from app import db
+from app.models import Client, Employee, Intervention, Invoice, PayStub
+
+YIELD_PER = 1000
+
+# rows per chunk written to the socket
+_CHUNK_ROWS = 200
+
+FORMATS = ('ndjson', 'csv')
+
+
+def session_rows(start, end, client_id=None, employee_id=None):
+    """Sessions between two dates (inclusive) with employee and client names."""
+    query = (
+        db.session.query(
+            Intervention.id, Intervention.client_id, Intervention.employee_id, Intervention.intervention_type,
+            Intervention.date, Intervention.start_time, Intervention.end_time,
+            Intervention._duration.label('duration'), Intervention.invoiced, Intervention.invoice_number,
+            Intervention.is_paid,
+            Employee.firstname.label('employee_firstname'), Employee.lastname.label('employee_lastname'),
+            Client.firstname.label('client_firstname'), Client.lastname.label('client_lastname'),
+        )
+        .join(Employee, Intervention.employee_id == Employee.id)
+        .outerjoin(Client, Intervention.client_id == Client.id)
+        .filter(Intervention.date >= start, Intervention.date <= end)
+    )
+    if client_id:
+        query = query.filter(Intervention.client_id == client_id)
+    if employee_id:
+        query = query.filter(Intervention.employee_id == employee_id)
+    return query.order_by(Intervention.date, Intervention.id)
+
+
+def invoice_rows(start, end, client_id=None, payment_state=None):
+    """Invoices dated between two dates (inclusive), newest first, with client names."""
+    query = (
+        db.session.query(
+            Invoice.id, Invoice.invoice_number, Invoice.client_id, Invoice.invoiced_date, Invoice.payby_date,
+            Invoice.date_from, Invoice.date_to, Invoice.total_cost, Invoice.status, Invoice.paid_date,
+            Invoice.amount_paid, Invoice.amount_pending, Invoice.payment_state,
+            Client.firstname.label('client_firstname'), Client.lastname.label('client_lastname'),
+        )
+        .join(Client, Invoice.client_id == Client.id)
+        .filter(Invoice.invoiced_date >= start, Invoice.invoiced_date <= end)
+    )
+    if client_id:
+        query = query.filter(Invoice.client_id == client_id)
+    if payment_state:
+        query = query.filter(Invoice.payment_state == payment_state)
+    return query.order_by(Invoice.invoiced_date.desc(), Invoice.id.desc())
+
+
+def paystub_rows(start, end, employee_id=None):
+    """Paystubs generated between two dates (inclusive), newest first, with employee names."""
+    query = (
+        db.session.query(
+            PayStub.id, PayStub.employee_id, PayStub.period_start, PayStub.period_end, PayStub.generated_date,
+            PayStub.total_hours, PayStub.total_amount, PayStub.email_sent,
+            Employee.firstname.label('employee_firstname'), Employee.lastname.label('employee_lastname'),
+        )
+        .join(Employee, PayStub.employee_id == Employee.id)
+        .filter(PayStub.generated_date >= start, PayStub.generated_date <= end)
+    )
+    if employee_id:
+        query = query.filter(PayStub.employee_id == employee_id)
+    return query.order_by(PayStub.generated_date.desc(), PayStub.id.desc())
+
+
+def _chunks(rows, render_row):
+    buffer = []
+    for row in rows.yield_per(YIELD_PER):
+        buffer.append(render_row(row))
+        if len(buffer) >= _CHUNK_ROWS:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_ndjson(rows, fields):
+    """One JSON object per line."""
+    def render_row(row):
+        return json.dumps({name: getter(row) for name, getter in fields}) + '\n'
+
+    return current_app.response_class(
+        stream_with_context(_chunks(rows, render_row)), mimetype='application/x-ndjson'
+    )
+
+
+def stream_csv(rows, fields, filename):
+    """CSV with a header row, downloaded as ``filename``."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def render_row(values):
+        writer.writerow(values)
+        line = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return line
+
+    def generate():
+        yield render_row([name for name, _ in fields])
+        yield from _chunks(rows, lambda row: render_row([getter(row) for _, getter in fields]))
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,288 @@
+"""Maintain the ``daily_rollups`` dashboard table.
+
+Each row holds, for one (date, employee, client), the session count and
+hours plus the invoiced, received and paystub amounts attributed to those
+sessions, so the dashboard sums a few hundred rows instead of aggregating
+interventions, invoices, payments and paystub items on every load.
+
+Rows are recomputed per key rather than adjusted by deltas, because a
+payment or an edited invoice total moves the prorated amounts of every
+session on that invoice. ``before_flush`` records which keys a write touches
+(directly, or through its invoice, payment or paystub item) and
+``before_commit`` recomputes just those keys in the same transaction.
+Rows are written with ``INSERT ... ON CONFLICT DO UPDATE`` on the unique
+``(date, employee_id, COALESCE(client_id, 0))`` index, so two transactions
+refreshing the same key leave one row rather than one each.
+Statements that bypass the unit of work (bulk ``update``/``insert``/
+``delete``) must call :func:`mark_dirty`. ``flask rebuild-rollups``
+recomputes a whole date range.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert, inspect, literal_column, or_, select
+
+from app import db
+from app.models import DailyRollup, Intervention, Invoice, InvoicePayment, PayStub, PayStubItem
+
+logger = logging.getLogger(__name__)
+
+_DIRTY_KEY = 'daily_rollups_dirty'
+
+# columns whose change moves a session's figures (is_paid, file_names... do not)
+_INTERVENTION_ATTRS = ('date', 'employee_id', 'client_id', '_duration', 'invoiced', 'invoice_number')
+
+
+def _dirty(session):
+    return session.info.setdefault(_DIRTY_KEY, {
+        'keys': set(),
+        'intervention_ids': set(),
+        'invoice_ids': set(),
+        'invoice_numbers': set(),
+    })
+
+
+def mark_dirty(session=None, keys=(), intervention_ids=(), invoice_ids=(), invoice_numbers=()):
+    """Queue rollup keys for recomputation at the next commit of ``session``."""
+    dirty = _dirty(session or db.session)
+    dirty['keys'].update(keys)
+    dirty['intervention_ids'].update(i for i in intervention_ids if i is not None)
+    dirty['invoice_ids'].update(i for i in invoice_ids if i is not None)
+    dirty['invoice_numbers'].update(n for n in invoice_numbers if n)
+
+
+def _values(state, attr):
+    """Current and previous values of ``attr`` on an instance."""
+    history = state.attrs[attr].history
+    values = set(history.added) | set(history.deleted) | set(history.unchanged)
+    if not values:
+        values.add(getattr(state.obj(), attr, None))
+    return values
+
+
+def _changed(state, attrs):
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_dirty(session, flush_context, instances):
+    moved_ids = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        state = inspect(obj)
+        touched = obj in session.new or obj in session.deleted
+        if isinstance(obj, Intervention):
+            if not touched and not _changed(state, _INTERVENTION_ATTRS):
+                continue
+            keys = {
+                (d, e, c)
+                for d in _values(state, 'date')
+                for e in _values(state, 'employee_id')
+                for c in _values(state, 'client_id')
+            }
+            mark_dirty(session, keys=keys, invoice_numbers=_values(state, 'invoice_number'))
+            if state.persistent:
+                moved_ids.append(obj.id)
+        elif isinstance(obj, Invoice):
+            if touched or _changed(state, ('total_cost', 'invoice_number')):
+                mark_dirty(session, invoice_numbers=_values(state, 'invoice_number'))
+        elif isinstance(obj, InvoicePayment):
+            if touched or _changed(state, ('amount', 'invoice_id')):
+                mark_dirty(session, invoice_ids=_values(state, 'invoice_id'))
+        elif isinstance(obj, PayStubItem):
+            if touched or _changed(state, ('amount', 'intervention_id')):
+                mark_dirty(session, intervention_ids=_values(state, 'intervention_id'))
+        elif isinstance(obj, PayStub) and obj in session.deleted:
+            mark_dirty(session, intervention_ids=[item.intervention_id for item in obj.items])
+
+    # the previous key of an edited session is only in its history if the
+    # attribute was loaded before the change; read it while the row is unchanged
+    if moved_ids:
+        old_keys = session.execute(
+            select(Intervention.date, Intervention.employee_id, Intervention.client_id)
+            .where(Intervention.id.in_(moved_ids))
+        )
+        mark_dirty(session, keys=[tuple(row) for row in old_keys])
+
+
+@event.listens_for(db.session, 'before_commit')
+def _refresh_dirty(session):
+    # flush first so pending writes are both recorded and visible to the recompute
+    session.flush()
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        refresh_rollups(_resolve_keys(session, dirty), session=session)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_dirty(session, previous_transaction):
+    session.info.pop(_DIRTY_KEY, None)
+
+
+def _resolve_keys(session, dirty):
+    """Expand invoice/payment/paystub references into rollup keys."""
+    keys = set(dirty['keys'])
+    invoice_numbers = set(dirty['invoice_numbers'])
+    if dirty['invoice_ids']:
+        invoice_numbers.update(
+            n for (n,) in session.query(Invoice.invoice_number).filter(Invoice.id.in_(dirty['invoice_ids']))
+        )
+    conditions = []
+    if invoice_numbers:
+        conditions.append(Intervention.invoice_number.in_(invoice_numbers))
+    if dirty['intervention_ids']:
+        conditions.append(Intervention.id.in_(dirty['intervention_ids']))
+    if conditions:
+        keys.update(
+            tuple(row) for row in
+            session.query(Intervention.date, Intervention.employee_id, Intervention.client_id).filter(or_(*conditions))
+        )
+    return keys
+
+
+def _compute(session, keys, date_from, date_to):
+    """Return ``{key: row dict}`` for ``keys`` from the fact tables."""
+    employee_ids = {e for _, e, _ in keys}
+    sessions = [
+        s for s in session.query(
+            Intervention.id, Intervention.date, Intervention.employee_id, Intervention.client_id,
+            Intervention._duration, Intervention.invoiced, Intervention.invoice_number
+        ).filter(
+            Intervention.date.between(date_from, date_to),
+            Intervention.employee_id.in_(employee_ids)
+        )
+        if (s.date, s.employee_id, s.client_id) in keys
+    ]
+
+    # invoice totals and received amounts are prorated by each session's share
+    # of the invoice's invoiced hours, as the dashboard always has
+    invoice_numbers = {s.invoice_number for s in sessions if s.invoiced and s.invoice_number}
+    invoices = {}
+    if invoice_numbers:
+        hours = dict(
+            session.query(Intervention.invoice_number, func.sum(Intervention._duration))
+            .filter(Intervention.invoice_number.in_(invoice_numbers), Intervention.invoiced == True)
+            .group_by(Intervention.invoice_number)
+        )
+        paid = dict(
+            session.query(InvoicePayment.invoice_id, func.sum(InvoicePayment.amount))
+            .join(Invoice, Invoice.id == InvoicePayment.invoice_id)
+            .filter(Invoice.invoice_number.in_(invoice_numbers))
+            .group_by(InvoicePayment.invoice_id)
+        )
+        for inv_id, number, total_cost in (
+            session.query(Invoice.id, Invoice.invoice_number, Invoice.total_cost)
+            .filter(Invoice.invoice_number.in_(invoice_numbers))
+        ):
+            invoices[number] = (float(total_cost or 0), float(paid.get(inv_id) or 0), float(hours.get(number) or 0))
+
+    paystub_amounts = {}
+    session_ids = [s.id for s in sessions]
+    for start in range(0, len(session_ids), 500):
+        chunk = session_ids[start:start + 500]
+        paystub_amounts.update(
+            session.query(PayStubItem.intervention_id, func.sum(PayStubItem.amount))
+            .filter(PayStubItem.intervention_id.in_(chunk))
+            .group_by(PayStubItem.intervention_id)
+        )
+
+    now = datetime.utcnow()
+    rows = {}
+    for s in sessions:
+        key = (s.date, s.employee_id, s.client_id)
+        row = rows.setdefault(key, {
+            'date': s.date, 'employee_id': s.employee_id, 'client_id': s.client_id,
+            'session_count': 0, 'hours': 0.0, 'invoiced_amount': 0.0,
+            'received_amount': 0.0, 'paystub_amount': 0.0, 'updated_at': now,
+        })
+        duration = float(s._duration or 0)
+        row['session_count'] += 1
+        row['hours'] += duration
+        invoice = invoices.get(s.invoice_number) if s.invoiced else None
+        if invoice and invoice[2]:
+            share = duration / invoice[2]
+            row['invoiced_amount'] += share * invoice[0]
+            row['received_amount'] += share * invoice[1]
+        row['paystub_amount'] += float(paystub_amounts.get(s.id) or 0)
+    return rows
+
+
+def _key_columns():
+    # the expressions of the ux_daily_rollups_key index
+    return [DailyRollup.date, DailyRollup.employee_id, func.coalesce(DailyRollup.client_id, literal_column('0'))]
+
+
+def _write(session, rows):
+    """Insert ``rows``, replacing the figures of any row already there for the same key."""
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        session.execute(insert(DailyRollup), rows)
+        return
+    stmt = upsert(DailyRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=_key_columns(),
+        set_={name: stmt.excluded[name] for name in rows[0] if name not in ('date', 'employee_id', 'client_id')},
+    )
+    for start in range(0, len(rows), 500):
+        session.execute(stmt, rows[start:start + 500])
+
+
+def refresh_rollups(keys, session=None):
+    """Recompute the rollup rows for ``keys`` (``(date, employee_id, client_id)``)."""
+    session = session or db.session
+    keys = {k for k in keys if k[0] is not None and k[1] is not None}
+    if not keys:
+        return 0
+    date_from = min(d for d, _, _ in keys)
+    date_to = max(d for d, _, _ in keys)
+    rows = _compute(session, keys, date_from, date_to)
+
+    # keys with no sessions left lose their row; the others are upserted
+    stale_ids = [
+        r.id for r in session.query(DailyRollup.id, DailyRollup.date, DailyRollup.employee_id, DailyRollup.client_id)
+        .filter(DailyRollup.date.between(date_from, date_to), DailyRollup.employee_id.in_({e for _, e, _ in keys}))
+        if (r.date, r.employee_id, r.client_id) in keys and (r.date, r.employee_id, r.client_id) not in rows
+    ]
+    for start in range(0, len(stale_ids), 500):
+        session.query(DailyRollup).filter(DailyRollup.id.in_(stale_ids[start:start + 500])).delete(synchronize_session=False)
+    _write(session, list(rows.values()))
+    return len(rows)
+
+
+def rebuild_rollups(date_from=None, date_to=None):
+    """Recompute every rollup row between two dates (inclusive), a month at a time.
+
+    Defaults to the full range of session dates. Commits after each month and
+    returns the number of rows written.
+    """
+    if date_from is None or date_to is None:
+        first, last = db.session.query(func.min(Intervention.date), func.max(Intervention.date)).one()
+        date_from = date_from or first
+        date_to = date_to or last
+    if date_from is None or date_to is None:
+        return 0
+
+    written = 0
+    start = date_from
+    while start <= date_to:
+        end = min((start.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1), date_to)
+        keys = {
+            tuple(row) for row in
+            db.session.query(Intervention.date, Intervention.employee_id, Intervention.client_id)
+            .filter(Intervention.date.between(start, end)).distinct()
+        }
+        db.session.query(DailyRollup).filter(DailyRollup.date.between(start, end)).delete(synchronize_session=False)
+        if keys:
+            rows = _compute(db.session, keys, start, end)
+            _write(db.session, list(rows.values()))
+            written += len(rows)
+        db.session.commit()
+        logger.info('Rebuilt daily rollups %s..%s', start, end)
+        start = end + timedelta(days=1)
+    return written
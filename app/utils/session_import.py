@@ -0,0 +1,270 @@
+"""CSV import of sessions (the "Bulk Upload" on the session list and calendar).
+
+The upload used to resolve every row with its own queries: one per
+first/last-name split for the client and again for the employee, one for
+the activity, one for the supervisor and one overlap check. An import now
+runs in two passes over the CSV, read as a stream:
+
+1. each row is parsed and its names resolved against a :class:`NameIndex`
+   of active clients, active employees and activities, built once
+2. the accepted rows are checked for overlaps against one preloaded
+   :class:`~app.utils.session_overlaps.SessionOverlapChecker` and inserted
+   with bulk INSERTs of ``CHUNK_SIZE`` rows, in one transaction
+
+Every rejected row is reported with its row number. Without ``skip_errors``
+any rejected row means nothing is imported. Uploads larger than
+``SESSION_IMPORT_BACKGROUND_BYTES`` run in a background thread and report
+progress on their ``session_import_jobs`` row.
+"""
+
+import csv
+import json
+import logging
+import os
+from datetime import datetime
+from threading import Thread
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app import db
+from app.models import Activity, Client, Employee, Intervention, SessionImportJob
+from app.utils import calendar_feed
+from app.utils.rollups import mark_dirty as mark_rollups_dirty
+from app.utils.session_overlaps import SessionOverlapChecker
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+# commit the job's progress this often while reading the file
+PROGRESS_EVERY = 500
+
+COLUMNS = ('Client Name', 'Employee Name', 'Intervention Type', 'Date', 'Start Time', 'End Time')
+
+
+def normalize_name(value):
+    """Lower-case ``value`` with runs of whitespace collapsed to one space."""
+    return ' '.join((value or '').split()).lower()
+
+
+class NameIndex:
+    """Active clients and employees by full name, and activities by name, all normalised."""
+
+    def __init__(self):
+        self.clients = self._people(
+            Client.query.with_entities(Client.id, Client.firstname, Client.lastname, Client.supervisor_id)
+            .filter(Client.is_active == True)
+        )
+        self.employees = self._people(
+            Employee.query.with_entities(Employee.id, Employee.firstname, Employee.lastname, Employee.position)
+            .filter(Employee.is_active == True)
+        )
+        self.activities = {
+            normalize_name(a.activity_name): a
+            for a in Activity.query.with_entities(Activity.activity_name, Activity.activity_category)
+        }
+
+    @staticmethod
+    def _people(query):
+        matches = {}
+        for row in query.order_by('id'):
+            first, last = normalize_name(row.firstname), normalize_name(row.lastname)
+            if first and last:
+                matches.setdefault(f'{first} {last}', []).append((len(first.split()), row))
+        # "Mary Ann Smith" can be Mary / Ann Smith or Mary Ann / Smith; like the
+        # old per-split queries, prefer the shorter first name
+        return {name: min(rows, key=lambda match: match[0])[1] for name, rows in matches.items()}
+
+    def _find(self, people, name, label):
+        if len(name.split()) < 2:
+            raise ValueError(f"{label} name must have at least first and last name")
+        match = people.get(normalize_name(name))
+        if match is None:
+            raise ValueError(f"{label} '{name}' not found or inactive")
+        return match
+
+    def client(self, name):
+        return self._find(self.clients, name, 'Client')
+
+    def employee(self, name):
+        return self._find(self.employees, name, 'Employee')
+
+    def activity(self, name):
+        activity = self.activities.get(normalize_name(name))
+        if activity is None:
+            available = ', '.join(a.activity_name for a in self.activities.values())
+            raise ValueError(f"Intervention type '{name}' not found. Available types: {available}")
+        return activity
+
+
+def _parse_row(row, index, supervisor_id=None):
+    """Validate one CSV row and return the session it describes. Raises ValueError."""
+    client_name, employee_name, intervention_type, date_str, start_str, end_str = (
+        (row.get(column) or '').strip() for column in COLUMNS
+    )
+    if not all([client_name, employee_name, intervention_type, date_str, start_str, end_str]):
+        raise ValueError("Missing required fields")
+
+    try:
+        day = datetime.strptime(date_str, '%Y-%m-%d').date()
+        start_time = datetime.strptime(start_str, '%H:%M').time()
+        end_time = datetime.strptime(end_str, '%H:%M').time()
+    except ValueError:
+        raise ValueError("Invalid date or time format")
+
+    start_dt = datetime.combine(day, start_time)
+    end_dt = datetime.combine(day, end_time)
+    if end_dt <= start_dt:
+        raise ValueError("End time must be after start time")
+
+    client = index.client(client_name)
+    employee = index.employee(employee_name)
+    activity = index.activity(intervention_type)
+
+    position = (employee.position or '').lower()
+    category = (activity.activity_category or '').lower()
+    if position == 'behaviour analyst' and category not in ['supervision', 'therapy']:
+        raise ValueError("Behaviour Analyst can only perform Supervision or Therapy activities")
+    elif position in ['therapist', 'senior therapist'] and category != 'therapy':
+        raise ValueError(f"{employee.position} can only perform Therapy activities")
+
+    if supervisor_id is not None and client.supervisor_id != supervisor_id:
+        raise ValueError("Supervisor can only upload sessions for their clients")
+
+    return {
+        'client_id': client.id,
+        'employee_id': employee.id,
+        'intervention_type': activity.activity_name,
+        'date': day,
+        'start_time': start_time,
+        'end_time': end_time,
+        '_duration': round((end_dt - start_dt).total_seconds() / 3600, 2),
+        'invoiced': False,
+        'invoice_number': None,
+        'file_names': json.dumps([]),
+    }, f"Schedule conflict for {employee_name} on {date_str}"
+
+
+def import_sessions(lines, supervisor_id=None, skip_errors=False, progress=None):
+    """Import the sessions in ``lines`` (an iterable of CSV text lines, header first).
+
+    ``supervisor_id`` restricts the import to that supervisor's clients.
+    ``progress(rows_read)`` is called every ``PROGRESS_EVERY`` rows. Returns
+    ``(rows, imported, errors)`` where ``errors`` is a list of
+    ``{'row': n, 'error': message}`` with CSV row numbers (the header is row
+    1). The caller commits.
+    """
+    index = NameIndex()
+    parsed, errors = [], []
+    rows = 0
+    for row_num, row in enumerate(csv.DictReader(lines), start=2):
+        rows += 1
+        try:
+            parsed.append((row_num,) + _parse_row(row, index, supervisor_id))
+        except Exception as e:
+            errors.append({'row': row_num, 'error': str(e)})
+        if progress and rows % PROGRESS_EVERY == 0:
+            progress(rows)
+
+    # one query for every (employee, date) in the file; rows are also checked against each other
+    checker = SessionOverlapChecker()
+    checker.preload((session['employee_id'], session['date']) for _, session, _ in parsed)
+    accepted = []
+    for row_num, session, conflict in parsed:
+        args = (session['employee_id'], session['date'], session['start_time'], session['end_time'])
+        if checker.overlaps(*args):
+            errors.append({'row': row_num, 'error': conflict})
+        else:
+            checker.add(*args)
+            accepted.append(session)
+    errors.sort(key=lambda error: error['row'])
+
+    if errors and not skip_errors:
+        return rows, 0, errors
+
+    for start in range(0, len(accepted), CHUNK_SIZE):
+        db.session.execute(insert(Intervention), accepted[start:start + CHUNK_SIZE])
+    # bulk inserts bypass the session listeners
+    mark_rollups_dirty(keys={(s['date'], s['employee_id'], s['client_id']) for s in accepted})
+    calendar_feed.mark_dirty(entities={('client', s['client_id']) for s in accepted}
+                             | {('employee', s['employee_id']) for s in accepted})
+    return rows, len(accepted), errors
+
+
+def create_import_job(filename, size, skip_errors=False, requested_by=None):
+    job = SessionImportJob(filename=filename, size=size, skip_errors=skip_errors, requested_by=requested_by,
+                           status='queued', rows=0, imported=0, failed=0)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def run_import_job(job_id, path, supervisor_id=None):
+    """Import the CSV at ``path`` for the job, recording the outcome on it. Deletes ``path``. Returns the job."""
+    job = db.session.get(SessionImportJob, job_id)
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    def progress(rows):
+        job.rows = rows
+        db.session.commit()
+
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            rows, imported, errors = import_sessions(f, supervisor_id=supervisor_id, skip_errors=job.skip_errors,
+                                                     progress=progress)
+        job.rows, job.imported, job.failed = rows, imported, len(errors)
+        job.errors = json.dumps(errors) if errors else None
+        job.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Session import job %s failed: %s', job_id, e)
+        job = db.session.get(SessionImportJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    job.finished_at = datetime.utcnow()
+    # the sessions and the job's outcome are committed together
+    db.session.commit()
+    logger.info('Session import job %s %s: %s of %s rows imported', job_id, job.status, job.imported, job.rows)
+    return job
+
+
+def start_import_job(job, path, supervisor_id=None):
+    """Run :func:`run_import_job` for ``job`` in a background thread."""
+    app = current_app._get_current_object()
+    Thread(target=_run_in_app, args=(app, job.id, path, supervisor_id), name=f'session-import-{job.id}',
+           daemon=True).start()
+
+
+def _run_in_app(app, job_id, path, supervisor_id):
+    with app.app_context():
+        run_import_job(job_id, path, supervisor_id)
+
+
+def runs_in_background(size):
+    return size > current_app.config.get('SESSION_IMPORT_BACKGROUND_BYTES', 65536)
+
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'filename': job.filename,
+        'size': job.size,
+        'status': job.status,
+        'skip_errors': job.skip_errors,
+        'rows': job.rows,
+        'imported': job.imported,
+        'failed': job.failed,
+        'errors': job.error_list,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
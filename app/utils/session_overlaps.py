@@ -0,0 +1,112 @@
+"""Overlap checking for many sessions at once.
+
+``Intervention.has_overlap`` runs one query per session and only sees rows
+already in the database, so two rows of the same submission can overlap
+each other unnoticed. ``SessionOverlapChecker`` loads the stored sessions of
+every (employee, date) pair involved in one query, keeps them sorted by
+start time with a running maximum of end times, and also tracks the rows
+accepted so far in the batch. Each check is a couple of bisects.
+
+Sessions touching end-to-start (09:00-10:00 and 10:00-11:00) do not overlap,
+matching ``Intervention.has_overlap``.
+"""
+
+from bisect import bisect_left, insort
+
+from app.models import Intervention
+
+
+class _DaySchedule:
+    """Stored and in-flight sessions of one employee on one date."""
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        # max_ends[i] = latest end among the first i + 1 stored sessions
+        self.max_ends = []
+        latest = None
+        for _, end in intervals:
+            latest = end if latest is None or end > latest else latest
+            self.max_ends.append(latest)
+        # accepted batch rows never overlap each other, so they stay sorted
+        # by start and by end at the same time
+        self.pending = []
+
+    def overlaps(self, start, end):
+        # stored sessions starting before ``end`` overlap if any ends after ``start``
+        pos = bisect_left(self.starts, end)
+        if pos and self.max_ends[pos - 1] > start:
+            return True
+        pos = bisect_left(self.pending, (end,))
+        return bool(pos) and self.pending[pos - 1][1] > start
+
+    def add(self, start, end):
+        insort(self.pending, (start, end))
+
+
+class SessionOverlapChecker:
+    """Validate a batch of sessions against the DB and against each other.
+
+    Call :meth:`preload` with every (employee_id, date) pair up front to
+    fetch them in one query; pairs not preloaded are fetched on first use.
+    :meth:`add` records a session accepted into the batch so later rows are
+    checked against it.
+    """
+
+    def __init__(self, exclude_ids=()):
+        self.exclude_ids = {i for i in exclude_ids if i is not None}
+        self._days = {}
+
+    def preload(self, pairs):
+        pairs = {(int(employee_id), day) for employee_id, day in pairs} - set(self._days)
+        if not pairs:
+            return
+        rows = (
+            Intervention.query
+            .with_entities(Intervention.id, Intervention.employee_id, Intervention.date,
+                           Intervention.start_time, Intervention.end_time)
+            .filter(
+                Intervention.employee_id.in_({employee_id for employee_id, _ in pairs}),
+                Intervention.date.in_({day for _, day in pairs})
+            )
+            .all()
+        )
+        intervals = {pair: [] for pair in pairs}
+        for row in rows:
+            key = (row.employee_id, row.date)
+            if key in intervals and row.id not in self.exclude_ids:
+                intervals[key].append((row.start_time, row.end_time))
+        for key, day_intervals in intervals.items():
+            self._days[key] = _DaySchedule(day_intervals)
+
+    def _day(self, employee_id, day):
+        key = (int(employee_id), day)
+        if key not in self._days:
+            self.preload([key])
+        return self._days[key]
+
+    def overlaps(self, employee_id, day, start_time, end_time):
+        """True if the session overlaps a stored session or an accepted batch row."""
+        return self._day(employee_id, day).overlaps(start_time, end_time)
+
+    def add(self, employee_id, day, start_time, end_time):
+        self._day(employee_id, day).add(start_time, end_time)
+
+
+def find_overlaps(sessions, exclude_ids=()):
+    """Return the indexes of ``sessions`` that overlap.
+
+    ``sessions`` is a list of ``(employee_id, date, start_time, end_time)``.
+    Rows are taken in order: a row is reported if it overlaps a stored
+    session (other than ``exclude_ids``) or an earlier row that was not
+    itself reported.
+    """
+    checker = SessionOverlapChecker(exclude_ids=exclude_ids)
+    checker.preload((employee_id, day) for employee_id, day, _, _ in sessions)
+    conflicts = []
+    for index, (employee_id, day, start_time, end_time) in enumerate(sessions):
+        if checker.overlaps(employee_id, day, start_time, end_time):
+            conflicts.append(index)
+        else:
+            checker.add(employee_id, day, start_time, end_time)
+    return conflicts
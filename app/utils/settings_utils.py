@@ -1,7 +1,81 @@
 import os
+import time
+from threading import Lock
 from flask import current_app
 
+# Seconds a cached settings entry is trusted without a version bump. Changes made
+# by this process bump the version immediately; the TTL only bounds how long
+# another process (CLI, second worker) can see stale values.
+DEFAULT_CACHE_TTL = 300
+
+_cache_lock = Lock()
+
+
+class AppSettingsSnapshot:
+    """Read-only copy of an AppSettings row that outlives the DB session.
+
+    Cached settings are shared across requests and threads, so they must not
+    hold a session-bound ORM instance. Code that needs to modify settings
+    should load the row with ``AppSettings.get()`` instead.
+    """
+
+    def __init__(self, row):
+        for column in row.__table__.columns:
+            setattr(self, column.key, getattr(row, column.key, None))
+
+
+def _settings_state():
+    return current_app.extensions.setdefault('settings_cache', {'version': 0, 'entry': None})
+
+
+def bump_settings_version():
+    """Invalidate the cached settings after AppSettings has been changed."""
+    with _cache_lock:
+        state = _settings_state()
+        state['version'] += 1
+        state['entry'] = None
+
+
+def _cache_ttl():
+    try:
+        return float(current_app.config.get('SETTINGS_CACHE_TTL', DEFAULT_CACHE_TTL))
+    except (TypeError, ValueError):
+        return DEFAULT_CACHE_TTL
+
+
 def get_org_settings():
+    """Return the resolved organization settings, memoised per app process.
+
+    The dict is cached until ``bump_settings_version()`` is called (the
+    settings page and settings API do this after saving) or the
+    ``SETTINGS_CACHE_TTL`` expires, so rendering a page doesn't query
+    AppSettings. ``settings['appsettings']`` is an ``AppSettingsSnapshot``.
+    """
+    try:
+        state = _settings_state()
+    except RuntimeError:
+        # no app context: nothing to cache against
+        return _resolve_org_settings()
+
+    entry = state['entry']
+    if entry and entry['version'] == state['version'] and time.monotonic() - entry['loaded_at'] < _cache_ttl():
+        return dict(entry['settings'])
+
+    version = state['version']
+    settings = _resolve_org_settings()
+    if settings.get('appsettings') is not None:
+        with _cache_lock:
+            if state['version'] == version:
+                state['entry'] = {'version': version, 'loaded_at': time.monotonic(), 'settings': settings}
+    return dict(settings)
+
+
+def get_app_settings():
+    """Return the cached ``AppSettingsSnapshot`` (or None) for read-only use."""
+    return get_org_settings().get('appsettings')
+
+
+def _resolve_org_settings():
     """Return resolved organization settings with priority:
     1) AppSettings (DB)
     2) Environment variables
@@ -22,7 +96,8 @@ def get_org_settings():
     s = None
     try:
         from app.models import AppSettings
-        s = AppSettings.get()
+        row = AppSettings.get()
+        s = AppSettingsSnapshot(row) if row is not None else None
     except Exception:
         s = None
 
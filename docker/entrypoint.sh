@@ -29,6 +29,9 @@ else
     echo "Database migrations completed."
 fi
 
+# Populate the dashboard rollups once after the table is created
+flask rebuild-rollups --if-empty
+
 # Set up cron job for invoice reminders based on settings
 echo "Setting up cron job for invoice reminders..."
 # Use the same python executable the container will use so cron runs the
@@ -0,0 +1,50 @@
+"""Index unpaid-session lookups used by payroll
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # payroll now trusts interventions.is_paid (plus a NOT EXISTS check on
+    # paystub_items); make the flag consistent before relying on it
+    op.execute(sa.text("UPDATE interventions SET is_paid = false WHERE is_paid IS NULL"))
+    op.execute(sa.text(
+        "UPDATE interventions SET is_paid = true "
+        "WHERE is_paid = false AND EXISTS ("
+        "SELECT 1 FROM paystub_items WHERE paystub_items.intervention_id = interventions.id)"
+    ))
+
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    intervention_indexes = {ix['name'] for ix in inspector.get_indexes('interventions')}
+    paystub_item_indexes = {ix['name'] for ix in inspector.get_indexes('paystub_items')}
+
+    if 'ix_interventions_employee_date_paid' not in intervention_indexes:
+        op.create_index('ix_interventions_employee_date_paid', 'interventions', ['employee_id', 'date', 'is_paid'], unique=False)
+    if 'ix_paystub_items_intervention_id' not in paystub_item_indexes:
+        op.create_index('ix_paystub_items_intervention_id', 'paystub_items', ['intervention_id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    intervention_indexes = {ix['name'] for ix in inspector.get_indexes('interventions')}
+    paystub_item_indexes = {ix['name'] for ix in inspector.get_indexes('paystub_items')}
+
+    if 'ix_paystub_items_intervention_id' in paystub_item_indexes:
+        op.drop_index('ix_paystub_items_intervention_id', table_name='paystub_items')
+    if 'ix_interventions_employee_date_paid' in intervention_indexes:
+        op.drop_index('ix_interventions_employee_date_paid', table_name='interventions')
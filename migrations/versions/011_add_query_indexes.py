@@ -0,0 +1,63 @@
+"""Index the filter columns used by lists, reports, calendar and invoicing
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) -- mirrored in app/models.py
+INDEXES = [
+    # invoicing: uninvoiced sessions for a client in a date range; client calendar
+    ('ix_interventions_client_invoiced_date', 'interventions', ['client_id', 'invoiced', 'date']),
+    # sessions report: date range without client/employee
+    ('ix_interventions_date', 'interventions', ['date']),
+    # invoice delete / detail: sessions linked to an invoice
+    ('ix_interventions_invoice_number', 'interventions', ['invoice_number']),
+    ('ix_mileages_client_invoiced_date', 'mileages', ['client_id', 'invoiced', 'date']),
+    ('ix_mileages_employee_date_paid', 'mileages', ['employee_id', 'date', 'is_paid']),
+    ('ix_mileages_invoice_number', 'mileages', ['invoice_number']),
+    ('ix_invoices_client_invoiced_date', 'invoices', ['client_id', 'invoiced_date']),
+    # reminders: Sent invoices by due date
+    ('ix_invoices_status_payby_date', 'invoices', ['status', 'payby_date']),
+    ('ix_invoices_invoiced_date', 'invoices', ['invoiced_date']),
+    ('ix_invoice_payments_invoice_id', 'invoice_payments', ['invoice_id']),
+    ('ix_payrates_employee_client_effective', 'payrates', ['employee_id', 'client_id', 'effective_date']),
+    ('ix_employees_password_reset_key', 'employees', ['password_reset_key']),
+]
+
+
+def _existing_indexes(inspector, table):
+    return {ix['name'] for ix in inspector.get_indexes(table)}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    existing = {}
+    for name, table, columns in INDEXES:
+        if table not in existing:
+            existing[table] = _existing_indexes(inspector, table)
+        if name not in existing[table]:
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    existing = {}
+    for name, table, _ in reversed(INDEXES):
+        if table not in existing:
+            existing[table] = _existing_indexes(inspector, table)
+        if name in existing[table]:
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,50 @@
+"""Add daily_rollups table for dashboard statistics
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 00:00:00.000000
+
+The table is filled by ``flask rebuild-rollups`` (run with ``--if-empty``
+from the container entrypoint) and kept current by app.utils.rollups.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'daily_rollups' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'daily_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('employee_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=True),
+        sa.Column('session_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('hours', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('invoiced_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('received_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('paystub_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_daily_rollups_date_employee_client', 'daily_rollups', ['date', 'employee_id', 'client_id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'daily_rollups' in inspector.get_table_names():
+        op.drop_index('ix_daily_rollups_date_employee_client', table_name='daily_rollups')
+        op.drop_table('daily_rollups')
@@ -0,0 +1,52 @@
+"""Add updated_at to the tables exported by the API list endpoints
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+# tables filtered by ?updated_after= -- mirrored in app/models.py
+TABLES = ['interventions', 'mileages', 'invoices', 'payrates', 'paystubs']
+
+
+def _index_name(table):
+    return f'ix_{table}_updated_at'
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    for table in TABLES:
+        existing_cols = {c['name'] for c in inspector.get_columns(table)}
+        if 'updated_at' not in existing_cols:
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+            # existing rows count as changed now, so the first incremental
+            # export after the upgrade still picks them up
+            op.execute(sa.text(f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP'))
+        existing_indexes = {ix['name'] for ix in inspector.get_indexes(table)}
+        if _index_name(table) not in existing_indexes:
+            op.create_index(_index_name(table), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    for table in reversed(TABLES):
+        existing_indexes = {ix['name'] for ix in inspector.get_indexes(table)}
+        if _index_name(table) in existing_indexes:
+            op.drop_index(_index_name(table), table_name=table)
+        existing_cols = {c['name'] for c in inspector.get_columns(table)}
+        if 'updated_at' in existing_cols:
+            op.drop_column(table, 'updated_at')
@@ -0,0 +1,91 @@
+"""Store paid/pending amounts and payment state on invoices
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+# mirrored in app/models.py; kept up to date by app/utils/invoice_balances.py
+COLUMNS = [
+    ('amount_paid', sa.Float(), '0'),
+    ('amount_pending', sa.Float(), '0'),
+    ('payment_state', sa.String(length=20), "'Pending'"),
+]
+INDEXES = ['amount_pending', 'payment_state']
+
+
+def _index_name(column):
+    return f'ix_invoices_{column}'
+
+
+def _backfill(bind):
+    """Same figures as invoice_balances.payment_totals, computed from invoice_payments."""
+    invoices = sa.table('invoices', sa.column('id'), sa.column('total_cost'), sa.column('status'))
+    payments = sa.table('invoice_payments', sa.column('invoice_id'), sa.column('amount'))
+    paid = dict(bind.execute(
+        sa.select(payments.c.invoice_id, sa.func.sum(payments.c.amount)).group_by(payments.c.invoice_id)
+    ).all())
+    rows = []
+    for invoice_id, total_cost, status in bind.execute(sa.select(invoices.c.id, invoices.c.total_cost, invoices.c.status)):
+        amount_paid = float(paid.get(invoice_id) or 0.0)
+        if status == 'Paid':
+            # legacy Paid invoices have no payment rows; they are settled in full
+            amount_paid = max(amount_paid, float(total_cost or 0.0))
+        amount_paid = round(amount_paid, 2)
+        amount_pending = round(max(float(total_cost or 0.0) - amount_paid, 0.0), 2)
+        if amount_pending <= 0:
+            state = 'Paid'
+        elif amount_paid > 0:
+            state = 'Partially Paid'
+        else:
+            state = 'Pending'
+        rows.append({'b_id': invoice_id, 'amount_paid': amount_paid,
+                     'amount_pending': amount_pending, 'payment_state': state})
+    if rows:
+        bind.execute(
+            sa.text('UPDATE invoices SET amount_paid = :amount_paid, amount_pending = :amount_pending, '
+                    'payment_state = :payment_state WHERE id = :b_id'),
+            rows,
+        )
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    existing_cols = {c['name'] for c in inspector.get_columns('invoices')}
+    added = False
+    for name, type_, default in COLUMNS:
+        if name not in existing_cols:
+            op.add_column('invoices', sa.Column(name, type_, nullable=False, server_default=sa.text(default)))
+            added = True
+    if added:
+        _backfill(bind)
+    existing_indexes = {ix['name'] for ix in inspector.get_indexes('invoices')}
+    for column in INDEXES:
+        if _index_name(column) not in existing_indexes:
+            op.create_index(_index_name(column), 'invoices', [column], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    existing_indexes = {ix['name'] for ix in inspector.get_indexes('invoices')}
+    for column in reversed(INDEXES):
+        if _index_name(column) in existing_indexes:
+            op.drop_index(_index_name(column), table_name='invoices')
+    existing_cols = {c['name'] for c in inspector.get_columns('invoices')}
+    for name, _, _ in reversed(COLUMNS):
+        if name in existing_cols:
+            op.drop_column('invoices', name)
@@ -0,0 +1,50 @@
+"""Add reminder_runs table logging each invoice reminder run
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'reminder_runs' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'reminder_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('candidates', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sent', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('skipped', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('workers', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('duration_ms', sa.Integer(), nullable=True),
+        sa.Column('avg_send_ms', sa.Integer(), nullable=True),
+        sa.Column('max_send_ms', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_reminder_runs_started_at', 'reminder_runs', ['started_at'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'reminder_runs' in inspector.get_table_names():
+        op.drop_index('ix_reminder_runs_started_at', table_name='reminder_runs')
+        op.drop_table('reminder_runs')
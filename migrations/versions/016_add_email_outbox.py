@@ -0,0 +1,70 @@
+"""Add email_outbox and email_attachments tables for queued mail
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '016'
+down_revision = '015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+
+    if 'email_attachments' not in tables:
+        op.create_table(
+            'email_attachments',
+            sa.Column('sha256', sa.String(length=64), nullable=False),
+            sa.Column('content', sa.LargeBinary(), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.PrimaryKeyConstraint('sha256')
+        )
+
+    if 'email_outbox' not in tables:
+        op.create_table(
+            'email_outbox',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('dedupe_key', sa.String(length=200), nullable=True),
+            sa.Column('subject', sa.String(length=500), nullable=False),
+            sa.Column('recipients', sa.Text(), nullable=False),
+            sa.Column('from_addr', sa.String(length=200), nullable=True),
+            sa.Column('body_text', sa.Text(), nullable=True),
+            sa.Column('body_html', sa.Text(), nullable=True),
+            sa.Column('attachments', sa.Text(), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.Column('claimed_by', sa.String(length=32), nullable=True),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('dedupe_key')
+        )
+        op.create_index('ix_email_outbox_status_next_attempt', 'email_outbox', ['status', 'next_attempt_at'], unique=False)
+        op.create_index('ix_email_outbox_created_at', 'email_outbox', ['created_at'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+    if 'email_outbox' in tables:
+        op.drop_index('ix_email_outbox_created_at', table_name='email_outbox')
+        op.drop_index('ix_email_outbox_status_next_attempt', table_name='email_outbox')
+        op.drop_table('email_outbox')
+    if 'email_attachments' in tables:
+        op.drop_table('email_attachments')
@@ -0,0 +1,53 @@
+"""Add invoice_send_jobs table for bulk draft invoice sending
+
+Revision ID: 017
+Revises: 016
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '017'
+down_revision = '016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'invoice_send_jobs' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'invoice_send_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('date_from', sa.Date(), nullable=False),
+        sa.Column('date_to', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+        sa.Column('requested_by', sa.Integer(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sent', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('skipped', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('errors', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['requested_by'], ['employees.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_invoice_send_jobs_created_at', 'invoice_send_jobs', ['created_at'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'invoice_send_jobs' in inspector.get_table_names():
+        op.drop_index('ix_invoice_send_jobs_created_at', table_name='invoice_send_jobs')
+        op.drop_table('invoice_send_jobs')
@@ -0,0 +1,53 @@
+"""Add session_import_jobs table for background CSV session imports
+
+Revision ID: 018
+Revises: 017
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '018'
+down_revision = '017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'session_import_jobs' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'session_import_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('size', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+        sa.Column('skip_errors', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('requested_by', sa.Integer(), nullable=True),
+        sa.Column('rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('imported', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('errors', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['requested_by'], ['employees.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_session_import_jobs_created_at', 'session_import_jobs', ['created_at'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'session_import_jobs' in inspector.get_table_names():
+        op.drop_index('ix_session_import_jobs_created_at', table_name='session_import_jobs')
+        op.drop_table('session_import_jobs')
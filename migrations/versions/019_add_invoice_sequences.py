@@ -0,0 +1,39 @@
+"""Add invoice_sequences table for per-month invoice number allocation
+
+Revision ID: 019
+Revises: 018
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '019'
+down_revision = '018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'invoice_sequences' in inspector.get_table_names():
+        return
+
+    # rows are created on first use, from the highest existing invoice number of the month
+    op.create_table(
+        'invoice_sequences',
+        sa.Column('month', sa.String(length=6), nullable=False),
+        sa.Column('last_value', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('month')
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'invoice_sequences' in inspector.get_table_names():
+        op.drop_table('invoice_sequences')
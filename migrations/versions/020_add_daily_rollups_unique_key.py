@@ -0,0 +1,36 @@
+"""Make daily_rollups keys unique so concurrent refreshes upsert one row
+
+Revision ID: 020
+Revises: 019
+Create Date: 2026-10-18 00:00:00.000000
+
+SQLite's inspector does not reflect expression indexes, so the index is
+created and dropped with IF [NOT] EXISTS rather than after an inspector check.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '020'
+down_revision = '019'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # concurrent refreshes could each insert a row for the same key; every copy
+    # holds the full figures, so keep the newest one
+    op.execute(
+        'DELETE FROM daily_rollups WHERE id NOT IN ('
+        'SELECT MAX(id) FROM daily_rollups GROUP BY date, employee_id, COALESCE(client_id, 0))'
+    )
+    op.create_index(
+        'ux_daily_rollups_key', 'daily_rollups',
+        ['date', 'employee_id', sa.text('COALESCE(client_id, 0)')], unique=True, if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ux_daily_rollups_key', table_name='daily_rollups', if_exists=True)
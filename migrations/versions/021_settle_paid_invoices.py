@@ -0,0 +1,29 @@
+"""Settle the stored balance of Paid invoices without payment rows
+
+Revision ID: 021
+Revises: 020
+Create Date: 2026-10-18 00:00:00.000000
+
+Databases that ran 014 before its backfill settled Paid invoices still show
+legacy Paid invoices (and ones marked Paid through the API) as outstanding.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '021'
+down_revision = '020'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "UPDATE invoices SET amount_paid = COALESCE(total_cost, 0), amount_pending = 0, payment_state = 'Paid' "
+        "WHERE status = 'Paid' AND payment_state != 'Paid'"
+    )
+
+
+def downgrade():
+    # the settled figures are what the app now maintains; nothing to undo
+    pass
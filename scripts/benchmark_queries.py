@@ -0,0 +1,328 @@
+"""Time the hot list/report/calendar queries with and without the 011 indexes.
+
+Usage:
+  python scripts/benchmark_queries.py [--years 3] [--clients 60] [--employees 25]
+                                      [--runs 30] [--database-url URL]
+
+Seeds N years of sessions, mileage and invoices into a scratch database and
+reports p50/p95 (ms) for the queries the session list, reports, calendar,
+invoice generation and reminder job issue -- first with the indexes added in
+migration 011 dropped, then with them created.
+
+The database is created from the models and its indexes are dropped and
+re-created, so point --database-url at a scratch SQLite file or an empty
+Postgres database, never at a live one. It defaults to a SQLite file in the
+system temp directory; DATABASE_URL is deliberately ignored.
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time as timer
+from datetime import date, time, timedelta
+
+# Ensure project root is on sys.path so imports work when running this script directly
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# names of the indexes introduced by migrations/versions/011_add_query_indexes.py
+BENCHMARK_INDEXES = [
+    'ix_interventions_client_invoiced_date',
+    'ix_interventions_date',
+    'ix_interventions_invoice_number',
+    'ix_mileages_client_invoiced_date',
+    'ix_mileages_employee_date_paid',
+    'ix_mileages_invoice_number',
+    'ix_invoices_client_invoiced_date',
+    'ix_invoices_status_payby_date',
+    'ix_invoices_invoiced_date',
+    'ix_invoice_payments_invoice_id',
+    'ix_payrates_employee_client_effective',
+    'ix_employees_password_reset_key',
+]
+
+CHUNK = 5000
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), CHUNK):
+        yield rows[i:i + CHUNK]
+
+
+def seed(db, models, years, n_clients, n_employees, rng):
+    """Insert ``years`` of weekday sessions ending today; returns the date span."""
+    from sqlalchemy import insert
+
+    end = date.today()
+    start = end - timedelta(days=365 * years)
+
+    db.session.add(models.Designation(designation='Therapist'))
+    db.session.add(models.Activity(activity_name='Therapy', activity_category='Therapy'))
+    rate = models.MileageRate(rate=0.5, effective_date=start)
+    db.session.add(rate)
+    db.session.flush()
+
+    employee_rows = [{
+        'firstname': f'T{n}', 'lastname': 'Bench', 'position': 'Therapist', 'email': f't{n}@bench.example',
+        'cell': '4165550000', 'user_type': 'therapist', 'is_active': True,
+        'password_reset_key': f'key{n:06d}' if n % 5 == 0 else None,
+    } for n in range(n_employees)]
+    db.session.execute(insert(models.Employee), employee_rows)
+    employee_ids = [e.id for e in models.Employee.query.all()]
+
+    client_rows = [{
+        'firstname': f'C{n}', 'lastname': 'Bench', 'dob': date(2015, 1, 1), 'gender': 'Female',
+        'address1': '1 St', 'address2': '', 'city': 'Toronto', 'state': 'ON', 'zipcode': 'M1M1M1',
+        'is_active': True, 'supervisor_id': rng.choice(employee_ids),
+    } for n in range(n_clients)]
+    db.session.execute(insert(models.Client), client_rows)
+    client_ids = [c.id for c in models.Client.query.all()]
+
+    db.session.execute(insert(models.PayRate), [
+        {'employee_id': e, 'client_id': None, 'rate': 30.0, 'effective_date': start} for e in employee_ids
+    ])
+
+    # one invoice per client per month, older months paid, the last two sent
+    invoice_rows = []
+    month = start.replace(day=1)
+    seq = 0
+    while month <= end:
+        month_end = (month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        recent = (end - month_end).days < 62
+        for client_id in client_ids:
+            seq += 1
+            invoice_rows.append({
+                'invoice_number': f'INV{month:%Y%m}{seq:08d}', 'invoiced_date': month_end,
+                'payby_date': month_end + timedelta(days=7), 'client_id': client_id,
+                'date_from': month, 'date_to': month_end, 'total_cost': 0.0,
+                'status': 'Sent' if recent else 'Paid', 'reminder_count': 0,
+            })
+        month = month_end + timedelta(days=1)
+    for rows in _chunks(invoice_rows):
+        db.session.execute(insert(models.Invoice), rows)
+    invoices = {(inv.client_id, inv.date_from): inv for inv in models.Invoice.query.all()}
+    db.session.execute(insert(models.InvoicePayment), [
+        {'invoice_id': inv.id, 'amount': 100.0, 'payment_date': inv.payby_date, 'created_at': inv.payby_date}
+        for inv in invoices.values() if inv.status == 'Paid'
+    ])
+
+    # the current month stays uninvoiced
+    open_month = end.replace(day=1)
+    session_rows = []
+    mileage_rows = []
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            for client_id in client_ids:
+                employee_id = employee_ids[(client_id + day.toordinal()) % len(employee_ids)]
+                hour = rng.randint(8, 16)
+                invoice = None if day >= open_month else invoices.get((client_id, day.replace(day=1)))
+                session_rows.append({
+                    'client_id': client_id, 'employee_id': employee_id, 'intervention_type': 'Therapy',
+                    'date': day, 'start_time': time(hour, 0), 'end_time': time(hour + 2, 0), '_duration': 2.0,
+                    'file_names': '', 'invoiced': invoice is not None,
+                    'invoice_number': invoice.invoice_number if invoice else None,
+                    'is_paid': (end - day).days > 14,
+                })
+                if rng.random() < 0.2:
+                    mileage_rows.append({
+                        'employee_id': employee_id, 'client_id': client_id, 'date': day, 'distance': 10.0,
+                        'mileage_rate_id': rate.id, 'cost': 5.0, 'invoiced': invoice is not None,
+                        'invoice_number': invoice.invoice_number if invoice else None,
+                        'is_paid': (end - day).days > 14,
+                    })
+        day += timedelta(days=1)
+    for rows in _chunks(session_rows):
+        db.session.execute(insert(models.Intervention), rows)
+    for rows in _chunks(mileage_rows):
+        db.session.execute(insert(models.Mileage), rows)
+    db.session.commit()
+    logger.info('Seeded %d sessions, %d mileage entries, %d invoices', len(session_rows), len(mileage_rows), len(invoice_rows))
+    return start, end
+
+
+def build_queries(db, models, start, end, rng):
+    """Return ``{name: callable}`` reproducing the query shapes of the views/API."""
+    from sqlalchemy.orm import joinedload
+
+    Client, Employee, Intervention, Invoice, InvoicePayment, Mileage, PayRate = (
+        models.Client, models.Employee, models.Intervention, models.Invoice, models.InvoicePayment,
+        models.Mileage, models.PayRate,
+    )
+    client_ids = [c.id for c in Client.query.all()]
+    employee_ids = [e.id for e in Employee.query.all()]
+    invoice_numbers = [n for (n,) in db.session.query(Invoice.invoice_number).all()]
+    invoice_ids = [n for (n,) in db.session.query(Invoice.id).all()]
+    month_starts = [start.replace(day=1) + timedelta(days=31 * i) for i in range((end - start).days // 31)]
+    month_starts = [m.replace(day=1) for m in month_starts]
+
+    def month():
+        m = rng.choice(month_starts)
+        return m, (m + timedelta(days=32)).replace(day=1)
+
+    def sessions_list():
+        # interventions list, therapist view, filtered to a month
+        m_start, m_end = month()
+        return (Intervention.query.join(Employee, Intervention.employee_id == Employee.id)
+                .filter(Intervention.employee_id == rng.choice(employee_ids),
+                        Intervention.date >= m_start, Intervention.date < m_end)
+                .order_by(Intervention.date.desc(), Intervention.start_time.desc())
+                .limit(10).all())
+
+    def invoices_list():
+        return Invoice.query.order_by(Invoice.invoiced_date.desc()).limit(10).all()
+
+    def sessions_report():
+        m_start, m_end = month()
+        return Intervention.query.filter(Intervention.date >= m_start, Intervention.date < m_end).order_by(Intervention.date).all()
+
+    def invoices_report():
+        m_start, m_end = month()
+        return (Invoice.query.filter(Invoice.invoiced_date >= m_start, Invoice.invoiced_date < m_end,
+                                     Invoice.client_id == rng.choice(client_ids))
+                .order_by(Invoice.invoiced_date.desc()).all())
+
+    def client_calendar():
+        m_start, m_end = month()
+        return (Intervention.query.join(Client).join(Employee)
+                .options(joinedload(Intervention.invoice))
+                .filter(Intervention.client_id == rng.choice(client_ids),
+                        Intervention.date >= m_start, Intervention.date < m_end)
+                .all())
+
+    def uninvoiced_sessions():
+        return Intervention.query.filter(
+            Intervention.client_id == rng.choice(client_ids), Intervention.invoiced == False,
+            Intervention.date >= end.replace(day=1), Intervention.date <= end,
+        ).all()
+
+    def uninvoiced_mileage():
+        return Mileage.query.filter(
+            Mileage.client_id == rng.choice(client_ids), Mileage.invoiced == False,
+            Mileage.date >= end.replace(day=1), Mileage.date <= end,
+        ).all()
+
+    def invoice_sessions():
+        return Intervention.query.filter_by(invoice_number=rng.choice(invoice_numbers)).all()
+
+    def invoice_payments():
+        return InvoicePayment.query.filter_by(invoice_id=rng.choice(invoice_ids)).all()
+
+    def reminder_candidates():
+        return Invoice.query.filter(Invoice.status == 'Sent').order_by(Invoice.payby_date).all()
+
+    def payrates():
+        return (PayRate.query.filter_by(employee_id=rng.choice(employee_ids), client_id=None)
+                .order_by(PayRate.effective_date.desc()).all())
+
+    def password_reset():
+        return Employee.query.filter_by(password_reset_key=f'key{rng.randrange(len(employee_ids)):06d}').first()
+
+    return {
+        'sessions list': sessions_list,
+        'invoices list': invoices_list,
+        'sessions report': sessions_report,
+        'invoices report': invoices_report,
+        'client calendar': client_calendar,
+        'uninvoiced sessions': uninvoiced_sessions,
+        'uninvoiced mileage': uninvoiced_mileage,
+        'sessions by invoice': invoice_sessions,
+        'invoice payments': invoice_payments,
+        'reminder candidates': reminder_candidates,
+        'payrates': payrates,
+        'password reset': password_reset,
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[k]
+
+
+def time_queries(db, queries, runs):
+    results = {}
+    for name, fn in queries.items():
+        fn()  # warm up
+        samples = []
+        for _ in range(runs):
+            t0 = timer.perf_counter()
+            fn()
+            samples.append((timer.perf_counter() - t0) * 1000)
+            db.session.expunge_all()
+        results[name] = (statistics.median(samples), percentile(samples, 95))
+    return results
+
+
+def set_indexes(db, enabled):
+    """Create or drop the 011 indexes as declared on the models."""
+    indexes = [ix for table in db.metadata.tables.values() for ix in table.indexes if ix.name in BENCHMARK_INDEXES]
+    with db.engine.begin() as conn:
+        for ix in indexes:
+            if enabled:
+                ix.create(conn, checkfirst=True)
+            else:
+                ix.drop(conn, checkfirst=True)
+        # refresh planner statistics so the comparison is fair on both backends
+        conn.exec_driver_sql('ANALYZE')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=60)
+    parser.add_argument('--employees', type=int, default=25)
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--database-url', default=None,
+                        help='scratch database (default: a SQLite file in the temp directory)')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url
+    if not database_url:
+        path = os.path.join(tempfile.gettempdir(), 'aba_benchmark.db')
+        if os.path.exists(path):
+            os.remove(path)
+        database_url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = database_url
+
+    from sqlalchemy import inspect
+
+    from app import create_app, db
+    from app import models
+
+    app = create_app()
+    rng = random.Random(args.seed)
+    with app.app_context():
+        if inspect(db.engine).has_table('interventions'):
+            logger.error('%s already has an interventions table; use an empty scratch database', database_url)
+            return 1
+        db.create_all()
+        t0 = timer.perf_counter()
+        start, end = seed(db, models, args.years, args.clients, args.employees, rng)
+        logger.info('Seeding took %.1fs', timer.perf_counter() - t0)
+
+        queries = build_queries(db, models, start, end, rng)
+        set_indexes(db, False)
+        before = time_queries(db, queries, args.runs)
+        set_indexes(db, True)
+        after = time_queries(db, queries, args.runs)
+
+    print(f"\n{'query':<22} {'p50 before':>11} {'p95 before':>11} {'p50 after':>10} {'p95 after':>10}  (ms, {args.runs} runs)")
+    for name in queries:
+        b50, b95 = before[name]
+        a50, a95 = after[name]
+        print(f'{name:<22} {b50:>11.2f} {b95:>11.2f} {a50:>10.2f} {a95:>10.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+import unittest
+from datetime import date, datetime, time, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.api import api_bp, generate_token
+from app.models import Activity, Client, Designation, Employee, Intervention
+
+
+class ApiPagingTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.register_blueprint(api_bp, url_prefix='/api')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        employee = Employee('Ada', 'Admin', 'Therapist', None, 'ada@example.com', '4165550000',
+                            user_type='admin', login_enabled=True)
+        client = Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add_all([employee, client])
+        db.session.flush()
+        # three sessions per day so pages split inside a date
+        for day in range(1, 6):
+            for hour in (9, 11, 13):
+                db.session.add(Intervention(client.id, employee.id, 'Therapy', date(2026, 9, day),
+                                            time(hour, 0), time(hour + 1, 0), 1.0, ''))
+        db.session.commit()
+        self.headers = {'Authorization': f'Bearer {generate_token(employee.id)}'}
+        self.http = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _pages(self, url):
+        ids, pages = [], 0
+        while url:
+            resp = self.http.get(url, headers=self.headers)
+            self.assertEqual(resp.status_code, 200, resp.get_json())
+            ids.extend(item['id'] for item in resp.get_json())
+            pages += 1
+            cursor = resp.headers.get('X-Next-Cursor')
+            self.assertEqual(bool(cursor), 'Link' in resp.headers)
+            url = resp.headers['Link'].split('>')[0].lstrip('<') if cursor else None
+        return ids, pages
+
+    def test_cursor_pages_cover_every_row_once_in_order(self):
+        ids, pages = self._pages('/api/interventions?limit=4')
+        expected = [i.id for i in Intervention.query.order_by(Intervention.date.desc(), Intervention.id.desc())]
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 4)
+
+        ids, _ = self._pages('/api/interventions?limit=4&order=asc&since=2026-09-04')
+        expected = [i.id for i in Intervention.query.filter(Intervention.date >= date(2026, 9, 4))
+                    .order_by(Intervention.date, Intervention.id)]
+        self.assertEqual(ids, expected)
+
+    def test_updated_after_returns_only_changed_rows(self):
+        cutoff = datetime.utcnow() + timedelta(seconds=1)
+        session = Intervention.query.filter_by(date=date(2026, 9, 2)).first()
+        session.updated_at = cutoff + timedelta(seconds=1)
+        db.session.commit()
+
+        resp = self.http.get(f'/api/interventions?updated_after={cutoff.isoformat()}Z', headers=self.headers)
+        self.assertEqual([item['id'] for item in resp.get_json()], [session.id])
+
+    def test_fields_selects_only_the_requested_columns(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', record)
+
+        resp = self.http.get('/api/interventions?fields=id,start_time&limit=1', headers=self.headers)
+        self.assertEqual(list(resp.get_json()[0]), ['id', 'start_time'])
+        self.assertEqual(resp.get_json()[0]['start_time'], '13:00')
+        select = [s for s in statements if 'FROM interventions' in s][-1]
+        self.assertNotIn('file_names', select)
+
+        resp = self.http.get('/api/interventions?fields=id,secret', headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('date', resp.get_json()['allowed'])
+
+    def test_invalid_cursor_is_rejected(self):
+        resp = self.http.get('/api/interventions?cursor=not-a-cursor', headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
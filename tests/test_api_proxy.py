@@ -0,0 +1,103 @@
+import base64
+import io
+import os
+import unittest
+from datetime import date
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from flask import render_template_string, send_file
+
+from app import create_app, db
+from app.api import api_bp, generate_token
+from app.clients.views import clients_bp
+from app.models import Client, Designation, Employee
+
+
+class ApiProxyTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.register_blueprint(clients_bp, url_prefix='/clients')
+        self.app.add_url_rule('/files/report.pdf', 'report_pdf', self._report_pdf)
+        self.app.add_url_rule('/guarded', 'guarded', self._guarded)
+        self.app.register_blueprint(api_bp, url_prefix='/api')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Therapist'))
+        self.admin = Employee('Ada', 'Admin', 'Therapist', None, 'ada@example.com', '4165550000',
+                              password='secret-pass', user_type='admin', login_enabled=True)
+        self.therapist = Employee('Pat', 'Rated', 'Therapist', None, 'pat@example.com', '4165550001',
+                                  password='secret-pass', login_enabled=True)
+        db.session.add_all([self.admin, self.therapist])
+        db.session.add(Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None))
+        db.session.commit()
+        self.http = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def _report_pdf():
+        return send_file(io.BytesIO(b'%PDF-1.4 \xff\x00'), mimetype='application/pdf')
+
+    @staticmethod
+    def _guarded():
+        # like the web views: a failed render falls back to something else
+        try:
+            return render_template_string('{{ greeting }}', greeting='hello')
+        except Exception:
+            return 'fallback'
+
+    def _get(self, path, user, **headers):
+        headers['Authorization'] = f'Bearer {generate_token(user.id)}'
+        return self.http.get(path, headers=headers)
+
+    def test_json_accept_returns_the_template_context_as_the_token_user(self):
+        resp = self._get('/api/clients/list?per_page=5', self.admin, Accept='application/json')
+        self.assertEqual(resp.status_code, 200)
+        payload = resp.get_json()
+        self.assertEqual(payload['template'], 'client_list_info.html')
+        context = payload['context']
+        self.assertEqual(context['per_page'], 5)
+        self.assertEqual([c['firstname'] for c in context['clients']], ['Jane'])
+        self.assertEqual(context['pagination']['total'], 1)
+        self.assertNotIn('current_user', context)
+        self.assertNotIn('Set-Cookie', resp.headers)
+
+    def test_view_errors_and_unknown_paths_keep_their_status(self):
+        resp = self._get('/api/clients/list', self.therapist)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resp.get_json()['status_code'], 403)
+
+        self.assertEqual(self._get('/api/nowhere', self.admin).status_code, 404)
+        self.assertEqual(self._get('/api/api/clients/list', self.admin).status_code, 404)
+
+    def test_file_responses_are_returned_base64_encoded(self):
+        resp = self._get('/api/files/report.pdf', self.admin)
+        self.assertEqual(resp.status_code, 200)
+        payload = resp.get_json()
+        self.assertEqual(payload['content_encoding'], 'base64')
+        self.assertEqual(payload['mimetype'], 'application/pdf')
+        self.assertEqual(base64.b64decode(payload['content']), b'%PDF-1.4 \xff\x00')
+
+    def test_context_is_captured_through_a_views_broad_except(self):
+        resp = self._get('/api/guarded', self.admin, Accept='application/json')
+        self.assertEqual(resp.get_json()['context'], {'greeting': 'hello'})
+
+        self.assertEqual(self._get('/api/guarded', self.admin).get_json()['content'], 'hello')
+
+    def test_models_in_the_context_never_include_credentials(self):
+        from app.utils.direct_dispatch import to_jsonable
+        data = to_jsonable({'employee': self.admin})['employee']
+        self.assertEqual(data['email'], 'ada@example.com')
+        self.assertFalse({'password_hash', 'activation_key', 'password_reset_key', 'two_factor_secret'} & set(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
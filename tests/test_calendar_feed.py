@@ -0,0 +1,84 @@
+import json
+import os
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Activity, Client, Designation, Employee, Intervention, Invoice
+from app.utils.calendar_feed import load_events
+
+
+class CalendarFeedTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        self.employee = Employee('Pat', 'Rated', 'Therapist', None, 'pat@example.com', '4165550000')
+        self.client = Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add_all([self.employee, self.client])
+        db.session.flush()
+        for day in (29, 30):
+            db.session.add(Intervention(self.client.id, self.employee.id, 'Therapy', date(2026, 9, day),
+                                        time(9, 0), time(10, 0), 1.0, ''))
+        for day in (1, 2):
+            db.session.add(Intervention(self.client.id, self.employee.id, 'Therapy', date(2026, 10, day),
+                                        time(9, 0), time(10, 0), 1.0, ''))
+        db.session.commit()
+        self.client_id = self.client.id
+
+        self.queries = 0
+
+        def count(*args):
+            self.queries += 1
+        event.listen(db.engine, 'before_cursor_execute', count)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', count)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _load(self, date_from=date(2026, 9, 28), date_to=date(2026, 10, 2)):
+        return load_events('client', self.client_id, ('all',), [], date_from, date_to)
+
+    def test_months_are_loaded_in_one_query_and_then_cached(self):
+        events_json, etag, _ = self._load()
+        self.assertEqual(self.queries, 1)
+        events = json.loads(events_json)
+        # end is exclusive
+        self.assertEqual([e['start'][:10] for e in events], ['2026-09-29', '2026-09-30', '2026-10-01'])
+        self.assertEqual(events[0]['extendedProps']['employee'], 'Pat Rated')
+
+        again, etag_again, _ = self._load()
+        self.assertEqual(self.queries, 1)
+        self.assertEqual((again, etag_again), (events_json, etag))
+
+    def test_commit_touching_the_client_invalidates_its_months(self):
+        _, etag, _ = self._load()
+        invoice = Invoice('INV202609000001', date(2026, 9, 30), date(2026, 10, 7), self.client_id,
+                          date(2026, 9, 1), date(2026, 9, 30), 100.0, 'Sent', None, None)
+        db.session.add(invoice)
+        session = Intervention.query.filter_by(date=date(2026, 9, 29)).one()
+        session.invoiced = True
+        session.invoice_number = invoice.invoice_number
+        db.session.commit()
+
+        self.queries = 0
+        events_json, new_etag, _ = self._load()
+        self.assertEqual(self.queries, 1)
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(json.loads(events_json)[0]['className'], 'invoice-sent')
+
+
+if __name__ == '__main__':
+    unittest.main()
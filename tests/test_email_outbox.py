@@ -0,0 +1,102 @@
+import os
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from googleapiclient.errors import HttpError
+
+from app import create_app, db
+from app.models import EmailAttachment, EmailOutbox
+from app.utils import email_outbox
+from app.utils.email_utils import queue_email, queue_email_with_pdf
+
+
+class EmailOutboxTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['EMAIL_OUTBOX_WORKER'] = False
+        self.app.config['EMAIL_MAX_ATTEMPTS'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_identical_attachments_are_stored_once(self):
+        for n in range(3):
+            self.assertTrue(queue_email_with_pdf('parent@example.com', f'Invoice {n}', 'See attached', b'%PDF-1.4 same', 'a.pdf'))
+        self.assertEqual(EmailOutbox.query.filter_by(status='queued').count(), 3)
+        self.assertEqual(EmailAttachment.query.count(), 1)
+
+    def test_dedupe_key_queues_a_message_once(self):
+        first = email_outbox.enqueue('Reminder', 'parent@example.com', body_text='x', dedupe_key='invoice-reminder:INV1:1')
+        second = email_outbox.enqueue('Reminder', 'parent@example.com', body_text='x', dedupe_key='invoice-reminder:INV1:1')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(EmailOutbox.query.count(), 1)
+
+    def test_queued_mail_is_committed_by_the_caller_which_wakes_the_worker(self):
+        with mock.patch.object(email_outbox, 'kick') as kick:
+            email_outbox.enqueue('Hello', 'c@example.com', body_text='hi')
+            db.session.rollback()
+            self.assertEqual(EmailOutbox.query.count(), 0)
+
+            email_outbox.enqueue('Hello', 'c@example.com', body_text='hi')
+            kick.assert_not_called()
+            db.session.commit()
+            kick.assert_called_once()
+        self.assertEqual(EmailOutbox.query.count(), 1)
+
+    def test_a_message_that_cannot_be_queued_leaves_the_session_usable(self):
+        email_outbox.enqueue('Kept', 'c@example.com', body_text='hi')
+        # the second attachment has no content
+        self.assertFalse(queue_email('a@example.com', 'Lost', 'x', attachments=[
+            ('a.pdf', b'%PDF-1.4', 'application/pdf'), ('b.pdf', None, 'application/pdf'),
+        ]))
+        db.session.commit()
+        self.assertEqual([row.subject for row in EmailOutbox.query], ['Kept'])
+        self.assertEqual(EmailAttachment.query.count(), 0)
+
+    def test_batch_sends_due_messages(self):
+        queue_email_with_pdf(['a@example.com', 'b@example.com'], 'Paystub', 'Attached', b'%PDF-1.4', 'p.pdf')
+        email_outbox.enqueue('Hello', 'c@example.com', body_text='hi')
+
+        counts = email_outbox.process_outbox(max_workers=2)
+
+        self.assertEqual((counts['claimed'], counts['sent']), (2, 2))
+        rows = EmailOutbox.query.all()
+        self.assertTrue(all(r.status == 'sent' and r.sent_at and r.claimed_by is None for r in rows))
+        self.assertEqual(email_outbox.process_outbox()['claimed'], 0)
+
+    def test_http_errors_back_off_then_fail_and_can_be_retried(self):
+        row = email_outbox.enqueue('Hello', 'c@example.com', body_text='hi')
+        error = HttpError(SimpleNamespace(status=503, reason='Unavailable'), b'')
+        with mock.patch.object(email_outbox, '_send_messages', side_effect=error):
+            self.assertEqual(email_outbox.process_outbox()['retried'], 1)
+            db.session.refresh(row)
+            self.assertEqual((row.status, row.attempts), ('queued', 1))
+            self.assertGreater(row.next_attempt_at, datetime.utcnow())
+            # not due yet
+            self.assertEqual(email_outbox.process_outbox()['claimed'], 0)
+
+            row.next_attempt_at = datetime.utcnow()
+            db.session.commit()
+            self.assertEqual(email_outbox.process_outbox()['failed'], 1)
+            db.session.refresh(row)
+            self.assertEqual((row.status, row.attempts), ('failed', 2))
+
+        self.assertTrue(email_outbox.retry(row.id))
+        self.assertEqual(email_outbox.process_outbox()['sent'], 1)
+        self.assertEqual(email_outbox.status_counts()['sent'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import base64
+import json
+import os
+import re
+import unittest
+from email.message import EmailMessage
+from types import SimpleNamespace
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from app import create_app
+from app.utils.gmail_client import get_gmail_client
+
+
+class StubGmail:
+    """Stands in for oauth2.googleapis.com and gmail.googleapis.com; records every request."""
+
+    def __init__(self, reject=()):
+        self.requests = []
+        self.reject = set(reject)
+        self.sent = 0
+
+    def __call__(self):
+        # GMAIL_HTTP_FACTORY: every connection talks to this one stub
+        return self
+
+    def _send_response(self, to):
+        if to in self.reject:
+            return 429, {'error': {'code': 429, 'message': 'Rate limit exceeded'}}
+        self.sent += 1
+        return 200, {'id': f'msg-{self.sent}'}
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.requests.append(uri)
+        if uri.startswith('https://oauth2.googleapis.com/token'):
+            return self._response(200, {'access_token': f'token-{len(self.requests)}', 'expires_in': 3600})
+        if '/batch' in uri:
+            return self._batch(body)
+        status, payload = self._send_response(self._recipient(json.loads(body)['raw']))
+        return self._response(status, payload)
+
+    @staticmethod
+    def _recipient(raw):
+        return re.search(r'^To: (.+)$', base64.urlsafe_b64decode(raw).decode(), re.M).group(1).strip()
+
+    @staticmethod
+    def _response(status, payload, content_type='application/json'):
+        return httplib2.Response({'status': status, 'content-type': content_type}), json.dumps(payload).encode()
+
+    def _batch(self, body):
+        body = body.decode() if isinstance(body, bytes) else body
+        parts = []
+        for content_id, raw in re.findall(r'Content-ID: <[^+]+\+ (\d+)>.*?"raw": "([^"]+)"', body, re.S):
+            status, payload = self._send_response(self._recipient(raw))
+            parts.append(
+                f'--batch\r\nContent-Type: application/http\r\nContent-ID: <response-x + {content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n'
+            )
+        content = ''.join(parts) + '--batch--\r\n'
+        return httplib2.Response({'status': 200, 'content-type': 'multipart/mixed; boundary=batch'}), content.encode()
+
+
+def _message(to):
+    msg = EmailMessage()
+    msg['Subject'] = 'Hello'
+    msg['From'] = 'org@example.com'
+    msg['To'] = to
+    msg.set_content('hi')
+    return msg
+
+
+class GmailClientTests(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubGmail(reject={'busy@example.com'})
+        self.app = create_app()
+        self.app.config['GMAIL_HTTP_FACTORY'] = self.stub
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.settings = SimpleNamespace(gmail_client_id='id', gmail_client_secret='secret', gmail_refresh_token='refresh')
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_client_and_access_token_are_reused_across_sends(self):
+        client = get_gmail_client(self.settings)
+        self.assertEqual(client.send(_message('a@example.com')), 'msg-1')
+        self.assertIs(get_gmail_client(self.settings), client)
+        self.assertEqual(get_gmail_client(self.settings).send(_message('b@example.com')), 'msg-2')
+
+        token_requests = [uri for uri in self.stub.requests if 'oauth2' in uri]
+        self.assertEqual(len(token_requests), 1)
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_new_credentials_build_a_new_client(self):
+        client = get_gmail_client(self.settings)
+        self.settings.gmail_refresh_token = 'rotated'
+        self.assertIsNot(get_gmail_client(self.settings), client)
+
+    def test_batch_sends_in_one_round_trip_and_reports_each_message(self):
+        client = get_gmail_client(self.settings)
+        with self.assertRaises(HttpError):
+            client.send(_message('busy@example.com'))
+
+        results = client.send_batch([_message('a@example.com'), _message('busy@example.com'), _message('c@example.com')])
+
+        self.assertEqual([message_id for message_id, _ in results], ['msg-1', None, 'msg-2'])
+        self.assertIsInstance(results[1][1], HttpError)
+        self.assertEqual(sum('/batch/gmail/v1' in uri for uri in self.stub.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import unittest
+from datetime import date
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Client, Invoice, InvoicePayment
+
+
+class InvoiceBalanceTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        client = Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add(client)
+        db.session.flush()
+        self.invoice = Invoice('INVTEST0001', date(2026, 9, 30), date(2026, 10, 7), client.id,
+                               date(2026, 9, 1), date(2026, 9, 30), 100.0, 'Sent', None, '')
+        db.session.add(self.invoice)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _stored(self):
+        return db.session.query(Invoice.amount_paid, Invoice.amount_pending, Invoice.payment_state).one()
+
+    def test_new_invoice_is_pending_for_its_total(self):
+        self.assertEqual(tuple(self._stored()), (0.0, 100.0, 'Pending'))
+
+    def test_payments_written_outside_add_payment_are_reflected_on_commit(self):
+        payment = InvoicePayment(self.invoice.id, 30.0, date(2026, 10, 1))
+        db.session.add(payment)
+        db.session.commit()
+        self.assertEqual(tuple(self._stored()), (30.0, 70.0, 'Partially Paid'))
+
+        payment.amount = 100.0
+        db.session.commit()
+        self.assertEqual(tuple(self._stored()), (100.0, 0.0, 'Paid'))
+
+        db.session.delete(payment)
+        db.session.commit()
+        self.assertEqual(tuple(self._stored()), (0.0, 100.0, 'Pending'))
+
+    def test_changing_the_total_moves_the_pending_amount(self):
+        self.invoice.add_payment(40.0, date(2026, 10, 1))
+        db.session.commit()
+        self.invoice.total_cost = 40.0
+        db.session.commit()
+        self.assertEqual(tuple(self._stored()), (40.0, 0.0, 'Paid'))
+        self.assertEqual(Invoice.query.filter(Invoice.amount_pending > 0).count(), 0)
+
+    def test_marking_paid_without_payments_settles_the_invoice(self):
+        # as PUT /api/invoices/<number> does
+        self.invoice.status = 'Paid'
+        db.session.commit()
+        self.assertEqual(tuple(self._stored()), (100.0, 0.0, 'Paid'))
+
+        self.invoice.status = 'Sent'
+        db.session.commit()
+        self.assertEqual(tuple(self._stored()), (0.0, 100.0, 'Pending'))
+
+
+if __name__ == '__main__':
+    unittest.main()
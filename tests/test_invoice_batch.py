@@ -0,0 +1,132 @@
+import json
+import os
+import unittest
+from datetime import date, time
+
+from sqlalchemy import event
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Activity, Client, Designation, Employee, Intervention, Invoice, Mileage, MileageRate
+from app.utils.invoice_batch import generate_invoices_for_period
+
+
+class InvoiceBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self._seed()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _client(self, firstname, is_active=True):
+        client = Client(
+            firstname=firstname,
+            lastname='Doe',
+            dob=date(2015, 1, 1),
+            gender='Female',
+            address1='123 Main St',
+            address2='',
+            city='Toronto',
+            state='ON',
+            zipcode='M1M1M1',
+            supervisor_id=None,
+            parentname='John Doe',
+            parentemail=f'{firstname.lower()}@example.com',
+            cost_therapy=100.0,
+            cost_supervision=150.0,
+            is_active=is_active,
+        )
+        db.session.add(client)
+        db.session.flush()
+        return client
+
+    def _session(self, client, day, activity='Therapy'):
+        db.session.add(Intervention(
+            client_id=client.id,
+            employee_id=self.employee.id,
+            intervention_type=activity,
+            date=day,
+            start_time=time(9, 0),
+            end_time=time(11, 0),
+            duration=2.0,
+            file_names='',
+        ))
+
+    def _seed(self):
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        db.session.add(Activity(activity_name='Supervision', activity_category='Supervision'))
+        self.employee = Employee('Tina', 'Therapist', 'Therapist', None, 'tina@example.com', '4165550000')
+        db.session.add(self.employee)
+        db.session.flush()
+        self.alice = self._client('Alice')
+        self.bob = self._client('Bob')
+        self.inactive = self._client('Carl', is_active=False)
+        self._session(self.alice, date(2026, 9, 3))
+        self._session(self.alice, date(2026, 9, 10), activity='Supervision')
+        self._session(self.alice, date(2026, 10, 1))
+        self._session(self.bob, date(2026, 9, 15))
+        self._session(self.inactive, date(2026, 9, 15))
+        db.session.commit()
+
+    def test_creates_one_draft_invoice_per_active_client(self):
+        results = generate_invoices_for_period(date(2026, 9, 1), date(2026, 9, 30), render_pdfs=False)
+
+        self.assertEqual({r['client_id'] for r in results}, {self.alice.id, self.bob.id})
+        invoice = Invoice.query.filter_by(client_id=self.alice.id).one()
+        self.assertEqual(invoice.status, 'Draft')
+        self.assertEqual(invoice.total_cost, 2 * 100.0 + 2 * 150.0)
+        self.assertEqual(len(json.loads(invoice.invoice_items)), 2)
+        # the October session is outside the period and stays uninvoiced
+        self.assertEqual(Intervention.query.filter_by(client_id=self.alice.id, invoiced=False).count(), 1)
+        self.assertEqual(Invoice.query.count(), 2)
+        self.assertEqual(len({r['invoice_number'] for r in results}), 2)
+
+    def test_rows_loaded_up_front_are_not_reloaded_per_row(self):
+        rate = MileageRate(rate=0.5, effective_date=date(2026, 1, 1))
+        db.session.add(rate)
+        db.session.flush()
+        for client in (self.alice, self.bob):
+            for day in range(1, 21):
+                self._session(client, date(2026, 9, day))
+            for day in (4, 11):
+                db.session.add(Mileage(self.employee.id, client.id, date(2026, 9, day), 10.0, rate.id))
+        db.session.commit()
+        db.session.expire_all()
+        selects = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                selects.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', record)
+
+        results = generate_invoices_for_period(date(2026, 9, 1), date(2026, 9, 30), render_pdfs=False)
+
+        self.assertEqual([(r['sessions'], r['mileages']) for r in results], [(22, 2), (21, 2)])
+        reloads = [s for s in selects if 'WHERE interventions.id = ' in s or 'WHERE mileages.id = ' in s]
+        self.assertEqual(reloads, [])
+        # the run's own queries and a fixed set per committed invoice, not one per session
+        self.assertLessEqual(len(selects), 30)
+
+    def test_dry_run_does_not_write(self):
+        results = generate_invoices_for_period(date(2026, 9, 1), date(2026, 9, 30), dry_run=True)
+
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(r['invoice_number'] is None for r in results))
+        self.assertEqual(Invoice.query.count(), 0)
+        self.assertEqual(Intervention.query.filter_by(invoiced=True).count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
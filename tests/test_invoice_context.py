@@ -0,0 +1,112 @@
+import json
+import os
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Activity, Client, Designation, Employee, Intervention, Invoice, InvoicePayment
+from app.utils.invoice_context import InvoiceRenderContext
+
+
+class InvoiceRenderContextTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _make_invoice(self, number, sessions):
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        supervisor = Employee('Sue', 'Pervisor', 'Therapist', 'RBA1', 'sue@example.com', '4165550001')
+        db.session.add(supervisor)
+        db.session.flush()
+        employees = []
+        for n in range(3):
+            employee = Employee(f'T{n}', 'Therapist', 'Therapist', None, f't{n}@example.com', '4165550000')
+            db.session.add(employee)
+            employees.append(employee)
+        client = Client(
+            firstname='Jane', lastname='Doe', dob=date(2015, 1, 1), gender='Female',
+            address1='123 Main St', address2='', city='Toronto', state='ON', zipcode='M1M1M1',
+            supervisor_id=supervisor.id, parentname='John Doe', parentemail='parent@example.com',
+            cost_therapy=100.0,
+        )
+        db.session.add(client)
+        db.session.flush()
+        invoice = Invoice(
+            invoice_number=number, invoiced_date=date(2026, 10, 1), payby_date=date(2026, 10, 8),
+            client_id=client.id, date_from=date(2026, 9, 1), date_to=date(2026, 9, 30),
+            total_cost=200.0 * sessions, status='Sent', paid_date=None, payment_comments='',
+        )
+        db.session.add(invoice)
+        db.session.flush()
+        items = []
+        for n in range(sessions):
+            intervention = Intervention(
+                client.id, employees[n % 3].id, 'Therapy', date(2026, 9, 1 + n % 28),
+                time(9, 0), time(11, 0), 2.0, '', invoiced=True, invoice_number=number,
+            )
+            db.session.add(intervention)
+            db.session.flush()
+            # leave one session out of the snapshot to exercise the rate fallback
+            if n:
+                items.append({'type': 'intervention', 'intervention_id': intervention.id, 'rate': 100.0, 'cost': 200.0})
+        items.append({'type': 'mileage', 'date': '2026-09-02', 'description': 'Trip', 'distance': 10, 'rate': 0.5, 'cost': 5.0})
+        invoice.invoice_items = json.dumps(items)
+        db.session.add(InvoicePayment(invoice_id=invoice.id, amount=50.0, payment_date=date(2026, 10, 2)))
+        db.session.commit()
+        db.session.expunge_all()
+
+    def _count_queries(self, func):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, len(statements)
+
+    def _load_and_touch(self, number):
+        ctx = InvoiceRenderContext.load(number, settings={})
+        # everything the PDF template reads
+        for i in ctx.interventions:
+            (i.employee.firstname, i.employee.position, i.rate, i.cost)
+        (ctx.client.parentname, ctx.supervisor.rba_number, ctx.invoice.payment_status, len(ctx.invoice.payments))
+        return ctx
+
+    def test_loads_snapshot_rates_supervisor_and_mileage(self):
+        self._make_invoice('INVCTX0001', 3)
+        ctx = InvoiceRenderContext.load('INVCTX0001', settings={})
+
+        self.assertEqual(ctx.supervisor.rba_number, 'RBA1')
+        self.assertEqual([i.cost for i in ctx.interventions], [200.0, 200.0, 200.0])
+        self.assertEqual(len(ctx.mileages), 1)
+        self.assertEqual(ctx.mileages[0].cost, 5.0)
+        self.assertEqual(ctx.invoice.paid_amount, 50.0)
+
+    def test_query_count_does_not_grow_with_sessions(self):
+        self._make_invoice('INVCTX0002', 25)
+        _ctx, queries = self._count_queries(lambda: self._load_and_touch('INVCTX0002'))
+
+        self.assertLessEqual(queries, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
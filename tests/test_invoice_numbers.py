@@ -0,0 +1,88 @@
+import os
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Activity, Client, Employee, Intervention, Invoice, InvoiceSequence
+from app.utils import invoice_numbers
+from app.utils.invoice_batch import generate_invoices_for_period
+
+
+class InvoiceNumberTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.month = date.today().strftime('%Y%m')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _client(self, firstname):
+        client = Client(firstname=firstname, lastname='Doe', dob=date(2015, 1, 1), gender='Female',
+                        address1='1 Main St', address2='', city='Toronto', state='ON', zipcode='M1M1M1',
+                        supervisor_id=None, parentname='John Doe', parentemail='parent@example.com',
+                        cost_therapy=100.0, cost_supervision=150.0, is_active=True)
+        db.session.add(client)
+        db.session.flush()
+        return client
+
+    def _invoice(self, client, number):
+        db.session.add(Invoice(client_id=client.id, invoice_number=number, invoiced_date=date.today(),
+                               payby_date=date.today(), date_from=date.today(), date_to=date.today(),
+                               total_cost=0, status='Draft', paid_date=None, payment_comments='',
+                               invoice_items='[]'))
+        db.session.commit()
+
+    def test_numbers_are_consecutive_and_blocks_are_contiguous(self):
+        self.assertEqual(Invoice.generate_invoice_number(), f'INV{self.month}0001')
+        db.session.commit()
+        self.assertEqual(invoice_numbers.reserve(3), [f'INV{self.month}000{n}' for n in (2, 3, 4)])
+        db.session.commit()
+        self.assertEqual(db.session.get(InvoiceSequence, self.month).last_value, 4)
+
+    def test_rolled_back_reserve_returns_the_numbers(self):
+        invoice_numbers.reserve(5)
+        db.session.rollback()
+        self.assertEqual(invoice_numbers.reserve(1), [f'INV{self.month}0001'])
+
+    def test_sequence_starts_after_existing_invoices_of_the_month(self):
+        client = self._client('Alice')
+        self._invoice(client, f'INV{self.month}0009')
+        self._invoice(client, f'INV{self.month}0012')
+        self._invoice(client, 'INV2001010099')
+
+        self.assertEqual(invoice_numbers.peek(), f'INV{self.month}0013')
+        self.assertEqual(invoice_numbers.reserve(2), [f'INV{self.month}0013', f'INV{self.month}0014'])
+        self.assertEqual(invoice_numbers.reserve(1, on=date(2001, 1, 15)), ['INV2001010100'])
+        self.assertEqual(invoice_numbers.reserve(1, on=date(2001, 2, 1)), ['INV2001020001'])
+
+    def test_bulk_invoicing_reserves_one_block(self):
+        employee = Employee('Tina', 'Therapist', 'Therapist', None, 'tina@example.com', '4165550000')
+        db.session.add(employee)
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        db.session.flush()
+        for name in ('Alice', 'Bob', 'Cara'):
+            db.session.add(Intervention(client_id=self._client(name).id, employee_id=employee.id,
+                                        intervention_type='Therapy', date=date(2026, 9, 3), start_time=time(9, 0),
+                                        end_time=time(10, 0), duration=1.0, file_names=''))
+        db.session.commit()
+        # an invoice created elsewhere meanwhile
+        self.assertEqual(Invoice.generate_invoice_number(), f'INV{self.month}0001')
+        db.session.commit()
+
+        results = generate_invoices_for_period(date(2026, 9, 1), date(2026, 9, 30), render_pdfs=False)
+
+        self.assertEqual([r['invoice_number'] for r in results], [f'INV{self.month}000{n}' for n in (2, 3, 4)])
+        self.assertEqual(db.session.get(InvoiceSequence, self.month).last_value, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import AppSettings, Client, EmailOutbox, Invoice, ReminderRun
+from app.utils import email_outbox
+from app.utils.invoice_reminder import (
+    process_invoice_reminders, reminder_candidates, should_send_first_reminder, should_send_repeat_reminder,
+)
+
+
+class InvoiceReminderRunTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(AppSettings(org_name='Org', invoice_reminder_enabled=True, invoice_reminder_days=5,
+                                   invoice_reminder_repeat_enabled=True, invoice_reminder_repeat_days=3))
+        self.client = Client('Jane', 'Doe', datetime(2015, 1, 1).date(), 'Female', '1 St', '', 'Toronto', 'ON',
+                             'M1M1M1', None, parentname='John Doe', parentemail='parent@example.com')
+        self.no_email = Client('Kim', 'Doe', datetime(2015, 1, 1).date(), 'Female', '1 St', '', 'Toronto', 'ON',
+                               'M1M1M1', None)
+        db.session.add_all([self.client, self.no_email])
+        db.session.flush()
+        self.today = datetime.utcnow().date()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _invoice(self, number, due_in, paid=0.0, status='Sent', reminders=0, last_sent_days_ago=None, client=None):
+        invoice = Invoice(number, self.today - timedelta(days=30), self.today + timedelta(days=due_in),
+                          (client or self.client).id, self.today - timedelta(days=60), self.today - timedelta(days=31),
+                          100.0, status, None, '')
+        invoice.reminder_count = reminders
+        if last_sent_days_ago is not None:
+            invoice.last_reminder_sent_date = datetime.utcnow() - timedelta(days=last_sent_days_ago)
+        db.session.add(invoice)
+        db.session.flush()
+        if paid:
+            invoice.add_payment(paid, self.today)
+        return invoice
+
+    def _seed(self):
+        self._invoice('FIRST', 3)
+        self._invoice('TOO_EARLY', 10)
+        self._invoice('LOW_BALANCE', 2, paid=95.0)
+        self._invoice('REPEAT', 20, reminders=1, last_sent_days_ago=3)
+        self._invoice('RECENT', 20, reminders=1, last_sent_days_ago=1)
+        self._invoice('DUE_TODAY', 0, reminders=1, last_sent_days_ago=1)
+        self._invoice('DRAFT', 0, status='Draft')
+        self._invoice('NO_EMAIL', 1, client=self.no_email)
+        db.session.commit()
+
+    def test_candidate_query_matches_the_per_invoice_checks(self):
+        self._seed()
+        settings = AppSettings.get()
+        selected = {i.invoice_number for i in reminder_candidates(settings)}
+        expected = {
+            i.invoice_number for i in Invoice.query.filter_by(status='Sent')
+            if should_send_first_reminder(i, settings) or should_send_repeat_reminder(i, settings)
+        }
+        self.assertEqual(selected, expected)
+        self.assertEqual(selected, {'FIRST', 'REPEAT', 'DUE_TODAY', 'NO_EMAIL'})
+
+    def test_run_queues_reminders_in_the_outbox_once(self):
+        self._seed()
+        with mock.patch.object(email_outbox, 'kick') as kick:
+            run = process_invoice_reminders()
+
+        self.assertEqual((run.candidates, run.sent, run.skipped, run.failed), (4, 3, 1, 0))
+        self.assertIsNotNone(run.duration_ms)
+        self.assertEqual(ReminderRun.query.count(), 1)
+        kick.assert_called_once()
+        self.assertEqual(
+            {row.dedupe_key for row in EmailOutbox.query},
+            {'invoice-reminder:FIRST:1', 'invoice-reminder:REPEAT:2', 'invoice-reminder:DUE_TODAY:2'},
+        )
+        counts = dict(db.session.query(Invoice.invoice_number, Invoice.reminder_count))
+        self.assertEqual((counts['FIRST'], counts['REPEAT'], counts['NO_EMAIL']), (1, 2, 0))
+        # sent today, so the next run selects nothing new
+        self.assertEqual({i.invoice_number for i in reminder_candidates(AppSettings.get())}, {'DUE_TODAY', 'NO_EMAIL'})
+
+    def test_a_reminder_already_queued_is_not_queued_again(self):
+        self._seed()
+        # queued by an earlier run that died before its tracking update
+        email_outbox.enqueue_many([{'subject': 'Reminder', 'recipients': ['parent@example.com'],
+                                    'dedupe_key': 'invoice-reminder:FIRST:1'}])
+        db.session.commit()
+        with mock.patch.object(email_outbox, 'kick'):
+            run = process_invoice_reminders()
+
+        self.assertEqual(run.sent, 3)
+        self.assertEqual(EmailOutbox.query.filter_by(dedupe_key='invoice-reminder:FIRST:1').count(), 1)
+        self.assertEqual(EmailOutbox.query.count(), 3)
+        self.assertEqual(Invoice.query.filter_by(invoice_number='FIRST').one().reminder_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
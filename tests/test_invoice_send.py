@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, time
+from unittest import mock
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Activity, Client, EmailOutbox, Employee, Intervention, Invoice
+from app.utils import invoice_send
+from app.utils.invoice_batch import generate_invoices_for_period
+from app.utils.invoice_send import create_send_job, run_send_job
+
+
+class InvoiceSendJobTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['PDF_CACHE_FOLDER'] = self.cache_dir
+        self.app.config['EMAIL_OUTBOX_WORKER'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self._seed()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _client(self, firstname, email):
+        client = Client('%s' % firstname, 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None,
+                        parentname='John Doe', parentemail=email, cost_therapy=100.0)
+        db.session.add(client)
+        db.session.flush()
+        db.session.add(Intervention(client_id=client.id, employee_id=self.employee.id, intervention_type='Therapy',
+                                    date=date(2026, 9, 3), start_time=time(9, 0), end_time=time(10, 0),
+                                    duration=1.0, file_names=''))
+        return client
+
+    def _seed(self):
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        self.employee = Employee('Tina', 'Therapist', 'Therapist', None, 'tina@example.com', '4165550000')
+        db.session.add(self.employee)
+        db.session.flush()
+        self._client('Alice', 'alice@example.com')
+        self._client('Bob', 'bob@example.com')
+        self._client('Carl', None)
+        db.session.commit()
+        generate_invoices_for_period(date(2026, 9, 1), date(2026, 9, 30), render_pdfs=False)
+
+    def _render(self, jobs, **kwargs):
+        pdfs = {key: b'%PDF-1.4 ' + key.encode() for key, _html in jobs}
+        self.rendered.extend(pdfs)
+        return pdfs
+
+    def _run(self, job_id):
+        # only the WeasyPrint side is replaced; the job logic runs as in production
+        self.rendered = []
+        with mock.patch.object(invoice_send, '_pdf_html', side_effect=lambda ctx: ctx.invoice.invoice_number), \
+                mock.patch.object(invoice_send.pdf_render, 'render_pdfs', side_effect=self._render):
+            job = run_send_job(job_id)
+        return job, self.rendered
+
+    def test_sends_the_period_drafts_in_one_pass(self):
+        job, created = create_send_job(date(2026, 9, 1), date(2026, 9, 30))
+        self.assertTrue(created)
+        self.assertEqual(job.total, 3)
+        # a second request while the first is pending reports the same job
+        self.assertEqual(create_send_job(date(2026, 9, 1), date(2026, 9, 30)), (job, False))
+
+        job, rendered = self._run(job.id)
+
+        self.assertEqual(len(rendered), 2)
+        self.assertEqual((job.status, job.total, job.sent, job.skipped, job.failed), ('done', 3, 2, 1, 0))
+        self.assertEqual(len(job.error_list), 1)
+        statuses = dict(db.session.query(Client.firstname, Invoice.status).join(Invoice.client))
+        self.assertEqual(statuses, {'Alice': 'Sent', 'Bob': 'Sent', 'Carl': 'Draft'})
+
+        emails = EmailOutbox.query.order_by(EmailOutbox.id).all()
+        self.assertEqual([e.recipient_list for e in emails], [['alice@example.com'], ['bob@example.com']])
+        self.assertTrue(all(e.attachment_refs and 'Invoice INV' in e.subject for e in emails))
+        self.assertIsNone(invoice_send.active_job())
+
+    def test_cached_pdfs_are_not_rendered_again(self):
+        first, _ = create_send_job(date(2026, 9, 1), date(2026, 9, 30))
+        self._run(first.id)
+        Invoice.query.update({Invoice.status: 'Draft'})
+        db.session.commit()
+
+        second, _ = create_send_job(date(2026, 9, 1), date(2026, 9, 30))
+        second, rendered = self._run(second.id)
+        self.assertEqual((second.status, second.sent), ('done', 2))
+        self.assertEqual(rendered, [])
+        self.assertEqual(EmailOutbox.query.count(), 4)
+
+    def test_an_invoice_sent_meanwhile_is_not_emailed_again(self):
+        job, _ = create_send_job(date(2026, 9, 1), date(2026, 9, 30))
+        alice = db.session.query(Invoice.invoice_number).join(Invoice.client).filter(Client.firstname == 'Alice').scalar()
+        render = self._render
+
+        def render_while_another_job_sends(jobs, **kwargs):
+            # a concurrent job claims Alice's invoice after this one loaded the drafts
+            Invoice.query.filter_by(invoice_number=alice).update({Invoice.status: 'Sent'}, synchronize_session=False)
+            return render(jobs, **kwargs)
+
+        self._render = render_while_another_job_sends
+        job, _ = self._run(job.id)
+
+        self.assertEqual((job.status, job.sent, job.skipped), ('done', 1, 2))
+        self.assertIn({'invoice_number': alice, 'error': 'invoice was sent by another request'}, job.error_list)
+        self.assertEqual([e.recipient_list for e in EmailOutbox.query], [['bob@example.com']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import random
+import unittest
+from datetime import date, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Client, Designation, Employee, PayRate
+from app.utils.payrates import PayRateResolver
+
+
+def _legacy_rate(emp_id, client_id, on_date):
+    """The per-session lookup create_paystub used before PayRateResolver.
+
+    Ties on effective_date are broken by id so the comparison does not depend
+    on the order the database happens to return them in.
+    """
+    rate = None
+    payrates = PayRate.query.filter_by(employee_id=emp_id, client_id=client_id).order_by(PayRate.effective_date.desc(), PayRate.id.desc()).all()
+    if payrates:
+        for pr in payrates:
+            if pr.effective_date is None or pr.effective_date <= on_date:
+                rate = pr.rate
+                break
+        if rate is None:
+            rate = payrates[0].rate
+    if rate is None:
+        base_rates = PayRate.query.filter_by(employee_id=emp_id, client_id=None).order_by(PayRate.effective_date.desc(), PayRate.id.desc()).all()
+        if base_rates:
+            for br in base_rates:
+                if br.effective_date is None or br.effective_date <= on_date:
+                    rate = br.rate
+                    break
+            if rate is None:
+                rate = base_rates[0].rate
+    return rate
+
+
+class PayRateResolverTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Therapist'))
+        self.employees = []
+        for n in range(3):
+            employee = Employee(f'T{n}', 'Therapist', 'Therapist', None, f't{n}@example.com', '4165550000')
+            db.session.add(employee)
+            self.employees.append(employee)
+        self.clients = []
+        for n in range(3):
+            client = Client(f'C{n}', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+            db.session.add(client)
+            self.clients.append(client)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_matches_legacy_lookup(self):
+        rng = random.Random(5)
+        start = date(2026, 1, 1)
+        for employee in self.employees[:2]:
+            for client_id in [None] + [c.id for c in self.clients[:2]]:
+                for _ in range(rng.randint(1, 4)):
+                    effective = None if rng.random() < 0.2 else start + timedelta(days=rng.randint(0, 200))
+                    db.session.add(PayRate(employee_id=employee.id, client_id=client_id,
+                                           rate=float(rng.randint(20, 60)), effective_date=effective))
+        # an employee with only a client-specific rate and no base rate
+        db.session.add(PayRate(employee_id=self.employees[2].id, client_id=self.clients[0].id,
+                               rate=33.0, effective_date=date(2026, 6, 1)))
+        db.session.commit()
+
+        resolver = PayRateResolver.for_employees([e.id for e in self.employees])
+        for employee in self.employees:
+            for client_id in [None] + [c.id for c in self.clients]:
+                for offset in range(-10, 260, 7):
+                    on_date = start + timedelta(days=offset)
+                    self.assertEqual(
+                        resolver.resolve(employee.id, client_id, on_date),
+                        _legacy_rate(employee.id, client_id, on_date),
+                        (employee.id, client_id, on_date),
+                    )
+
+    def test_missing_rate_resolves_to_none(self):
+        resolver = PayRateResolver.for_employees([self.employees[0].id])
+        self.assertIsNone(resolver.resolve(self.employees[0].id, self.clients[0].id, date(2026, 1, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
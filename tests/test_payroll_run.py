@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, time
+from unittest.mock import patch
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Activity, Client, Designation, Employee, Intervention, PayRate, PayStub, PayStubItem
+from app.utils import pdf_cache
+from app.utils.payroll_run import run_payroll_for_period
+
+
+class PayrollRunTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self._seed()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _seed(self):
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        self.paid = Employee('Pat', 'Rated', 'Therapist', None, 'pat@example.com', '4165550000')
+        self.unrated = Employee('Una', 'Rated', 'Therapist', None, 'una@example.com', '4165550001')
+        db.session.add_all([self.paid, self.unrated])
+        self.client = Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add(self.client)
+        db.session.flush()
+        db.session.add(PayRate(employee_id=self.paid.id, client_id=None, rate=30.0, effective_date=date(2026, 1, 1)))
+        for employee in (self.paid, self.unrated):
+            for day in (2, 9):
+                db.session.add(Intervention(self.client.id, employee.id, 'Therapy', date(2026, 9, day),
+                                            time(9, 0), time(11, 0), 2.0, ''))
+        db.session.commit()
+
+    def test_saves_paystubs_and_reports_missing_rates(self):
+        result = run_payroll_for_period(date(2026, 9, 1), date(2026, 9, 14), render_pdfs=False)
+
+        self.assertEqual([p['employee_id'] for p in result['paystubs']], [self.paid.id])
+        self.assertEqual(result['paystubs'][0]['total_amount'], 120.0)
+        self.assertEqual(result['missing_rates'][0]['employee_id'], self.unrated.id)
+        self.assertEqual(len(result['missing_rates'][0]['intervention_ids']), 2)
+
+        paystub = PayStub.query.one()
+        self.assertEqual(paystub.employee_id, self.paid.id)
+        self.assertEqual(PayStubItem.query.filter_by(paystub_id=paystub.id).count(), 2)
+        self.assertEqual(Intervention.query.filter_by(employee_id=self.paid.id, is_paid=True).count(), 2)
+        self.assertEqual(Intervention.query.filter_by(employee_id=self.unrated.id, is_paid=True).count(), 0)
+
+        # a second run finds nothing left to pay
+        again = run_payroll_for_period(date(2026, 9, 1), date(2026, 9, 14), render_pdfs=False)
+        self.assertEqual(again['paystubs'], [])
+        self.assertEqual(PayStub.query.count(), 1)
+
+    def test_sessions_on_a_paystub_are_excluded_even_if_flag_is_stale(self):
+        first = run_payroll_for_period(date(2026, 9, 1), date(2026, 9, 14), render_pdfs=False)
+        # simulate a row written before is_paid was maintained everywhere
+        Intervention.query.update({Intervention.is_paid: False})
+        db.session.commit()
+
+        unpaid = Intervention.query.filter(
+            Intervention.employee_id == self.paid.id,
+            Intervention.unpaid_clause()
+        ).count()
+        self.assertEqual(unpaid, 0)
+        self.assertEqual(first['paystubs'][0]['sessions'], 2)
+
+    def test_rendered_pdfs_only_go_to_the_pdf_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        self.app.config['PDF_CACHE_FOLDER'] = cache_dir
+
+        with patch('app.payroll.views._paystub_pdf_html', return_value='<html></html>'), \
+                patch('app.utils.pdf_render.render_pdfs', side_effect=lambda items, **kw: {key: b'%PDF stub' for key, _ in items}):
+            result = run_payroll_for_period(date(2026, 9, 1), date(2026, 9, 14))
+
+        paystub = PayStub.query.one()
+        self.assertEqual(result['pdfs'], [paystub.id])
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # editing or deleting the paystub leaves no stale copy behind
+        pdf_cache.invalidate_paystub(paystub.id)
+        self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_dry_run_does_not_write(self):
+        result = run_payroll_for_period(date(2026, 9, 1), date(2026, 9, 14), dry_run=True)
+
+        self.assertIsNone(result['paystubs'][0]['paystub_id'])
+        self.assertEqual(PayStub.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.utils import pdf_assets
+from app.utils.pdf_assets import LocalAssets, url_fetcher
+
+
+class LocalAssetsTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.static = os.path.join(self.root, 'static')
+        self.pics = os.path.join(self.root, 'pics')
+        os.makedirs(os.path.join(self.static, 'images'))
+        os.makedirs(self.pics)
+        self.logo = os.path.join(self.static, 'images', 'logo.png')
+        self._write(self.logo, b'\x89PNG logo')
+        self._write(os.path.join(self.pics, 'me.jpg'), b'jpeg')
+        self.custom_logo = os.path.join(self.root, 'uploads', 'org logo.png')
+        os.makedirs(os.path.dirname(self.custom_logo))
+        self._write(self.custom_logo, b'custom')
+        self.roots = [('/static/', self.static), ('/profile_pic/', self.pics)]
+        pdf_assets.image_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    @staticmethod
+    def _write(path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_site_urls_resolve_to_files_on_disk(self):
+        assets = LocalAssets('http://example.com/app/', self.roots,
+                             {'/logo': self.custom_logo, self.custom_logo: self.custom_logo})
+
+        self.assertEqual(assets.resolve('http://example.com/app/static/images/logo.png'), self.logo)
+        self.assertEqual(assets.resolve('http://example.com/profile_pic/me.jpg'), os.path.join(self.pics, 'me.jpg'))
+        self.assertEqual(assets.resolve('http://example.com/app/logo'), self.custom_logo)
+        self.assertEqual(assets.resolve(Path(self.custom_logo).as_uri()), self.custom_logo)
+        self.assertEqual(assets.resolve(Path(self.logo).as_uri()), self.logo)
+        self.assertIsNone(assets.resolve('https://cdn.example.org/static/images/logo.png'))
+        self.assertIsNone(assets.resolve('data:image/png;base64,AAAA'))
+        with self.assertRaises(FileNotFoundError):
+            assets.resolve('http://example.com/static/../../etc/passwd')
+        with self.assertRaises(FileNotFoundError):
+            assets.resolve('http://example.com/static/images/missing.png')
+
+    def test_site_paths_resolve_against_a_file_base_url(self):
+        # outside a request the base URL is the app folder's file:// URI
+        assets = LocalAssets(Path(self.root).as_uri() + '/', self.roots)
+
+        self.assertEqual(assets.resolve('file:///static/images/logo.png'), self.logo)
+
+    def test_fetched_files_are_kept_in_memory_until_they_change(self):
+        fetch = url_fetcher(LocalAssets('http://example.com/', self.roots))
+        url = 'http://example.com/static/images/logo.png'
+        pdf_assets._read_file.cache_clear()
+
+        first = fetch(url)
+        self.assertEqual(first['string'], b'\x89PNG logo')
+        self.assertEqual(first['mime_type'], 'image/png')
+        fetch(url)
+        self.assertEqual(pdf_assets._read_file.cache_info().hits, 1)
+
+        pdf_assets.image_cache[url] = 'decoded logo'
+        self.assertIn(url, pdf_assets.image_cache)
+        self._write(self.logo, b'\x89PNG new logo!')
+        self.assertNotIn(url, pdf_assets.image_cache)
+        self.assertEqual(fetch(url)['string'], b'\x89PNG new logo!')
+
+
+if __name__ == '__main__':
+    unittest.main()
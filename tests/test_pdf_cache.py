@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import date, time as dtime
+from types import SimpleNamespace
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Client, Invoice
+from app.utils import pdf_cache
+
+
+class PdfCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['PDF_CACHE_FOLDER'] = self.cache_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _make_invoice(self):
+        client = Client(
+            firstname='Jane',
+            lastname='Doe',
+            dob=date(1990, 1, 1),
+            gender='Female',
+            address1='123 Main St',
+            address2='',
+            city='Toronto',
+            state='ON',
+            zipcode='M1M1M1',
+            supervisor_id=None,
+            parentname='John Doe',
+            parentemail='parent@example.com',
+        )
+        db.session.add(client)
+        db.session.flush()
+        invoice = Invoice(
+            invoice_number='INVTEST0001',
+            invoiced_date=date(2026, 7, 1),
+            payby_date=date(2026, 7, 8),
+            client_id=client.id,
+            date_from=date(2026, 6, 1),
+            date_to=date(2026, 6, 30),
+            total_cost=100.0,
+            status='Sent',
+            paid_date=None,
+            payment_comments='',
+            invoice_items='[]',
+        )
+        db.session.add(invoice)
+        db.session.commit()
+        return client, invoice
+
+    def _fingerprint(self, client, invoice):
+        settings = {'org_name': 'Org', 'org_address': 'Addr', 'org_email': 'a@b.c', 'org_phone': '', 'payment_email': 'p@b.c'}
+        return pdf_cache.invoice_pdf_fingerprint(invoice, client, [], [], None, settings)
+
+    def test_second_request_is_served_from_cache(self):
+        client, invoice = self._make_invoice()
+        fingerprint = self._fingerprint(client, invoice)
+        calls = []
+
+        def render():
+            calls.append(1)
+            return b'%PDF-1.7 test'
+
+        first = pdf_cache.get_or_render_pdf(invoice.invoice_number, fingerprint, render)
+        second = pdf_cache.get_or_render_pdf(invoice.invoice_number, fingerprint, render)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def test_payment_changes_fingerprint_and_drops_cached_files(self):
+        client, invoice = self._make_invoice()
+        before = self._fingerprint(client, invoice)
+        pdf_cache.store_pdf(invoice.invoice_number, before, b'%PDF old')
+
+        invoice.add_payment(amount=40.0, payment_date=date(2026, 7, 2))
+        db.session.commit()
+
+        self.assertNotEqual(before, self._fingerprint(client, invoice))
+        self.assertIsNone(pdf_cache.get_cached_pdf(invoice.invoice_number, before))
+
+    def test_eviction_removes_least_recently_used_entries(self):
+        self.app.config['PDF_CACHE_MAX_BYTES'] = 25
+        pdf_cache.store_pdf('INVA', 'a' * 64, b'0123456789')
+        old = os.path.join(self.cache_dir, 'INVA-' + 'a' * 64 + '.pdf')
+        os.utime(old, (time.time() - 60, time.time() - 60))
+        pdf_cache.store_pdf('INVB', 'b' * 64, b'0123456789')
+        pdf_cache.store_pdf('INVC', 'c' * 64, b'0123456789')
+
+        self.assertIsNone(pdf_cache.get_cached_pdf('INVA', 'a' * 64))
+        self.assertEqual(pdf_cache.get_cached_pdf('INVC', 'c' * 64), b'0123456789')
+
+    def _paystub(self, paystub_id=1, amount=75.0):
+        employee = SimpleNamespace(firstname='Tina', lastname='Therapist', position='Therapist', rba_number=None)
+        session = SimpleNamespace(intervention_type='Therapy', date=date(2026, 9, 2), start_time=dtime(9), end_time=dtime(10))
+        item = SimpleNamespace(id=1, rate=75.0, hours=1.0, amount=amount, intervention=session,
+                               client=SimpleNamespace(firstname='Jane', lastname='Doe'))
+        return SimpleNamespace(id=paystub_id, period_start=date(2026, 9, 1), period_end=date(2026, 9, 14),
+                               generated_date=date(2026, 9, 15), total_hours=1.0, total_amount=amount, notes=None,
+                               employee=employee, items=[item])
+
+    def test_paystubs_share_the_cache_under_their_own_keys(self):
+        settings = {'org_name': 'Org', 'org_address': 'Addr', 'org_email': 'a@b.c', 'org_phone': ''}
+        paystub = self._paystub()
+        fingerprint = pdf_cache.paystub_pdf_fingerprint(paystub, settings)
+        self.assertEqual(fingerprint, pdf_cache.paystub_pdf_fingerprint(self._paystub(), settings))
+        self.assertNotEqual(fingerprint, pdf_cache.paystub_pdf_fingerprint(self._paystub(amount=80.0), settings))
+        self.assertNotEqual(fingerprint, pdf_cache.paystub_pdf_fingerprint(paystub, dict(settings, org_name='New')))
+
+        pdf_cache.store_pdf(pdf_cache.paystub_cache_key(1), fingerprint, b'%PDF paystub 1')
+        pdf_cache.store_pdf(pdf_cache.paystub_cache_key(12), fingerprint, b'%PDF paystub 12')
+        pdf_cache.store_pdf('INVTEST0001', fingerprint, b'%PDF invoice')
+        self.assertEqual(pdf_cache.invalidate_paystub(1), 1)
+
+        self.assertIsNone(pdf_cache.get_cached_pdf(pdf_cache.paystub_cache_key(1), fingerprint))
+        self.assertEqual(pdf_cache.get_cached_pdf(pdf_cache.paystub_cache_key(12), fingerprint), b'%PDF paystub 12')
+        self.assertEqual(pdf_cache.get_cached_pdf('INVTEST0001', fingerprint), b'%PDF invoice')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+import unittest
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+import gevent
+
+from app import create_app
+from app.utils import pdf_render
+from app.utils.pdf_render import PdfRenderService, render_pdfs
+
+
+def fake_write_pdf(html, base_url, stylesheets=(), assets=None):
+    """Stands in for WeasyPrint in the worker processes."""
+    if html == 'broken':
+        raise ValueError('bad markup')
+    if html.startswith('slow'):
+        time.sleep(float(html.split()[1]))
+    return f'%PDF {html} {base_url} {os.getpid()}'.encode()
+
+
+class PdfRenderServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.service = self.app.extensions['pdf_render'] = PdfRenderService(
+            workers=2, queue_timeout=5, render_timeout=5, render=fake_write_pdf
+        )
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.app_context.pop()
+
+    def test_renders_in_worker_processes_that_are_kept_warm(self):
+        first = self.service.render('a', 'file:///x/')
+        second = self.service.render('b', 'file:///x/')
+
+        self.assertTrue(first.startswith(b'%PDF a file:///x/ '))
+        self.assertNotIn(str(os.getpid()).encode(), first)
+        pool = self.service._pool
+        self.service.render('c', 'file:///x/')
+        self.assertIs(self.service._pool, pool)
+        stats = self.service.stats()
+        self.assertEqual((stats['renders'], stats['failed'], stats['in_flight']), (3, 0, 0))
+        self.assertGreater(stats['max_render_ms'], 0)
+        self.assertTrue(second)
+
+    def test_waits_for_a_free_slot_only_until_the_queue_timeout(self):
+        self.service = self.app.extensions['pdf_render'] = PdfRenderService(
+            workers=1, queue_timeout=0.1, render_timeout=5, render=fake_write_pdf
+        )
+        slow = threading.Thread(target=self.service.render, args=('slow 1', 'file:///x/'))
+        slow.start()
+        time.sleep(0.2)
+        with self.assertRaises(TimeoutError):
+            self.service.render('a', 'file:///x/')
+        slow.join()
+
+        self.assertEqual(self.service.stats()['busy'], 1)
+        self.assertTrue(self.service.render('a', 'file:///x/'))
+
+    def test_a_timed_out_render_stops_its_worker(self):
+        self.service = self.app.extensions['pdf_render'] = PdfRenderService(
+            workers=1, queue_timeout=5, render_timeout=0.3, render=fake_write_pdf
+        )
+        # the pool starts before the render clock runs, so worker start-up does not count
+        self.service.render('warm', 'file:///x/')
+        pool = self.service._pool
+        workers = list(pool._processes.values())
+        with self.assertRaises(TimeoutError):
+            self.service.render('slow 30', 'file:///x/')
+
+        for worker in workers:
+            worker.join(5)
+            self.assertFalse(worker.is_alive())
+        self.assertIsNot(self.service._pool, pool)
+        self.assertTrue(self.service.render('a', 'file:///x/').startswith(b'%PDF a'))
+        self.assertEqual(self.service.stats()['timed_out'], 1)
+
+    def test_a_render_running_next_to_a_timed_out_one_still_succeeds(self):
+        self.service = self.app.extensions['pdf_render'] = PdfRenderService(
+            workers=2, queue_timeout=5, render_timeout=2, render=fake_write_pdf
+        )
+        self.service.render('warm', 'file:///x/')
+        results = {}
+
+        def render(html):
+            try:
+                results[html] = self.service.render(html, 'file:///x/')
+            except Exception as e:
+                results[html] = e
+
+        stuck = threading.Thread(target=render, args=('slow 30',))
+        stuck.start()
+        time.sleep(1)
+        # still rendering when the stuck render times out and its pool is stopped
+        normal = threading.Thread(target=render, args=('slow 1.5',))
+        normal.start()
+        stuck.join()
+        normal.join()
+
+        self.assertIsInstance(results['slow 30'], TimeoutError)
+        self.assertTrue(results['slow 1.5'].startswith(b'%PDF slow 1.5'))
+        stats = self.service.stats()
+        self.assertEqual((stats['timed_out'], stats['resubmitted'], stats['failed']), (1, 1, 0))
+
+    def test_batch_reports_failed_documents_as_none(self):
+        pdfs = render_pdfs([('INV1', 'one'), ('INV2', 'broken'), ('INV3', 'three')], base_url='file:///x/')
+
+        self.assertEqual(sorted(pdfs), ['INV1', 'INV2', 'INV3'])
+        self.assertIsNone(pdfs['INV2'])
+        self.assertTrue(pdfs['INV3'].startswith(b'%PDF three'))
+        self.assertEqual(self.service.stats()['failed'], 1)
+
+    def test_greenlets_keep_running_while_a_request_waits_for_its_pdf(self):
+        ticks = []
+
+        def request():
+            with self.app.test_request_context('/'):
+                pdf = pdf_render.render_pdf('slow 0.3')
+            return pdf, time.monotonic()
+
+        def other_request():
+            for _ in range(10):
+                ticks.append(time.monotonic())
+                gevent.sleep(0.01)
+
+        waiting = gevent.spawn(request)
+        gevent.spawn(other_request).join()
+        pdf, rendered_at = waiting.get()
+
+        self.assertTrue(pdf.startswith(b'%PDF slow 0.3 http://localhost/'))
+        # the other greenlet was served while the render was still running
+        self.assertEqual(len(ticks), 10)
+        self.assertLess(ticks[-1], rendered_at)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Activity, Client, Designation, Employee, Intervention, Invoice, InvoicePayment
+from app.utils.report_aggregates import invoice_summary, session_summary
+from app.utils.report_export import invoice_rows, session_rows
+
+
+class ReportAggregateTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add_all([Activity(activity_name='Therapy', activity_category='Therapy'),
+                            Activity(activity_name='Supervision', activity_category='Supervision')])
+        self.employees = [Employee(name, 'T', 'Therapist', None, f'{name}@example.com', '4165550000')
+                          for name in ('Ann', 'Bob')]
+        self.clients = [Client(name, 'C', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+                        for name in ('Jane', 'Kim')]
+        db.session.add_all(self.employees + self.clients)
+        db.session.flush()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _session(self, employee, client, day, hours, activity='Therapy'):
+        db.session.add(Intervention(client.id, employee.id, activity, day, time(9, 0), time(9 + hours, 0),
+                                    float(hours), ''))
+
+    def test_session_totals_per_dimension_match_the_rows(self):
+        ann, bob = self.employees
+        jane, kim = self.clients
+        self._session(ann, jane, date(2026, 9, 1), 2)
+        self._session(ann, kim, date(2026, 9, 2), 1, 'Supervision')
+        self._session(bob, jane, date(2026, 10, 1), 3)
+        self._session(bob, jane, date(2026, 10, 2), 1)
+        self._session(bob, kim, date(2026, 11, 1), 5)  # outside the range
+        db.session.commit()
+
+        summary = session_summary(session_rows(date(2026, 9, 1), date(2026, 10, 31)))
+        self.assertEqual(summary['total'], {'sessions': 4, 'hours': 7.0})
+        by = {name: {r['label']: (r['sessions'], r['hours']) for r in summary[name]}
+              for name in ('client', 'employee', 'activity', 'month')}
+        self.assertEqual(by['client'], {'Jane C': (3, 6.0), 'Kim C': (1, 1.0)})
+        self.assertEqual(by['employee'], {'Ann T': (2, 3.0), 'Bob T': (2, 4.0)})
+        self.assertEqual(by['activity'], {'Therapy': (3, 6.0), 'Supervision': (1, 1.0)})
+        self.assertEqual([r['label'] for r in summary['month']], ['2026-09', '2026-10'])
+
+    def test_invoice_received_amounts_count_each_payment_once(self):
+        jane, kim = self.clients
+        for number, client, total in (('INV1', jane, 400.0), ('INV2', kim, 100.0)):
+            db.session.add(Invoice(number, date(2026, 9, 30), date(2026, 10, 7), client.id,
+                                   date(2026, 9, 1), date(2026, 9, 30), total, 'Sent', None, None))
+        db.session.flush()
+        inv1 = Invoice.query.filter_by(invoice_number='INV1').one()
+        db.session.add_all([InvoicePayment(inv1.id, 150.0, date(2026, 10, 1)),
+                            InvoicePayment(inv1.id, 50.0, date(2026, 10, 2))])
+        db.session.commit()
+
+        summary = invoice_summary(invoice_rows(date(2026, 9, 1), date(2026, 9, 30), client_id=jane.id))
+        self.assertEqual(summary['total'], {'invoices': 1, 'invoiced': 400.0, 'received': 200.0, 'outstanding': 200.0})
+        summary = invoice_summary(invoice_rows(date(2026, 9, 1), date(2026, 9, 30)))
+        self.assertEqual(summary['total'], {'invoices': 2, 'invoiced': 500.0, 'received': 200.0, 'outstanding': 300.0})
+        self.assertEqual(summary['month'], [{'key': '2026-09', 'label': '2026-09', 'invoices': 2,
+                                             'invoiced': 500.0, 'received': 200.0, 'outstanding': 300.0}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+import os
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.api import api_bp, generate_token
+from app.models import Activity, Client, Designation, Employee, Intervention
+
+
+class ReportExportTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.register_blueprint(api_bp, url_prefix='/api')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Administrator'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        admin = Employee('Ada', 'Admin', 'Administrator', None, 'ada@example.com', '4165550000',
+                         user_type='admin', login_enabled=True)
+        client = Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add_all([admin, client])
+        db.session.flush()
+        for day in (3, 1, 2):
+            db.session.add(Intervention(client.id, admin.id, 'Therapy', date(2026, 9, day),
+                                        time(9, 0), time(10, 30), 1.5, ''))
+        db.session.commit()
+        self.headers = {'Authorization': f'Bearer {generate_token(admin.id)}'}
+        self.http = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _get(self, query):
+        return self.http.get(f'/api/reports/sessions?start_date=2026-09-01&end_date=2026-09-30{query}',
+                             headers=self.headers)
+
+    def test_ndjson_streams_the_same_rows_as_the_json_report(self):
+        expected = self._get('').get_json()['interventions']
+
+        resp = self._get('&format=ndjson')
+        self.assertTrue(resp.is_streamed)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(rows, expected)
+        self.assertEqual([r['date'] for r in rows], ['2026-09-01', '2026-09-02', '2026-09-03'])
+
+    def test_csv_has_a_header_and_one_line_per_session(self):
+        resp = self._get('&format=csv')
+        self.assertIn('attachment', resp.headers['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+        self.assertEqual(rows[0][:5], ['id', 'client_id', 'employee_id', 'intervention_type', 'date'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][7], '1.5')
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self._get('&format=xml').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app, db
+from app.models import (Activity, Client, DailyRollup, Designation, Employee, Intervention, Invoice,
+                        InvoicePayment, PayStub, PayStubItem)
+from app.utils.rollups import rebuild_rollups, refresh_rollups
+
+
+def _snapshot():
+    return {
+        (r.date, r.employee_id, r.client_id): (r.session_count, round(r.hours, 4), round(r.invoiced_amount, 4),
+                                               round(r.received_amount, 4), round(r.paystub_amount, 4))
+        for r in DailyRollup.query.all()
+    }
+
+
+class DailyRollupTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        self.employee = Employee('Pat', 'Rated', 'Therapist', None, 'pat@example.com', '4165550000')
+        db.session.add(self.employee)
+        self.client = Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add(self.client)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _session(self, day, hours):
+        i = Intervention(self.client.id, self.employee.id, 'Therapy', date(2026, 9, day),
+                         time(9, 0), time(9 + hours, 0), float(hours), '')
+        db.session.add(i)
+        return i
+
+    def assertMatchesRebuild(self):
+        incremental = _snapshot()
+        rebuild_rollups()
+        self.assertEqual(incremental, _snapshot())
+
+    def test_session_writes_update_counts_and_hours(self):
+        first = self._session(1, 2)
+        self._session(1, 1)
+        self._session(2, 3)
+        db.session.commit()
+
+        key = (date(2026, 9, 1), self.employee.id, self.client.id)
+        self.assertEqual(_snapshot()[key][:2], (2, 3.0))
+
+        first.date = date(2026, 9, 3)
+        db.session.commit()
+        rollups = _snapshot()
+        self.assertEqual(rollups[key][:2], (1, 1.0))
+        self.assertEqual(rollups[(date(2026, 9, 3), self.employee.id, self.client.id)][:2], (1, 2.0))
+        self.assertMatchesRebuild()
+
+    def test_invoice_payment_and_paystub_amounts_are_prorated_to_sessions(self):
+        a = self._session(1, 1)
+        b = self._session(2, 3)
+        db.session.flush()
+        invoice = Invoice('INV202609000001', date(2026, 9, 30), date(2026, 10, 7), self.client.id,
+                          date(2026, 9, 1), date(2026, 9, 30), 400.0, 'Sent', None, None)
+        db.session.add(invoice)
+        for i in (a, b):
+            i.invoiced = True
+            i.invoice_number = invoice.invoice_number
+        db.session.commit()
+
+        day1 = (date(2026, 9, 1), self.employee.id, self.client.id)
+        day2 = (date(2026, 9, 2), self.employee.id, self.client.id)
+        self.assertEqual(_snapshot()[day1][2:4], (100.0, 0.0))
+        self.assertEqual(_snapshot()[day2][2:4], (300.0, 0.0))
+
+        db.session.add(InvoicePayment(invoice.id, 200.0, date(2026, 10, 1)))
+        paystub = PayStub(employee_id=self.employee.id, period_start=date(2026, 9, 1), period_end=date(2026, 9, 14),
+                          generated_date=date(2026, 9, 15), total_hours=1.0, total_amount=30.0)
+        db.session.add(paystub)
+        db.session.flush()
+        db.session.add(PayStubItem(paystub_id=paystub.id, intervention_id=a.id, client_id=self.client.id,
+                                   rate=30.0, hours=1.0, amount=30.0))
+        db.session.commit()
+
+        self.assertEqual(_snapshot()[day1][2:], (100.0, 50.0, 30.0))
+        self.assertEqual(_snapshot()[day2][2:], (300.0, 150.0, 0.0))
+        self.assertMatchesRebuild()
+
+        db.session.delete(paystub)
+        invoice.reset_to_draft()
+        db.session.commit()
+        self.assertEqual(_snapshot()[day1][2:], (100.0, 0.0, 0.0))
+        self.assertMatchesRebuild()
+
+    def test_each_key_has_one_row_and_refreshes_upsert_it(self):
+        self._session(1, 2)
+        db.session.commit()
+        key = (date(2026, 9, 1), self.employee.id, self.client.id)
+        row_id = DailyRollup.query.one().id
+
+        # what a second transaction refreshing the same key would have inserted
+        with self.assertRaises(IntegrityError):
+            db.session.execute(insert(DailyRollup), [{'date': key[0], 'employee_id': key[1], 'client_id': key[2]}])
+        db.session.rollback()
+        # rows without a client share one key too
+        db.session.execute(insert(DailyRollup), [{'date': key[0], 'employee_id': key[1], 'client_id': None}])
+        with self.assertRaises(IntegrityError):
+            db.session.execute(insert(DailyRollup), [{'date': key[0], 'employee_id': key[1], 'client_id': None}])
+        db.session.rollback()
+
+        DailyRollup.query.update({DailyRollup.hours: 99.0})
+        refresh_rollups({key})
+        db.session.commit()
+        row = DailyRollup.query.one()
+        self.assertEqual((row.id, row.hours), (row_id, 2.0))
+
+    def test_rollback_discards_pending_keys(self):
+        self._session(1, 2)
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(_snapshot(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
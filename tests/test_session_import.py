@@ -0,0 +1,126 @@
+import io
+import os
+import tempfile
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Activity, Client, Employee, Intervention, SessionImportJob
+from app.utils.session_import import create_import_job, import_sessions, run_import_job
+
+HEADER = 'Client Name,Employee Name,Intervention Type,Date,Start Time,End Time\n'
+
+
+def _csv(*rows):
+    return io.StringIO(HEADER + ''.join(row + '\n' for row in rows))
+
+
+class SessionImportTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self._seed()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _seed(self):
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        db.session.add(Activity(activity_name='Supervision', activity_category='Supervision'))
+        self.therapist = Employee('Tina', 'Therapist', 'Therapist', None, 'tina@example.com', '4165550000')
+        self.analyst = Employee('Ann', 'Analyst', 'Behaviour Analyst', None, 'ann@example.com', '4165550001')
+        db.session.add_all([self.therapist, self.analyst])
+        db.session.flush()
+        self.client = Client('Mary Ann', 'Smith', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1',
+                             self.analyst.id)
+        self.other = Client('Bob', 'Doe', date(2015, 1, 1), 'Male', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add_all([self.client, self.other])
+        db.session.flush()
+        db.session.add(Intervention(client_id=self.other.id, employee_id=self.therapist.id,
+                                    intervention_type='Therapy', date=date(2026, 9, 1), start_time=time(9, 0),
+                                    end_time=time(10, 0), duration=1.0, file_names=''))
+        db.session.commit()
+
+    def test_imports_rows_with_names_resolved_case_and_space_insensitively(self):
+        rows, imported, errors = import_sessions(_csv(
+            'mary  ann smith,TINA THERAPIST,therapy,2026-09-02,09:00,10:30',
+            'Bob Doe,Ann Analyst,Supervision,2026-09-02,09:00,10:00',
+        ))
+        db.session.commit()
+
+        self.assertEqual((rows, imported, errors), (2, 2, []))
+        session = Intervention.query.filter_by(client_id=self.client.id).one()
+        self.assertEqual(session.employee_id, self.therapist.id)
+        self.assertEqual(session.intervention_type, 'Therapy')
+        self.assertEqual(session.duration, 1.5)
+        self.assertFalse(session.invoiced)
+
+    def test_any_rejected_row_imports_nothing_unless_errors_are_skipped(self):
+        lines = (
+            'Mary Ann Smith,Tina Therapist,Therapy,2026-09-02,09:00,10:00',
+            'Nobody Here,Tina Therapist,Therapy,2026-09-02,11:00,12:00',
+            'Bob Doe,Tina Therapist,Supervision,2026-09-02,13:00,14:00',
+            'Bob Doe,Tina Therapist,Therapy,2026-09-02,10:00,09:00',
+        )
+        rows, imported, errors = import_sessions(_csv(*lines))
+        self.assertEqual((rows, imported), (4, 0))
+        self.assertEqual([e['row'] for e in errors], [3, 4, 5])
+        self.assertIn("Client 'Nobody Here' not found", errors[0]['error'])
+        self.assertIn('can only perform Therapy', errors[1]['error'])
+        self.assertEqual(errors[2]['error'], 'End time must be after start time')
+        self.assertEqual(Intervention.query.count(), 1)
+
+        rows, imported, errors = import_sessions(_csv(*lines), skip_errors=True)
+        db.session.commit()
+        self.assertEqual((rows, imported, len(errors)), (4, 1, 3))
+        self.assertEqual(Intervention.query.count(), 2)
+
+    def test_overlaps_are_checked_against_the_database_and_the_file(self):
+        rows, imported, errors = import_sessions(_csv(
+            'Mary Ann Smith,Tina Therapist,Therapy,2026-09-01,09:30,10:30',
+            'Mary Ann Smith,Tina Therapist,Therapy,2026-09-03,09:00,10:00',
+            'Bob Doe,Tina Therapist,Therapy,2026-09-03,09:30,11:00',
+        ), skip_errors=True)
+
+        self.assertEqual(imported, 1)
+        self.assertEqual(errors, [
+            {'row': 2, 'error': 'Schedule conflict for Tina Therapist on 2026-09-01'},
+            {'row': 4, 'error': 'Schedule conflict for Tina Therapist on 2026-09-03'},
+        ])
+
+    def test_supervisor_is_limited_to_their_clients(self):
+        rows, imported, errors = import_sessions(_csv(
+            'Mary Ann Smith,Tina Therapist,Therapy,2026-09-02,09:00,10:00',
+            'Bob Doe,Tina Therapist,Therapy,2026-09-02,11:00,12:00',
+        ), supervisor_id=self.analyst.id, skip_errors=True)
+
+        self.assertEqual(imported, 1)
+        self.assertEqual(errors, [{'row': 3, 'error': 'Supervisor can only upload sessions for their clients'}])
+
+    def test_job_records_the_outcome_and_removes_the_upload(self):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf-8-sig') as f:
+            f.write(HEADER + 'Mary Ann Smith,Tina Therapist,Therapy,2026-09-02,09:00,10:00\n'
+                    'Bob,Tina Therapist,Therapy,2026-09-02,11:00,12:00\n')
+        job = create_import_job('sessions.csv', os.path.getsize(path), skip_errors=True)
+
+        job = run_import_job(job.id, path)
+
+        self.assertFalse(os.path.exists(path))
+        job = db.session.get(SessionImportJob, job.id)
+        self.assertEqual((job.status, job.rows, job.imported, job.failed), ('done', 2, 1, 1))
+        self.assertEqual(job.error_list, [{'row': 3, 'error': 'Client name must have at least first and last name'}])
+        self.assertIsNotNone(job.finished_at)
+
+
+if __name__ == '__main__':
+    unittest.main()
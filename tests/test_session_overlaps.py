@@ -0,0 +1,89 @@
+import os
+import random
+import unittest
+from datetime import date, time
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import create_app, db
+from app.models import Activity, Client, Designation, Employee, Intervention
+from app.utils.session_overlaps import SessionOverlapChecker, find_overlaps
+
+
+class SessionOverlapTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Designation(designation='Therapist'))
+        db.session.add(Activity(activity_name='Therapy', activity_category='Therapy'))
+        self.employees = [Employee(f'T{n}', 'Therapist', 'Therapist', None, f't{n}@example.com', '4165550000')
+                          for n in range(2)]
+        db.session.add_all(self.employees)
+        self.client = Client('Jane', 'Doe', date(2015, 1, 1), 'Female', '1 St', '', 'Toronto', 'ON', 'M1M1M1', None)
+        db.session.add(self.client)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _add(self, employee, day, start, end):
+        i = Intervention(self.client.id, employee.id, 'Therapy', day, start, end, 1.0, '')
+        db.session.add(i)
+        db.session.commit()
+        return i
+
+    def test_matches_has_overlap_for_stored_sessions(self):
+        rng = random.Random(3)
+        days = [date(2026, 9, d) for d in (1, 2)]
+        for employee in self.employees:
+            for day in days:
+                for _ in range(4):
+                    start = rng.randint(8, 17)
+                    self._add(employee, day, time(start, rng.choice((0, 30))), time(start + rng.randint(1, 2), 0))
+
+        checker = SessionOverlapChecker()
+        checker.preload((e.id, d) for e in self.employees for d in days)
+        for employee in self.employees:
+            for day in days:
+                for start in range(7, 20):
+                    for minutes in (0, 30):
+                        st, et = time(start, minutes), time(start + 1, minutes)
+                        self.assertEqual(
+                            checker.overlaps(employee.id, day, st, et),
+                            Intervention.has_overlap(employee.id, day, st, et),
+                            (employee.id, day, st, et),
+                        )
+
+    def test_rows_in_the_same_batch_are_checked_against_each_other(self):
+        employee = self.employees[0]
+        day = date(2026, 9, 1)
+        self._add(employee, day, time(9, 0), time(10, 0))
+
+        conflicts = find_overlaps([
+            (employee.id, day, time(10, 0), time(11, 0)),   # touches the stored session
+            (employee.id, day, time(10, 30), time(12, 0)),  # overlaps the row above
+            (employee.id, day, time(9, 30), time(9, 45)),   # inside the stored session
+            (self.employees[1].id, day, time(10, 30), time(12, 0)),  # other employee
+            (employee.id, day, time(12, 0), time(13, 0)),
+        ])
+        self.assertEqual(conflicts, [1, 2])
+
+    def test_excluded_session_does_not_conflict_with_itself(self):
+        employee = self.employees[0]
+        day = date(2026, 9, 1)
+        stored = self._add(employee, day, time(9, 0), time(10, 0))
+
+        moved = [(employee.id, day, time(9, 30), time(10, 30))]
+        self.assertEqual(find_overlaps(moved), [0])
+        self.assertEqual(find_overlaps(moved, exclude_ids=[stored.id]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
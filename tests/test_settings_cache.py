@@ -0,0 +1,74 @@
+import os
+import unittest
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import AppSettings
+from app.utils.settings_utils import bump_settings_version, get_app_settings, get_org_settings
+
+
+class SettingsCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(AppSettings(org_name='Before Org', testing_mode=True, testing_email='qa@example.com'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _settings_queries(self, func):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if 'app_settings' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    def test_repeated_lookups_hit_the_database_once(self):
+        def lookups():
+            for _ in range(5):
+                get_org_settings()
+                get_app_settings()
+
+        self.assertEqual(self._settings_queries(lookups), 1)
+        self.assertEqual(self._settings_queries(lookups), 0)
+
+    def test_version_bump_picks_up_saved_changes(self):
+        self.assertEqual(get_org_settings()['org_name'], 'Before Org')
+
+        row = AppSettings.get()
+        row.org_name = 'After Org'
+        db.session.commit()
+        self.assertEqual(get_org_settings()['org_name'], 'Before Org')
+
+        bump_settings_version()
+        self.assertEqual(get_org_settings()['org_name'], 'After Org')
+
+    def test_snapshot_is_usable_after_session_ends(self):
+        get_org_settings()
+        db.session.remove()
+
+        snapshot = get_app_settings()
+        self.assertTrue(snapshot.testing_mode)
+        self.assertEqual(snapshot.testing_email, 'qa@example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()